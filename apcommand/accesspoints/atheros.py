@@ -2,13 +2,18 @@
 # python standard library
 from abc import ABCMeta, abstractproperty, abstractmethod
 import string
+import sys
 # this package
 from apcommand.baseclass import BaseClass
 from apcommand.connections.telnetconnection import TelnetConnection
+from apcommand.connections.telnetconnection import TelnetBatch, PendingOutput
+from apcommand.connections.asynctelnet import AsyncTelnetConnection
+from apcommand.connections.asyncloop import Return
 from apcommand.commons.errors import CommandError
 from apcommand.commons.errors import ArgumentError
 from apcommand.accesspoints.arbitrarycommand import ArbitraryCommand
 from apcommand.commands.settingsvalidator import SettingsValidator
+from apcommand.commands.iwlist import IwlistLexer
 
 EMPTY_STRING = ''
 FIVE_GHZ_SUFFIX = '_2'
@@ -19,6 +24,8 @@ BAND_ID = {TWO_POINT_FOUR:0, FIVE:1}
 G_BANDWIDTH = 'HT20'
 A_LOWER_BANDWIDTH = 'HT40PLUS'
 A_UPPER_BANDWIDTH = 'HT40MINUS'
+# what cfg prints when it can't take its arguments
+CFG_ERROR = 'usage: cfg'
 
 class LineLogger(BaseClass):
     """
@@ -43,6 +50,10 @@ class LineLogger(BaseClass):
         :postcondition: lines from output sent to debug logger
         :raises: CommandError if error_substring found in output
         """
+        if isinstance(output, PendingOutput) and not output.sent:
+            # log it once the batch is sent instead of sending the batch now
+            output.when_sent(lambda: self(output, error_substring, level))
+            return
         if level == 'info':
             logger = self.logger.info
         else:
@@ -59,7 +70,7 @@ class Configure(BaseClass):
     """
     A context manager for configure commands on the Atheros
     """
-    def __init__(self, connection, radio_id=0):
+    def __init__(self, connection, radio_id=0, pipeline=False):
         """
         The Configure constructor 
 
@@ -67,11 +78,14 @@ class Configure(BaseClass):
 
          - `connection`: connection to AP's command-line interface
          - `radio_id`: the id (0 for 2.4ghz 1 for 5GHz)
+         - `pipeline`: if True, send all the commands as one batch when the context exits
         """
         super(Configure, self).__init__()
         self.connection = connection
         self.radio_id = radio_id
+        self.pipeline = pipeline
         self._log_lines = None
+        self._batch = None
         self.logger.debug(str(connection))
         self.logger.debug("radio id: {0}".format(radio_id))
         return
@@ -85,31 +99,73 @@ class Configure(BaseClass):
             self._log_lines = LineLogger()
         return self._log_lines
 
+    @property
+    def batch(self):
+        """
+        A TelnetBatch to record the commands (only used if `pipeline` is True)
+        """
+        if self._batch is None:
+            self._batch = TelnetBatch(self.connection)
+        return self._batch
+
+    @property
+    def commands(self):
+        """
+        The batch if pipelining, the connection otherwise
+        """
+        if self.pipeline:
+            return self.batch
+        return self.connection
+
     def __enter__(self):
         """
         Takes down the AP
         """
         # turn off the wifi interface
-        output, error = self.connection.apdown()
+        output, error = self.commands.apdown()
         self.log_lines(output)
         # tell it which radio to set up (0=2.4GHz, 1=5GHz)
-        output, error = self.connection.cfg('-a AP_RADIO_ID={0}'.format(self.radio_id))
+        output, error = self.commands.cfg('-a AP_RADIO_ID={0}'.format(self.radio_id))
         self.log_lines(output)
         # tell it to only start up the current radio, not both ath0 and ath1
-        output, error = self.connection.cfg('-a AP_STARTMODE=standard')
+        output, error = self.commands.cfg('-a AP_STARTMODE=standard')
         self.log_lines(output)
-        return self.connection
+        return self.commands
 
     def __exit__(self, type, value, traceback):
         """
         Commits the configuration and brings up the AP
-        """
+
+        If pipelining, the settings are sent (and their output checked) before
+        the commit is sent, and nothing is sent if the ``with`` block raised an error.
+        If a pipelined setting was refused the AP is brought back up (without the commit).
+
+        :raise: CommandError if pipelining and a setting's output has an error
+        """
+        if self.pipeline:
+            if type is not None:
+                # the batch was never sent so the AP is left the way it was
+                self._batch = None
+                return
+            try:
+                self.batch.flush()
+            except CommandError:
+                # the apdown was in the batch so the AP has to come back up
+                self._batch = None
+                output, error = self.batch.apup()
+                self.log_lines(output)
+                self.batch.flush()
+                self._batch = None
+                raise
         # commit the configuration changes        
-        output, error = self.connection.cfg('-c')
+        output, error = self.commands.cfg('-c')
         self.log_lines(output)
         # bring up the AP
-        output, error = self.connection.apup()
+        output, error = self.commands.apup()
         self.log_lines(output)
+        if self.pipeline:
+            self.batch.flush()
+            self._batch = None
         return
 
 class AtherosAR5KAP(BaseClass):
@@ -117,7 +173,7 @@ class AtherosAR5KAP(BaseClass):
     A controller for the Atheros AR5KAP
     """
     def __init__(self, hostname='10.10.10.21', username='root', password='5up',
-                 interface='ath0', connection=None):
+                 interface='ath0', connection=None, pool=None, pipeline=False):
         """
         The AtherosAR5KAP constructor
 
@@ -128,6 +184,8 @@ class AtherosAR5KAP(BaseClass):
          - `password`: the password for the AP command-line interface
          - `interface`: the settings validator needs the VAP name
          - `connection`: overrides the TelnetConnection creation
+         - `pool`: TelnetSessionPool for the TelnetConnection to share sessions
+         - `pipeline`: if True, send each configuration as one batch of commands
         """
         super(AtherosAR5KAP, self).__init__()
         self._logger = None
@@ -135,7 +193,10 @@ class AtherosAR5KAP(BaseClass):
         self.username = username
         self.password = password
         self.interface = interface
+        self.pool = pool
+        self.pipeline = pipeline
         self._connection = connection
+
         self._log_lines = None
         self._command_executor = None
         self._validate = None
@@ -181,9 +242,19 @@ class AtherosAR5KAP(BaseClass):
         if self._connection is None:
             self._connection = TelnetConnection(hostname=self.hostname,
                                                 username=self.username,
-                                                password=self.password)
+                                                password=self.password,
+                                                pool=self.pool)
         return self._connection
+
+    def close(self):
+        """
+        Closes the connection (checks the session back in if there's a pool)
+        """
+        if self._connection is not None:
+            self._connection.close()
+        return
         
+
     def up(self):
         """
         Brings the AP up
@@ -249,9 +320,10 @@ class AtherosAR5KAP(BaseClass):
          - `band`: 2.4 or 5
         """
         radio = BAND_ID[band]
-        with Configure(connection=self.connection, radio_id=radio):
-            output, error = self.connection.cfg('-x')
-            self.log_lines(output)
+        with Configure(connection=self.connection, radio_id=radio,
+                       pipeline=self.pipeline) as connection:
+            output, error = connection.cfg('-x')
+            self.log_lines(output, error_substring=CFG_ERROR)
         return
 
     def set_ssid(self, ssid, band):
@@ -263,8 +335,10 @@ class AtherosAR5KAP(BaseClass):
          - `band`: 2.4 or 5 (they share the SSID, but this will decide which comes up)
          - `ssid`: string name to set the ssid to 
         """
-        with Configure(self.connection, radio_id=BAND_ID[band]):
-            output, error = self.connection.cfg('-a AP_SSID={0}'.format(ssid))
+        with Configure(self.connection, radio_id=BAND_ID[band],
+                       pipeline=self.pipeline) as connection:
+            output, error = connection.cfg('-a AP_SSID={0}'.format(ssid))
+            self.log_lines(output, error_substring=CFG_ERROR)
         return
 
     def set_ip(self, address='10.10.10.21', mask='255.255.255.0', band='2.4'):
@@ -276,10 +350,12 @@ class AtherosAR5KAP(BaseClass):
          - `address`: the IP address to use
          - `mask`: the subnet mask
         """
-        with Configure(connection=self.connection, radio_id=BAND_ID[band]):
-            output, error = self.connection.cfg('-a AP_IPADDR={0}'.format(address))
-            self.log_lines(output)
-            output, error = self.connection.cfg('-a AP_NETMASK={0}'.format(mask))
+        with Configure(connection=self.connection, radio_id=BAND_ID[band],
+                       pipeline=self.pipeline) as connection:
+            output, error = connection.cfg('-a AP_IPADDR={0}'.format(address))
+            self.log_lines(output, error_substring=CFG_ERROR)
+            output, error = connection.cfg('-a AP_NETMASK={0}'.format(mask))
+            self.log_lines(output, error_substring=CFG_ERROR)
         return
 
     def set_channel(self, channel, mode=None, bandwidth=None):
@@ -292,7 +368,8 @@ class AtherosAR5KAP(BaseClass):
          - `mode`: optional mode (e.g. 11NG)
          - `bandwidth`: bandwidth for the mode (e.g. HT40PLUS)
         """
-        changer = AtherosChannelChanger(connection=self.connection)
+        changer = AtherosChannelChanger(connection=self.connection,
+                                        pipeline=self.pipeline)
         changer(channel, mode, bandwidth)
         self.validate.channel(channel)
         return
@@ -307,7 +384,7 @@ class AtherosAR5KAP(BaseClass):
         """
         if security_type == 'open':
             setter_class = AtherosOpen
-        setter = setter_class(connection=self.connection)
+        setter = setter_class(connection=self.connection, pipeline=self.pipeline)
         setter()
         return
 
@@ -323,17 +400,19 @@ class AtherosSecuritySetter(BaseClass):
     A base-class to change the AP's security
     """
     __metaclass__ = ABCMeta
-    def __init__(self, connection):
+    def __init__(self, connection, pipeline=False):
         """
         AtherosSecuritySetter Constructor
 
         :param:
 
          - `connection`: connection to the AP
+         - `pipeline`: if True, send the configuration as one batch
         """
         super(AtherosSecuritySetter, self).__init__()
         self._logger = None
         self.connection = connection
+        self.pipeline = pipeline
         self._log_lines = None
         return
 
@@ -369,16 +448,17 @@ class AtherosOpen(AtherosSecuritySetter):
         sets the security mode to open
         """
         self.logger.debug('setting the security to open')
-        with Configure(connection=self.connection):
-            out, err = self.connection.cfg('-a AP_SECMODE=None')
-            self.log_lines(out)
+        with Configure(connection=self.connection,
+                       pipeline=self.pipeline) as connection:
+            out, err = connection.cfg('-a AP_SECMODE=None')
+            self.log_lines(out, error_substring=CFG_ERROR)
         return
 
 class AtherosChannelChanger(BaseClass):
     """
     A channel changer
     """
-    def __init__(self, connection, interface='ath0'):
+    def __init__(self, connection, interface='ath0', pipeline=False):
         """
         AtherosChannelChanger constructor
 
@@ -386,10 +466,12 @@ class AtherosChannelChanger(BaseClass):
 
          - `connection`: the connection to the AP
          - `interface`: name of the network interface
+         - `pipeline`: if True, send the configuration as one batch
         """
         super(AtherosChannelChanger, self).__init__()
         self.connection = connection
         self.interface = interface
+        self.pipeline = pipeline
         self._logger = None
         self._channel_to_bandwidth = None
         self._g_channels = None
@@ -587,14 +669,15 @@ class AtherosChannelChanger(BaseClass):
         parameter_suffix = self.parameter_suffix(channel)
 
         band = self.band(channel)
-        with Configure(connection=self.connection, radio_id=BAND_ID[band]):
-            output, error = self.connection.cfg('-a AP_CHMODE{1}={0}{2}'.format(mode,
-                                                                                 parameter_suffix,
-                                                                                 bandwidth))
-            self.log_lines(output)
-            output, error = self.connection.cfg('-a AP_PRIMARY_CH{1}={0}'.format(channel,
-                                                                                 parameter_suffix))
-            self.log_lines(output)
+        with Configure(connection=self.connection, radio_id=BAND_ID[band],
+                       pipeline=self.pipeline) as connection:
+            output, error = connection.cfg('-a AP_CHMODE{1}={0}{2}'.format(mode,
+                                                                            parameter_suffix,
+                                                                            bandwidth))
+            self.log_lines(output, error_substring=CFG_ERROR)
+            output, error = connection.cfg('-a AP_PRIMARY_CH{1}={0}'.format(channel,
+                                                                            parameter_suffix))
+            self.log_lines(output, error_substring=CFG_ERROR)
         return
 
     def validate_channel(self, channel):
@@ -607,12 +690,279 @@ class AtherosChannelChanger(BaseClass):
             raise ArgumentError("Invalid Channel: {0}".format(channel))
         return
 
+class AsyncAtherosAR5KAP(AtherosAR5KAP):
+    """
+    A controller for the Atheros AR5KAP whose methods are coroutines
+    """
+    def __init__(self, hostname='10.10.10.21', username='root', password='5up',
+                 interface='ath0', connection=None, pool=None, pipeline=False, loop=None):
+        """
+        The AsyncAtherosAR5KAP constructor
+
+        :param:
+
+         - `hostname`: the hostname (IP address) of the AP's telnet interface
+         - `username`: the user-login to the AP command-line interface
+         - `password`: the password for the AP command-line interface
+         - `interface`: the interface to check the channel on
+         - `connection`: overrides the AsyncTelnetConnection creation
+         - `pool`: TelnetSessionPool for the TelnetConnection to share sessions
+         - `pipeline`: if True, send each configuration as one batch of commands
+         - `loop`: the EventLoop for the connection (default is the shared event_loop)
+        """
+        super(AsyncAtherosAR5KAP, self).__init__(hostname=hostname, username=username,
+                                                 password=password, interface=interface,
+                                                 connection=connection, pool=pool,
+                                                 pipeline=pipeline)
+        self._loop = loop
+        self._channel_changer = None
+        self._lexer = None
+        return
+
+    @property
+    def connection(self):
+        """
+        The asynchronous telnet connection to the AP
+
+        :return: AsyncTelnetConnection
+        """
+        if self._connection is None:
+            self._connection = AsyncTelnetConnection(hostname=self.hostname,
+                                                     username=self.username,
+                                                     password=self.password,
+                                                     loop=self._loop)
+        return self._connection
+
+    @property
+    def loop(self):
+        """
+        The EventLoop running the connection
+        """
+        return self.connection.loop
+
+    @property
+    def channel_changer(self):
+        """
+        An AtherosChannelChanger (only used to look up the channel settings)
+        """
+        if self._channel_changer is None:
+            self._channel_changer = AtherosChannelChanger(connection=None,
+                                                          interface=self.interface)
+        return self._channel_changer
+
+    @property
+    def lexer(self):
+        """
+        An IwlistLexer to get the channel from the ``iwlist`` output
+        """
+        if self._lexer is None:
+            self._lexer = IwlistLexer(interface=self.interface)
+        return self._lexer
+
+    def wait(self, outputs, error_substring=None, level='debug'):
+        """
+        Coroutine to wait for the outputs and then log them
+
+        :param:
+
+         - `outputs`: list of AsyncOutputs
+         - `error_substring`: string that raises CommandError if matches
+         - `level`: 'debug' or 'info'
+
+        :raise: Return with the outputs
+        """
+        yield self.loop.gather(*outputs)
+        for output in outputs:
+            self.log_lines(output, error_substring=error_substring, level=level)
+        raise Return(outputs)
+
+    def configure(self, radio_id, *arguments):
+        """
+        Coroutine to send a configuration (the asynchronous `Configure`)
+
+        :param:
+
+         - `radio_id`: the id (0 for 2.4ghz 1 for 5GHz)
+         - `arguments`: the arguments for each ``cfg`` call (e.g. '-a AP_SSID=wifi')
+
+        :raise: CommandError (after bringing the AP back up, without the commit) if a setting's output has an error
+        """
+        connection = self.connection
+        settings = ([connection.apdown(),
+                     connection.cfg('-a AP_RADIO_ID={0}'.format(radio_id)),
+                     connection.cfg('-a AP_STARTMODE=standard')] +
+                    [connection.cfg(argument) for argument in arguments])
+        try:
+            yield self.loop.spawn(self.wait([output for output, error in settings],
+                                            error_substring=CFG_ERROR))
+        except CommandError as refused:
+            # the AP was taken down so it has to come back up (without the commit)
+            output, error = connection.apup()
+            yield self.loop.spawn(self.wait([output]))
+            raise refused
+        commit = [connection.cfg('-c'), connection.apup()]
+        yield self.loop.spawn(self.wait([output for output, error in commit]))
+        return
+
+    def up(self):
+        """
+        Coroutine to bring the AP up
+        """
+        output, error = self.connection.apup()
+        yield self.loop.spawn(self.wait([output]))
+        return
+
+    def down(self):
+        """
+        Coroutine to take the AP down
+        """
+        output, error = self.connection.apdown()
+        yield self.loop.spawn(self.wait([output]))
+        return
+
+    def destroy(self, interface):
+        """
+        Coroutine to take down a VAP
+
+        :param:
+
+         - `interface`: name of VAP
+
+        :raise: CommandError if the VAP doesn't exist
+        """
+        output, error = self.connection.wlanconfig("{0} destroy".format(interface))
+        yield self.loop.spawn(self.wait([output], error_substring='No such device'))
+        return
+
+    def status(self, interface='ath0'):
+        """
+        Coroutine to log iwconfig, ifconfig, iwlist for interface (use 'all' for all interfaces)
+
+        :param:
+
+         - `interface`: name of network interface (e.g. ath0)
+        """
+        if interface == 'all':
+            interface = ''
+        iwconfig, error = self.connection.iwconfig(interface)
+        ifconfig, error = self.connection.ifconfig("{0} | grep 'inet addr'".format(interface))
+        iwlist, error = self.connection.iwlist("{0} channel | grep Current".format(interface))
+        yield self.loop.gather(iwconfig, ifconfig, iwlist)
+        try:
+            self.log_lines(iwconfig, level='info', error_substring='No such device')
+            self.log_lines(ifconfig, level='info', error_substring='Device not found')
+            self.log_lines(iwlist, level='info')
+        except CommandError:
+            self.logger.info("interface {0} seems to be down".format(interface))
+        return
+
+    def reset(self, band='2.4'):
+        """
+        Coroutine to clear the AP configuration back to the factory defaults
+
+        :param:
+
+         - `band`: 2.4 or 5
+        """
+        yield self.loop.spawn(self.configure(BAND_ID[band], '-x'))
+        return
+
+    def set_ssid(self, ssid, band):
+        """
+        Coroutine to set the SSID
+
+        :param:
+
+         - `band`: 2.4 or 5 (they share the SSID, but this will decide which comes up)
+         - `ssid`: string name to set the ssid to
+        """
+        yield self.loop.spawn(self.configure(BAND_ID[band],
+                                             '-a AP_SSID={0}'.format(ssid)))
+        return
+
+    def set_ip(self, address='10.10.10.21', mask='255.255.255.0', band='2.4'):
+        """
+        Coroutine to set the AP's IP address
+
+        :param:
+
+         - `address`: the IP address to use
+         - `mask`: the subnet mask
+        """
+        yield self.loop.spawn(self.configure(BAND_ID[band],
+                                             '-a AP_IPADDR={0}'.format(address),
+                                             '-a AP_NETMASK={0}'.format(mask)))
+        return
+
+    def set_channel(self, channel, mode=None, bandwidth=None):
+        """
+        Coroutine to set the channel on the AP and check that it changed
+
+        :param:
+
+         - `channel`: A valid 802.11 channel
+         - `mode`: optional mode (e.g. 11NG)
+         - `bandwidth`: bandwidth for the mode (e.g. HT40PLUS)
+
+        :raise: ArgumentError for an invalid channel, RuntimeError if the channel didn't change
+        """
+        changer = self.channel_changer
+        channel = str(channel)
+        if mode is None:
+            mode = changer.mode(channel)
+        if bandwidth is None:
+            bandwidth = changer.bandwidth(channel)
+        suffix = changer.parameter_suffix(channel)
+        yield self.loop.spawn(self.configure(BAND_ID[changer.band(channel)],
+                                             '-a AP_CHMODE{1}={0}{2}'.format(mode.upper(),
+                                                                             suffix,
+                                                                             bandwidth),
+                                             '-a AP_PRIMARY_CH{1}={0}'.format(channel,
+                                                                              suffix)))
+        output, error = self.connection.iwlist("{0} channel".format(self.interface))
+        lines = yield output
+        actual_channel = self.lexer.channel(lines=lines)
+        if actual_channel != channel:
+            raise RuntimeError("Expected channel: {0}, Actual: {1}".format(channel,
+                                                                           actual_channel))
+        return
+
+    def set_security(self, security_type='open'):
+        """
+        Coroutine to set the security on the access point
+
+        :param:
+
+         - `security_type`: one of {open}
+        """
+        if security_type == 'open':
+            yield self.loop.spawn(self.configure(BAND_ID[TWO_POINT_FOUR],
+                                                 '-a AP_SECMODE=None'))
+        return
+
+    def exec_command(self, command):
+        """
+        Coroutine to send the command to the connection and dump the output to the screen
+        """
+        output, error = self.connection(command)
+        lines = yield output
+        for line in lines:
+            sys.stdout.write(line)
+            self.logger.debug(line)
+        return
+# end class AsyncAtherosAR5KAP
+
 # python standard library
 import unittest
 import random
+from StringIO import StringIO
 # third party
 from mock import MagicMock, call, patch
 from nose.tools import raises
+# this package
+from apcommand.connections.localconnection import OutputError
+from apcommand.connections.asyncloop import EventLoop, FakeClock
+from apcommand.connections.asynctelnet import AsyncOutput
 
 ENTER_CALLS = [call.apdown(), call.cfg('-a AP_RADIO_ID=0'),
                call.cfg('-a AP_STARTMODE=standard')]
@@ -735,7 +1085,7 @@ class TestAR5KAP(unittest.TestCase):
         changer.__call__ = changer_call
         with patch('apcommand.accesspoints.atheros.AtherosChannelChanger', changer):
             self.ap.set_channel(channel)
-        changer.assert_called_with(connection=self.connection)
+        changer.assert_called_with(connection=self.connection, pipeline=False)
         self.validator.channel.assert_called_with(channel)
         return 
 
@@ -755,7 +1105,7 @@ class TestAR5KAP(unittest.TestCase):
         changer = MagicMock()
         with patch('apcommand.accesspoints.atheros.AtherosChannelChanger', changer):
             self.ap.set_channel(channel)
-        changer.assert_called_with(connection=self.connection)
+        changer.assert_called_with(connection=self.connection, pipeline=False)
         self.validator.channel.assert_called_with(channel)
         return
 
@@ -768,7 +1118,7 @@ class TestAR5KAP(unittest.TestCase):
         setter = MagicMock()
         with patch('apcommand.accesspoints.atheros.AtherosOpen', setter):
             self.ap.set_security(security_type=security_type)
-        setter.assert_called_with(connection=self.connection)
+        setter.assert_called_with(connection=self.connection, pipeline=False)
         calls = ENTER_CALLS + [call.cfg('-a AP_SECMODE=None')] + EXIT_CALLS
         return
 
@@ -838,6 +1188,69 @@ class TestConfigure(unittest.TestCase):
         self.assertEqual(calls, self.connection.method_calls)
         return
 
+    def test_pipeline(self):
+        """
+        Does a pipelined configure send the settings as one batch and then the commit?
+        """
+        self.connection.exec_batch.side_effect = lambda commands, timeout: [
+            OutputError(StringIO(''), StringIO('')) for command in commands]
+        with Configure(self.connection, 1, pipeline=True) as connection:
+            output, error = connection.cfg('-a AP_SSID=test')
+            self.assertFalse(self.connection.exec_batch.called)
+        commands = ['apdown ', 'cfg -a AP_RADIO_ID=1', 'cfg -a AP_STARTMODE=standard',
+                    'cfg -a AP_SSID=test']
+        self.assertEqual([call.exec_batch(commands, timeout=10),
+                          call.exec_batch(['cfg -c', 'apup '], timeout=10)],
+                         self.connection.method_calls)
+        return
+
+    def test_refused_setting(self):
+        """
+        Is the AP brought back up after a setting is refused?
+        """
+        refused = ['usage: cfg [-a NAME=VALUE] [-r NAME] [-c] [-s] [-x]\n']
+        self.set_context_connection()
+        self.connection.cfg.side_effect = lambda argument: ((refused, '')
+                                                            if 'AP_SSID' in argument
+                                                            else EMPTY_TUPLE)
+        ap = AtherosAR5KAP(connection=self.connection)
+        self.assertRaises(CommandError, ap.set_ssid, 'bad ssid', '2.4')
+        self.assertEqual(call.apup(), self.connection.method_calls[-1])
+
+        # the settings the Configure makes itself are only logged (the AP still comes up)
+        self.connection.reset_mock()
+        self.connection.cfg.side_effect = lambda argument: ((refused, '')
+                                                            if 'AP_STARTMODE' in argument
+                                                            else EMPTY_TUPLE)
+        ap.set_ssid('good_ssid', '2.4')
+        self.assertEqual(call.apup(), self.connection.method_calls[-1])
+        return
+
+    def test_pipeline_error(self):
+        """
+        Does a refused setting stop a pipelined configure before the commit?
+        """
+        refused = 'usage: cfg [-a NAME=VALUE] [-r NAME] [-c] [-s] [-x]\n'
+        self.connection.exec_batch.return_value = [OutputError(StringIO(''), StringIO('')),
+                                                   OutputError(StringIO(''), StringIO('')),
+                                                   OutputError(StringIO(''), StringIO('')),
+                                                   OutputError(StringIO(refused), StringIO(''))]
+        ap = AtherosAR5KAP(connection=self.connection, pipeline=True)
+        self.assertRaises(CommandError, ap.set_ssid, 'bad ssid', '2.4')
+        # the AP is brought back up without committing the settings
+        self.assertEqual(call.exec_batch(['apup '], timeout=10),
+                         self.connection.method_calls[-1])
+        self.assertEqual(2, self.connection.exec_batch.call_count)
+
+        # an error in the with block means nothing is sent
+        self.connection.reset_mock()
+        with self.assertRaises(RuntimeError):
+            with Configure(self.connection, 0, pipeline=True) as connection:
+                connection.cfg('-a AP_SSID=test')
+                raise RuntimeError('bad setting')
+        self.assertFalse(self.connection.exec_batch.called)
+        return
+
 class TestAtheros24(unittest.TestCase):
     def setUp(self):
         self.connection = MagicMock()
@@ -1028,5 +1441,104 @@ class TestAtherosOpen(unittest.TestCase):
         self.setter()
         return
 
+class TestAsyncAR5KAP(unittest.TestCase):
+    def setUp(self):
+        self.loop = EventLoop()
+        self.connection = MagicMock()
+        self.ap = AsyncAtherosAR5KAP(loop=self.loop, connection=self.connection)
+        self.connection.loop = self.loop
+        self.connection.side_effect = self.output
+        for command in 'apdown apup cfg wlanconfig iwconfig ifconfig'.split():
+            getattr(self.connection, command).side_effect = self.output
+        return
+
+    def output(self, *args, **kwargs):
+        output = AsyncOutput(self.loop)
+        self.loop.call_later(0.01, output.set_result, ['line\r\n'])
+        return OutputError(output, StringIO(''))
+
+    def test_constructor(self):
+        """
+        Do the arguments go in the same order as the AtherosAR5KAP's (with the loop last)?
+        """
+        ap = AsyncAtherosAR5KAP('10.0.0.1', 'admin', loop=self.loop)
+        self.assertEqual(('10.0.0.1', 'admin'), (ap.hostname, ap.username))
+        self.assertIs(self.loop, ap._loop)
+        return
+
+    def test_up(self):
+        """
+        Does it wait for the apup output?
+        """
+        self.loop.run_until_complete(self.ap.up())
+        self.connection.apup.assert_called_with()
+        return
+
+    def test_destroy(self):
+        """
+        Does it raise a CommandError if the VAP isn't there?
+        """
+        output = AsyncOutput(self.loop)
+        output.set_result(['wlanconfig: ioctl: No such device\r\n'])
+        self.connection.wlanconfig.side_effect = None
+        self.connection.wlanconfig.return_value = OutputError(output, StringIO(''))
+        self.assertRaises(CommandError, self.loop.run_until_complete,
+                          self.ap.destroy('ath0'))
+        return
+
+    def test_set_channel(self):
+        """
+        Does it send the configuration as the Configure would then check the channel?
+        """
+        output = AsyncOutput(self.loop)
+        output.set_result(['ath0   Current Frequency:5.18 GHz (Channel 36)\r\n'])
+        self.connection.iwlist.return_value = OutputError(output, StringIO(''))
+        self.loop.run_until_complete(self.ap.set_channel(36))
+        self.assertEqual([call.apdown(), call.cfg('-a AP_RADIO_ID=1'),
+                          call.cfg('-a AP_STARTMODE=standard'),
+                          call.cfg('-a AP_CHMODE_2=11NAHT40PLUS'),
+                          call.cfg('-a AP_PRIMARY_CH_2=36'),
+                          call.cfg('-c'), call.apup(), call.iwlist('ath0 channel')],
+                         [c for c in self.connection.method_calls if c[0] != 'loop'])
+        self.connection.iwlist.return_value = OutputError(output, StringIO(''))
+        self.assertRaises(RuntimeError, self.loop.run_until_complete, self.ap.set_channel(1))
+        return
+
+    def test_refused(self):
+        """
+        Does a refused setting stop the configuration before the commit?
+        """
+        def refuse(argument):
+            output = AsyncOutput(self.loop)
+            output.set_result(['usage: cfg [-a NAME=VALUE]\r\n'])
+            return OutputError(output, StringIO(''))
+        self.connection.cfg.side_effect = refuse
+        self.assertRaises(CommandError, self.loop.run_until_complete,
+                          self.ap.set_ssid('bad ssid', '2.4'))
+        # the AP is brought back up without committing the settings
+        self.assertTrue(self.connection.apup.called)
+        self.assertNotIn(call('-c'), self.connection.cfg.mock_calls)
+        return
+
+    def test_concurrent(self):
+        """
+        Do the APs wait at the same time?
+        """
+        aps = []
+        for index in range(10):
+            ap = AsyncAtherosAR5KAP(loop=self.loop, connection=self.connection)
+            aps.append(ap)
+        clock = FakeClock()
+        self.loop.clock = clock
+        with patch('time.sleep', clock.sleep):
+            self.loop.run(aps[0].set_ssid('wifi', '2.4'))
+            alone = clock.now
+            self.loop.run(*(ap.set_ssid('wifi', '2.4') for ap in aps))
+        # ten APs at once take as long as one on its own
+        self.assertAlmostEqual(alone, clock.now - alone)
+        self.assertEqual(11, self.connection.apup.call_count)
+        return
+# end class TestAsyncAR5KAP
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,413 @@
+# this package
+from apcommand.baseclass import BaseClass
+from apcommand.connections.asyncloop import event_loop, Return
+from apcommand.connections.asynchttp import AsyncHTTPConnection, TIMEOUT
+
+from apcommand.accesspoints.broadcom.broadcom import BroadcomBCM94718NR
+from apcommand.accesspoints.broadcom.commons import BroadcomRadioData
+from apcommand.accesspoints.broadcom.commons import BandEnumeration
+from apcommand.accesspoints.broadcom.pagecache import page_cache
+from apcommand.accesspoints.broadcom.parser import DEFAULT_ENGINE
+
+class AsyncQuerier(BaseClass):
+    """
+    A non-blocking wrapper around a Broadcom querier
+    """
+    def __init__(self, querier, connection, fetches=None):
+        """
+        AsyncQuerier constructor
+
+        :param:
+
+         - `querier`: a BroadcomBaseQuerier (its connection's PageCache gets the pages)
+         - `connection`: AsyncHTTPConnection to the same AP
+         - `fetches`: dictionary of PageCacheKey: Task shared with the other AsyncQueriers for the AP
+        """
+        super(AsyncQuerier, self).__init__()
+        self.querier = querier
+        self.connection = connection
+        self.fetches = fetches if fetches is not None else {}
+        return
+
+    def fetch(self):
+        """
+        Starts putting the querier's page in the cache (or joins the Task already getting it)
+
+        :return: Task for the page's html
+        """
+        key = self.querier.cache.key(self.querier.asp_page, self.querier.data)
+        task = self.fetches.get(key)
+        if task is None or task.done:
+            task = self.fetches[key] = self.connection.loop.spawn(self.load())
+        return task
+
+    def load(self):
+        """
+        Coroutine to put the querier's page in the cache (if it isn't there)
+
+        :raise: Return with the page's html
+        """
+        querier = self.querier
+        cache = querier.cache
+        if querier.refresh:
+            cache.invalidate(querier.asp_page, querier.data)
+        text = cache.cached(querier.asp_page, querier.data)
+        if text is None:
+            generation = cache.generation(querier.asp_page, querier.data)
+            response = yield self.connection(path=querier.asp_page, data=querier.data)
+            text = response.text
+            cache.store(querier.asp_page, querier.data, text, generation)
+        raise Return(text)
+
+    def get(self, attribute):
+        """
+        Coroutine to get one of the querier's settings
+
+        :param:
+
+         - `attribute`: name of the querier's property (e.g. 'channel')
+
+        :raise: Return with the setting
+        """
+        yield self.fetch()
+        # the page was just fetched, so don't let a refreshing querier fetch it again
+        refresh, self.querier.refresh = self.querier.refresh, False
+        try:
+            value = getattr(self.querier, attribute)
+        finally:
+            self.querier.refresh = refresh
+        raise Return(value)
+# end class AsyncQuerier
+
+class AsyncBroadcomBCM94718NR(BroadcomBCM94718NR):
+    """
+    A non-blocking BroadcomBCM94718NR (the methods return Tasks)
+    """
+    def __init__(self, hostname='192.168.1.1', username='',
+                 password='admin', sleep=0.1, adaptive=False, timeout=TIMEOUT,
+                 loop=None, engine=DEFAULT_ENGINE):
+        """
+        AsyncBroadcomBCM94718NR Constructor
+
+        :param:
+
+         - `hostname`: address of the AP
+         - `username`: login username (use empty string if none)
+         - `password`: login password (use empty string if none)
+         - `sleep`: seconds to sleep after a call to the web server
+         - `adaptive`: if True learn shorter sleeps for the pages that can take them
+         - `timeout`: seconds to wait for the web server
+         - `loop`: The EventLoop to use (default is the shared event_loop)
+         - `engine`: name of the soup engine to parse the pages with
+        """
+        super(AsyncBroadcomBCM94718NR, self).__init__(hostname=hostname,
+                                                      username=username,
+                                                      password=password,
+                                                      sleep=sleep,
+                                                      adaptive=adaptive,
+                                                      engine=engine)
+        self.timeout = timeout
+        self._loop = loop
+        self._async_connection = None
+        self.fetches = {}
+        return
+
+    @property
+    def loop(self):
+        """
+        The EventLoop for the AP
+        """
+        if self._loop is None:
+            self._loop = event_loop
+        return self._loop
+
+    @property
+    def async_connection(self):
+        """
+        An AsyncHTTPConnection to the AP (paced with the same host limiter and pacer as `connection`)
+        """
+        if self._async_connection is None:
+            self._async_connection = AsyncHTTPConnection(hostname=self.hostname,
+                                                         username=self.username,
+                                                         password=self.password,
+                                                         rest=self.sleep,
+                                                         adaptive=self.adaptive,
+                                                         timeout=self.timeout,
+                                                         path=BroadcomRadioData.radio_page,
+                                                         loop=self.loop)
+        return self._async_connection
+
+    def asynchronous(self, querier):
+        """
+        Wraps the querier (the wrappers share the page fetches)
+
+        :param:
+
+         - `querier`: one of the queriers (e.g. self.query['5'])
+
+        :return: AsyncQuerier
+        """
+        return AsyncQuerier(querier, self.async_connection, self.fetches)
+
+    def ask(self, querier, attribute):
+        """
+        Gets one of a querier's settings
+
+        :param:
+
+         - `querier`: one of the queriers (e.g. self.query['5'])
+         - `attribute`: name of the querier's property
+
+        :return: Task for the setting
+        """
+        return self.loop.spawn(self.asynchronous(querier).get(attribute))
+
+    def send(self, command):
+        """
+        Coroutine to call a command without blocking
+
+        :param:
+
+         - `command`: a BroadcomBaseCommand (with its band set)
+        """
+        if command.reads_previous:
+            yield self.asynchronous(command.querier).fetch()
+        command.store()
+        yield self.async_connection(path=command.asp_page, data=command.data)
+        command.invalidate()
+        return
+
+    def get_channel(self, band):
+        """
+        Gets the channel for the given band (uses only first character)
+
+        :return: Task for the channel
+        """
+        return self.ask(self.query[band[0]], 'channel')
+
+    def get_ssid(self, band):
+        """
+        Gets the ssid for the interface matching the band
+
+        :return: Task for the SSID
+        """
+        return self.ask(self.ssid_query[band[0]], 'ssid')
+
+    def get_state(self, band):
+        """
+        Gets the state of the interface for the band
+
+        :return: Task for ``Disabled`` or ``Enabled``
+        """
+        return self.ask(self.query[band[0]], 'state')
+
+    def status_lines(self, band):
+        """
+        Coroutine to get the pages for the status, then build it
+
+        :param:
+
+         - `band`: '2.4', '5', or 'both'
+
+        :raise: Return with the list of status strings
+        """
+        queriers = self.status_reader.queriers(band)
+        # the requests are queued on the connection in this order
+        yield self.loop.gather(*(self.asynchronous(querier).fetch() for querier in queriers))
+        # the pages are in the page-cache now so the reader doesn't fetch them
+        raise Return(self.status_reader(band).lines())
+
+    def get_status(self, band):
+        """
+        Gets the status of the AP
+
+        :param:
+
+         - `band`: '2.4', '5', or 'both'
+
+        :return: Task for the list of status strings
+        """
+        return self.loop.spawn(self.status_lines(band))
+
+    def set_ssid(self, band, ssid):
+        """
+        Sets a band's SSID
+
+        :param:
+
+         - `band`: '2.4' or '5'
+         - `ssid`: the new SSID
+
+        :return: Task that finishes once it's set
+        """
+        return self.loop.spawn(self.send(self.ssid_command(band, ssid)))
+
+    def set_5_ssid(self, ssid):
+        """
+        Sets the 5 Ghz band SSID
+
+        :return: Task that finishes once it's set
+        """
+        return self.set_ssid('5', ssid)
+
+    def set_24_ssid(self, ssid):
+        """
+        Sets the 2.4 Ghz band SSID
+
+        :return: Task that finishes once it's set
+        """
+        return self.set_ssid('2.4', ssid)
+
+    def change_channel(self, channel):
+        """
+        Coroutine to send the ChannelChanger's commands in order
+        """
+        for command in self.channel_changer.commands(channel):
+            yield self.loop.spawn(self.send(command))
+        return
+
+    def set_channel(self, channel):
+        """
+        Sets the wifi channel (and disables the other interface)
+
+        :param:
+
+         - `channel`: wifi channel to set
+
+        :return: Task that finishes once it's set
+        :raise: BroadcomError if the channel isn't a Broadcom channel
+        """
+        # check the channel now instead of failing in the Task
+        self.channel_changer.commands(channel)
+        return self.loop.spawn(self.change_channel(channel))
+
+    def disable(self, band):
+        """
+        Disables the interface for the band
+
+        :return: Task that finishes once it's disabled
+        """
+        self.disable_command.band = band
+        return self.loop.spawn(self.send(self.disable_command))
+
+    def enable(self, band):
+        """
+        Enables the interface for the band
+
+        :return: Task that finishes once it's enabled
+        """
+        self.enable_command.band = band
+        return self.loop.spawn(self.send(self.enable_command))
+# end class AsyncBroadcomBCM94718NR
+
+# python standard library
+import time
+import unittest
+
+# third-party
+from mock import patch
+
+# this package
+from apcommand.connections.asyncloop import EventLoop
+from apcommand.accesspoints.broadcom.commands import BroadcomBaseCommand
+from apcommand.accesspoints.broadcom.commons import BroadcomError
+from apcommand.accesspoints.broadcom.status import CHANNEL_STRING, DHCP_STRING
+from apcommand.benchmarks.fakebroadcom import FakeBroadcomServer
+
+class TestAsyncBroadcomBCM94718NR(unittest.TestCase):
+    def setUp(self):
+        self.loop = EventLoop()
+        self.servers = []
+        self.aps = []
+        return
+
+    def tearDown(self):
+        for ap in self.aps:
+            if isinstance(ap, AsyncBroadcomBCM94718NR):
+                ap.async_connection.close()
+            ap.connection.close()
+        for server in self.servers:
+            server.stop()
+        return
+
+    def access_point(self, latency=0):
+        server = FakeBroadcomServer(latency=latency)
+        server.start()
+        self.servers.append(server)
+        ap = AsyncBroadcomBCM94718NR(hostname=server.hostname, sleep=0,
+                                     adaptive=False, loop=self.loop)
+        self.aps.append(ap)
+        return ap
+
+    def test_get(self):
+        """
+        Does it get the settings from the pages?
+        """
+        ap = self.access_point()
+        self.assertEqual(['44', 'hownowbrowndog', 'Enabled'],
+                         self.loop.run(ap.get_channel('5'), ap.get_ssid('2.4'),
+                                       ap.get_state('5')))
+        # the radio.asp for the 5 GHz band was only fetched once
+        self.assertEqual(2, len(self.servers[0].requests))
+        return
+
+    def test_status(self):
+        """
+        Does it get each page once and build the same lines as the blocking status?
+        """
+        ap = self.access_point()
+        lines = self.loop.run_until_complete(ap.get_status(BandEnumeration.both))
+        self.assertEqual(6, len(self.servers[0].requests))
+        blocking = BroadcomBCM94718NR(hostname=self.servers[0].hostname, sleep=0,
+                                      adaptive=False)
+        self.aps.append(blocking)
+        self.assertEqual(['2.4 GHz:', CHANNEL_STRING.format(blocking.get_channel('2.4')),
+                          '5 GHz:', CHANNEL_STRING.format(blocking.get_channel('5'))],
+                         [line for line in lines if 'GHz' in line or 'Channel' in line])
+        self.assertEqual(DHCP_STRING.format(blocking.lan_query.dhcp_state), lines[-4])
+        # the blocking AP's scheduled fetches read the same status
+        self.assertEqual(lines, blocking.read_status(BandEnumeration.both).lines())
+        return
+
+    def test_concurrent(self):
+        """
+        Do the APs wait at the same time?
+        """
+        aps = [self.access_point(latency=0.2) for index in range(4)]
+        start = time.time()
+        self.assertEqual(['44'] * 4, self.loop.run(*(ap.get_channel('5') for ap in aps)))
+        self.assertLess(time.time() - start, 0.2 * 3)
+        return
+
+    def test_set_channel(self):
+        """
+        Does it send the ChannelChanger's commands and forget the changed page?
+        """
+        ap = self.access_point()
+        self.assertRaises(BroadcomError, ap.set_channel, 15)
+        self.loop.run_until_complete(ap.get_channel('5'))
+        with patch.object(BroadcomBaseCommand, 'store') as store:
+            self.loop.run_until_complete(ap.set_channel(44))
+        self.assertEqual(2, store.call_count)
+        forms = [request.form for request in self.servers[0].requests
+                 if request.form.get('action') == 'Apply']
+        self.assertEqual(['0', '1'], [form['wl_unit'] for form in forms])
+        self.assertEqual('44', forms[1]['wl_channel'])
+        self.assertIsNone(page_cache(ap.connection).cached(BroadcomRadioData.radio_page,
+                                                           {'wl_unit': '1'}))
+        return
+
+    def test_set_ssid(self):
+        """
+        Does it send the SetSSID command's form for the band and forget the old SSID?
+        """
+        ap = self.access_point()
+        self.assertEqual('hownowbrowndog', self.loop.run_until_complete(ap.get_ssid('5')))
+        self.loop.run_until_complete(ap.set_5_ssid('benchmark'))
+        form = self.servers[0].requests[-1].form
+        self.assertEqual(('Apply', '1', 'benchmark'),
+                         (form['action'], form['wl_unit'], form['wl_ssid']))
+        self.assertEqual('benchmark', self.loop.run_until_complete(ap.get_ssid('5')))
+        self.assertEqual('hownowbrowndog', self.loop.run_until_complete(ap.get_ssid('2.4')))
+        return
+# end class TestAsyncBroadcomBCM94718NR
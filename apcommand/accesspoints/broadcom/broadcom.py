@@ -8,26 +8,21 @@ import apcommand.connections.httpconnection as httpconnection
 
 from apcommand.accesspoints.broadcom.commons import BroadcomRadioData
 from apcommand.accesspoints.broadcom.commons import BandEnumeration
-from apcommand.accesspoints.broadcom.commons import SSID, SSID_PAGE
-from apcommand.accesspoints.broadcom.commons import set_24_data, set_5_data, ssid_page
 from apcommand.accesspoints.broadcom.querier import BroadcomRadioQuerier, BroadcomSSIDQuerier
 from apcommand.accesspoints.broadcom.querier import BroadcomLANQuerier
+from apcommand.accesspoints.broadcom.querier import set_soup_engine
+from apcommand.accesspoints.broadcom.parser import DEFAULT_ENGINE
+from apcommand.accesspoints.broadcom.pagecache import page_cache
 from apcommand.accesspoints.broadcom.firmware import BroadcomFirmwareQuerier
 from apcommand.accesspoints.broadcom.macros import ChannelChanger
+from apcommand.accesspoints.broadcom.status import StatusReader
+from apcommand.accesspoints.broadcom.scheduler import FetchScheduler
+from apcommand.accesspoints.broadcom.transaction import BroadcomTransaction
 
 # for some reason Pweave sometimes accepts relative paths, sometimes not
 from apcommand.accesspoints.broadcom.commands import DisableInterface
 from apcommand.accesspoints.broadcom.commands import EnableInterface
-
-BAND_STRING = '{0} GHz:'
-CHANNEL_STRING = '\tChannel: {0}'
-SSID_STRING = '\tSSID: {0}'
-STATE_STRING = '\tState: {0}'
-SIDEBAND_STRING = '\tSideband: {0}'
-DHCP_STRING = 'DHCP: {0}'
-BOOTLOADER_STRING = 'Bootloader Version: {0}'
-OS_STRING = 'OS Version: {0}'
-WL_DRIVER_STRING = 'WL Driver Version: {0}'
+from apcommand.accesspoints.broadcom.commands import SetSSID
 
 class RadioPageConnection(BaseClass):
     """
@@ -66,7 +61,8 @@ class BroadcomBCM94718NR(BaseClass):
     A class to control and query the Broadcom BCM94718NR
     """
     def __init__(self, hostname='192.168.1.1', username='',
-                 password='admin', sleep=0.1):
+                 password='admin', sleep=0.1, adaptive=False, engine=DEFAULT_ENGINE,
+                 skip_unchanged=False):
         """
         BroadcomBCM94718NR Constructor
 
@@ -76,12 +72,18 @@ class BroadcomBCM94718NR(BaseClass):
          - `username`: login username (use empty string if none)
          - `password`: login password (use empty string if none)
          - `sleep`: seconds to sleep after a call to the web server
+         - `adaptive`: if True learn shorter sleeps for the pages that can take them
+         - `engine`: name of the soup engine to parse the pages with
+         - `skip_unchanged`: if True don't send the commands that wouldn't change anything
         """
         super(BroadcomBCM94718NR, self).__init__()
         self.hostname = hostname
         self.username = username
         self.password = password
         self.sleep = sleep
+        self.adaptive = adaptive
+        self.engine = engine
+        self.skip_unchanged = skip_unchanged
         self._connection = None
         self._enable_command = None
         self._disable_command = None
@@ -92,8 +94,31 @@ class BroadcomBCM94718NR(BaseClass):
         self._ssid_query = None
         self._lan_query = None
         self._firmware_query = None
+        self._status_reader = None
+        self._scheduler = None
         return
 
+    @property
+    def status_reader(self):
+        """
+        A StatusReader for the queriers
+        """
+        if self._status_reader is None:
+            self._status_reader = StatusReader(query=self.query,
+                                               ssid_query=self.ssid_query,
+                                               lan_query=self.lan_query,
+                                               firmware_query=self.firmware_query)
+        return self._status_reader
+
+    @property
+    def scheduler(self):
+        """
+        A FetchScheduler to get the pages for the queriers at the same time
+        """
+        if self._scheduler is None:
+            self._scheduler = FetchScheduler(connection=self.connection)
+        return self._scheduler
+
     @property
     def firmware_query(self):
         """
@@ -119,7 +144,8 @@ class BroadcomBCM94718NR(BaseClass):
         A command to disable a wireless interface
         """
         if self._disable_command is None:
-            self._disable_command = DisableInterface(connection=self.connection)
+            self._disable_command = DisableInterface(connection=self.connection,
+                                                     skip_unchanged=self.skip_unchanged)
         return self._disable_command
 
     @property
@@ -128,7 +154,8 @@ class BroadcomBCM94718NR(BaseClass):
         a commanad to enable a wireless interface
         """
         if self._enable_command is None:
-            self._enable_command = EnableInterface(connection=self.connection)
+            self._enable_command = EnableInterface(connection=self.connection,
+                                                   skip_unchanged=self.skip_unchanged)
         return self._enable_command
 
     @property
@@ -137,7 +164,8 @@ class BroadcomBCM94718NR(BaseClass):
         A BroadcomChannelChanger
         """
         if self._channel_changer is None:
-            self._channel_changer = ChannelChanger(connection=self.connection)
+            self._channel_changer = ChannelChanger(connection=self.connection,
+                                                   skip_unchanged=self.skip_unchanged)
         return self._channel_changer
 
     @property
@@ -159,9 +187,9 @@ class BroadcomBCM94718NR(BaseClass):
         """
         if self._ssid_query is None:
             self._ssid_query = {'2':BroadcomSSIDQuerier(connection=self.connection,
-                                                    band='5'),
-                                                    '5':BroadcomSSIDQuerier(connection=self.connection,
-                                                      band='2.4')}
+                                                        band='2.4'),
+                                '5':BroadcomSSIDQuerier(connection=self.connection,
+                                                        band='5')}
         return self._ssid_query
 
     @property
@@ -176,27 +204,50 @@ class BroadcomBCM94718NR(BaseClass):
                                                              username=self.username,
                                                              password=self.password,
                                                              rest=self.sleep,
+                                                             adaptive=self.adaptive,
                                                              path=BroadcomRadioData.radio_page)
+            set_soup_engine(self._connection, self.engine)
         return self._connection
 
-    @ssid_page
+    def transaction(self, commands=None):
+        """
+        Makes a transaction to send commands to the AP in the fewest requests
+
+        :param:
+
+         - `commands`: collection of commands to start the transaction with
+
+        :return: BroadcomTransaction using this AP's connection
+        """
+        return BroadcomTransaction(self.connection, commands)
+
+    def ssid_command(self, band, ssid):
+        """
+        Makes a command to set a band's SSID (without calling it)
+
+        :param:
+
+         - `band`: '2.4' or '5'
+         - `ssid`: the new SSID
+
+        :return: SetSSID command
+        """
+        command = SetSSID(connection=self.connection, band=band)
+        command.ssid = ssid
+        return command
+
     def set_5_ssid(self, ssid):
         """
         Sets the 5 Ghz band SSID
         """
-        data = set_5_data()
-        data[SSID] = ssid
-        self.connection(data=data)
+        self.ssid_command('5', ssid)()
         return
 
-    @ssid_page
     def set_24_ssid(self, ssid):
         """
         Sets the 2.4 Ghz band SSID
         """
-        data = set_24_data()
-        data[SSID] = ssid
-        self.connection(data=data)
+        self.ssid_command('2.4', ssid)()
         return
 
     def get_ssid(self, band):
@@ -240,29 +291,35 @@ class BroadcomBCM94718NR(BaseClass):
 
         :postcondition: status strings sent to stdout and logged
         """
-        if band is not BandEnumeration.both:
-            self.log_status(band)
-        else:
-            bands = (BandEnumeration.two_point_four, BandEnumeration.five)
-            for band in bands:
-                self.log_status(band)
+        status = self.read_status(band)
+        for band_status in status.bands:
+            for line in band_status.lines():
+                self.print_and_log(line)
         print()
-        self.print_and_log(DHCP_STRING.format(self.lan_query.dhcp_state))
-        self.print_and_log(BOOTLOADER_STRING.format(self.firmware_query.bootloader_version))
-        self.print_and_log(OS_STRING.format(self.firmware_query.os_version))
-        self.print_and_log(WL_DRIVER_STRING.format(self.firmware_query.wl_driver_version))
+        for line in status.device_lines():
+            self.print_and_log(line)
         return
 
+    def read_status(self, band=BandEnumeration.both):
+        """
+        Gets the status of the AP (each page it needs is fetched once)
+
+        :param:
+
+         - `band`: '2.4', '5', or 'both'
+
+        :return: BroadcomStatus
+        """
+        report = self.scheduler.fetch(self.status_reader.queriers(band))
+        self.logger.debug("Overlapping the page fetches saved {0:.3f} seconds".format(report.saved))
+        return self.status_reader(band)
+
     def log_status(self, band):
         """
         Prints and logs the status for a single band
         """
-        self.print_and_log(BAND_STRING.format(band))
-        self.print_and_log(CHANNEL_STRING.format(self.get_channel(band)))            
-        self.print_and_log(SSID_STRING.format(self.get_ssid(band)))
-        self.print_and_log(STATE_STRING.format(self.query[band[0]].state))
-        if band.startswith('5'):
-            self.print_and_log(SIDEBAND_STRING.format(self.query[band[0]].sideband))
+        for line in self.status_reader.read_band(band).lines():
+            self.print_and_log(line)
         return
 
     def unset_channel(self):
@@ -295,4 +352,31 @@ class BroadcomBCM94718NR(BaseClass):
         self.enable_command.band = band
         self.enable_command()
         return
-# end Class BroadcomBCM94718NR
\ No newline at end of file
+# end Class BroadcomBCM94718NR
+
+# python standard library
+import unittest
+
+# third-party
+from mock import MagicMock
+
+
+class TestBroadcomBCM94718NR(unittest.TestCase):
+    def setUp(self):
+        self.connection = MagicMock(name='connection')
+        self.connection.return_value.text = open('ssid_asp.html').read()
+        self.ap = BroadcomBCM94718NR()
+        self.ap._connection = self.connection
+        return
+
+    def test_get_ssid(self):
+        """
+        Does each band's SSID come from its own interface (wl_unit)?
+        """
+        self.ap.get_ssid('2.4')
+        self.assertEqual('ssid.asp', self.connection.path)
+        self.assertEqual('0', self.connection.call_args[1]['data']['wl_unit'])
+        self.ap.get_ssid('5')
+        self.assertEqual('1', self.connection.call_args[1]['data']['wl_unit'])
+        return
+# end class TestBroadcomBCM94718NR
@@ -1,8 +1,6 @@
 
 # python standard library
 from abc import ABCMeta, abstractproperty, abstractmethod
-from contextlib import closing
-import shelve
 
 # this package
 from apcommand.baseclass import BaseClass
@@ -11,8 +9,10 @@ from apcommand.baseclass import BaseClass
 from commons import action_dict, radio_page
 from commons import BroadcomWirelessData, BroadcomRadioData
 from commons import BroadcomPages, set_page
-from commons import BandEnumeration
+from commons import BandEnumeration, SSID
 from querier import BroadcomRadioQuerier, BroadcomSSIDQuerier
+from pagecache import page_cache
+from journal import undo_journal
 
 class BroadcomBaseData(object):
     """
@@ -83,12 +83,45 @@ class BroadcomBaseData(object):
                                                              self.base_5_ghz_data(),
                                                              self.base_24_ghz_data())
 
+
+# values the AP sends for its interface_state
+ENABLED = 'Enabled'
+
+
+def radio_value(querier):
+    """
+    The wl_radio value for the querier's interface state
+    """
+    if querier.state == ENABLED:
+        return BroadcomRadioData.radio_on
+    return BroadcomRadioData.radio_off
+
+
+def sideband_value(querier):
+    """
+    The wl_nctrlsb value for the querier's sideband (None for 2.4 GHz)
+    """
+    sideband = querier.sideband
+    if sideband is None:
+        return None
+    return sideband.lower()
+
+# radio.asp form-field: function to read its current value from a BroadcomRadioQuerier
+CURRENT_VALUES = {BroadcomRadioData.interface: radio_value,
+                  BroadcomRadioData.control_channel: lambda querier: querier.channel,
+                  BroadcomRadioData.sideband: sideband_value}
+
+
 class BroadcomBaseCommand(BaseClass):
     """
     A base-class for the commands that change settings
     """
     __metaclass__ = ABCMeta
-    def __init__(self, connection, band=None):
+    # True if the shelf_objects ask the querier for the AP's current settings
+    reads_previous = False
+    # False if the command has no undo (so there's nothing to journal)
+    journaled = True
+    def __init__(self, connection, band=None, skip_unchanged=False):
         """
         BroadcomBaseCommand constructor
 
@@ -96,11 +129,13 @@ class BroadcomBaseCommand(BaseClass):
 
          - `connection`: A connection to the AP (HTTPConnection)
          - `band`: 2.4, 5, or None (chooses the data-dictionary)
+         - `skip_unchanged`: if True don't send the data if the AP already has the settings
         """
         super(BroadcomBaseCommand, self).__init__()
         self._logger = None
         self.connection = connection
         self._band = band
+        self.skip_unchanged = skip_unchanged
         self._base_data = None
         self._singular_data = None
         self._added_data = None
@@ -108,7 +143,7 @@ class BroadcomBaseCommand(BaseClass):
         self._data = None
         self.previous_state = None
         self._querier = None
-        self._shelf_name = None
+        self._journal = None
         self._shelf_objects = None
         self._shelf_key = None
         self._asp_page = None
@@ -128,6 +163,7 @@ class BroadcomBaseCommand(BaseClass):
         if self._shelf_key is None:
             self._shelf_key = "{0}_{1}".format(self.__module__,
                                                self.__class__.__name__)
+        return self._shelf_key
 
     @property
     def shelf_objects(self):
@@ -137,13 +173,20 @@ class BroadcomBaseCommand(BaseClass):
         return {self.shelf_key:self.singular_data}
 
     @property
-    def shelf_name(self):
+    def journal(self):
+        """
+        The UndoJournal to keep the shelf_objects in
+        """
+        if self._journal is None:
+            self._journal = undo_journal()
+        return self._journal
+
+    @property
+    def host(self):
         """
-        A name to use for any shelves created
+        The AP's hostname (the journal keeps each AP's history separately)
         """
-        if self._shelf_name is None:
-            self._shelf_name = "{0}.shelve".format(__package__.split('.')[0])
-        return self._shelf_name
+        return getattr(self.connection, 'hostname', None)
 
     @property
     def querier(self):
@@ -226,6 +269,29 @@ class BroadcomBaseCommand(BaseClass):
             self._data.update(self.non_base_data)
         return self._data
 
+    @property
+    def current_data(self):
+        """
+        The AP's current values for the fields in non_base_data
+
+        :return: dictionary of field: value (None if a field can't be read)
+        """
+        if self.asp_page != BroadcomPages.radio:
+            return None
+        fields = self.non_base_data
+        if not fields or any(field not in CURRENT_VALUES for field in fields):
+            return None
+        return dict((field, CURRENT_VALUES[field](self.querier)) for field in fields)
+
+    def unchanged(self):
+        """
+        Checks if sending the data would leave the AP's settings as they are
+
+        :return: True if the AP already has every setting in non_base_data
+        """
+        current = self.current_data
+        return current is not None and current == self.non_base_data
+
     def __iadd__(self, other):
         """
         Adds the other's non_base_data to this added_data
@@ -242,7 +308,8 @@ class BroadcomBaseCommand(BaseClass):
         **For this to work the sub-classes can't change the constructor interface**
         """
         new_object = self.__class__(connection=self.connection,
-                                    band=self.band)
+                                    band=self.band,
+                                    skip_unchanged=self.skip_unchanged)
         new_object.added_data.update(other.non_base_data)
         return new_object
 
@@ -253,7 +320,8 @@ class BroadcomBaseCommand(BaseClass):
         :return: object with this data minus other's non_base_data
         """
         new_object = self.__class__(connection=self.connection,
-                                    band=self.band)
+                                    band=self.band,
+                                    skip_unchanged=self.skip_unchanged)
         new_object._added_data = self.added_data.copy()
         
         for key in other.non_base_data.iterkeys():
@@ -266,8 +334,27 @@ class BroadcomBaseCommand(BaseClass):
         """
         The main method to change settings 
         """
+        if self.skip_unchanged and self.unchanged():
+            self.logger.info("Not sending {0}, the AP already has it".format(self.non_base_data))
+            return
         self.store()
+        self.send()
+        return
+
+    @set_page
+    def send(self):
+        """
+        Sends the data without journaling it (the undo uses this)
+        """
         self.connection(data=self.data)
+        self.invalidate()
+        return
+
+    def invalidate(self):
+        """
+        Tells the connection's page-cache to forget the changed page (for every wl_unit)
+        """
+        page_cache(self.connection).invalidate(self.asp_page)
         return
 
     def undo(self):
@@ -281,27 +368,34 @@ class BroadcomBaseCommand(BaseClass):
 
     def store(self):
         """
-        shelve data from this class (use in __call__, not meant for public)
+        journal data from this class (use in __call__, not meant for public)
 
-        :precondition: self.shelf_objects is a dictionary of things to shelve
-        :postocondition: objects is shelf_objects is shelved
+        :precondition: self.shelf_objects is a dictionary of things to journal
+        :postcondition: shelf_objects are appended to the journal for this AP and band
         """
-        with closing(shelve.open(self.shelf_name, writeback=True)) as open_shelf:
-            for key, value in self.shelf_objects.iteritems():
-                open_shelf[key] = value
+        if not self.journaled:
+            return
+        self.journal.append(self.host, self.band, self.shelf_objects)
         return
 
     def load(self):
         """ 
-        Loads the shelved data for the undo method
+        Loads the newest journaled data (without undoing it)
         (to prevent circular calls using shelf_objects' keys, just uses shelf_key)
 
-        :return: dictionary of objects using shelf_objects' keys
-        :raise: KeyError if an item in shelf_objects isn't on the shelf
+        :return: the object journaled with the shelf_key
+        :raise: KeyError if there isn't an entry for the shelf_key
+        """
+        return self.journal.latest(self.host, self.shelf_key, self.band).value
+
+    def pop(self):
         """
-        with closing(shelve.open(self.shelf_name, flag='r')) as open_shelf:
-            data = open_shelf[self.shelf_key]
-        return data
+        Takes the newest journaled data for the undo method (so the next undo goes back further)
+
+        :return: the object journaled with the shelf_key
+        :raise: KeyError if there isn't an entry for the shelf_key
+        """
+        return self.journal.pop(self.host, self.shelf_key, self.band).value
 
 # end class BroadcomBaseCommand
 
@@ -314,6 +408,7 @@ class EnableInterface(BroadcomBaseCommand):
     """
     An interface enabler
     """
+    reads_previous = True
     def __init__(self, *args, **kwargs):
         super(EnableInterface, self).__init__(*args, **kwargs)
         self._enable_24_data = None
@@ -355,11 +450,12 @@ class EnableInterface(BroadcomBaseCommand):
         This is actually just a call to DisableInterface...
         """
         try:
-            self.band = self.load()
-            self.disable()
+            self.band = self.pop()
+            self.disable.band = self.band
+            self.disable.send()
         except KeyError as error:
             self.logger.debug(error)
-            self.logger.debug('No entry on the shelf for {0}'.format(self.shelf_key))
+            self.logger.debug('No entry in the journal for {0}'.format(self.shelf_key))
         return
 
     @property
@@ -428,17 +524,6 @@ class DisableInterface(BroadcomBaseCommand):
                                            band=self.band)
         return self._enable                                           
 
-    @property
-    def querier(self):
-        """
-        A querier to get the previous state
-        """
-        if self._querier is None:
-            self._querier = BroadcomQuerier(connection=self.connection,
-                                            refresh=True,
-                                            band=self.band)
-        return self._querier
-
     @property
     def shelf_objects(self):
         """
@@ -451,11 +536,12 @@ class DisableInterface(BroadcomBaseCommand):
         enables the interface 
         """
         try:
-            self.band = self.load()
-            self.enable()
+            self.band = self.pop()
+            self.enable.band = self.band
+            self.enable.send()
         except KeyError as error:
             self.logger.debug(error)
-            self.logger.debug('No entry on the shelf for {0}'.format(self.shelf_key))    
+            self.logger.debug('No entry in the journal for {0}'.format(self.shelf_key))    
         return
 
     @property
@@ -499,6 +585,7 @@ class SetChannel(BroadcomBaseCommand):
     """
     A channel setter for the AP
     """
+    reads_previous = True
     def __init__(self, *args, **kwargs):
         super(SetChannel, self).__init__(*args, **kwargs)
         self._channel_map = None
@@ -565,20 +652,21 @@ class SetChannel(BroadcomBaseCommand):
 
     def undo(self):
         """
-        Sets the channels found on the shelve
+        Sets the newest channel in the journal (each undo goes back one more channel)
         """
         try:
-            self.channel = self.load()
-            self()
+            self.channel = self.pop()
+            self.send()
         except KeyError as error:
             self.logger.debug(error)
-            self.logger.debug("No entry on shelf for {0}".format(self.shelf_key))
+            self.logger.debug("No entry in the journal for {0}".format(self.shelf_key))
         return
 
 class SetSideband(BroadcomBaseCommand):
     """
     A side-band ('upper' or 'lower') setter
     """
+    journaled = False
     def __init__(self, *args, **kwargs):
         super(SetSideband, self).__init__(*args, **kwargs)
         self.band = '5'
@@ -621,25 +709,88 @@ class SetSideband(BroadcomBaseCommand):
         #else raise some kind of error
         self._singular_data = {BroadcomRadioData.sideband:self._direction}
         return
-    
-    def __call__(self):
+# end SetSideband
+
+
+class SetSSID(BroadcomBaseCommand):
+    """
+    An SSID setter for one band
+    """
+    journaled = False
+    def __init__(self, *args, **kwargs):
+        super(SetSSID, self).__init__(*args, **kwargs)
+        self._ssid = None
+        return
+
+    @property
+    def asp_page(self):
         """
-        Sets the sideband ('upper' or 'lower') for 5GHz
+        ssid.asp
         """
-        self.connection(data=self.data)
+        if self._asp_page is None:
+            self._asp_page = BroadcomPages.ssid
+        return self._asp_page
+
+    @property
+    def ssid(self):
+        """
+        The SSID to set
+        """
+        return self._ssid
+
+    @ssid.setter
+    def ssid(self, new_ssid):
+        """
+        Sets the ssid and singular_data
+        """
+        self._ssid = new_ssid
+        self._singular_data = {SSID: new_ssid}
+        self._data = self._non_base_data = None
         return
-# end SetSideband
+
+    @property
+    def singular_data(self):
+        """
+        This is a pass-through (it has to be set when given an ssid)
+        """
+        return self._singular_data
+# end class SetSSID
 
 # python standard library
 import unittest
+import os
 import random
+import shutil
 import string
+import tempfile
 
 # third-party
 from mock import MagicMock, call, patch
 
+# this package
+from journal import UndoJournal
+
 random_letters = lambda: ",".join((random.choice(string.letters) for char in xrange(random.randint(1,5))))
 
+
+class JournalTestCase(unittest.TestCase):
+    """
+    A TestCase whose commands journal to a temporary directory (not the working directory)
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.journal = UndoJournal(os.path.join(self.directory, 'apcommand.journal'))
+        self.journal_patch = patch(__name__ + '.undo_journal', return_value=self.journal)
+        self.journal_patch.start()
+        return
+
+    def tearDown(self):
+        self.journal_patch.stop()
+        self.journal.close()
+        shutil.rmtree(self.directory)
+        return
+# end class JournalTestCase
+
 class BadChild(BroadcomBaseCommand):
     def query(self):
         return
@@ -806,9 +957,20 @@ class TestBroadcomCommands(unittest.TestCase):
         self.assertEqual(command_1.data, data_1)
         return
 
-class TestEnableInterface(unittest.TestCase):
+    def test_shelf_key(self):
+        """
+        Is the shelf_key the command's module and class names?
+        """
+        command = SetChannel(connection=self.connection)
+        self.assertEqual("{0}_SetChannel".format(SetChannel.__module__),
+                         command.shelf_key)
+        return
+
+class TestEnableInterface(JournalTestCase):
     def setUp(self):
+        super(TestEnableInterface, self).setUp()
         self.connection = MagicMock(name='connection')
+        self.connection.hostname = '192.168.1.1'
         self.html = MagicMock(name='html')
         self.connection.return_value = self.html
         self.html.text = open('radio_asp.html').read()
@@ -867,6 +1029,7 @@ class TestEnableInterface(unittest.TestCase):
         Does the undo disable the interface?
         """
         connection = MagicMock(name='connection')
+        connection.hostname = '192.168.1.1'
         html = MagicMock(name='html')
         connection.return_value = html
         html.text = open('radio_asp.html').read()
@@ -886,7 +1049,7 @@ class TestEnableInterface(unittest.TestCase):
                             call(data ={'action':'Apply',
                         'wl_unit':'1',
                         'wl_radio':'0'})]
-        self.assertEqual(connection.mock_calls, calls)
+        self.assertEqual(connection.call_args_list, calls)
         self.command.previous_state = 'Enabled'
 
         # the disable checks the state so we need to change the html so it is Disabled
@@ -895,9 +1058,11 @@ class TestEnableInterface(unittest.TestCase):
         #self.assertEqual(self.connection.mock_calls, calls)
         return
 
-class TestDisableInterface(unittest.TestCase):
+class TestDisableInterface(JournalTestCase):
     def setUp(self):
+        super(TestDisableInterface, self).setUp()
         self.connection = MagicMock(name='connection')
+        self.connection.hostname = '192.168.1.1'
         self.html = MagicMock(name='html')
         self.connection.return_value = self.html
         self.html.text = open('radio_5_asp.html').read()
@@ -929,12 +1094,14 @@ class TestDisableInterface(unittest.TestCase):
                         'wl_radio':'0'}
         self.assertEqual(command.data, expected_data)
 
-class TestSetChannel(unittest.TestCase):
+class TestSetChannel(JournalTestCase):
     def setUp(self):
+        super(TestSetChannel, self).setUp()
         self.fake_channel = random_letters()
         self.querier = MagicMock()
         self.querier.channel = self.fake_channel
         self.connection = MagicMock()
+        self.connection.hostname = '192.168.1.1'
         self.command = SetChannel(connection=self.connection)
         self.command._querier = self.querier
         return
@@ -990,6 +1157,31 @@ class TestSetChannel(unittest.TestCase):
         self.assertEqual(self.fake_channel,
                           shelf_objects[command.shelf_key])
         return
+
+    def test_undo(self):
+        """
+        Does each undo set the channel before the last one (for the AP and band)?
+        """
+        journal = self.journal
+        self.command._journal = journal
+        for previous, channel in (('1', '6'), ('6', '11'), ('36', '44')):
+            self.querier.channel = previous
+            self.command.channel = channel
+            # changing the band makes a new querier
+            self.command._querier = self.querier
+            self.command()
+        self.connection.reset_mock()
+        undo = SetChannel(connection=self.connection, band='2.4')
+        undo._journal = journal
+        for step in range(3):
+            undo.undo()
+        self.assertEqual([call(data={'action': 'Apply', 'wl_unit': '0', 'wl_channel': '6'}),
+                          call(data={'action': 'Apply', 'wl_unit': '0', 'wl_channel': '1'})],
+                         self.connection.mock_calls)
+        # the undos aren't journaled, the 5 GHz change is still there
+        self.assertEqual('36', journal.latest('192.168.1.1', undo.shelf_key).value)
+        self.assertRaises(KeyError, undo.load)
+        return
 # end class TestSetChannel
 
 class TestSetSideband(unittest.TestCase):
@@ -1008,4 +1200,102 @@ class TestSetSideband(unittest.TestCase):
                         'wl_nctrlsb':'lower'}
         command()
         self.connection.assert_called_with(data=expected_data)
-        return
\ No newline at end of file
+        return
+
+    def test_invalidate(self):
+        """
+        Does changing the sideband make the queriers get radio.asp again?
+        """
+        cache = page_cache(self.connection)
+        cache.page(BroadcomPages.radio, {'wl_unit': '1'})
+        cache.page(BroadcomPages.lan)
+        command = SetSideband(connection=self.connection)
+        command.direction = 'upper'
+        command()
+        self.assertEqual([BroadcomPages.lan], [key.page for key in cache.pages])
+        return
+
+
+class TestSkipUnchanged(unittest.TestCase):
+    def setUp(self):
+        self.connection = MagicMock(name='connection')
+        html = MagicMock(name='html')
+        self.connection.return_value = html
+        # 5 GHz enabled on channel 44 (lower sideband)
+        html.text = open('radio_5_asp.html').read()
+        self.journal = MagicMock()
+        self.query_call = call(data={'wl_unit': '1'})
+        return
+
+    def command(self, command):
+        command._journal = self.journal
+        command()
+        return self.connection.call_args_list
+
+    def test_current_data(self):
+        """
+        Does it read the fields the command sets from the radio page?
+        """
+        command = SetChannel(connection=self.connection)
+        command.channel = 44
+        sideband = SetSideband(connection=self.connection)
+        sideband.direction = 'lower'
+        command += sideband
+        command += EnableInterface(connection=self.connection, band='5')
+        self.assertEqual({'wl_channel': '44', 'wl_nctrlsb': 'lower', 'wl_radio': '1'},
+                         command.current_data)
+        self.assertTrue(command.unchanged())
+        self.assertIsNone(SetSSID(connection=self.connection, band='5').current_data)
+        return
+
+    def test_skip(self):
+        """
+        Does a command that wouldn't change anything only read the page?
+        """
+        enable = EnableInterface(connection=self.connection, band='5', skip_unchanged=True)
+        self.assertEqual([self.query_call], self.command(enable))
+        channel = SetChannel(connection=self.connection, skip_unchanged=True)
+        channel.channel = 44
+        self.assertEqual([self.query_call], self.command(channel))
+        self.assertEqual([], self.journal.append.mock_calls)
+        sideband = SetSideband(connection=self.connection, skip_unchanged=True)
+        sideband.direction = 'lower'
+        sideband += channel
+        self.assertTrue(sideband.skip_unchanged)
+        self.assertEqual([self.query_call], self.command(sideband))
+        return
+
+    def test_changed(self):
+        """
+        Does a command still send the data if it would change something (or isn't skipping)?
+        """
+        disable = DisableInterface(connection=self.connection, band='5', skip_unchanged=True)
+        self.assertEqual([self.query_call, call(data={'action': 'Apply', 'wl_unit': '1',
+                                                      'wl_radio': '0'})],
+                         self.command(disable))
+        self.connection.reset_mock()
+        page_cache(self.connection).clear()
+        channel = SetChannel(connection=self.connection)
+        channel.channel = 44
+        self.assertEqual([self.query_call, call(data={'action': 'Apply', 'wl_unit': '1',
+                                                      'wl_channel': '44'})],
+                         self.command(channel))
+        return
+# end class TestSkipUnchanged
+
+
+class TestSetSSID(unittest.TestCase):
+    def test_set_ssid(self):
+        """
+        Does it send the ssid for its band to ssid.asp (without journaling it)?
+        """
+        connection = MagicMock()
+        command = SetSSID(connection=connection, band='5')
+        command._journal = MagicMock()
+        command.ssid = 'ummagumma'
+        command()
+        connection.assert_called_with(data={'action': 'Apply', 'wl_unit': '1',
+                                            'wl_ssid': 'ummagumma'})
+        self.assertEqual(BroadcomPages.ssid, connection.path)
+        self.assertEqual([], command._journal.mock_calls)
+        return
@@ -6,7 +6,7 @@ import re
 from bs4 import BeautifulSoup
 
 # this package
-from apcommand.accesspoints.broadcom.parser import BroadcomBaseSoup
+from apcommand.accesspoints.broadcom.parser import BroadcomBaseSoup, FIELD_ENGINES
 from apcommand.accesspoints.broadcom.commons import BroadcomPages
 from apcommand.accesspoints.broadcom.querier import BroadcomBaseQuerier
 
@@ -14,6 +14,7 @@ EMPTY_STRING = ''
 BOOTLOADER = 1
 OS_VERSION = 3
 WL_DRIVER = 5
+UPGRADE_FORM = 'upgrade.cgi'
 
 class BroadcomFirmwareSoup(BroadcomBaseSoup):
     """
@@ -31,6 +32,8 @@ class BroadcomFirmwareSoup(BroadcomBaseSoup):
         """
         Get the data of at table-data index
         """
+        if self.engine in FIELD_ENGINES:
+            return self.cells(UPGRADE_FORM)[index]
         data = self.soup('form', attrs={'action': 'upgrade.cgi'})[0]('table')[0]('td')
         return self.extractor_expression.sub(EMPTY_STRING, str(data[index]))
     
@@ -88,7 +91,7 @@ class BroadcomFirmwareQuerier(BroadcomBaseQuerier):
         A BroadcomFirmwareSoup
         """
         if self._soup is None:
-            self._soup = BroadcomFirmwareSoup()
+            self._soup = BroadcomFirmwareSoup(engine=self.engine)
         return self._soup
 
     @property
@@ -104,4 +107,28 @@ class BroadcomFirmwareQuerier(BroadcomBaseQuerier):
     @property
     def wl_driver_version(self):
         self.set_soup()
-        return self.soup.wl_driver_version
\ No newline at end of file
+        return self.soup.wl_driver_version
+
+# python standard library
+import unittest
+
+# this package
+from apcommand.accesspoints.broadcom.parser import BS4
+
+class TestBroadcomFirmwareSoup(unittest.TestCase):
+    def setUp(self):
+        self.html = open('firmware_asp.html').read()
+        self.soup = BroadcomFirmwareSoup(self.html)
+        return
+
+    def test_versions(self):
+        """
+        Does it get the versions from the table (the same as BeautifulSoup does)?
+        """
+        self.assertEqual('CFE 5.10.128.2', self.soup.bootloader_version)
+        self.assertEqual('Linux  5.70.63.1', self.soup.os_version)
+        soup = BroadcomFirmwareSoup(self.html, engine=BS4)
+        for version in ('bootloader_version', 'os_version', 'wl_driver_version'):
+            self.assertEqual(getattr(soup, version), getattr(self.soup, version))
+        return
+# end class TestBroadcomFirmwareSoup
\ No newline at end of file
@@ -0,0 +1,356 @@
+# python standard library
+from collections import namedtuple
+from contextlib import contextmanager
+import atexit
+import cPickle as pickle
+import os
+import sqlite3
+import threading
+import time
+
+# this package
+from apcommand.baseclass import BaseClass
+
+JOURNAL_NAME = 'apcommand.journal'
+# seconds to wait for another writer to finish before giving up
+TIMEOUT = 10
+SCHEMA = ('CREATE TABLE IF NOT EXISTS entries (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+          'host TEXT NOT NULL, band TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, '
+          'time REAL NOT NULL)',
+          'CREATE INDEX IF NOT EXISTS entries_key ON entries (host, key, band)',
+          'CREATE TABLE IF NOT EXISTS undone (entry INTEGER PRIMARY KEY)')
+INSERT = 'INSERT INTO entries (host, band, key, value, time) VALUES (?, ?, ?, ?, ?)'
+SELECT = ('SELECT host, band, key, value, time, id FROM entries '
+          'WHERE host = ? AND key = ? AND (? IS NULL OR band = ?) '
+          'AND id NOT IN (SELECT entry FROM undone) ORDER BY id DESC')
+UNDO = 'INSERT INTO undone (entry) VALUES (?)'
+
+JournalEntry = namedtuple('JournalEntry', 'host band key value time')
+
+
+def field(value):
+    """
+    Converts a host or band to the text stored in the journal
+
+    :param:
+
+     - `value`: the host or band (or None)
+
+    :return: the value as a string ('' for None)
+    """
+    if value is None:
+        return ''
+    return str(value)
+
+class UndoJournal(BaseClass):
+    """
+    An append-only journal of the settings the commands changed
+    """
+    def __init__(self, name=JOURNAL_NAME, timeout=TIMEOUT):
+        """
+        UndoJournal constructor
+
+        :param:
+
+         - `name`: path to the sqlite file
+         - `timeout`: seconds to wait for other writers
+        """
+        super(UndoJournal, self).__init__()
+        self.name = name
+        self.timeout = timeout
+        self.lock = threading.RLock()
+        self._database = None
+        return
+
+    @property
+    def database(self):
+        """
+        The sqlite connection (the journal is created the first time)
+        """
+        if self._database is None:
+            database = sqlite3.connect(self.name, timeout=self.timeout,
+                                       isolation_level=None, check_same_thread=False)
+            database.execute('PRAGMA journal_mode=WAL')
+            database.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                database.execute(statement)
+            self._database = database
+        return self._database
+
+    @contextmanager
+    def transaction(self, begin='BEGIN'):
+        """
+        Context manager to run statements in one transaction
+
+        :param:
+
+         - `begin`: the statement that starts the transaction
+
+        :yield: the sqlite connection
+        """
+        with self.lock:
+            database = self.database
+            database.execute(begin)
+            try:
+                yield database
+            except:
+                database.execute('ROLLBACK')
+                raise
+            database.execute('COMMIT')
+        return
+
+    def append(self, host, band, objects):
+        """
+        Adds the objects to the end of the journal (in one transaction)
+
+        :param:
+
+         - `host`: the AP's hostname
+         - `band`: the band the objects were set for
+         - `objects`: dictionary of key: value to journal
+        """
+        now = time.time()
+        rows = [(field(host), field(band), key,
+                 sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)), now)
+                for key, value in objects.iteritems()]
+        with self.transaction() as database:
+            database.executemany(INSERT, rows)
+        return
+
+    def select(self, host, key, band=None):
+        """
+        Gets the entries that haven't been undone (newest first)
+
+        :param:
+
+         - `host`: the AP's hostname
+         - `key`: the key the values were journaled with
+         - `band`: the band to get (None for all of them)
+
+        :return: list of (JournalEntry, row-id)
+        """
+        band = band if band is None else field(band)
+        with self.lock:
+            rows = self.database.execute(SELECT, (field(host), key, band, band)).fetchall()
+        return [(JournalEntry(row[0] or None, row[1] or None, row[2], pickle.loads(str(row[3])),
+                              row[4]), row[5]) for row in rows]
+
+    def newest(self, host, key, band=None):
+        """
+        Gets the newest entry that hasn't been undone
+
+        :return: (JournalEntry, row-id)
+        :raise: KeyError if there isn't one
+        """
+        selected = self.select(host, key, band)
+        if not selected:
+            raise KeyError("No journal entries for {0} (host: {1}, band: {2})".format(key, host,
+                                                                                     band))
+        return selected[0]
+
+    def history(self, host, key, band=None):
+        """
+        The entries that haven't been undone (newest first)
+
+        :param:
+
+         - `host`: the AP's hostname
+         - `key`: the key the values were journaled with
+         - `band`: the band to get (None for all of them)
+
+        :return: list of JournalEntry
+        """
+        return [entry for entry, identifier in self.select(host, key, band)]
+
+    def latest(self, host, key, band=None):
+        """
+        The newest entry that hasn't been undone
+
+        :param:
+
+         - `host`: the AP's hostname
+         - `key`: the key the value was journaled with
+         - `band`: the band to get (None for any of them)
+
+        :return: JournalEntry
+        :raise: KeyError if there isn't one
+        """
+        return self.newest(host, key, band)[0]
+
+    def pop(self, host, key, band=None):
+        """
+        Takes the newest entry that hasn't been undone (and marks it undone)
+
+        :param:
+
+         - `host`: the AP's hostname
+         - `key`: the key the value was journaled with
+         - `band`: the band to undo (None for any of them)
+
+        :return: JournalEntry
+        :raise: KeyError if there isn't one
+        """
+        with self.transaction('BEGIN IMMEDIATE') as database:
+            entry, identifier = self.newest(host, key, band)
+            database.execute(UNDO, (identifier,))
+        return entry
+
+    def close(self):
+        """
+        Closes the sqlite connection
+        """
+        with self.lock:
+            if self._database is not None:
+                self._database.close()
+                self._database = None
+        return
+# end class UndoJournal
+
+_journals = {}
+_journals_lock = threading.Lock()
+
+
+def undo_journal(name=JOURNAL_NAME):
+    """
+    Gets the journal for the file (creating it if it doesn't exist yet)
+
+    :param:
+
+     - `name`: path to the sqlite file
+
+    :return: UndoJournal shared by the commands
+    """
+    name = os.path.abspath(name)
+    with _journals_lock:
+        if name not in _journals:
+            _journals[name] = UndoJournal(name)
+    return _journals[name]
+
+
+def close_journals():
+    """
+    Closes all the shared journals
+    """
+    with _journals_lock:
+        journals = _journals.values()
+    for journal in journals:
+        journal.close()
+    return
+
+atexit.register(close_journals)
+
+# python standard library
+import shutil
+import tempfile
+import unittest
+
+HOST = '192.168.1.1'
+KEY = 'apcommand.accesspoints.broadcom.commands_SetChannel'
+
+
+class TestUndoJournal(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.name = os.path.join(self.directory, 'apcommand.journal')
+        self.journal = UndoJournal(self.name)
+        return
+
+    def tearDown(self):
+        self.journal.close()
+        shutil.rmtree(self.directory)
+        return
+
+    def test_latest(self):
+        """
+        Does the newest entry for the AP come back?
+        """
+        self.assertRaises(KeyError, self.journal.latest, HOST, KEY)
+        self.journal.append(HOST, '5', {KEY: '44'})
+        self.journal.append(HOST, '5', {KEY: '149'})
+        self.journal.append('192.168.1.2', '5', {KEY: '36'})
+        entry = self.journal.latest(HOST, KEY)
+        self.assertEqual((HOST, '5', KEY, '149'), entry[:4])
+        self.assertEqual(['149', '44'], [entry.value for entry in self.journal.history(HOST, KEY)])
+        # the shelf's default host and band
+        self.journal.append(None, None, {KEY: 1})
+        self.assertEqual((None, None, 1), (self.journal.latest(None, KEY).host,
+                                           self.journal.latest(None, KEY).band,
+                                           self.journal.latest(None, KEY).value))
+        return
+
+    def test_pop(self):
+        """
+        Does each pop go back one more entry (without removing anything from the file)?
+        """
+        for channel in ('1', '6', '11'):
+            self.journal.append(HOST, '2.4', {KEY: channel})
+        self.assertEqual(['11', '6', '1'], [self.journal.pop(HOST, KEY).value
+                                            for undo in range(3)])
+        self.assertRaises(KeyError, self.journal.pop, HOST, KEY)
+        count = self.journal.database.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        self.assertEqual(3, count)
+        # a new change can be undone after the old ones were
+        self.journal.append(HOST, '2.4', {KEY: '3'})
+        self.assertEqual('3', self.journal.pop(HOST, KEY).value)
+        return
+
+    def test_bands(self):
+        """
+        Does each band have its own history?
+        """
+        self.journal.append(HOST, '2.4', {KEY: '6'})
+        self.journal.append(HOST, '5', {KEY: '44'})
+        self.journal.append(HOST, '2.4', {KEY: '11'})
+        self.assertEqual('44', self.journal.pop(HOST, KEY, band='5').value)
+        self.assertRaises(KeyError, self.journal.pop, HOST, KEY, band=5)
+        self.assertEqual('11', self.journal.pop(HOST, KEY).value)
+        self.assertEqual('2.4', self.journal.latest(HOST, KEY).band)
+        return
+
+    def test_persistence(self):
+        """
+        Does another journal on the same file see the entries?
+        """
+        self.journal.append(HOST, '5', {KEY: '44', 'other': 'value'})
+        self.journal.close()
+        other = UndoJournal(self.name)
+        self.assertEqual('44', other.pop(HOST, KEY).value)
+        self.assertEqual('value', other.latest(HOST, 'other').value)
+        self.assertRaises(KeyError, self.journal.latest, HOST, KEY)
+        other.close()
+        return
+
+    def test_writers(self):
+        """
+        Can several journals on the same file append and undo at the same time?
+        """
+        journals = [UndoJournal(self.name) for writer in range(4)]
+
+        def write(journal):
+            for change in range(25):
+                journal.append(HOST, '5', {KEY: (id(journal), change)})
+            return
+
+        threads = [threading.Thread(target=write, args=(journal,)) for journal in journals]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        undone = []
+
+        def undo(journal):
+            for change in range(25):
+                undone.append(journal.pop(HOST, KEY).value)
+            return
+
+        threads = [threading.Thread(target=undo, args=(journal,)) for journal in journals]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for journal in journals:
+            journal.close()
+        self.assertEqual(100, len(set(undone)))
+        self.assertRaises(KeyError, self.journal.pop, HOST, KEY)
+        return
+# end class TestUndoJournal
@@ -5,21 +5,24 @@ from apcommand.accesspoints.broadcom.commons import BroadcomRadioData
 from apcommand.accesspoints.broadcom.commands import DisableInterface, EnableInterface
 from apcommand.accesspoints.broadcom.commands import SetChannel, SetSideband
 from apcommand.accesspoints.broadcom.commons import BroadcomError
+from apcommand.accesspoints.broadcom.transaction import BroadcomTransaction
 
 class ChannelChanger(BaseClass):
     """
     A channel changer for the broadcom 
     """
-    def __init__(self, connection):
+    def __init__(self, connection, skip_unchanged=False):
         """
         ChannelChanger constructor
 
         :param:
 
          - `connection`: connection to the AP 
+         - `skip_unchanged`: if True don't send the commands the AP already matches
         """
         super(ChannelChanger, self).__init__()
         self.connection = connection
+        self.skip_unchanged = skip_unchanged
 
         self._enable_command = None
         self._disable_command = None
@@ -33,7 +36,8 @@ class ChannelChanger(BaseClass):
         An EnableInterface command (without the band set)
         """
         if self._enable_command is None:
-            self._enable_command = EnableInterface(connection=self.connection)
+            self._enable_command = EnableInterface(connection=self.connection,
+                                                   skip_unchanged=self.skip_unchanged)
         return self._enable_command
 
     @property
@@ -42,7 +46,8 @@ class ChannelChanger(BaseClass):
         A DisableInterface command (without the band set)
         """
         if self._disable_command is None:
-            self._disable_command = DisableInterface(connection=self.connection)
+            self._disable_command = DisableInterface(connection=self.connection,
+                                                     skip_unchanged=self.skip_unchanged)
         return self._disable_command
 
     @property
@@ -51,7 +56,8 @@ class ChannelChanger(BaseClass):
         A SetChannel command
         """
         if self._set_channel_command is None:
-            self._set_channel_command = SetChannel(connection=self.connection)
+            self._set_channel_command = SetChannel(connection=self.connection,
+                                                   skip_unchanged=self.skip_unchanged)
         return self._set_channel_command
 
     @property
@@ -60,7 +66,8 @@ class ChannelChanger(BaseClass):
         A SetSideband command (defaulted 'lower')
         """
         if self._set_sideband_command is None:
-            self._set_sideband_command = SetSideband(connection=self.connection)
+            self._set_sideband_command = SetSideband(connection=self.connection,
+                                                     skip_unchanged=self.skip_unchanged)
         return self._set_sideband_command
     
     def undo(self):
@@ -70,6 +77,51 @@ class ChannelChanger(BaseClass):
         self.set_channel_command.undo()
         return
         
+    def commands(self, channel):
+        """
+        Sets up the commands to change the channel (without calling them)
+
+        :param:
+
+         - `channel`: wifi channel to set on the AP
+
+        :return: list of the commands to call (in order)
+        :raise: BroadcomError if the channel isn't a Broadcom channel
+        """
+        channel = str(channel)
+        if channel in BroadcomRadioData.channels_24ghz:
+            this_band, other_band = '2.4', '5'
+
+            # disable the other interface
+            self.disable_command.band = other_band
+            self.logger.debug('Setting 2.4 Ghz Channel ({0})'.format(channel))
+            ## now set this interface settings
+            self.enable_command.band = this_band
+            self.set_channel_command.channel = channel
+            
+            ## aggregate the settings
+            self._set_channel_command += self._enable_command
+            
+        elif channel in BroadcomRadioData.channels_5ghz:
+            band, other_band = '5', '2.4'
+            self.logger.debug('Setting 5 GHz Channel ({0})'.format(channel))
+            self.logger.debug('Disabling {0}'.format(other_band))
+            self.disable_command.band = other_band
+            self.logger.debug("Disable Data: {0}".format(self.disable_command.data))
+
+            self.enable_command.band = band
+            self.set_channel_command.channel=channel
+            sideband = BroadcomRadioData.sideband_map[channel]
+            self.set_sideband_command.direction = sideband
+            self.logger.debug("Setting the sideband to '{0}'".format(sideband))
+            self._set_channel_command += self._enable_command
+            self._set_channel_command += self._set_sideband_command
+        else:
+            self.logger.error("Valid 5 GHz Channels: {0}".format(','.join(BroadcomRadioData.channels_5ghz)))
+            self.logger.error("Valid 2.4 GHz Channels: {0}".format(','.join(BroadcomRadioData.channels_24ghz)))                
+            raise BroadcomError("Unknown Channel: {0}".format(channel))
+        return [self.disable_command, self.set_channel_command]
+
     def __call__(self, channel):
         """
         The main interface -- enables the Wireless interface and sets the channel
@@ -80,42 +132,8 @@ class ChannelChanger(BaseClass):
 
          - `channel`: wifi channel to set on the AP
         """
-        channel = str(channel)
         with self.connection.lock:
-            if channel in BroadcomRadioData.channels_24ghz:
-                this_band, other_band = '2.4', '5'
-
-                # disable the other interface
-                self.disable_command.band = other_band
-                self.disable_command()
-                self.logger.debug('Setting 2.4 Ghz Channel ({0})'.format(channel))
-                ## now set this interface settings
-                self.enable_command.band = this_band
-                self.set_channel_command.channel = channel
-                
-                ## aggregate the settings
-                self._set_channel_command += self._enable_command
-                
-            elif channel in BroadcomRadioData.channels_5ghz:
-                band, other_band = '5', '2.4'
-                self.logger.debug('Setting 5 GHz Channel ({0})'.format(channel))
-                self.logger.debug('Disabling {0}'.format(other_band))
-                self.disable_command.band = other_band
-                self.logger.debug("Disable Data: {0}".format(self.disable_command.data))
-                self.disable_command()
-
-                self.enable_command.band = band
-                self.set_channel_command.channel=channel
-                sideband = BroadcomRadioData.sideband_map[channel]
-                self.set_sideband_command.direction = sideband
-                self.logger.debug("Setting the sideband to '{0}'".format(sideband))
-                self._set_channel_command += self._enable_command
-                self._set_channel_command += self._set_sideband_command
-            else:
-                self.logger.error("Valid 5 GHz Channels: {0}".format(','.join(BroadcomRadioData.channels_5ghz)))
-                self.logger.error("Valid 2.4 GHz Channels: {0}".format(','.join(BroadcomRadioData.channels_24ghz)))                
-                raise BroadcomError("Unknown Channel: {0}".format(channel))
-            self.set_channel_command()
+            BroadcomTransaction(self.connection, self.commands(channel))()
             #channel_prime = self.reader(band)
             #if channel_prime != channel:
             #    raise BroadcomError("Channel set failure (expected:{0} actual:{1})".format(channel,
@@ -153,4 +171,18 @@ class TestBroadcomChannelChanger(unittest.TestCase):
         #channel = random.choice(xrange(1,12))
         #self.command(channel)
         #self.disable.assert_called_with()
-        return
\ No newline at end of file
+        return
+
+    def test_commands(self):
+        """
+        Does it set up the disable and the aggregated channel command?
+        """
+        # the commands have to be real to aggregate their data
+        self.disable_patcher.stop()
+        self.patchers = []
+        disable, set_channel = self.command.commands(44)
+        self.assertEqual('2.4', disable.band)
+        self.assertEqual({'action': 'Apply', 'wl_unit': '1', 'wl_nctrlsb': 'lower',
+                          'wl_radio': '1', 'wl_channel': '44'}, set_channel.data)
+        self.assertRaises(BroadcomError, self.command.commands, 15)
+        return
@@ -0,0 +1,386 @@
+# python standard library
+from collections import namedtuple
+import threading
+
+# this package
+from apcommand.baseclass import BaseClass
+from apcommand.connections.ratelimiter import monotonic
+from commons import BroadcomWirelessData
+
+# seconds to keep a page (pages changed by someone else will be this old at most)
+TTL = 5
+# the connection attribute that holds its PageCache
+CACHE_ATTRIBUTE = 'page_cache'
+
+PageCacheKey = namedtuple('PageCacheKey', 'page unit')
+CachedPage = namedtuple('CachedPage', 'text fetched')
+
+class PageCache(BaseClass):
+    """
+    A holder of the Broadcom pages fetched by one connection
+    """
+    def __init__(self, connection, ttl=TTL, clock=monotonic):
+        """
+        PageCache constructor
+
+        :param:
+
+         - `connection`: HTTPConnection to the AP
+         - `ttl`: seconds to keep a page before fetching it again
+         - `clock`: function that returns the time in seconds
+        """
+        super(PageCache, self).__init__()
+        self.connection = connection
+        self.ttl = ttl
+        self.clock = clock
+        self.lock = threading.RLock()
+        self.pages = {}
+        self.fetching = {}
+        self.generations = {}
+        self.hits = 0
+        self.misses = 0
+        return
+
+    def key(self, page, data=None):
+        """
+        Builds the key for the page
+
+        :param:
+
+         - `page`: name of the page (e.g. 'radio.asp')
+         - `data`: the form-data for the page
+
+        :return: PageCacheKey
+        """
+        unit = None
+        if data:
+            unit = data.get(BroadcomWirelessData.wireless_interface)
+        return PageCacheKey(page, unit)
+
+    def page(self, page, data=None):
+        """
+        Gets the html for the page (from the AP if it isn't kept or is too old)
+
+        :param:
+
+         - `page`: name of the page (e.g. 'radio.asp')
+         - `data`: the form-data for the page
+
+        :return: html text
+        """
+        text = self.cached(page, data)
+        if text is None:
+            with self.connection.lock:
+                text = self.fetch(page, data)
+        return text
+
+    def fetch_lock(self, key):
+        """
+        Gets the lock to hold while the key's page is fetched (creating it if it doesn't exist yet)
+
+        :param:
+
+         - `key`: the PageCacheKey for the page
+
+        :return: Lock
+        """
+        with self.lock:
+            if key not in self.fetching:
+                self.fetching[key] = threading.Lock()
+            return self.fetching[key]
+
+    def fetch(self, page, data=None, connection=None):
+        """
+        Gets the page from the AP and keeps it (unless another thread got it while this one waited)
+
+        :param:
+
+         - `page`: name of the page (e.g. 'radio.asp')
+         - `data`: the form-data for the page
+         - `connection`: connection to fetch with (default is the cache's, whose lock the caller holds)
+
+        :return: html text
+        """
+        if connection is None:
+            connection = self.connection
+        key = self.key(page, data)
+        with self.fetch_lock(key):
+            text = self.peek(page, data)
+            if text is None:
+                generation = self.generation(page, data)
+                self.logger.debug("Fetching {0}".format(key))
+                connection.path = page
+                text = connection(data=data).text
+                self.store(page, data, text, generation)
+        return text
+
+    def peek(self, page, data=None):
+        """
+        Gets the html for the page if it's kept and isn't too old (without counting it)
+
+        :param:
+
+         - `page`: name of the page (e.g. 'radio.asp')
+         - `data`: the form-data for the page
+
+        :return: html text or None if the page has to be fetched
+        """
+        with self.lock:
+            cached = self.pages.get(self.key(page, data))
+            if cached is not None and self.clock() - cached.fetched < self.ttl:
+                return cached.text
+        return None
+
+    def cached(self, page, data=None):
+        """
+        Gets the html for the page if it's kept and isn't too old (counts the hits and misses)
+
+        :param:
+
+         - `page`: name of the page (e.g. 'radio.asp')
+         - `data`: the form-data for the page
+
+        :return: html text or None if the page has to be fetched
+        """
+        text = self.peek(page, data)
+        with self.lock:
+            if text is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return text
+
+    def store(self, page, data, text, generation=None):
+        """
+        Keeps the html for a page that was fetched somewhere else (e.g. by an AsyncHTTPConnection)
+
+        :param:
+
+         - `page`: name of the page (e.g. 'radio.asp')
+         - `data`: the form-data for the page
+         - `text`: the page's html
+         - `generation`: the page's generation from before it was fetched (None to always keep it)
+        """
+        key = self.key(page, data)
+        with self.lock:
+            if generation is not None and generation != self.generation(page, data):
+                self.logger.debug("Not keeping {0}, it was invalidated while it was fetched".format(key))
+                return
+            self.pages[key] = CachedPage(text, self.clock())
+        return
+
+    def generation(self, page, data=None):
+        """
+        Counts the times the page was invalidated
+
+        :param:
+
+         - `page`: name of the page (e.g. 'radio.asp')
+         - `data`: the form-data for the page
+
+        :return: number of the invalidations that covered the page's wl_unit
+        """
+        key = self.key(page, data)
+        every_unit = PageCacheKey(page, None)
+        with self.lock:
+            generation = self.generations.get(every_unit, 0)
+            if key != every_unit:
+                generation += self.generations.get(key, 0)
+        return generation
+
+    def invalidate(self, page, data=None):
+        """
+        Forgets the page so the next read fetches it again
+
+        :param:
+
+         - `page`: name of the page (e.g. 'radio.asp')
+         - `data`: the form-data for the page (without a wl_unit every unit is forgotten)
+        """
+        key = self.key(page, data)
+        with self.lock:
+            self.generations[key] = self.generations.get(key, 0) + 1
+            for cached in self.pages.keys():
+                if cached.page == page and key.unit in (None, cached.unit):
+                    self.logger.debug("Forgetting {0}".format(cached))
+                    del self.pages[cached]
+        return
+
+    def clear(self):
+        """
+        Forgets all the pages
+        """
+        with self.lock:
+            self.pages.clear()
+        return
+# end class PageCache
+
+_caches_lock = threading.Lock()
+
+
+def page_cache(connection):
+    """
+    Gets the connection's PageCache (creating it if it doesn't exist yet)
+
+    :param:
+
+     - `connection`: HTTPConnection to the AP
+
+    :return: PageCache shared by all the users of the connection
+    """
+    with _caches_lock:
+        cache = vars(connection).get(CACHE_ATTRIBUTE)
+        if cache is None:
+            cache = PageCache(connection)
+            setattr(connection, CACHE_ATTRIBUTE, cache)
+    return cache
+
+# python standard library
+import unittest
+
+# third-party
+from mock import MagicMock, call
+
+class TestPageCache(unittest.TestCase):
+    def setUp(self):
+        self.connection = MagicMock()
+        self.connection.return_value.text = 'html'
+        self.now = 0
+        self.cache = PageCache(self.connection, ttl=5, clock=lambda: self.now)
+        return
+
+    def test_page(self):
+        """
+        Is each (page, wl_unit) fetched once?
+        """
+        for request in range(2):
+            self.assertEqual('html', self.cache.page('radio.asp', {'wl_unit': '0'}))
+            self.cache.page('radio.asp', {'wl_unit': '1'})
+            self.cache.page('lan.asp')
+        self.assertEqual([call(data={'wl_unit': '0'}), call(data={'wl_unit': '1'}),
+                          call(data=None)], self.connection.call_args_list)
+        self.assertEqual('lan.asp', self.connection.path)
+        self.assertEqual((3, 3), (self.cache.hits, self.cache.misses))
+        return
+
+    def test_ttl(self):
+        """
+        Is a page fetched again once it's older than the ttl?
+        """
+        self.cache.page('lan.asp')
+        self.now = 4.9
+        self.cache.page('lan.asp')
+        self.assertEqual(1, self.cache.misses)
+        self.now = 5
+        self.cache.page('lan.asp')
+        self.assertEqual(2, self.cache.misses)
+        return
+
+    def test_store(self):
+        """
+        Does a stored page get used instead of fetching it?
+        """
+        self.assertIsNone(self.cache.cached('radio.asp', {'wl_unit': '1'}))
+        self.cache.store('radio.asp', {'wl_unit': '1'}, 'stored')
+        self.assertEqual('stored', self.cache.cached('radio.asp', {'wl_unit': '1'}))
+        self.assertEqual('stored', self.cache.page('radio.asp', {'wl_unit': '1'}))
+        self.assertFalse(self.connection.called)
+        self.now = 5
+        self.assertIsNone(self.cache.cached('radio.asp', {'wl_unit': '1'}))
+        return
+
+    def test_invalidate(self):
+        """
+        Does invalidate forget the page (for one unit or all of them)?
+        """
+        for unit in '01':
+            self.cache.page('radio.asp', {'wl_unit': unit})
+        self.cache.page('ssid.asp', {'wl_unit': '0'})
+        self.cache.invalidate('radio.asp', {'wl_unit': '1'})
+        self.assertEqual(set([PageCacheKey('radio.asp', '0'), PageCacheKey('ssid.asp', '0')]),
+                         set(self.cache.pages))
+        self.cache.invalidate('radio.asp')
+        self.assertEqual([PageCacheKey('ssid.asp', '0')], self.cache.pages.keys())
+        self.cache.clear()
+        self.assertEqual({}, self.cache.pages)
+        return
+
+    def test_page_cache(self):
+        """
+        Does each connection get one cache?
+        """
+        cache = page_cache(self.connection)
+        self.assertIs(cache, page_cache(self.connection))
+        self.assertIsNot(cache, page_cache(MagicMock()))
+        return
+
+    def test_fetching(self):
+        """
+        Can other pages be read while a page is fetched and is the page only fetched once?
+        """
+        started, answer = threading.Event(), threading.Event()
+        copy = MagicMock()
+
+        def slow(data=None):
+            started.set()
+            answer.wait(5)
+            return MagicMock(text='slow')
+
+        copy.side_effect = slow
+        fetcher = threading.Thread(target=self.cache.fetch,
+                                   args=('radio.asp', {'wl_unit': '0'}, copy))
+        fetcher.start()
+        started.wait(5)
+        # the other pages don't wait for the fetch
+        self.cache.store('lan.asp', None, 'stored')
+        self.assertEqual('stored', self.cache.page('lan.asp'))
+        self.assertEqual('html', self.cache.page('ssid.asp', {'wl_unit': '0'}))
+        self.assertFalse(answer.is_set())
+        # the same page waits for the fetch instead of fetching it again
+        texts = []
+        reader = threading.Thread(target=lambda: texts.append(
+            self.cache.page('radio.asp', {'wl_unit': '0'})))
+        reader.start()
+        answer.set()
+        fetcher.join(5)
+        reader.join(5)
+        self.assertEqual(['slow'], texts)
+        self.assertEqual(1, copy.call_count)
+        self.assertEqual('radio.asp', copy.path)
+        self.assertEqual([call(data={'wl_unit': '0'})], self.connection.call_args_list)
+        # peek doesn't count
+        hits, misses = self.cache.hits, self.cache.misses
+        self.assertEqual('slow', self.cache.peek('radio.asp', {'wl_unit': '0'}))
+        self.assertIsNone(self.cache.peek('firmware.asp'))
+        self.assertEqual((hits, misses), (self.cache.hits, self.cache.misses))
+        return
+
+    def test_invalidate_fetching(self):
+        """
+        Is a page that was invalidated while it was fetched thrown away instead of kept?
+        """
+        invalidated = [{'wl_unit': '0'}]
+
+        def changed(data=None):
+            self.cache.invalidate('radio.asp', invalidated[0])
+            return MagicMock(text='old')
+
+        self.connection.side_effect = changed
+        self.assertEqual('old', self.cache.page('radio.asp', {'wl_unit': '0'}))
+        self.assertIsNone(self.cache.peek('radio.asp', {'wl_unit': '0'}))
+
+        # forgetting every unit throws away the fetch of one unit
+        invalidated[0] = None
+        self.cache.page('radio.asp', {'wl_unit': '1'})
+        self.assertIsNone(self.cache.peek('radio.asp', {'wl_unit': '1'}))
+
+        # but forgetting one unit doesn't throw away the fetch of another
+        invalidated[0] = {'wl_unit': '0'}
+        self.cache.page('radio.asp', {'wl_unit': '1'})
+        self.assertEqual('old', self.cache.peek('radio.asp', {'wl_unit': '1'}))
+
+        # a store without a generation is always kept
+        self.cache.store('radio.asp', {'wl_unit': '0'}, 'stored')
+        self.assertEqual('stored', self.cache.peek('radio.asp', {'wl_unit': '0'}))
+        return
+# end class TestPageCache
@@ -1,9 +1,15 @@
 
 # python standard library
+from collections import namedtuple
+import HTMLParser
 import re
 
 # third-party
 import bs4
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
 
 # this package
 from apcommand.baseclass import BaseClass
@@ -14,21 +20,404 @@ class SoupError(RuntimeError):
     Raise if something is detected at run-time.
     """
 
+Option = namedtuple('Option', 'value text')
+FormFields = namedtuple('FormFields', 'fields cells')
+
+# the soup engines
+STREAM = 'stream'
+LXML = 'lxml'
+REGEX = 'regex'
+BS4 = 'bs4'
+# the engines that only read the form-fields (BS4 builds the whole tree)
+FIELD_ENGINES = (STREAM, LXML, REGEX)
+ENGINES = FIELD_ENGINES + (BS4,)
+DEFAULT_ENGINE = STREAM
+# the tree-builder BeautifulSoup uses for the BS4 engine
+BS4_FEATURES = 'html.parser'
+
+# the tags and attributes the FormFieldParser looks at
+FORM = 'form'
+INPUT = 'input'
+SELECT = 'select'
+OPTION = 'option'
+TABLE_DATA = 'td'
+ACTION = 'action'
+EMPTY_STRING = ''
+
+
+class FormField(namedtuple('FormField', 'name value text options')):
+    """
+    A named <input> or <select> (for a <select> the value and text are the selected option's)
+    """
+    __slots__ = ()
+
+    def option(self, value):
+        """
+        Gets one of the <select> options
+
+        :param:
+
+         - `value`: the option's value attribute
+
+        :return: Option or None if the field doesn't have one with the value
+        """
+        for option in self.options:
+            if option.value == value:
+                return option
+        return None
+# end class FormField
+
+
+class FormFieldCollector(object):
+    """
+    Keeps the named form-fields and the text of the table-cells in forms from a stream of tags
+    """
+    def __init__(self):
+        # name: FormField (the first one if the name is repeated)
+        self.fields = {}
+        # form-action: [cell-text,...]
+        self.cells = {}
+        self.form = None
+        self.select = None
+        self.options = []
+        self.selected = None
+        self.option = None
+        self.option_text = []
+        # (index, [text,...]) for each open <td>
+        self.open_cells = []
+        return
+
+    def handle_starttag(self, tag, attrs):
+        """
+        Starts a form, field, option or cell
+        """
+        attributes = dict(attrs)
+        if tag == OPTION:
+            if self.select is not None:
+                self.end_option()
+                self.option = attributes
+                self.option_text = []
+        elif tag == TABLE_DATA:
+            if self.form is not None:
+                cells = self.cells[self.form]
+                cells.append(EMPTY_STRING)
+                self.open_cells.append((len(cells) - 1, []))
+        elif tag == INPUT:
+            name = attributes.get(NAME)
+            if name is not None:
+                self.fields.setdefault(name, FormField(name, attributes.get(VALUE, EMPTY_STRING),
+                                                       None, ()))
+        elif tag == SELECT:
+            self.end_select()
+            self.select = attributes.get(NAME)
+        elif tag == FORM:
+            self.form = attributes.get(ACTION, EMPTY_STRING)
+            self.cells.setdefault(self.form, [])
+        return
+
+    def handle_endtag(self, tag):
+        """
+        Ends an option, field, cell or form
+        """
+        if tag == OPTION:
+            self.end_option()
+        elif tag == TABLE_DATA:
+            if self.open_cells:
+                index, text = self.open_cells.pop()
+                self.cells[self.form][index] = EMPTY_STRING.join(text).rstrip()
+        elif tag == SELECT:
+            self.end_select()
+        elif tag == FORM:
+            self.form = None
+            self.open_cells = []
+        return
+
+    def handle_data(self, data):
+        """
+        Adds the text to the open option and cells
+        """
+        if self.option is not None:
+            self.option_text.append(data)
+        for index, text in self.open_cells:
+            text.append(data)
+        return
+
+    def end_option(self):
+        """
+        Adds the open option to the select's options
+        """
+        if self.option is not None:
+            text = EMPTY_STRING.join(self.option_text)
+            option = Option(self.option.get(VALUE, text), text)
+            self.options.append(option)
+            if SELECTED in self.option and self.selected is None:
+                self.selected = option
+            self.option = None
+        return
+
+    def end_select(self):
+        """
+        Adds the open select to the fields
+        """
+        self.end_option()
+        if self.select is not None:
+            value = text = None
+            if self.selected is not None:
+                value, text = self.selected
+            self.fields.setdefault(self.select, FormField(self.select, value, text,
+                                                          tuple(self.options)))
+        self.select = None
+        self.options = []
+        self.selected = None
+        return
+
+    def form_fields(self):
+        """
+        Ends anything still open
+
+        :return: FormFields with what was collected
+        """
+        self.end_select()
+        return FormFields(self.fields, self.cells)
+# end class FormFieldCollector
+
+
+class FormFieldParser(FormFieldCollector, HTMLParser.HTMLParser):
+    """
+    The html.parser backend -- feeds the standard library's HTMLParser events to the collector
+    """
+    def __init__(self):
+        HTMLParser.HTMLParser.__init__(self)
+        FormFieldCollector.__init__(self)
+        return
+
+    def handle_entityref(self, name):
+        """
+        Adds the character for an entity (e.g. &amp;) to the text
+        """
+        self.handle_data(self.unescape('&{0};'.format(name)).encode('utf-8'))
+        return
+
+    def handle_charref(self, name):
+        """
+        Adds the character for a reference (e.g. &#38;) to the text
+        """
+        self.handle_data(self.unescape('&#{0};'.format(name)).encode('utf-8'))
+        return
+# end class FormFieldParser
+
+# the regex backend's tokens
+TAG = 'tag'
+CLOSE = 'close'
+ATTRIBUTES = 'attributes'
+TOKEN_EXPRESSION = re.compile(r'<!--.*?-->|<![^>]*>|<\?[^>]*>|'
+                              r'<(?P<close>/?)(?P<tag>[a-zA-Z][a-zA-Z0-9]*)'
+                              r'(?P<attributes>(?:"[^"]*"|\'[^\']*\'|[^\'">])*)>', re.DOTALL)
+ATTRIBUTE_EXPRESSION = re.compile(r'([^\s"\'>/=]+)(?:\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+)))?')
+ENTITY_EXPRESSION = re.compile(r'&(?:#[0-9]+|#[xX][0-9a-fA-F]+|[a-zA-Z][a-zA-Z0-9]*);')
+AMPERSAND = '&'
+# tags whose contents are text (tag: end-tag expression)
+RAW_TEXT = {'script': re.compile(r'</script\s*>', re.IGNORECASE),
+            'style': re.compile(r'</style\s*>', re.IGNORECASE)}
+FIELD_TAGS = frozenset((FORM, INPUT, SELECT, OPTION, TABLE_DATA))
+unescape = HTMLParser.HTMLParser().unescape
+
+PARSE_ERRORS = (HTMLParser.HTMLParseError,)
+if etree is not None:
+    PARSE_ERRORS += (etree.LxmlError,)
+
+
+class LxmlTarget(object):
+    """
+    The lxml backend -- a parser-target that passes lxml's events to a collector
+    """
+    def __init__(self):
+        self.collector = FormFieldCollector()
+        return
+
+    def start(self, tag, attrib):
+        """
+        Passes a start-tag to the collector
+        """
+        self.collector.handle_starttag(tag, attrib.items())
+        return
+
+    def end(self, tag):
+        """
+        Passes an end-tag to the collector
+        """
+        self.collector.handle_endtag(tag)
+        return
+
+    def data(self, data):
+        """
+        Passes text to the collector
+        """
+        self.collector.handle_data(data)
+        return
+
+    def close(self):
+        """
+        Ends the page
+
+        :return: FormFields
+        """
+        return self.collector.form_fields()
+# end class LxmlTarget
+
+
+def tokenize_fields(html):
+    """
+    The regex backend -- splits the html into tags and text with one regular expression
+
+    :param:
+
+     - `html`: text of the page
+
+    :return: FormFields
+    """
+    collector = FormFieldCollector()
+    position = 0
+    while True:
+        token = TOKEN_EXPRESSION.search(html, position)
+        start = len(html) if token is None else token.start()
+        if start > position and (collector.option is not None or collector.open_cells):
+            collector.handle_data(unescape_text(html[position:start]))
+        if token is None:
+            break
+        position = token.end()
+        tag = token.group(TAG)
+        if tag is None:
+            # a comment or declaration
+            continue
+        tag = tag.lower()
+        if tag in RAW_TEXT and not token.group(CLOSE):
+            # scripts and styles are text up to their end-tag (the way HTMLParser treats them)
+            end = RAW_TEXT[tag].search(html, position)
+            stop = len(html) if end is None else end.start()
+            collector.handle_data(html[position:stop])
+            position = len(html) if end is None else end.end()
+        elif tag in FIELD_TAGS:
+            if token.group(CLOSE):
+                collector.handle_endtag(tag)
+            else:
+                collector.handle_starttag(tag, attributes(token.group(ATTRIBUTES)))
+    return collector.form_fields()
+
+
+def attributes(text):
+    """
+    Splits the attributes of a tag
+
+    :param:
+
+     - `text`: everything in the tag after its name
+
+    :return: list of (lower-cased name, value or None)
+    """
+    pairs = []
+    for match in ATTRIBUTE_EXPRESSION.finditer(text):
+        name, double, single, bare = match.groups()
+        value = double if double is not None else single if single is not None else bare
+        if value is not None and AMPERSAND in value:
+            value = unescape(value)
+        pairs.append((name.lower(), value))
+    return pairs
+
+
+def unescape_text(text):
+    """
+    Replaces the entities and character references in text (the same way the FormFieldParser does)
+    """
+    if AMPERSAND not in text:
+        return text
+    return ENTITY_EXPRESSION.sub(lambda match: unescape(match.group()).encode('utf-8'), text)
+
+
+def parse_fields(html):
+    """
+    Gets the form-fields with the html.parser backend
+    """
+    parser = FormFieldParser()
+    parser.feed(html)
+    parser.close()
+    return parser.form_fields()
+
+
+def lxml_fields(html):
+    """
+    Gets the form-fields with the lxml backend
+    """
+    parser = etree.HTMLParser(target=LxmlTarget())
+    parser.feed(html)
+    return parser.close()
+
+
+# engine: function(html) that returns FormFields
+EXTRACTORS = {STREAM: parse_fields,
+              LXML: lxml_fields,
+              REGEX: tokenize_fields}
+
+
+def extract_fields(html, engine=STREAM):
+    """
+    Gets the named form-fields and the cells in the forms from the html
+
+    :param:
+
+     - `html`: text of the page
+     - `engine`: the backend to use (STREAM, LXML or REGEX)
+
+    :return: FormFields
+    :raise: SoupError if the html can't be parsed or the engine can't be used
+    """
+    check_engine(engine)
+    try:
+        return EXTRACTORS[engine](html)
+    except PARSE_ERRORS as error:
+        raise SoupError("unable to parse the html: {0}".format(error))
+
+
+def available_engines():
+    """
+    The engines that can be used here (LXML is left out if it isn't installed)
+    """
+    return tuple(engine for engine in ENGINES if engine != LXML or etree is not None)
+
+
+def check_engine(engine):
+    """
+    Checks that the engine can be used
+
+    :raise: SoupError if the engine is unknown or lxml isn't installed
+    """
+    if engine not in ENGINES:
+        raise SoupError("unknown engine '{0}' (use one of {1})".format(engine, ENGINES))
+    if engine not in available_engines():
+        raise SoupError("the '{0}' engine needs lxml, which isn't installed".format(engine))
+    return
+
 class BroadcomBaseSoup(BaseClass):
     """
     A base-class to hold some code common to the soups
     """
-    def __init__(self, html=None):
+    def __init__(self, html=None, engine=DEFAULT_ENGINE):
         """
         BroadcomBaseSoup constructor
 
         :param:
 
          - `html`: html text for the soup to parse
+         - `engine`: one of the ENGINES (BS4 uses BeautifulSoup, the others the form-fields)
+
+        :raise: SoupError if the engine isn't one of the ENGINES or can't be used
         """
         super(BroadcomBaseSoup, self).__init__()
+        check_engine(engine)
+        self.engine = engine
         self._logger = None
         self._html = None
+        self._form_fields = None
         self.html = html
         self._soup = None
         # regular expressions
@@ -52,6 +441,9 @@ class BroadcomBaseSoup(BaseClass):
         # so cast to a string to be safe
         self._html = str(new_html)
         self._soup = None
+        self._form_fields = None
+        # the sub-classes' snapshot of the page
+        self._snapshot = None
         return
 
     @property
@@ -64,7 +456,7 @@ class BroadcomBaseSoup(BaseClass):
         """
         if self._soup is None:
             try:
-                self._soup = bs4.BeautifulSoup(self.html)
+                self._soup = bs4.BeautifulSoup(self.html, BS4_FEATURES)
             except TypeError as error:
                 self.logger.error(error)
                 raise SoupError("unable to create soup from {0}".format(self.html))
@@ -79,6 +471,41 @@ class BroadcomBaseSoup(BaseClass):
             self._selected_expression = re.compile(SELECTED_EXPRESSION.format(SELECTED))
         return self._selected_expression
 
+    @property
+    def form_fields(self):
+        """
+        The FormFields from one pass over self.html
+
+        :raise: SoupError if the html can't be parsed
+        """
+        if self._form_fields is None:
+            self._form_fields = extract_fields(self.html, self.engine)
+        return self._form_fields
+
+    def field(self, name):
+        """
+        Gets a named form-field
+
+        :param:
+
+         - `name`: the field's name attribute (e.g. 'wl_radio')
+
+        :return: FormField or None if the page doesn't have it
+        """
+        return self.form_fields.fields.get(name)
+
+    def cells(self, action):
+        """
+        Gets the text of the table-cells in a form
+
+        :param:
+
+         - `action`: the form's action attribute (e.g. 'upgrade.cgi')
+
+        :return: list of strings (empty if the page doesn't have the form)
+        """
+        return self.form_fields.cells.get(action, [])
+
 NAME = 'name'
 VALUE = 'value'
 ZERO = '0'
@@ -103,6 +530,16 @@ BANDWIDTH_EXPRESSION = SELECTED_EXPRESSION.format(BANDWIDTH)
 SIDEBAND = 'wl_nctrlsb'
 SIDEBAND_EXPRESSION = SELECTED_EXPRESSION.format(SIDEBAND)
 SSID = 'wl_ssid'
+LAN_PROTOCOL = 'lan_proto'
+
+class RadioState(namedtuple('RadioState', ('mac_24_ghz mac_5_ghz country interface_state '
+                                             'channel bandwidth sideband'))):
+    """
+    The radio.asp settings for one wl_unit
+    """
+    __slots__ = ()
+# end class RadioState
+
 
 class BroadcomRadioSoup(BroadcomBaseSoup):
     """
@@ -119,6 +556,7 @@ class BroadcomRadioSoup(BroadcomBaseSoup):
         super(BroadcomRadioSoup, self).__init__(*args, **kwargs)
 
         # the sub-trees and text
+        self._snapshot = None
         self._wireless_interface = None
         self._mac_24_ghz = None
         self._mac_5_ghz = None
@@ -166,6 +604,8 @@ class BroadcomRadioSoup(BroadcomBaseSoup):
 
         :return: (<MAC ADDRESS>)
         """
+        if self.engine in FIELD_ENGINES:
+            return self.field(WIRELESS_INTERFACE).option(ZERO).text
         return self.get_value_zero(self.wireless_interface).text
 
     @property
@@ -175,6 +615,8 @@ class BroadcomRadioSoup(BroadcomBaseSoup):
 
         :return: (<5 GHz MAC Address>)
         """
+        if self.engine in FIELD_ENGINES:
+            return self.field(WIRELESS_INTERFACE).option(ONE).text
         return self.get_value_one(self.wireless_interface).text
 
     @property
@@ -184,6 +626,8 @@ class BroadcomRadioSoup(BroadcomBaseSoup):
 
         :return: Country Code (e.g. 'US')
         """
+        if self.engine in FIELD_ENGINES:
+            return self.field(COUNTRY).options[0].value
         return self.soup.find(attrs={NAME:COUNTRY}).option[VALUE]
 
     @property
@@ -193,6 +637,8 @@ class BroadcomRadioSoup(BroadcomBaseSoup):
 
         :return: 'Enabled' or 'Disabled'
         """
+        if self.engine in FIELD_ENGINES:
+            return self.field(INTERFACE).text
         for line in self.soup.find(attrs={'name':'wl_radio'}):
             match = self.selected_expression.search(str(line))
             if match:
@@ -203,6 +649,12 @@ class BroadcomRadioSoup(BroadcomBaseSoup):
         """
         Gets the channel for the currently selected interface
         """
+        if self.engine in FIELD_ENGINES:
+            field = self.field(CHANNEL)
+            if field is None or not field.options:
+                self.logger.error("No {0} options in the page".format(CHANNEL))
+                return
+            return field.options[0].value
         try:
             return self.soup.find(attrs={NAME:CHANNEL}).option[VALUE]
         except AttributeError as error:
@@ -215,6 +667,8 @@ class BroadcomRadioSoup(BroadcomBaseSoup):
         """
         The bandwidth setting (for both bands)
         """
+        if self.engine in FIELD_ENGINES:
+            return self.field(BANDWIDTH).text
         for line in self.soup.find(attrs={NAME:BANDWIDTH}):
             match = self.selected_expression.search(str(line))
             if match:
@@ -227,11 +681,24 @@ class BroadcomRadioSoup(BroadcomBaseSoup):
 
         :return: 'Upper', 'Lower', or None
         """
+        if self.engine in FIELD_ENGINES:
+            text = self.field(SIDEBAND).text
+            return text.rstrip() if text is not None else None
         for line in self.soup.find(attrs={NAME:SIDEBAND}):
             match = self.selected_expression.search(str(line))
             if match:
                 return match.group(SELECTED).rstrip()
 
+    def snapshot(self):
+        """
+        Gets all the radio settings at once (kept until the html changes)
+
+        :return: RadioState
+        """
+        if self._snapshot is None:
+            self._snapshot = RadioState(*(getattr(self, name) for name in RadioState._fields))
+        return self._snapshot
+
 class BroadcomLANSoup(BroadcomBaseSoup):
     """
     A soup for the lan.asp page
@@ -252,6 +719,8 @@ class BroadcomLANSoup(BroadcomBaseSoup):
         """
         The selected DHCP state
         """
+        if self.engine in FIELD_ENGINES:
+            return self.field(LAN_PROTOCOL).text
         lan_proto = self.soup.find(attrs={'name':'lan_proto'})
         return self.selected_expression.search(str(lan_proto)).group(SELECTED)
 
@@ -268,6 +737,8 @@ class BroadcomSSIDSoup(BroadcomBaseSoup):
         """
         Gets the SSID for the currently selected interface
         """
+        if self.engine in FIELD_ENGINES:
+            return self.field(SSID).value
         return self.soup.find(attrs={NAME:SSID})['value']
 # end class BroadcomSSIDSoup
 
@@ -279,6 +750,8 @@ choose = random.choice
 # third-party
 from mock import MagicMock, patch
 
+RADIO_PROPERTIES = ('mac_24_ghz', 'mac_5_ghz', 'country', 'interface_state',
+                    'channel', 'bandwidth', 'sideband')
 wl_unit = """<select name="wl_unit" onchange="submit();">
 <option selected value="0">(00:90:4C:09:11:03)</option>
 <option value="1">(00:90:4C:13:11:03)</option>
@@ -307,7 +780,7 @@ class TestBroadcomRadioSoup(unittest.TestCase):
         soup = MagicMock()
         with patch('bs4.BeautifulSoup', soup):
             self.soup.soup
-        soup.assert_called_with(self.soup.html)
+        soup.assert_called_with(self.soup.html, BS4_FEATURES)
 
         # now get rid of the html
         self.soup.html = None
@@ -396,6 +869,26 @@ class TestBroadcomRadioSoup(unittest.TestCase):
         self.assertEqual(self.soup_5.sideband, 'Lower')
         return
 
+    def test_snapshot(self):
+        """
+        Does the snapshot hold all the settings and get made once per page?
+        """
+        state = self.soup_5.snapshot()
+        self.assertEqual(RadioState('(00:90:4C:09:11:03)', '(00:90:4C:13:11:03)', 'US',
+                                    'Enabled', '44',
+                                    '20MHz in 2.4G Band and 40MHz in 5G Band', 'Lower'),
+                         state)
+        self.assertIs(state, self.soup_5.snapshot())
+        same = BroadcomRadioSoup(self.soup_5.html, engine=BS4).snapshot()
+        self.assertEqual(state, same)
+        self.assertEqual(1, len(set([state, same])))
+        self.assertNotEqual(state, self.soup.snapshot())
+        self.soup_5.html = self.radio_html
+        self.assertEqual(self.soup.snapshot(), self.soup_5.snapshot())
+        with self.assertRaises(AttributeError):
+            state.extra = 'no __dict__'
+        return
+
 class TestBroadcomLANSoup(unittest.TestCase):
     def setUp(self):
         self.lan_html = open('lan_asp.html').read()
@@ -426,4 +919,89 @@ class TestBroadcomSSIDSoup(unittest.TestCase):
         Does it get the SSID?
         """
         self.assertEqual('hownowbrowndog', self.soup.ssid)
-        return
\ No newline at end of file
+        return
+class TestFormFieldParser(unittest.TestCase):
+    def test_fields(self):
+        """
+        Does it keep the named inputs, selects and the cells in forms?
+        """
+        html = """<form action="apply.cgi"><table><tr>
+        <td><input name="wl_ssid" value="say &quot;when&quot;"><input value="no name"></td>
+        <td><select name="wl_radio">
+          <option value="0">Disabled</option>
+          <option value="1" selected>Enabled</option>
+        </select></td><td>Fish &amp; Chips  </td></tr></table></form>
+        <select name="wl_channel"><option>11</option></select>
+        <select name="wl_radio"><option value="0" selected>Ignored</option></select>
+        <td>not in a form</td>"""
+        fields = extract_fields(html)
+        self.assertEqual(['wl_channel', 'wl_radio', 'wl_ssid'], sorted(fields.fields))
+        self.assertEqual('say "when"', fields.fields['wl_ssid'].value)
+        radio = fields.fields['wl_radio']
+        self.assertEqual(('1', 'Enabled'), (radio.value, radio.text))
+        self.assertEqual(Option('0', 'Disabled'), radio.option('0'))
+        self.assertIsNone(radio.option('2'))
+        self.assertEqual((Option('11', '11'),), fields.fields['wl_channel'].options)
+        self.assertIsNone(fields.fields['wl_channel'].text)
+        self.assertEqual(['apply.cgi'], fields.cells.keys())
+        self.assertEqual('Fish & Chips', fields.cells['apply.cgi'][-1])
+        return
+
+    def test_engines(self):
+        """
+        Do the STREAM and BS4 engines get the same values from the saved pages?
+        """
+        pages = (('radio_asp.html', BroadcomRadioSoup, RADIO_PROPERTIES),
+                 ('radio_5_asp.html', BroadcomRadioSoup, RADIO_PROPERTIES),
+                 ('radio_disabled.html', BroadcomRadioSoup, RADIO_PROPERTIES),
+                 ('lan_asp.html', BroadcomLANSoup, ('dhcp_state',)),
+                 ('dhcp_enabled.html', BroadcomLANSoup, ('dhcp_state',)),
+                 ('ssid_asp.html', BroadcomSSIDSoup, ('ssid',)))
+        for filename, soup, properties in pages:
+            html = open(filename).read()
+            bs4_soup = soup(html, engine=BS4)
+            for engine in available_engines():
+                fields = soup(html, engine=engine)
+                for name in properties:
+                    self.assertEqual(getattr(bs4_soup, name), getattr(fields, name),
+                                     "{0} {1} {2}".format(engine, filename, name))
+        with self.assertRaises(SoupError):
+            BroadcomSSIDSoup(engine='nothere')
+        return
+
+    def test_tokenizer(self):
+        """
+        Does the regex backend skip comments and scripts and handle quoted '>'?
+        """
+        html = """<!DOCTYPE html><!-- <select name="commented"></select> -->
+        <script>document.write('<select name="written"><option>1</option></select>');</script>
+        <select name="wl_radio" onChange="if (a > b) submit();">
+          <OPTION value='0'>Disabled</OPTION>
+          <option value=1 selected>En&amp;abled</option>
+        </select>"""
+        fields = tokenize_fields(html)
+        self.assertEqual(['wl_radio'], fields.fields.keys())
+        self.assertEqual(('1', 'En&abled'), (fields.fields['wl_radio'].value,
+                                              fields.fields['wl_radio'].text))
+        self.assertEqual(extract_fields(html), fields)
+        return
+
+    @unittest.skipUnless(etree, "lxml isn't installed")
+    def test_lxml(self):
+        """
+        Does the lxml backend get the same fields as the html.parser backend?
+        """
+        html = open('radio_5_asp.html').read()
+        self.assertEqual(extract_fields(html), extract_fields(html, LXML))
+        return
+
+    def test_no_lxml(self):
+        """
+        Is the lxml engine refused if lxml isn't installed?
+        """
+        with patch('{0}.etree'.format(__name__), None):
+            self.assertNotIn(LXML, available_engines())
+            with self.assertRaises(SoupError):
+                BroadcomRadioSoup(engine=LXML)
+        return
+# end class TestFormFieldParser
\ No newline at end of file
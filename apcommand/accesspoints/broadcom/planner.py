@@ -0,0 +1,182 @@
+# this package
+from apcommand.baseclass import BaseClass
+from apcommand.accesspoints.broadcom.commons import BroadcomWirelessData
+from apcommand.accesspoints.broadcom.commands import BroadcomBaseCommand
+
+def unit(operation):
+    """
+    Gets the wl_unit an operation's request carries
+
+    :param:
+
+     - `operation`: a querier or command (anything with a `data` dictionary)
+
+    :return: the wl_unit or None if the request doesn't have one
+    """
+    data = operation.data
+    if not data:
+        return None
+    return data.get(BroadcomWirelessData.wireless_interface)
+
+
+def switches(operations):
+    """
+    Counts the times the requests change the selected interface
+
+    :param:
+
+     - `operations`: the queriers and commands in the order they're sent
+
+    :return: number of times the wl_unit changes
+    """
+    count, previous = 0, None
+    for operation in operations:
+        current = unit(operation)
+        if current is None:
+            continue
+        if previous is not None and current != previous:
+            count += 1
+        previous = current
+    return count
+
+class RequestPlanner(BaseClass):
+    """
+    Orders a batch of reads and writes so the requests for each wl_unit go together
+    """
+    def __init__(self, operations=None):
+        """
+        RequestPlanner constructor
+
+        :param:
+
+         - `operations`: collection of queriers and commands (in the order they were asked for)
+        """
+        super(RequestPlanner, self).__init__()
+        self.operations = list(operations) if operations is not None else []
+        return
+
+    def add(self, operation):
+        """
+        Adds a querier or command to the end of the batch
+
+        :param:
+
+         - `operation`: a querier or command
+        """
+        self.operations.append(operation)
+        return
+
+    def plan(self):
+        """
+        The operations grouped by wl_unit (each unit's operations keep their order)
+
+        :return: list of the operations in the order to send them
+        """
+        units, groups, no_unit = [], {}, []
+        for operation in self.operations:
+            current = unit(operation)
+            if current is None:
+                no_unit.append(operation)
+                continue
+            if current not in groups:
+                units.append(current)
+                groups[current] = []
+            groups[current].append(operation)
+        plan = []
+        for current in units:
+            plan += groups[current]
+        return plan + no_unit
+
+    @property
+    def avoided(self):
+        """
+        The number of interface switches the plan saves
+        """
+        return switches(self.operations) - switches(self.plan())
+
+    def __call__(self):
+        """
+        Sends the requests in the planned order
+
+        :return: the planned operations
+        """
+        plan = self.plan()
+        self.logger.debug("Planned {0} requests ({1} interface switches avoided)".format(
+            len(plan), self.avoided))
+        for operation in plan:
+            if isinstance(operation, BroadcomBaseCommand):
+                operation()
+            else:
+                operation.set_soup()
+        return plan
+# end class RequestPlanner
+
+# python standard library
+import unittest
+
+# third-party
+from mock import MagicMock, call
+
+# this package
+from apcommand.accesspoints.broadcom.querier import BroadcomRadioQuerier, BroadcomSSIDQuerier
+from apcommand.accesspoints.broadcom.querier import BroadcomLANQuerier
+from apcommand.accesspoints.broadcom.commands import DisableInterface, EnableInterface
+from apcommand.accesspoints.broadcom.commands import SetChannel
+
+class TestRequestPlanner(unittest.TestCase):
+    def setUp(self):
+        self.connection = MagicMock()
+        return
+
+    def test_plan(self):
+        """
+        Are the reads for each band put together?
+        """
+        radio_24 = BroadcomRadioQuerier(connection=self.connection, band='2.4')
+        radio_5 = BroadcomRadioQuerier(connection=self.connection, band='5')
+        ssid_24 = BroadcomSSIDQuerier(connection=self.connection, band='2.4')
+        ssid_5 = BroadcomSSIDQuerier(connection=self.connection, band='5')
+        lan = BroadcomLANQuerier(connection=self.connection)
+        planner = RequestPlanner([radio_24, radio_5, lan, ssid_24])
+        planner.add(ssid_5)
+        self.assertEqual([radio_24, ssid_24, radio_5, ssid_5, lan], planner.plan())
+        self.assertEqual(3, switches(planner.operations))
+        self.assertEqual(2, planner.avoided)
+        # a batch that's already grouped isn't changed
+        self.assertEqual(planner.plan(), RequestPlanner(planner.plan()).plan())
+        self.assertEqual(0, RequestPlanner(planner.plan()).avoided)
+        return
+
+    def test_writes(self):
+        """
+        Do each band's writes keep their order?
+        """
+        enable_5 = EnableInterface(connection=self.connection, band='5')
+        disable_24 = DisableInterface(connection=self.connection, band='2.4')
+        channel_5 = SetChannel(connection=self.connection)
+        channel_5.channel = 44
+        enable_24 = EnableInterface(connection=self.connection, band='2.4')
+        planner = RequestPlanner([enable_5, disable_24, channel_5, enable_24])
+        self.assertEqual([enable_5, channel_5, disable_24, enable_24], planner.plan())
+        self.assertEqual(2, planner.avoided)
+        return
+
+    def test_call(self):
+        """
+        Are the commands called and the queriers' soups set in the planned order?
+        """
+        calls = MagicMock()
+        write = MagicMock(spec=DisableInterface)
+        write.data = {BroadcomWirelessData.wireless_interface: '1'}
+        write.side_effect = calls.write
+        read_0 = MagicMock(spec=BroadcomRadioQuerier)
+        read_0.data = {BroadcomWirelessData.wireless_interface: '0'}
+        read_0.set_soup.side_effect = calls.read_0
+        read_1 = MagicMock(spec=BroadcomRadioQuerier)
+        read_1.data = {BroadcomWirelessData.wireless_interface: '1'}
+        read_1.set_soup.side_effect = calls.read_1
+        planner = RequestPlanner([write, read_0, read_1])
+        self.assertEqual([write, read_1, read_0], planner())
+        self.assertEqual([call.write(), call.read_1(), call.read_0()], calls.mock_calls)
+        return
+# end class TestRequestPlanner
@@ -12,28 +12,37 @@ from commons import BAND_INTERFACE_MAP
 from apcommand.accesspoints.broadcom.parser import BroadcomRadioSoup
 from apcommand.accesspoints.broadcom.parser import BroadcomSSIDSoup
 from apcommand.accesspoints.broadcom.parser import BroadcomLANSoup
+from apcommand.accesspoints.broadcom.parser import DEFAULT_ENGINE
+from apcommand.accesspoints.broadcom.pagecache import page_cache
 
-# a decorator to set the page 
-def set_page(method):
+# the connection attribute that holds the name of its soup engine
+ENGINE_ATTRIBUTE = 'soup_engine'
+
+
+def soup_engine(connection):
+    """
+    Gets the soup engine the connection's queriers should use
+
+    :param:
+
+     - `connection`: HTTPConnection to the AP
+
+    :return: name of the engine (DEFAULT_ENGINE if the connection doesn't have one)
     """
-    Decorator: sets connection.path to self.asp_page before, sleeps after 
+    return vars(connection).get(ENGINE_ATTRIBUTE, DEFAULT_ENGINE)
+
+
+def set_soup_engine(connection, engine):
+    """
+    Sets the soup engine for the connection's queriers
+
+    :param:
+
+     - `connection`: HTTPConnection to the AP
+     - `engine`: name of one of the available soup engines
     """
-    def _method(self, *args, **kwargs):
-        if not self.refresh and self.current_page == self.asp_page:
-            debug_message = ('Skipping this method (refresh={0},'
-                             'current_page={1})').format(self.refresh,
-                                                         self.current_page)
-            self.logger.debug(debug_message)
-            return _method
-
-        self.logger.debug('Setting current_page to {0}'.format(self.asp_page))
-        self.current_page = self.asp_page
-
-        self.logger.debug("Setting connection.path to '{0}'".format(self.asp_page))
-        self.connection.path = self.asp_page
-        outcome = method(self, *args, **kwargs)
-        return outcome
-    return _method
+    setattr(connection, ENGINE_ATTRIBUTE, engine)
+    return
 
 class BroadcomBaseQuerier(BaseClass):
     """
@@ -47,13 +56,13 @@ class BroadcomBaseQuerier(BaseClass):
         :param:
 
          - `connection`: Connection to the Broadcom AP
-         - `refresh`: if True, call the page even if already loaded
+         - `refresh`: if True, get the page from the AP even if it's in the page-cache
         """
         super(BroadcomBaseQuerier, self).__init__()
         self._logger = None
         self.connection = connection
         self.refresh = refresh
-        self.current_page = None
+        self.text = None
         self._soup = None
         self._asp_page = None
         self._data = None
@@ -79,7 +88,22 @@ class BroadcomBaseQuerier(BaseClass):
         """
         return
         
-    @set_page
+    @property
+    def cache(self):
+        """
+        The connection's PageCache (shared with the other queriers and the commands)
+        """
+        return page_cache(self.connection)
+
+    @property
+    def engine(self):
+        """
+        The soup engine set on the connection (shared with the other queriers)
+
+        :default: DEFAULT_ENGINE if the connection doesn't have one
+        """
+        return soup_engine(self.connection)
+
     def set_soup(self):
         """
         Sets the soup.html to the page specified by self.page
@@ -89,10 +113,15 @@ class BroadcomBaseQuerier(BaseClass):
          - `self.soup` set to correct asp page
          - `self.data` set to dict if needed
 
-        :postcondition: self.soup's html set to text from connection
+        :postcondition: self.soup's html set to the page's text (from the page-cache)
         """
-        text = self.connection(data=self.data).text
-        self.soup.html = text        
+        if self.refresh:
+            self.cache.invalidate(self.asp_page, self.data)
+        text = self.cache.page(self.asp_page, self.data)
+        if text is not self.text:
+            # only re-parse the html if the page was fetched again
+            self.text = text
+            self.soup.html = text
         return
 # end class BroadcomBaseQuerier
 
@@ -122,7 +151,7 @@ class BroadcomRadioQuerier(BroadcomBaseQuerier):
         A BroadcomRadioSoup
         """
         if self._soup is None:
-            self._soup = BroadcomRadioSoup()
+            self._soup = BroadcomRadioSoup(engine=self.engine)
         return self._soup
 
     @property
@@ -162,21 +191,27 @@ class BroadcomRadioQuerier(BroadcomBaseQuerier):
         self._data = None
         return
 
+    @property
+    def snapshot(self):
+        """
+        The RadioState for the band (read once per page)
+        """
+        self.set_soup()
+        return self.soup.snapshot()
+
     @property
     def sideband(self):
         """
         The sideband setting (Upper or Lower), empty for 2.4 GHz
         """
-        self.set_soup()
-        return self.soup.sideband
+        return self.snapshot.sideband
     
     @property
     def channel(self):
         """
         Get the current channel for the band
         """
-        self.set_soup()
-        return self.soup.channel
+        return self.snapshot.channel
 
     @property
     def state(self):
@@ -185,19 +220,18 @@ class BroadcomRadioQuerier(BroadcomBaseQuerier):
 
         :return: ``Disabled`` or ``Enabled``
         """
-        self.set_soup()
-        return self.soup.interface_state
+        return self.snapshot.interface_state
 
     @property
     def mac_address(self):
         """
         Gets the mac-address for this band
         """
-        self.set_soup()
+        snapshot = self.snapshot
         if self.band == BroadcomWirelessData.interface_24_ghz:
-            return self.soup.mac_24_ghz        
+            return snapshot.mac_24_ghz        
         elif self.band == BroadcomWirelessData.interface_5_ghz:
-            return self.soup.mac_5_ghz
+            return snapshot.mac_5_ghz
 # end class BroadcomRadioQuerier
 
 class BroadcomSSIDQuerier(BroadcomBaseQuerier):
@@ -217,7 +251,7 @@ class BroadcomSSIDQuerier(BroadcomBaseQuerier):
         A BroadcomSSIDSoup
         """
         if self._soup is None:
-            self._soup = BroadcomSSIDSoup()
+            self._soup = BroadcomSSIDSoup(engine=self.engine)
         return self._soup
 
     @property
@@ -292,7 +326,7 @@ class BroadcomLANQuerier(BroadcomBaseQuerier):
         The BroadcomLANSoup
         """
         if self._soup is None:
-            self._soup = BroadcomLANSoup()
+            self._soup = BroadcomLANSoup(engine=self.engine)
         return self._soup
 
     @property
@@ -309,6 +343,9 @@ import unittest
 # third-party
 from mock import MagicMock, patch, call
 
+# this package
+from apcommand.accesspoints.broadcom.parser import REGEX
+
 TEST_SSID = 'hownowbrowndog'
 SSID_ASP = 'ssid_asp.html'
 
@@ -411,7 +448,56 @@ class TestBroadcomQueriers(unittest.TestCase):
         ssid_2 = querier.ssid
         self.assertEqual([TEST_SSID, TEST_SSID], [ssid_1, ssid_2])
         calls = [call(data={'wl_unit':'1'})]
-        self.assertEqual(calls, self.connection.mock_calls)
+        self.assertEqual(calls, self.connection.call_args_list)
+        return
+
+    def test_shared_page(self):
+        """
+        Do queriers using the same connection share the page (and is it re-read after it's invalidated)?
+        """
+        other = BroadcomRadioQuerier(connection=self.connection, band='5')
+        self.assertEqual(self.querier.channel, other.channel)
+        self.assertEqual('Enabled', other.state)
+        self.assertEqual(1, len(self.connection.call_args_list))
+        page_cache(self.connection).invalidate(BroadcomPages.radio)
+        self.html.text = open('radio_disabled.html').read()
+        self.assertEqual('Disabled', self.querier.state)
+        self.assertEqual(2, len(self.connection.call_args_list))
+        return
+
+    def test_snapshot(self):
+        """
+        Do the properties come from one snapshot per page?
+        """
+        snapshot = self.querier.snapshot
+        self.assertEqual(('44', 'Enabled', 'Lower'),
+                         (snapshot.channel, snapshot.interface_state, snapshot.sideband))
+        with patch.object(BroadcomRadioSoup, 'snapshot', return_value=snapshot) as fake:
+            self.assertEqual('44', self.querier.channel)
+            self.assertEqual('Lower', self.querier.sideband)
+        self.assertEqual(2, fake.call_count)
+        self.assertIs(snapshot, self.querier.snapshot)
+        return
+
+    def test_engine(self):
+        """
+        Do the queriers for a connection use the connection's soup engine?
+        """
+        self.assertEqual(DEFAULT_ENGINE, self.querier.engine)
+        set_soup_engine(self.connection, REGEX)
+        querier = BroadcomRadioQuerier(connection=self.connection, band='5')
+        self.assertEqual(REGEX, querier.soup.engine)
+        self.assertEqual(self.querier.snapshot, querier.snapshot)
+        return
+
+    def test_refresh(self):
+        """
+        If `refresh` is True, does it get the page every time?
+        """
+        querier = BroadcomRadioQuerier(connection=self.connection, refresh=True, band='5')
+        querier.channel
+        querier.channel
+        self.assertEqual(2, len(self.connection.call_args_list))
         return
             
 # end class TestBroadcomBaseQuerier
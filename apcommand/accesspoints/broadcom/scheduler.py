@@ -0,0 +1,332 @@
+# python standard library
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+import Queue
+import threading
+
+# this package
+from apcommand.baseclass import BaseClass
+from apcommand.connections.ratelimiter import monotonic
+from apcommand.accesspoints.broadcom.pagecache import page_cache
+from apcommand.accesspoints.broadcom.planner import RequestPlanner
+
+# most pages fetched from one AP at the same time
+WORKERS = 3
+
+_slots = {}
+_slots_lock = threading.Lock()
+
+
+def host_slots(hostname, workers=WORKERS):
+    """
+    Gets the host's semaphore (creating it if it doesn't exist yet)
+
+    :param:
+
+     - `hostname`: the AP's address (with the port if it isn't the default)
+     - `workers`: most fetches at once for a new semaphore
+
+    :return: BoundedSemaphore shared by the host's schedulers
+    """
+    with _slots_lock:
+        if hostname not in _slots:
+            _slots[hostname] = threading.BoundedSemaphore(workers)
+    return _slots[hostname]
+
+
+def copy_connection(connection):
+    """
+    Makes a new HTTPConnection with the connection's settings
+
+    :param:
+
+     - `connection`: HTTPConnection to the AP
+
+    :return: HTTPConnection to the same AP (sharing its limiter and pacer)
+    """
+    return connection.copy()
+
+class FetchReport(namedtuple('FetchReport', 'pages serial wall')):
+    """
+    The number of pages fetched and the seconds they took
+    """
+    __slots__ = ()
+
+    @property
+    def saved(self):
+        """
+        Seconds the overlapping fetches saved
+        """
+        return max(0, self.serial - self.wall)
+# end class FetchReport
+
+class FetchScheduler(BaseClass):
+    """
+    Fetches the queriers' pages at the same time (keeping the wl_unit pages in order)
+    """
+    def __init__(self, connection, workers=WORKERS, copy=copy_connection):
+        """
+        FetchScheduler constructor
+
+        :param:
+
+         - `connection`: the HTTPConnection the queriers use
+         - `workers`: most pages to fetch at once
+         - `copy`: function to make a new connection like the queriers' connection
+        """
+        super(FetchScheduler, self).__init__()
+        self.connection = connection
+        self.workers = workers
+        self.copy = copy
+        self.connections = Queue.Queue()
+        self.report = None
+        return
+
+    @property
+    def cache(self):
+        """
+        The connection's PageCache
+        """
+        return page_cache(self.connection)
+
+    @property
+    def slots(self):
+        """
+        The semaphore that bounds the fetches for the connection's host
+        """
+        return host_slots(self.connection.hostname, self.workers)
+
+    def jobs(self, queriers):
+        """
+        Splits the queriers' pages into jobs that can run at the same time
+
+        :param:
+
+         - `queriers`: collection of queriers whose pages are needed
+
+        :return: list of jobs (each a list of (page, data) to fetch in order)
+        """
+        serial, jobs, seen = [], [], set()
+        for querier in RequestPlanner(queriers).plan():
+            key = self.cache.key(querier.asp_page, querier.data)
+            if key in seen or self.cache.peek(querier.asp_page, querier.data) is not None:
+                continue
+            seen.add(key)
+            if key.unit is None:
+                jobs.append([(querier.asp_page, querier.data)])
+            else:
+                serial.append((querier.asp_page, querier.data))
+        if serial:
+            jobs.insert(0, serial)
+        return jobs
+
+    def borrow(self):
+        """
+        Gets an idle copy of the connection (making one if they're all busy)
+
+        :return: HTTPConnection to the same AP
+        """
+        try:
+            return self.connections.get_nowait()
+        except Queue.Empty:
+            return self.copy(self.connection)
+
+    def run_job(self, job):
+        """
+        Fetches the job's pages in order and puts them in the cache
+
+        :param:
+
+         - `job`: list of (page, data)
+
+        :return: seconds each fetch took
+        """
+        connection = self.borrow()
+        times = []
+        try:
+            with self.slots:
+                for page, data in job:
+                    start = monotonic()
+                    self.cache.fetch(page, data, connection)
+                    times.append(monotonic() - start)
+        finally:
+            self.connections.put(connection)
+        return times
+
+    def fetch(self, queriers):
+        """
+        Puts the queriers' pages in the cache
+
+        :param:
+
+         - `queriers`: collection of queriers whose pages are needed
+
+        :return: FetchReport
+        """
+        start = monotonic()
+        jobs = self.jobs(queriers)
+        times = []
+        pool = others = None
+        if len(jobs) > 1 and self.workers > 1:
+            pool = ThreadPool(min(self.workers - 1, len(jobs) - 1))
+            others = pool.map_async(self.run_job, jobs[1:])
+            jobs = jobs[:1]
+        try:
+            for job in jobs:
+                times += self.run_job(job)
+            if others is not None:
+                for job_times in others.get():
+                    times += job_times
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        self.report = FetchReport(pages=len(times), serial=sum(times),
+                                  wall=monotonic() - start)
+        self.logger.debug("Fetched {0} pages in {1:.3f} seconds (saved {2:.3f})".format(
+            self.report.pages, self.report.wall, self.report.saved))
+        return self.report
+
+    def close(self):
+        """
+        Closes the copies of the connection
+        """
+        while True:
+            try:
+                self.connections.get_nowait().close()
+            except Queue.Empty:
+                break
+        return
+# end class FetchScheduler
+
+# python standard library
+import time
+import unittest
+
+# third-party
+from mock import MagicMock
+
+# this package
+from apcommand.accesspoints.broadcom.commons import BroadcomPages, BroadcomWirelessData
+from apcommand.accesspoints.broadcom.querier import BroadcomRadioQuerier, BroadcomSSIDQuerier
+from apcommand.accesspoints.broadcom.querier import BroadcomLANQuerier
+from apcommand.accesspoints.broadcom.firmware import BroadcomFirmwareQuerier
+
+LATENCY = 0.2
+WL_UNIT = BroadcomWirelessData.wireless_interface
+SAVED_PAGES = {BroadcomPages.radio: 'radio_5_asp.html',
+               BroadcomPages.ssid: 'ssid_asp.html',
+               BroadcomPages.lan: 'lan_asp.html',
+               BroadcomPages.firmware: 'firmware_asp.html'}
+Fetched = namedtuple('Fetched', 'page unit start end')
+
+
+class FakeConnection(object):
+    """
+    A connection that waits LATENCY seconds and answers with the saved page
+    """
+    def __init__(self, fetched):
+        """
+        :param:
+
+         - `fetched`: list to add the Fetched records to (shared by the copies)
+        """
+        self.fetched = fetched
+        self.path = None
+        return
+
+    def __call__(self, data=None):
+        start = monotonic()
+        time.sleep(LATENCY)
+        response = MagicMock()
+        response.text = open(SAVED_PAGES[self.path]).read()
+        unit = data.get(WL_UNIT) if data else None
+        self.fetched.append(Fetched(self.path, unit, start, monotonic()))
+        return response
+
+    def close(self):
+        return
+# end class FakeConnection
+
+
+class TestFetchScheduler(unittest.TestCase):
+    def setUp(self):
+        self.fetched = []
+        self.connection = MagicMock()
+        self.connection.hostname = 'fake.broadcom'
+        self.scheduler = FetchScheduler(self.connection,
+                                        copy=lambda connection: FakeConnection(self.fetched))
+        self.queriers = []
+        for band in ('2.4', '5'):
+            self.queriers += [BroadcomRadioQuerier(connection=self.connection, band=band),
+                              BroadcomSSIDQuerier(connection=self.connection, band=band)]
+        self.queriers += [BroadcomLANQuerier(connection=self.connection),
+                          BroadcomFirmwareQuerier(connection=self.connection)]
+        return
+
+    def tearDown(self):
+        self.scheduler.close()
+        return
+
+    def test_jobs(self):
+        """
+        Are the wl_unit pages one job and the other pages a job each?
+        """
+        jobs = self.scheduler.jobs(self.queriers + self.queriers[:1])
+        self.assertEqual([[(BroadcomPages.radio, {WL_UNIT: '0'}),
+                           (BroadcomPages.ssid, {WL_UNIT: '0'}),
+                           (BroadcomPages.radio, {WL_UNIT: '1'}),
+                           (BroadcomPages.ssid, {WL_UNIT: '1'})],
+                          [(BroadcomPages.lan, None)],
+                          [(BroadcomPages.firmware, None)]], jobs)
+        # the planner puts each band's pages together whatever order they come in
+        radio_24, ssid_24, radio_5, ssid_5, lan, firmware = self.queriers
+        self.assertEqual(jobs, self.scheduler.jobs([radio_24, lan, radio_5, ssid_24, firmware,
+                                                    ssid_5]))
+        # looking for the pages isn't counted
+        self.assertEqual((0, 0), (self.scheduler.cache.hits, self.scheduler.cache.misses))
+        return
+
+    def test_fetch(self):
+        """
+        Are the other pages fetched while the wl_unit pages are fetched in order?
+        """
+        report = self.scheduler.fetch(self.queriers)
+        self.assertEqual(6, report.pages)
+        units = [fetched for fetched in self.fetched if fetched.unit is not None]
+        self.assertEqual([(BroadcomPages.radio, '0'), (BroadcomPages.ssid, '0'),
+                          (BroadcomPages.radio, '1'), (BroadcomPages.ssid, '1')],
+                         [(fetched.page, fetched.unit) for fetched in units])
+        # each wl_unit request ended before the next one started
+        for before, after in zip(units, units[1:]):
+            self.assertLessEqual(before.end, after.start)
+        # the other two pages were fetched while the wl_unit pages were
+        self.assertLess(report.wall, LATENCY * 5.5)
+        self.assertGreater(report.saved, LATENCY)
+        # the queriers read the pages from the cache
+        self.assertEqual('44', self.queriers[2].channel)
+        self.assertFalse(self.connection.called)
+        return
+
+    def test_cached(self):
+        """
+        Are pages that are already in the cache skipped?
+        """
+        self.scheduler.fetch(self.queriers[:2])
+        report = self.scheduler.fetch(self.queriers)
+        self.assertEqual(4, report.pages)
+        self.assertEqual(6, len(self.fetched))
+        self.assertEqual(0, self.scheduler.fetch(self.queriers).pages)
+        return
+
+    def test_one_worker(self):
+        """
+        Does one worker fetch the pages one at a time?
+        """
+        self.scheduler.workers = 1
+        report = self.scheduler.fetch(self.queriers)
+        self.assertEqual(6, report.pages)
+        for before, after in zip(self.fetched, self.fetched[1:]):
+            self.assertLessEqual(before.end, after.start)
+        return
+# end class TestFetchScheduler
@@ -0,0 +1,259 @@
+# python standard library
+from collections import namedtuple
+
+# this package
+from apcommand.baseclass import BaseClass
+from apcommand.accesspoints.broadcom.commons import BandEnumeration
+
+BAND_STRING = '{0} GHz:'
+CHANNEL_STRING = '\tChannel: {0}'
+SSID_STRING = '\tSSID: {0}'
+STATE_STRING = '\tState: {0}'
+SIDEBAND_STRING = '\tSideband: {0}'
+DHCP_STRING = 'DHCP: {0}'
+BOOTLOADER_STRING = 'Bootloader Version: {0}'
+OS_STRING = 'OS Version: {0}'
+WL_DRIVER_STRING = 'WL Driver Version: {0}'
+BANDS = (BandEnumeration.two_point_four, BandEnumeration.five)
+
+class BandStatus(namedtuple('BandStatus', 'band channel ssid state sideband')):
+    """
+    The status of one band's interface
+    """
+    __slots__ = ()
+
+    def lines(self):
+        """
+        The status strings for the band
+
+        :return: list of strings
+        """
+        lines = [BAND_STRING.format(self.band),
+                 CHANNEL_STRING.format(self.channel),
+                 SSID_STRING.format(self.ssid),
+                 STATE_STRING.format(self.state)]
+        if self.band.startswith(BandEnumeration.five):
+            lines.append(SIDEBAND_STRING.format(self.sideband))
+        return lines
+# end class BandStatus
+
+
+class BroadcomStatus(namedtuple('BroadcomStatus', ('bands dhcp_state bootloader_version '
+                                                   'os_version wl_driver_version'))):
+    """
+    The status of the AP (the bands are a tuple of BandStatus)
+    """
+    __slots__ = ()
+
+    def device_lines(self):
+        """
+        The status strings for the settings that aren't for a band
+
+        :return: list of strings
+        """
+        return [DHCP_STRING.format(self.dhcp_state),
+                BOOTLOADER_STRING.format(self.bootloader_version),
+                OS_STRING.format(self.os_version),
+                WL_DRIVER_STRING.format(self.wl_driver_version)]
+
+    def lines(self):
+        """
+        The status strings for the bands and then the rest of the AP
+
+        :return: list of strings
+        """
+        lines = []
+        for band in self.bands:
+            lines += band.lines()
+        return lines + self.device_lines()
+# end class BroadcomStatus
+
+class StatusReader(BaseClass):
+    """
+    Reads the AP's status getting each page it needs once
+    """
+    def __init__(self, query, ssid_query, lan_query, firmware_query):
+        """
+        StatusReader constructor
+
+        :param:
+
+         - `query`: dict of band:BroadcomRadioQuerier ('2' and '5')
+         - `ssid_query`: dict of band:BroadcomSSIDQuerier ('2' and '5')
+         - `lan_query`: BroadcomLANQuerier
+         - `firmware_query`: BroadcomFirmwareQuerier
+        """
+        super(StatusReader, self).__init__()
+        self.query = query
+        self.ssid_query = ssid_query
+        self.lan_query = lan_query
+        self.firmware_query = firmware_query
+        return
+
+    def bands(self, band):
+        """
+        The bands the status is for
+
+        :param:
+
+         - `band`: '2.4', '5', or 'both'
+
+        :return: tuple of band names
+        """
+        if band == BandEnumeration.both:
+            return BANDS
+        return (band,)
+
+    def queriers(self, band):
+        """
+        The plan for the status -- one querier for each page it needs
+
+        :param:
+
+         - `band`: '2.4', '5', or 'both'
+
+        :return: list of queriers in the order the status reads them
+        """
+        queriers = []
+        for name in self.bands(band):
+            queriers += [self.query[name[0]], self.ssid_query[name[0]]]
+        return queriers + [self.lan_query, self.firmware_query]
+
+    def read_band(self, band):
+        """
+        Reads one band's radio and ssid pages
+
+        :param:
+
+         - `band`: '2.4' or '5'
+
+        :return: BandStatus
+        """
+        radio = self.query[band[0]]
+        radio.set_soup()
+        snapshot = radio.soup.snapshot()
+        ssid = self.ssid_query[band[0]]
+        ssid.set_soup()
+        return BandStatus(band=band,
+                          channel=snapshot.channel,
+                          ssid=ssid.soup.ssid,
+                          state=snapshot.interface_state,
+                          sideband=snapshot.sideband)
+
+    def __call__(self, band=BandEnumeration.both):
+        """
+        Reads the status
+
+        :param:
+
+         - `band`: '2.4', '5', or 'both'
+
+        :return: BroadcomStatus
+        """
+        bands = tuple(self.read_band(name) for name in self.bands(band))
+        self.lan_query.set_soup()
+        self.firmware_query.set_soup()
+        firmware = self.firmware_query.soup
+        return BroadcomStatus(bands=bands,
+                              dhcp_state=self.lan_query.soup.dhcp_state,
+                              bootloader_version=firmware.bootloader_version,
+                              os_version=firmware.os_version,
+                              wl_driver_version=firmware.wl_driver_version)
+# end class StatusReader
+
+# python standard library
+import unittest
+
+# third-party
+from mock import MagicMock
+
+# this package
+from apcommand.accesspoints.broadcom.commons import BroadcomPages, BroadcomWirelessData
+from apcommand.accesspoints.broadcom.querier import BroadcomRadioQuerier, BroadcomSSIDQuerier
+from apcommand.accesspoints.broadcom.querier import BroadcomLANQuerier
+from apcommand.accesspoints.broadcom.firmware import BroadcomFirmwareQuerier
+from apcommand.accesspoints.broadcom.pagecache import page_cache
+
+# (page, wl_unit): saved html-file
+SAVED_PAGES = {(BroadcomPages.radio, '0'): 'radio_asp.html',
+               (BroadcomPages.radio, '1'): 'radio_5_asp.html',
+               (BroadcomPages.ssid, '0'): 'ssid_asp.html',
+               (BroadcomPages.ssid, '1'): 'ssid_asp.html',
+               (BroadcomPages.lan, None): 'lan_asp.html',
+               (BroadcomPages.firmware, None): 'firmware_asp.html'}
+
+
+class TestStatusReader(unittest.TestCase):
+    def setUp(self):
+        self.requests = []
+        self.connection = MagicMock()
+        self.connection.side_effect = self.answer
+        page_cache(self.connection).ttl = 0
+        query = dict((band[0], BroadcomRadioQuerier(connection=self.connection, band=band))
+                     for band in BANDS)
+        ssid_query = dict((band[0], BroadcomSSIDQuerier(connection=self.connection, band=band))
+                          for band in BANDS)
+        self.reader = StatusReader(query, ssid_query,
+                                   BroadcomLANQuerier(connection=self.connection),
+                                   BroadcomFirmwareQuerier(connection=self.connection))
+        return
+
+    def answer(self, data=None):
+        """
+        Records the request and answers with the saved page
+        """
+        unit = None
+        if data:
+            unit = data.get(BroadcomWirelessData.wireless_interface)
+        self.requests.append((self.connection.path, unit))
+        response = MagicMock()
+        response.text = open(SAVED_PAGES[(self.connection.path, unit)]).read()
+        return response
+
+    def test_status(self):
+        """
+        Does the status for both bands get each page once?
+        """
+        status = self.reader(BandEnumeration.both)
+        self.assertEqual([(BroadcomPages.radio, '0'), (BroadcomPages.ssid, '0'),
+                          (BroadcomPages.radio, '1'), (BroadcomPages.ssid, '1'),
+                          (BroadcomPages.lan, None), (BroadcomPages.firmware, None)],
+                         self.requests)
+        self.assertEqual(BANDS, tuple(band.band for band in status.bands))
+        self.assertEqual('44', status.bands[1].channel)
+        self.assertEqual('hownowbrowndog', status.bands[0].ssid)
+        # the values are the ones the queriers read
+        self.assertEqual(self.reader.query['5'].state, status.bands[1].state)
+        self.assertEqual(self.reader.lan_query.dhcp_state, status.dhcp_state)
+        self.assertEqual(self.reader.firmware_query.os_version, status.os_version)
+        return
+
+    def test_band(self):
+        """
+        Does the status for one band only get that band's pages?
+        """
+        status = self.reader(BandEnumeration.five)
+        self.assertEqual([(BroadcomPages.radio, '1'), (BroadcomPages.ssid, '1'),
+                          (BroadcomPages.lan, None), (BroadcomPages.firmware, None)],
+                         self.requests)
+        self.assertEqual([BandEnumeration.five], [band.band for band in status.bands])
+        self.assertEqual(self.reader.queriers(BandEnumeration.five),
+                         [self.reader.query['5'], self.reader.ssid_query['5'],
+                          self.reader.lan_query, self.reader.firmware_query])
+        return
+
+    def test_lines(self):
+        """
+        Are the lines the ones the status has always printed?
+        """
+        bands = (BandStatus('2.4', '11', 'ape', 'Enabled', 'none'),
+                 BandStatus('5', '44', 'ape5', 'Disabled', 'lower'))
+        status = BroadcomStatus(bands, 'Enabled', 'b1', 'o2', 'w3')
+        self.assertEqual(['2.4 GHz:', '\tChannel: 11', '\tSSID: ape', '\tState: Enabled',
+                          '5 GHz:', '\tChannel: 44', '\tSSID: ape5', '\tState: Disabled',
+                          '\tSideband: lower',
+                          'DHCP: Enabled', 'Bootloader Version: b1', 'OS Version: o2',
+                          'WL Driver Version: w3'],
+                         status.lines())
+        return
+# end class TestStatusReader
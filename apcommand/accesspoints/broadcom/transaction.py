@@ -0,0 +1,220 @@
+# python standard library
+from collections import namedtuple
+
+# this package
+from apcommand.baseclass import BaseClass
+from apcommand.accesspoints.broadcom.commons import BroadcomError
+from apcommand.accesspoints.broadcom.pagecache import page_cache
+from apcommand.accesspoints.broadcom.planner import RequestPlanner, unit
+
+TransactionRequest = namedtuple('TransactionRequest', 'page unit data commands')
+
+
+class TransactionConflict(BroadcomError):
+    """
+    An error to raise if two commands set the same field to different values
+    """
+
+class BroadcomTransaction(BaseClass):
+    """
+    Merges commands into the fewest Apply requests
+    """
+    def __init__(self, connection, commands=None):
+        """
+        BroadcomTransaction constructor
+
+        :param:
+
+         - `connection`: the connection to the AP (HTTPConnection)
+         - `commands`: collection of commands to start the transaction with
+        """
+        super(BroadcomTransaction, self).__init__()
+        self.connection = connection
+        self.commands = list(commands) if commands is not None else []
+        self.sent = None
+        self.saved = None
+        return
+
+    def add(self, command):
+        """
+        Adds a command to the transaction
+
+        :param:
+
+         - `command`: a BroadcomBaseCommand (with its settings set)
+        """
+        self.commands.append(command)
+        return
+
+    def pending(self):
+        """
+        The commands to send (leaves out the skip_unchanged commands the AP already matches)
+
+        :return: list of commands
+        """
+        return [command for command in self.commands
+                if not (command.skip_unchanged and command.unchanged())]
+
+    def requests(self):
+        """
+        Merges the commands' data for each (page, wl_unit)
+
+        :return: list of TransactionRequests (in the order to send them)
+        :raise: TransactionConflict if commands in a request set a field to different values
+        """
+        requests = []
+        merged = {}
+        for command in RequestPlanner(self.pending()).plan():
+            key = (command.asp_page, unit(command))
+            if key not in merged:
+                merged[key] = TransactionRequest(command.asp_page, key[1],
+                                                 command.base_data.copy(), [])
+                requests.append(merged[key])
+            request = merged[key]
+            for field, value in command.non_base_data.iteritems():
+                if field in request.data and request.data[field] != value:
+                    message = "{0} sets {1} to {2} but it's already {3} ({4})"
+                    raise TransactionConflict(message.format(command.__class__.__name__, field,
+                                                             value, request.data[field],
+                                                             request.page))
+                request.data[field] = value
+            request.commands.append(command)
+        return requests
+
+    def __call__(self):
+        """
+        Sends the merged requests
+
+        :return: list of the TransactionRequests sent
+        :raise: TransactionConflict (before anything is sent) if the commands conflict
+        """
+        requests = self.requests()
+        self.sent = requests
+        self.saved = len(self.commands) - len(requests)
+        self.logger.debug("Sending {0} commands as {1} requests".format(len(self.commands),
+                                                                        len(requests)))
+        with self.connection.lock:
+            for request in requests:
+                for command in request.commands:
+                    command.store()
+                self.connection.path = request.page
+                self.connection(data=request.data)
+                page_cache(self.connection).invalidate(request.page)
+        return requests
+# end class BroadcomTransaction
+
+# python standard library
+import unittest
+
+# third-party
+from mock import MagicMock, call, patch
+
+# this package
+from apcommand.accesspoints.broadcom.commons import BroadcomPages
+from apcommand.accesspoints.broadcom.commands import DisableInterface, EnableInterface
+from apcommand.accesspoints.broadcom.commands import SetChannel, SetSideband, SetSSID
+
+class TestBroadcomTransaction(unittest.TestCase):
+    def setUp(self):
+        self.connection = MagicMock()
+        self.journal = MagicMock()
+        self.enable = EnableInterface(connection=self.connection, band='5')
+        self.channel = SetChannel(connection=self.connection)
+        self.channel.channel = 44
+        self.sideband = SetSideband(connection=self.connection)
+        self.sideband.direction = 'lower'
+        self.disable = DisableInterface(connection=self.connection, band='2.4')
+        self.ssid = SetSSID(connection=self.connection, band='5')
+        self.ssid.ssid = 'ummagumma'
+        self.commands = [self.disable, self.enable, self.channel, self.ssid, self.sideband]
+        for command in self.commands:
+            command._journal = self.journal
+        self.transaction = BroadcomTransaction(self.connection, self.commands[:-1])
+        self.transaction.add(self.sideband)
+        return
+
+    def test_requests(self):
+        """
+        Are the commands merged into one request for each (page, wl_unit)?
+        """
+        requests = self.transaction.requests()
+        self.assertEqual([(BroadcomPages.radio, '0', {'action': 'Apply', 'wl_unit': '0',
+                                                      'wl_radio': '0'}),
+                          (BroadcomPages.radio, '1', {'action': 'Apply', 'wl_unit': '1',
+                                                      'wl_radio': '1', 'wl_channel': '44',
+                                                      'wl_nctrlsb': 'lower'}),
+                          (BroadcomPages.ssid, '1', {'action': 'Apply', 'wl_unit': '1',
+                                                     'wl_ssid': 'ummagumma'})],
+                         [request[:3] for request in requests])
+        self.assertEqual([self.enable, self.channel, self.sideband], requests[1].commands)
+        # nothing has been sent yet
+        self.assertEqual((None, None), (self.transaction.sent, self.transaction.saved))
+        return
+
+    def test_conflict(self):
+        """
+        Does setting a field to two values raise a TransactionConflict?
+        """
+        other = SetChannel(connection=self.connection)
+        other.channel = 149
+        self.transaction.add(other)
+        self.assertRaises(TransactionConflict, self.transaction)
+        self.assertEqual([], self.connection.mock_calls)
+        # the same value twice isn't a conflict
+        again = SetSideband(connection=self.connection)
+        again.direction = 'lower'
+        self.assertEqual(3, len(BroadcomTransaction(self.connection,
+                                                    self.commands + [again]).requests()))
+        return
+
+    def test_call(self):
+        """
+        Does it journal the commands, send one request for each (page, wl_unit) and clear the cache?
+        """
+        self.channel._querier = MagicMock()
+        self.channel._querier.channel = '36'
+        self.enable._querier = MagicMock()
+        cache = page_cache(self.connection)
+        cache.page(BroadcomPages.ssid, {'wl_unit': '1'})
+        cache.page(BroadcomPages.lan)
+        self.connection.reset_mock()
+        requests = self.transaction()
+        self.assertEqual([call(data=request.data) for request in requests],
+                         self.connection.call_args_list)
+        self.assertEqual(requests, self.transaction.sent)
+        self.assertEqual(2, self.transaction.saved)
+        self.assertEqual(BroadcomPages.ssid, self.connection.path)
+        # the disable, enable and channel are journaled (the sideband and ssid have no undo)
+        self.assertEqual(3, len(self.journal.append.mock_calls))
+        self.assertEqual([BroadcomPages.lan], [key.page for key in cache.pages])
+        return
+
+    def test_skip_unchanged(self):
+        """
+        Are the commands that wouldn't change anything left out?
+        """
+        for command in self.commands:
+            command.skip_unchanged = True
+            command._querier = MagicMock()
+            command._querier.state = 'Enabled'
+            command._querier.channel = '44'
+            command._querier.sideband = 'Lower'
+        # the 2.4 GHz interface is already disabled
+        self.disable._querier.state = 'Disabled'
+        self.assertEqual([self.ssid], self.transaction.pending())
+        self.transaction()
+        self.assertEqual([call(data={'action': 'Apply', 'wl_unit': '1',
+                                     'wl_ssid': 'ummagumma'})],
+                         self.connection.call_args_list)
+        # saved doesn't plan (and read the AP) again
+        with patch.object(self.transaction, 'pending') as pending:
+            self.assertEqual(4, self.transaction.saved)
+        self.assertFalse(pending.called)
+        self.channel.skip_unchanged = False
+        self.assertEqual([(BroadcomPages.radio, '1', {'action': 'Apply', 'wl_unit': '1',
+                                                      'wl_channel': '44'}),
+                          (BroadcomPages.ssid, '1', {'action': 'Apply', 'wl_unit': '1',
+                                                     'wl_ssid': 'ummagumma'})],
+                         [request[:3] for request in self.transaction.requests()])
+        return
+# end class TestBroadcomTransaction
@@ -0,0 +1,656 @@
+# python standard library
+from telnetlib import IAC, WILL, ECHO
+import argparse
+import re
+import shlex
+import socket
+import SocketServer
+import threading
+import time
+
+# this package
+from apcommand.baseclass import BaseClass
+
+EOL = '\r\n'
+EMPTY_STRING = ''
+SPACE = ' '
+PROMPT = 'root@ap:~# '
+LOGIN_PROMPT = 'ap login: '
+PASSWORD_PROMPT = 'Password: '
+BANNER = EOL.join(('', '', 'BusyBox v1.01 (2011.03.24-09:29+0000) Built-in shell (ash)',
+                   "Enter 'help' for a list of built-in commands.", '', ''))
+# shell variable assignments (e.g. PS1=xyz)
+ASSIGNMENT = re.compile(r'^\s*(?P<name>[A-Za-z_]\w*)=(?P<value>.*)$')
+# telnet commands (like the client's refusal of ECHO) that end up in the input
+TELNET_COMMAND = re.compile(IAC + '[\xfb-\xfe].|' + IAC + '.')
+MAC_ADDRESS = '00:03:7F:12:3A:0F'
+FIVE_GHZ_SUFFIX = '_2'
+G_CHANNELS = range(1, 12)
+A_CHANNELS = [36, 40, 44, 48, 149, 153, 157, 161, 165]
+FACTORY_SETTINGS = {'AP_IPADDR': '192.168.1.2',
+                    'AP_NETMASK': '255.255.255.0',
+                    'AP_RADIO_ID': '0',
+                    'AP_STARTMODE': 'dual',
+                    'AP_SSID': 'Atheros_XSpan_2G',
+                    'AP_SECMODE': 'None',
+                    'AP_PRIMARY_CH': '11',
+                    'AP_CHMODE': '11NGHT20',
+                    'AP_PRIMARY_CH_2': '40',
+                    'AP_CHMODE_2': '11NAHT40MINUS'}
+
+class FakeAtheros(BaseClass):
+    """
+    The state and commands of a stand-in Atheros AP
+    """
+    def __init__(self, latencies=None):
+        """
+        FakeAtheros constructor
+
+        :param:
+
+         - `latencies`: dict of command name: seconds to wait before answering
+        """
+        super(FakeAtheros, self).__init__()
+        if latencies is None:
+            latencies = {}
+        self.latencies = latencies
+        self.settings = dict(FACTORY_SETTINGS)
+        self.committed = dict(FACTORY_SETTINGS)
+        self.interfaces = {}
+        self.calls = []
+        self.lock = threading.RLock()
+        self.commands = {'cfg': self.cfg,
+                         'apup': self.apup,
+                         'apdown': self.apdown,
+                         'iwconfig': self.iwconfig,
+                         'iwlist': self.iwlist,
+                         'ifconfig': self.ifconfig,
+                         'wlanconfig': self.wlanconfig,
+                         'echo': self.echo}
+        return
+
+    def run(self, line, environment=None):
+        """
+        Runs a command-line
+
+        :param:
+
+         - `line`: statements separated by semicolons
+         - `environment`: dict of the session's shell variables
+
+        :return: list of lines of output (without line endings)
+        """
+        if environment is None:
+            environment = {}
+        output = []
+        for statement in split(line, ';'):
+            if statement.strip():
+                output.extend(self.pipeline(statement, environment))
+        return output
+
+    def pipeline(self, statement, environment):
+        """
+        Runs a command and pipes its output through the commands after it
+
+        :param:
+
+         - `statement`: commands separated by pipes ('|') or a variable assignment
+         - `environment`: dict to put variable assignments in
+
+        :return: list of lines of output
+        """
+        assignment = ASSIGNMENT.match(statement)
+        if assignment is not None:
+            value = shlex.split(assignment.group('value')) or [EMPTY_STRING]
+            environment[assignment.group('name')] = value[0]
+            return []
+        lines = None
+        for command in split(statement, '|'):
+            try:
+                arguments = shlex.split(command)
+            except ValueError as error:
+                return ['sh: syntax error: {0}'.format(error)]
+            if not arguments:
+                return ['sh: syntax error: unexpected "|"']
+            name, arguments = arguments[0], arguments[1:]
+            if lines is not None and name == 'grep':
+                lines = self.grep(lines, *arguments)
+                continue
+            if name not in self.commands:
+                return ['sh: {0}: not found'.format(name)]
+            latency = self.latencies.get(name, 0)
+            if latency:
+                # wait before taking the lock so the other sessions don't wait too
+                time.sleep(latency)
+            with self.lock:
+                self.calls.append(name)
+                lines = self.commands[name](*arguments)
+        return lines
+
+    def cfg(self, *arguments):
+        """
+        Changes (-a), shows (-s), commits (-c) or clears (-x) the settings
+        """
+        if not arguments:
+            return ['usage: cfg [-a NAME=VALUE] [-r NAME] [-c] [-s] [-x]']
+        option = arguments[0]
+        if option == '-a' and len(arguments) == 2 and '=' in arguments[1]:
+            name, value = arguments[1].split('=', 1)
+            self.settings[name] = value
+        elif option == '-r' and len(arguments) == 2:
+            self.settings.pop(arguments[1], None)
+        elif option == '-c':
+            self.committed = dict(self.settings)
+        elif option == '-s':
+            return ['export {0}={1}'.format(name, self.settings[name])
+                    for name in sorted(self.settings)]
+        elif option == '-x':
+            self.settings = dict(FACTORY_SETTINGS)
+            self.committed = dict(FACTORY_SETTINGS)
+        else:
+            return ['cfg: invalid option {0}'.format(SPACE.join(arguments))]
+        return []
+
+    def radio(self, radio_id):
+        """
+        :param:
+
+         - `radio_id`: 0 (2.4 GHz) or 1 (5 GHz)
+
+        :return: dict with the radio's settings for an interface
+        """
+        suffix = FIVE_GHZ_SUFFIX if radio_id else EMPTY_STRING
+        mode = self.settings.get('AP_CHMODE' + suffix, FACTORY_SETTINGS['AP_CHMODE' + suffix])
+        return {'radio': radio_id,
+                'channel': int(self.settings.get('AP_PRIMARY_CH' + suffix,
+                                                 FACTORY_SETTINGS['AP_PRIMARY_CH' + suffix])),
+                'protocol': mode[2:4].lower(),
+                'bandwidth': mode[4:],
+                'ssid': self.settings.get('AP_SSID', EMPTY_STRING)}
+
+    def apup(self):
+        """
+        Creates the interfaces from the settings
+        """
+        self.interfaces = {}
+        if self.settings.get('AP_STARTMODE') == 'standard':
+            self.interfaces['ath0'] = self.radio(int(self.settings.get('AP_RADIO_ID', 0)))
+        else:
+            self.interfaces['ath0'] = self.radio(0)
+            self.interfaces['ath1'] = self.radio(1)
+        return ['Creating {0} on wifi{1}'.format(name, self.interfaces[name]['radio'])
+                for name in sorted(self.interfaces)]
+
+    def apdown(self):
+        """
+        Destroys the interfaces
+        """
+        lines = ['Destroying {0}'.format(name) for name in sorted(self.interfaces)]
+        self.interfaces = {}
+        return lines
+
+    def frequency(self, channel):
+        """
+        :return: the channel's center frequency in GHz (as a string)
+        """
+        if channel in G_CHANNELS:
+            return '{0:.3f}'.format(2.407 + 0.005 * channel)
+        return '{0:.3f}'.format(5 + 0.005 * channel).rstrip('0')
+
+    def iwconfig(self, interface=None):
+        """
+        Shows the wireless settings for the interface (all of them if not given)
+        """
+        if interface is None:
+            lines = []
+            for name in sorted(self.interfaces):
+                lines.extend(self.iwconfig(name))
+            return lines + ['lo        no wireless extensions.', EMPTY_STRING]
+        if interface not in self.interfaces:
+            return ['{0:<10}No such device'.format(interface)]
+        settings = self.interfaces[interface]
+        bitrate = 130 if settings['bandwidth'] == 'HT20' else 300
+        return ['{0:<10}IEEE 802.11{1}  ESSID:"{2}"'.format(interface, settings['protocol'],
+                                                             settings['ssid']),
+                '          Mode:Master  Frequency:{0} GHz  Access Point: {1}'.format(self.frequency(settings['channel']),
+                                                                                      MAC_ADDRESS),
+                '          Bit Rate:{0} Mb/s   Tx-Power:15 dBm'.format(bitrate),
+                '          RTS thr:off   Fragment thr:off',
+                '          Encryption key:off',
+                '          Power Management:off',
+                '          Link Quality=94/94  Signal level=-95 dBm  Noise level=-95 dBm',
+                EMPTY_STRING]
+
+    def iwlist(self, interface=None, command=None):
+        """
+        Lists the channels for the interface (only the `channel` command is supported)
+        """
+        if interface is None or command not in ('channel', 'frequency'):
+            return ['Usage: iwlist [interface] channel']
+        if interface not in self.interfaces:
+            return ["{0:<10}Interface doesn't support frequency information.".format(interface)]
+        settings = self.interfaces[interface]
+        channels = A_CHANNELS if settings['radio'] else G_CHANNELS
+        lines = ['{0:<10}{1} channels in total; available frequencies :'.format(interface,
+                                                                               len(channels))]
+        lines.extend('          Channel {0:02d} : {1} GHz'.format(channel, self.frequency(channel))
+                     for channel in channels)
+        lines.append('          Current Frequency:{0} GHz (Channel {1})'.format(self.frequency(settings['channel']),
+                                                                              settings['channel']))
+        return lines
+
+    def ifconfig(self, interface=None):
+        """
+        Shows the interface (the IP address is on br0)
+        """
+        names = ['br0'] + sorted(self.interfaces)
+        if interface is None:
+            lines = []
+            for name in names:
+                lines.extend(self.ifconfig(name))
+            return lines
+        if interface not in names:
+            return ['ifconfig: {0}: error fetching interface information: Device not found'.format(interface)]
+        lines = ['{0:<10}Link encap:Ethernet  HWaddr {1}'.format(interface, MAC_ADDRESS)]
+        if interface == 'br0':
+            lines.append('          inet addr:{0}  Bcast:0.0.0.0  Mask:{1}'.format(self.settings['AP_IPADDR'],
+                                                                                  self.settings['AP_NETMASK']))
+        lines.extend(['          UP BROADCAST RUNNING MULTICAST  MTU:1500  Metric:1', EMPTY_STRING])
+        return lines
+
+    def wlanconfig(self, interface=None, command=None, *arguments):
+        """
+        Destroys (or creates) an interface
+        """
+        if command == 'destroy':
+            if self.interfaces.pop(interface, None) is None:
+                return ['wlanconfig: ioctl: No such device']
+            return []
+        if command == 'create':
+            name = 'ath{0}'.format(len(self.interfaces))
+            radio_id = 1 if 'wifi1' in arguments else 0
+            self.interfaces[name] = self.radio(radio_id)
+            return [name]
+        return ['usage: wlanconfig athX destroy']
+
+    def echo(self, *arguments):
+        """
+        Prints the arguments
+        """
+        return [SPACE.join(arguments)]
+
+    def grep(self, lines, pattern=EMPTY_STRING, *arguments):
+        """
+        Keeps the lines that have the pattern in them
+
+        :param:
+
+         - `lines`: output of the command piped into grep
+         - `pattern`: the string to look for
+        """
+        return [line for line in lines if pattern in line]
+# end class FakeAtheros
+
+def split(line, separator):
+    """
+    Splits the line at separators that aren't in quotes
+
+    :param:
+
+     - `line`: string to split
+     - `separator`: the character to split it at
+
+    :return: list of strings
+    """
+    pieces = []
+    piece = []
+    quote = None
+    for character in line:
+        if quote is not None:
+            if character == quote:
+                quote = None
+        elif character in '\'"':
+            quote = character
+        elif character == separator:
+            pieces.append(EMPTY_STRING.join(piece))
+            piece = []
+            continue
+        piece.append(character)
+    pieces.append(EMPTY_STRING.join(piece))
+    return pieces
+
+class FakeAtherosHandler(SocketServer.StreamRequestHandler):
+    """
+    A telnet session with the fake AP
+    """
+    disable_nagle_algorithm = True
+
+    def readline(self):
+        """
+        :return: the next line from the client without telnet commands or line endings (None at EOF)
+        """
+        try:
+            line = self.rfile.readline()
+        except socket.error:
+            # the client reset the connection instead of closing it
+            return None
+        if not line:
+            return None
+        return TELNET_COMMAND.sub(EMPTY_STRING, line).rstrip('\r\n\0')
+
+    def login(self):
+        """
+        Asks for the login and password until they're right
+
+        :return: True if the client logged in, False if it hung up
+        """
+        server = self.server
+        while True:
+            self.wfile.write(LOGIN_PROMPT)
+            username = self.readline()
+            if username is None:
+                return False
+            self.wfile.write(username + EOL)
+            password = None
+            if server.password is not None:
+                self.wfile.write(PASSWORD_PROMPT)
+                password = self.readline()
+                if password is None:
+                    return False
+                self.wfile.write(EOL)
+            if username == server.username and password == server.password:
+                return True
+            self.wfile.write(EOL + 'Login incorrect' + EOL)
+        return
+
+    def handle(self):
+        """
+        Logs the client in then runs its commands until it hangs up
+        """
+        try:
+            self.wfile.write(IAC + WILL + ECHO)
+            if not self.login():
+                return
+            time.sleep(self.server.ap.latencies.get('login', 0))
+            environment = {'PS1': PROMPT}
+            self.wfile.write(BANNER + environment['PS1'])
+            while True:
+                line = self.readline()
+                if line is None:
+                    break
+                output = self.server.ap.run(line, environment)
+                self.wfile.write(EMPTY_STRING.join(text + EOL for text in [line] + output) +
+                                 environment['PS1'])
+        except socket.error:
+            # the client dropped the connection while we were answering it
+            pass
+        return
+
+    def finish(self):
+        """
+        Flushes and closes the session's files (unless the client already dropped the connection)
+        """
+        try:
+            SocketServer.StreamRequestHandler.finish(self)
+        except socket.error:
+            pass
+        return
+# end class FakeAtherosHandler
+
+class FakeAtherosServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    """
+    A telnet server on the loopback interface that acts like an Atheros AP
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, username='root', password='5up', latencies=None, port=0,
+                 host='127.0.0.1'):
+        """
+        FakeAtherosServer constructor
+
+        :param:
+
+         - `username`: the login name it accepts
+         - `password`: the password it accepts (None to not ask for one)
+         - `latencies`: dict of command name (or 'login'): seconds to wait before answering
+         - `port`: port to serve on (0 lets the operating system pick one)
+         - `host`: address to serve on
+        """
+        SocketServer.TCPServer.__init__(self, (host, port), FakeAtherosHandler)
+        self.username = username
+        self.password = password
+        self.ap = FakeAtheros(latencies=latencies)
+        return
+
+    @property
+    def port(self):
+        """
+        The port the server is listening on
+        """
+        return self.server_address[1]
+
+    def start(self):
+        """
+        Serves in a daemon thread
+        """
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return
+
+    def stop(self):
+        """
+        Stops serving and closes the listening socket
+        """
+        self.shutdown()
+        self.server_close()
+        return
+# end class FakeAtherosServer
+
+def main():
+    """
+    Runs the fake AP until it's killed
+    """
+    parser = argparse.ArgumentParser(description="A stand-in Atheros AP telnet server")
+    parser.add_argument('--port', type=int, default=2323,
+                        help="port to serve on (default: %(default)s)")
+    parser.add_argument('--host', default='127.0.0.1',
+                        help="address to serve on (default: %(default)s)")
+    parser.add_argument('--latency', nargs=2, action='append', default=[],
+                        metavar=('COMMAND', 'SECONDS'),
+                        help="time for a command (or 'login') to take (can be repeated)")
+    arguments = parser.parse_args()
+    latencies = dict((command, float(seconds)) for command, seconds in arguments.latency)
+    server = FakeAtherosServer(latencies=latencies, port=arguments.port,
+                               host=arguments.host)
+    print "Serving the fake Atheros AP on {0}:{1}".format(arguments.host, server.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    return
+
+# python standard library
+import socket
+import struct
+import unittest
+
+# third-party
+from mock import patch
+
+# this package
+from apcommand.accesspoints.atheros import AtherosAR5KAP
+from apcommand.commons.errors import TimeoutError
+from apcommand.connections.telnetconnection import TelnetConnection
+
+class TestFakeAtheros(unittest.TestCase):
+    def setUp(self):
+        self.ap = FakeAtheros()
+        return
+
+    def test_cfg(self):
+        """
+        Do the cfg options change the settings?
+        """
+        self.assertEqual([], self.ap.run('cfg -a AP_SSID=fake'))
+        self.assertIn('export AP_SSID=fake', self.ap.run('cfg -s'))
+        self.assertEqual('Atheros_XSpan_2G', self.ap.committed['AP_SSID'])
+        self.ap.run('cfg -c')
+        self.assertEqual('fake', self.ap.committed['AP_SSID'])
+        self.ap.run('cfg -x')
+        self.assertEqual(FACTORY_SETTINGS, self.ap.settings)
+        self.assertEqual(['cfg: invalid option -q'], self.ap.run('cfg -q'))
+        return
+
+    def test_apup(self):
+        """
+        Does apup create the interfaces from the settings?
+        """
+        self.ap.run('apup')
+        self.assertEqual(['ath0', 'ath1'], sorted(self.ap.interfaces))
+        self.ap.run('apdown; cfg -a AP_RADIO_ID=1; cfg -a AP_STARTMODE=standard')
+        self.assertEqual({}, self.ap.interfaces)
+        self.ap.run('cfg -a AP_PRIMARY_CH_2=153; apup')
+        self.assertEqual(['ath0'], sorted(self.ap.interfaces))
+        self.assertIn('          Current Frequency:5.765 GHz (Channel 153)',
+                      self.ap.run('iwlist ath0 channel'))
+        self.assertIn('IEEE 802.11na', self.ap.run('iwconfig ath0')[0])
+        self.assertEqual(['wlanconfig: ioctl: No such device'], self.ap.run('wlanconfig ath1 destroy'))
+        self.assertEqual([], self.ap.run('wlanconfig ath0 destroy'))
+        self.assertEqual(['ath0      No such device'], self.ap.run('iwconfig ath0'))
+        return
+
+    def test_pipeline(self):
+        """
+        Do the pipes, quotes and semicolons work?
+        """
+        self.assertEqual(['          inet addr:192.168.1.2  Bcast:0.0.0.0  Mask:255.255.255.0'],
+                         self.ap.run("ifconfig br0 | grep 'inet addr'"))
+        self.assertEqual(['APCOMMAND_a_0_start', 'a;b', 'APCOMMAND_a_0_end'],
+                         self.ap.run("echo APCOMMAND''_a_0_start; echo 'a;b'; echo APCOMMAND''_a_0_end"))
+        self.assertEqual(['sh: reboot: not found'], self.ap.run('reboot'))
+        environment = {}
+        self.assertEqual(['a'], self.ap.run("echo a; PS1='xyz# '", environment))
+        self.assertEqual({'PS1': 'xyz# '}, environment)
+        return
+
+    def test_latencies(self):
+        """
+        Does a command wait for its latency?
+        """
+        self.ap.latencies['apup'] = 0.1
+        sleeps = []
+        with patch('time.sleep', sleeps.append):
+            self.ap.run('apdown')
+            self.assertEqual([], sleeps)
+            self.ap.run('apup')
+        self.assertEqual([0.1], sleeps)
+        self.assertEqual(['apdown', 'apup'], self.ap.calls)
+        return
+
+    def test_concurrent(self):
+        """
+        Can one session run a command while another waits for its latency?
+        """
+        self.ap.latencies['apup'] = 1
+        waiting, done = threading.Event(), threading.Event()
+
+        def sleep(seconds):
+            waiting.set()
+            done.wait(5)
+            return
+
+        with patch('time.sleep', sleep):
+            session = threading.Thread(target=self.ap.run, args=('apup',))
+            session.start()
+            waiting.wait(5)
+            self.ap.run('apdown')
+            done.set()
+            session.join(5)
+        # the apdown didn't have to wait for the apup's latency
+        self.assertEqual(['apdown', 'apup'], self.ap.calls)
+        return
+# end class TestFakeAtheros
+
+class TestFakeAtherosServer(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeAtherosServer()
+        self.server.start()
+        return
+
+    def tearDown(self):
+        self.server.stop()
+        return
+
+    def connection(self, password='5up'):
+        return TelnetConnection(hostname='127.0.0.1', port=self.server.port,
+                                username='root', password=password, framed=True)
+
+    def test_connection(self):
+        """
+        Does the TelnetConnection log in and get the output?
+        """
+        connection = self.connection()
+        output, error = connection.cfg('-s')
+        lines = output.readlines()
+        self.assertIn('export AP_SSID=Atheros_XSpan_2G\r\n', lines)
+        self.assertEqual(len(FACTORY_SETTINGS), len([line for line in lines if line]))
+        self.assertIsNotNone(connection.login_time)
+        # an output that wasn't read doesn't get in the way
+        connection.cfg('-s')
+        output, error = connection.echo('done')
+        self.assertEqual('done\r\n', output.read())
+        connection.close()
+        return
+
+    def test_set_channel(self):
+        """
+        Can the AtherosAR5KAP change the channel?
+        """
+        ap = AtherosAR5KAP(connection=self.connection())
+        ap.set_channel('36')
+        self.assertEqual(36, self.server.ap.interfaces['ath0']['channel'])
+        self.assertEqual('11NAHT40PLUS', self.server.ap.committed['AP_CHMODE_2'])
+        ap.set_ssid('fake', '2.4')
+        self.assertEqual('fake', self.server.ap.interfaces['ath0']['ssid'])
+        ap.close()
+        return
+
+    def test_bad_password(self):
+        """
+        Does a wrong password keep the client from getting a prompt?
+        """
+        connection = self.connection(password='wrong')
+        connection.timeout = 0.2
+        self.assertRaises(TimeoutError, getattr, connection, 'client')
+        return
+
+    def test_reset(self):
+        """
+        Does a client that resets the connection end its session without an error?
+        """
+        closed = threading.Event()
+        shutdown_request = self.server.shutdown_request
+
+        def shutdown(request):
+            shutdown_request(request)
+            closed.set()
+            return
+
+        with patch.object(self.server, 'shutdown_request', side_effect=shutdown), \
+             patch.object(self.server, 'handle_error') as handle_error:
+            client = socket.create_connection(('127.0.0.1', self.server.port))
+            client.recv(1024)
+            # a zero linger makes the close send a reset
+            client.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            client.close()
+            closed.wait(5)
+        self.assertTrue(closed.is_set())
+        self.assertFalse(handle_error.called)
+        return
+# end class TestFakeAtherosServer
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,514 @@
+# python standard library
+from collections import namedtuple
+import argparse
+import BaseHTTPServer
+import cgi
+import os
+import re
+import socket
+import SocketServer
+import threading
+import time
+import urlparse
+
+# this package
+import apcommand.accesspoints.broadcom
+from apcommand.connections.ratelimiter import monotonic
+
+PAGE_DIRECTORY = os.path.dirname(apcommand.accesspoints.broadcom.__file__)
+WL_UNIT = 'wl_unit'
+DEFAULT_UNIT = '0'
+ACTION = 'action'
+APPLY = 'Apply'
+# form-fields that choose what to do instead of being settings
+NOT_SETTINGS = (ACTION, WL_UNIT)
+# page-name: {wl_unit: saved html-file}
+PAGES = {'radio.asp': {'0': 'radio_asp.html', '1': 'radio_5_asp.html'},
+         'ssid.asp': {'0': 'ssid_asp.html'},
+         'lan.asp': {'0': 'lan_asp.html'},
+         'firmware.asp': {'0': 'firmware_asp.html'}}
+NOT_FOUND = 404
+OK = 200
+
+INPUT_EXPRESSION = r'(<input[^>]*\bname="{0}"[^>]*\bvalue=")[^"]*(")'
+SELECT_EXPRESSION = r'(<select[^>]*\bname="{0}"[^>]*>)(.*?)(</select>)'
+OPTION_EXPRESSION = re.compile(r'<option value="(?P<value>[^"]*)"\s*(selected)?\s*>')
+OPTION = '<option value="{0}" {1}>'
+SELECTED = 'selected'
+
+
+def set_input(html, name, value):
+    """
+    Sets the value of the <input> field
+
+    :param:
+
+     - `html`: text of the page
+     - `name`: name of the field
+     - `value`: new value for the field
+
+    :return: html with the new value (unchanged if the field isn't on the page)
+    """
+    expression = re.compile(INPUT_EXPRESSION.format(re.escape(name)))
+    value = cgi.escape(value, quote=True)
+    return expression.sub(lambda match: match.group(1) + value + match.group(2), html)
+
+
+def set_select(html, name, value):
+    """
+    Selects the value in the <select> field
+
+    :param:
+
+     - `html`: text of the page
+     - `name`: name of the field
+     - `value`: value of the option to select
+
+    :return: html with the option selected (unchanged if the field isn't on the page)
+    """
+    expression = re.compile(SELECT_EXPRESSION.format(re.escape(name)), re.DOTALL)
+    value = cgi.escape(value, quote=True)
+
+    def select(match):
+        options = match.group(2)
+        values = [option.group('value') for option in OPTION_EXPRESSION.finditer(options)]
+        if value in values:
+            options = OPTION_EXPRESSION.sub(
+                lambda option: OPTION.format(option.group('value'),
+                                             SELECTED if option.group('value') == value else ''),
+                options)
+        else:
+            options = "\n\t  {0}</option>\n\t".format(OPTION.format(value, SELECTED))
+        return match.group(1) + options + match.group(3)
+    return expression.sub(select, html)
+
+
+def render(html, settings):
+    """
+    Writes the settings into the page's form-fields
+
+    :param:
+
+     - `html`: text of the saved page
+     - `settings`: dict of field-name:value
+
+    :return: html showing the settings
+    """
+    for name, value in sorted(settings.iteritems()):
+        html = set_select(set_input(html, name, value), name, value)
+    return html
+
+Request = namedtuple('Request', 'method page form')
+
+
+class FakeBroadcomHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Answers requests with the saved Broadcom pages
+    """
+    # keep the connection open between requests (every answer has a Content-Length)
+    protocol_version = 'HTTP/1.1'
+
+    def form(self):
+        """
+        Reads the form-data from the query-string and the body
+
+        :return: dict of field-name:value (the last value if it was repeated)
+        """
+        parsed = urlparse.urlparse(self.path)
+        fields = urlparse.parse_qsl(parsed.query)
+        length = int(self.headers.getheader('content-length', 0))
+        if length:
+            fields += urlparse.parse_qsl(self.rfile.read(length))
+        return dict(fields)
+
+    def answer(self):
+        """
+        Applies the form (if it's an Apply) and sends the page (or a 404 if there isn't one)
+        """
+        page = urlparse.urlparse(self.path).path.lstrip('/')
+        form = self.form()
+        self.server.record(Request(self.command, page, form))
+        if self.server.refuse():
+            self.close_connection = 1
+            return
+        time.sleep(self.server.latency)
+        unit = form.get(WL_UNIT, DEFAULT_UNIT)
+        if form.get(ACTION) == APPLY:
+            self.server.apply(page, unit, form)
+        html = self.server.page(page, unit)
+        if html is None:
+            self.send_error(NOT_FOUND)
+            return
+        self.send_response(OK)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(html)))
+        self.end_headers()
+        self.wfile.write(html)
+        return
+
+    do_GET = answer
+    do_POST = answer
+
+    def handle(self):
+        """
+        Answers requests until the client hangs up (quietly if it drops the connection)
+        """
+        self.server.opened(self.connection)
+        try:
+            BaseHTTPServer.BaseHTTPRequestHandler.handle(self)
+        except socket.error:
+            self.close_connection = 1
+        return
+
+    def finish(self):
+        """
+        Flushes and closes the connection's files (unless the client already dropped it)
+        """
+        try:
+            BaseHTTPServer.BaseHTTPRequestHandler.finish(self)
+        except socket.error:
+            pass
+        self.server.closed(self.connection)
+        return
+
+    def log_message(self, format, *args):
+        """
+        Stops the handler from writing every request to stderr
+        """
+        return
+# end class FakeBroadcomHandler
+
+class FakeBroadcomServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    A web-server on the loopback interface that serves the saved Broadcom pages
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, latency=0, port=0, host='127.0.0.1', busy=0, clock=monotonic):
+        """
+        FakeBroadcomServer constructor
+
+        :param:
+
+         - `latency`: seconds to wait before answering each request
+         - `port`: port to serve on (0 lets the operating system pick one)
+         - `host`: address to serve on
+         - `busy`: seconds to refuse requests after an Apply
+         - `clock`: function that returns the time in seconds
+        """
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port), FakeBroadcomHandler)
+        self.latency = latency
+        self.busy = busy
+        self.clock = clock
+        self.requests = []
+        self.settings = {}
+        self.busy_until = None
+        self.refusals = 0
+        self.lock = threading.Lock()
+        self.connections = set()
+        self.pages = {}
+        for page, units in PAGES.iteritems():
+            for unit, filename in units.iteritems():
+                with open(os.path.join(PAGE_DIRECTORY, filename)) as html:
+                    self.pages[(page, unit)] = html.read()
+        return
+
+    @property
+    def port(self):
+        """
+        The port the server is listening on
+        """
+        return self.server_address[1]
+
+    @property
+    def hostname(self):
+        """
+        The host:port to give the BroadcomBCM94718NR
+        """
+        return "{0}:{1}".format(*self.server_address)
+
+    def page(self, name, unit=DEFAULT_UNIT):
+        """
+        Gets a page
+
+        :param:
+
+         - `name`: name of the page (e.g. 'radio.asp')
+         - `unit`: wl_unit for the page (pages without one use the default)
+
+        :return: html for the page (with the unit's settings) or None if it isn't one of the PAGES
+        """
+        html = self.pages.get((name, unit), self.pages.get((name, DEFAULT_UNIT)))
+        with self.lock:
+            settings = self.settings.get(unit, {}).copy()
+        if html is None or not settings:
+            return html
+        return render(html, settings)
+
+    def apply(self, name, unit, form):
+        """
+        Changes the unit's settings to the fields in the form and starts the busy window
+
+        :param:
+
+         - `name`: name of the page the form was sent to
+         - `unit`: wl_unit the form was sent for
+         - `form`: dict of field-name:value from the request
+        """
+        if name not in PAGES:
+            return
+        with self.lock:
+            settings = self.settings.setdefault(unit, {})
+            settings.update((field, value) for field, value in form.iteritems()
+                            if field not in NOT_SETTINGS)
+            self.busy_until = self.clock() + self.busy
+        return
+
+    def refuse(self):
+        """
+        Checks if the server is still busy from the last Apply (and counts the refusal)
+
+        :return: True if the request should be refused
+        """
+        with self.lock:
+            if self.busy_until is None or self.clock() >= self.busy_until:
+                return False
+            self.refusals += 1
+        return True
+
+    def reset(self):
+        """
+        Forgets the settings, the requests and the busy window
+        """
+        with self.lock:
+            self.settings.clear()
+            self.requests = []
+            self.busy_until = None
+            self.refusals = 0
+        return
+
+    def record(self, request):
+        """
+        Adds the request to the list of requests (the handlers run in separate threads)
+        """
+        with self.lock:
+            self.requests.append(request)
+        return
+
+    def opened(self, connection):
+        """
+        Keeps the client's socket so stop can shut it down
+
+        :param:
+
+         - `connection`: socket a handler is answering
+        """
+        with self.lock:
+            self.connections.add(connection)
+        return
+
+    def closed(self, connection):
+        """
+        Forgets a client's socket once its handler is done with it
+
+        :param:
+
+         - `connection`: socket a handler was answering
+        """
+        with self.lock:
+            self.connections.discard(connection)
+        return
+
+    def start(self):
+        """
+        Serves in a daemon thread
+        """
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return
+
+    def stop(self):
+        """
+        Stops serving, shuts down the connections still open and closes the listening socket
+        """
+        self.shutdown()
+        with self.lock:
+            connections = list(self.connections)
+        for connection in connections:
+            try:
+                # the handler waiting on it reads the end of the stream and finishes
+                connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        self.server_close()
+        return
+# end class FakeBroadcomServer
+
+def main():
+    """
+    Runs the fake AP until it's killed
+    """
+    parser = argparse.ArgumentParser(description="A stand-in Broadcom AP web-server")
+    parser.add_argument('--port', type=int, default=8080,
+                        help="port to serve on (default: %(default)s)")
+    parser.add_argument('--host', default='127.0.0.1',
+                        help="address to serve on (default: %(default)s)")
+    parser.add_argument('--latency', type=float, default=0,
+                        help="seconds to wait before each answer (default: %(default)s)")
+    parser.add_argument('--busy', type=float, default=0,
+                        help="seconds to refuse requests after an Apply (default: %(default)s)")
+    arguments = parser.parse_args()
+    server = FakeBroadcomServer(latency=arguments.latency, port=arguments.port,
+                                host=arguments.host, busy=arguments.busy)
+    print "Serving the fake Broadcom AP on {0}".format(server.hostname)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    return
+
+# python standard library
+import shutil
+import tempfile
+import unittest
+
+# third-party
+from mock import patch
+import requests
+
+# this package
+from apcommand.accesspoints.broadcom.broadcom import BroadcomBCM94718NR
+from apcommand.accesspoints.broadcom.journal import UndoJournal
+from apcommand.accesspoints.broadcom.parser import BroadcomRadioSoup, BroadcomSSIDSoup
+from apcommand.connections.retry import RetryPolicy
+
+class TestFakeBroadcomServer(unittest.TestCase):
+    def setUp(self):
+        self.now = 0
+        self.server = FakeBroadcomServer(clock=lambda: self.now)
+        self.server.start()
+        self.ap = BroadcomBCM94718NR(hostname=self.server.hostname, sleep=0)
+        # the commands journal to a temporary directory instead of the working directory
+        self.directory = tempfile.mkdtemp()
+        self.journal = UndoJournal(os.path.join(self.directory, 'apcommand.journal'))
+        self.journal_patch = patch('apcommand.accesspoints.broadcom.commands.undo_journal',
+                                   return_value=self.journal)
+        self.journal_patch.start()
+        return
+
+    def tearDown(self):
+        self.journal_patch.stop()
+        self.journal.close()
+        shutil.rmtree(self.directory)
+        self.server.stop()
+        return
+
+    def test_query(self):
+        """
+        Does it serve the radio page for the requested wl_unit?
+        """
+        self.assertEqual('44', self.ap.get_channel('5'))
+        self.assertEqual('hownowbrowndog', self.ap.get_ssid('2.4'))
+        self.assertEqual(Request('GET', 'radio.asp', {'wl_unit': '1'}),
+                         self.server.requests[0])
+        return
+
+    def test_apply(self):
+        """
+        Does it record the form-data for the commands?
+        """
+        self.ap.set_24_ssid('benchmark')
+        request = self.server.requests[-1]
+        self.assertEqual('ssid.asp', request.page)
+        self.assertEqual('Apply', request.form['action'])
+        self.assertEqual('benchmark', request.form['wl_ssid'])
+        return
+
+    def test_not_found(self):
+        """
+        Does it answer pages it doesn't have with a 404?
+        """
+        response = requests.get('http://{0}/nothere.asp'.format(self.server.hostname))
+        self.assertEqual(NOT_FOUND, response.status_code)
+        return
+
+    def test_render(self):
+        """
+        Do the settings get written into the saved pages?
+        """
+        radio = BroadcomRadioSoup(render(self.server.pages[('radio.asp', '0')],
+                                         {'wl_channel': '157', 'wl_radio': '1',
+                                          'wl_nctrlsb': 'upper', 'wl_ssid': 'ignored'}))
+        self.assertEqual('157', radio.channel)
+        self.assertEqual('Enabled', radio.interface_state)
+        self.assertEqual('Upper', radio.sideband)
+        ssid = BroadcomSSIDSoup(render(self.server.pages[('ssid.asp', '0')],
+                                       {'wl_ssid': 'say "when"'}))
+        self.assertEqual('say "when"', ssid.ssid)
+        return
+
+    def test_state(self):
+        """
+        Do the queriers read back what the commands set (for that wl_unit only)?
+        """
+        self.ap.set_24_ssid('benchmark')
+        self.assertEqual('benchmark', self.ap.get_ssid('2.4'))
+        self.assertEqual('hownowbrowndog', self.ap.get_ssid('5'))
+        self.ap.set_channel('157')
+        self.assertEqual('157', self.ap.get_channel('5'))
+        self.assertEqual('36', self.ap.get_channel('2.4'))
+        self.assertEqual('Enabled', self.ap.query['5'].state)
+        self.server.reset()
+        self.assertEqual(self.server.pages[('radio.asp', '1')],
+                         self.server.page('radio.asp', '1'))
+        return
+
+    def test_busy(self):
+        """
+        Does it refuse requests after an Apply until the busy time is up?
+        """
+        def wait(seconds):
+            self.now += seconds
+            return
+        self.server.busy = 0.6
+        self.ap.connection.retry = RetryPolicy(sleep=wait)
+        self.ap.set_24_ssid('benchmark')
+        with self.assertRaises(requests.ConnectionError):
+            requests.get('http://{0}/ssid.asp'.format(self.server.hostname))
+        self.assertEqual(1, self.server.refusals)
+        # the retries wait out the busy time
+        self.assertEqual('benchmark', self.ap.get_ssid('2.4'))
+        self.assertGreater(self.server.refusals, 1)
+        return
+
+    def test_stop(self):
+        """
+        Does stopping the server end the handlers of kept-alive connections without an error?
+        """
+        finished = threading.Event()
+        shutdown_request = self.server.shutdown_request
+
+        def shutdown(request):
+            shutdown_request(request)
+            finished.set()
+            return
+
+        session = requests.Session()
+        with patch.object(self.server, 'shutdown_request', side_effect=shutdown), \
+             patch.object(self.server, 'handle_error') as handle_error:
+            session.get('http://{0}/lan.asp'.format(self.server.hostname))
+            self.assertEqual(1, len(self.server.connections))
+            self.server.stop()
+            finished.wait(5)
+        self.assertTrue(finished.is_set())
+        self.assertFalse(handle_error.called)
+        self.assertEqual(set(), self.server.connections)
+        session.close()
+        return
+# end class TestFakeBroadcomServer
+
+if __name__ == '__main__':
+    main()
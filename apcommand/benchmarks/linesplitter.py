@@ -0,0 +1,188 @@
+# python standard library
+from collections import namedtuple
+import argparse
+import SocketServer
+import threading
+import time
+
+# this package
+from apcommand.baseclass import BaseClass
+from apcommand.connections.telnetconnection import TelnetAdapter
+
+PROMPT = 'root@benchmark #'
+LINE = 'AP_SETTING_{0:06d}=some-value-for-the-line-splitter-benchmark\r\n'
+LINE_COUNTS = (1000, 5000, 20000)
+REPETITIONS = 3
+READERS = (('TelnetOutput', False),
+           ('BufferedTelnetOutput', True))
+HEADER = "{0:<10} {1:<20} {2:>17}".format('Lines', 'Reader', 'Lines/Second')
+ROW = "{0:<10} {1:<20} {2:>17.0f}"
+
+class LineHandler(SocketServer.StreamRequestHandler):
+    """
+    Answers every command with the server's output
+    """
+    # otherwise the end of the output can sit waiting for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        """
+        Sends the prompt then answers commands until the client hangs up
+        """
+        self.wfile.write(PROMPT)
+        while True:
+            command = self.rfile.readline()
+            if not command:
+                break
+            self.wfile.write(command.rstrip() + '\r\n' + self.server.output + PROMPT)
+        return
+# end class LineHandler
+
+
+class LineServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    """
+    A server on the loopback interface that sends `lines` lines per command
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, lines):
+        """
+        LineServer constructor
+
+        :param:
+
+         - `lines`: the number of lines to send for each command
+        """
+        SocketServer.TCPServer.__init__(self, ('127.0.0.1', 0), LineHandler)
+        self.lines = lines
+        self.output = ''.join(LINE.format(index) for index in xrange(lines))
+        return
+
+    @property
+    def port(self):
+        """
+        The port the operating system picked for the server
+        """
+        return self.server_address[1]
+
+    def start(self):
+        """
+        Serves in a daemon thread
+        """
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return
+# end class LineServer
+
+Result = namedtuple('Result', 'lines reader lines_per_second')
+
+
+class LineSplitterBenchmark(BaseClass):
+    """
+    Times reading long outputs with the telnet readers
+    """
+    def __init__(self, line_counts=LINE_COUNTS, repetitions=REPETITIONS):
+        """
+        LineSplitterBenchmark constructor
+
+        :param:
+
+         - `line_counts`: collection of output sizes (in lines) to time
+         - `repetitions`: number of times to time each reader (the best is kept)
+        """
+        super(LineSplitterBenchmark, self).__init__()
+        self.line_counts = line_counts
+        self.repetitions = repetitions
+        return
+
+    def time_reader(self, port, lines, buffered):
+        """
+        Times reading the output of one command
+
+        :param:
+
+         - `port`: port of the LineServer
+         - `lines`: number of lines the server sends
+         - `buffered`: if True use the BufferedTelnetOutput
+
+        :return: seconds it took to read the output
+        :raise: AssertionError if the wrong number of lines came back
+        """
+        adapter = TelnetAdapter(host='127.0.0.1', port=port, prompt=PROMPT,
+                                timeout=10, buffered=buffered, framed=False)
+        try:
+            # the adapter logs in on its first use
+            adapter.client
+            start = time.time()
+            output = adapter.exec_command('cfg -s').readlines()
+            elapsed = time.time() - start
+        finally:
+            adapter.close()
+        # the echoed command and the EOF are extra
+        assert len(output) == lines + 2, "Expected {0} lines, got {1}".format(lines + 2,
+                                                                           len(output))
+        return elapsed
+
+    def run(self):
+        """
+        Times the readers for each line-count
+
+        :return: list of Results
+        """
+        results = []
+        for lines in self.line_counts:
+            server = LineServer(lines)
+            server.start()
+            try:
+                for name, buffered in READERS:
+                    elapsed = min(self.time_reader(server.port, lines, buffered)
+                                  for repetition in xrange(self.repetitions))
+                    self.logger.debug("{0} read {1} lines in {2} seconds".format(name,
+                                                                                 lines,
+                                                                                 elapsed))
+                    results.append(Result(lines, name, lines/elapsed))
+            finally:
+                server.shutdown()
+                server.server_close()
+        return results
+# end class LineSplitterBenchmark
+
+def main():
+    """
+    Runs the benchmark and prints a table of the results
+    """
+    parser = argparse.ArgumentParser(description="Times the telnet output readers")
+    parser.add_argument('--lines', type=int, nargs='+', default=LINE_COUNTS,
+                        help='Number of lines per output (default=%(default)s)')
+    parser.add_argument('--repetitions', type=int, default=REPETITIONS,
+                        help='Times to read each output, the best is kept (default=%(default)s)')
+    args = parser.parse_args()
+    benchmark = LineSplitterBenchmark(line_counts=args.lines,
+                                      repetitions=args.repetitions)
+    print HEADER
+    for result in benchmark.run():
+        print ROW.format(*result)
+    return
+
+# python standard library
+import unittest
+
+class TestLineSplitterBenchmark(unittest.TestCase):
+    def test_run(self):
+        """
+        Does each reader get a result for each line-count?
+        """
+        benchmark = LineSplitterBenchmark(line_counts=(10, 100), repetitions=1)
+        results = benchmark.run()
+        self.assertEqual([(10, 'TelnetOutput'), (10, 'BufferedTelnetOutput'),
+                          (100, 'TelnetOutput'), (100, 'BufferedTelnetOutput')],
+                         [(result.lines, result.reader) for result in results])
+        for result in results:
+            self.assertGreater(result.lines_per_second, 0)
+        return
+# end class TestLineSplitterBenchmark
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,527 @@
+# python standard library
+from collections import namedtuple
+from StringIO import StringIO
+import argparse
+import json
+import os
+import shutil
+import sys
+import telnetlib
+import tempfile
+import threading
+import time
+
+# third-party
+import bs4
+from requests.packages.urllib3.connection import HTTPConnection as Urllib3Connection
+
+# this package
+from apcommand.baseclass import BaseClass
+from apcommand.accesspoints.atheros import AtherosAR5KAP
+from apcommand.accesspoints.broadcom.broadcom import BroadcomBCM94718NR
+from apcommand.accesspoints.broadcom.parser import FormFieldParser
+from apcommand.benchmarks.fakeatheros import FakeAtherosServer
+from apcommand.benchmarks.fakebroadcom import FakeBroadcomServer
+from apcommand.commands.iwlist import IwlistLexer
+from apcommand.connections.telnetconnection import TelnetConnection
+
+CONNECT = 'connect'
+COMMAND = 'command'
+SLEEP = 'sleep'
+PARSE = 'parse'
+PHASES = (CONNECT, COMMAND, SLEEP, PARSE)
+TOTAL = 'seconds'
+REPETITIONS = 3
+# fraction slower than the baseline a phase can get before it's a regression
+TOLERANCE = 0.25
+# differences smaller than this (in seconds) are noise
+MINIMUM_DIFFERENCE = 0.005
+USERNAME = 'root'
+PASSWORD = '5up'
+REGRESSION = "{0} {1}: {2:.4f} seconds (baseline {3:.4f})"
+
+class PhaseTimer(BaseClass):
+    """
+    Splits the time for an operation into phases
+    """
+    def __init__(self):
+        """
+        PhaseTimer constructor
+        """
+        super(PhaseTimer, self).__init__()
+        self.totals = None
+        self.stack = None
+        self.thread = None
+        self.last = None
+        return
+
+    @property
+    def timing(self):
+        """
+        True if the timer was started by this thread (and not stopped)
+        """
+        return self.thread is threading.current_thread()
+
+    def charge(self):
+        """
+        Adds the time since the last change to the phase on top of the stack
+        """
+        now = time.time()
+        self.totals[self.stack[-1]] += now - self.last
+        self.last = now
+        return
+
+    def start(self):
+        """
+        Starts timing (in the command phase) for the calling thread
+        """
+        self.totals = dict.fromkeys(PHASES, 0)
+        self.stack = [COMMAND]
+        self.thread = threading.current_thread()
+        self.last = time.time()
+        return
+
+    def stop(self):
+        """
+        Stops timing
+
+        :return: dict of phase:seconds
+        """
+        self.charge()
+        self.thread = None
+        return self.totals
+
+    def push(self, phase):
+        """
+        Starts a phase (if this thread is being timed)
+
+        :param:
+
+         - `phase`: one of the PHASES
+
+        :return: True if the phase was started
+        """
+        if not self.timing:
+            return False
+        if phase == COMMAND and self.stack[-1] == CONNECT:
+            phase = CONNECT
+        self.charge()
+        self.stack.append(phase)
+        return True
+
+    def pop(self):
+        """
+        Ends the current phase and goes back to the one before it
+        """
+        self.charge()
+        self.stack.pop()
+        return
+
+    def wrap(self, phase, function):
+        """
+        Makes a function that runs `function` in `phase`
+
+        :param:
+
+         - `phase`: one of the PHASES
+         - `function`: callable to time
+
+        :return: function that times calls to `function`
+        """
+        def timed(*args, **kwargs):
+            pushed = self.push(phase)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                if pushed:
+                    self.pop()
+        return timed
+# end class PhaseTimer
+
+Seam = namedtuple('Seam', 'owner name phase')
+
+SEAMS = (Seam(time, 'sleep', SLEEP),
+         Seam(TelnetConnection, 'login', CONNECT),
+         Seam(Urllib3Connection, 'connect', CONNECT),
+         Seam(telnetlib.Telnet, 'read_until', COMMAND),
+         Seam(telnetlib.Telnet, 'read_very_eager', COMMAND),
+         Seam(telnetlib.Telnet, 'expect', COMMAND),
+         Seam(telnetlib.Telnet, 'write', COMMAND),
+         Seam(IwlistLexer, 'search', PARSE),
+         Seam(bs4.BeautifulSoup, '__init__', PARSE),
+         Seam(bs4.element.Tag, 'find_all', PARSE),
+         Seam(FormFieldParser, 'feed', PARSE))
+
+class Instruments(BaseClass):
+    """
+    A context manager to time the seams with a PhaseTimer
+    """
+    def __init__(self, timer, seams=SEAMS):
+        """
+        Instruments constructor
+
+        :param:
+
+         - `timer`: the PhaseTimer to wrap the seams with
+         - `seams`: collection of Seams to time
+        """
+        super(Instruments, self).__init__()
+        self.timer = timer
+        self.seams = seams
+        self.originals = None
+        return
+
+    def __enter__(self):
+        """
+        Replaces the seams with timed versions
+
+        :return: the timer
+        """
+        self.originals = []
+        for seam in self.seams:
+            # only the owner's own attribute gets put back, not an inherited one
+            self.originals.append(vars(seam.owner).get(seam.name))
+            setattr(seam.owner, seam.name,
+                    self.timer.wrap(seam.phase, getattr(seam.owner, seam.name)))
+        return self.timer
+
+    def __exit__(self, type, value, traceback):
+        """
+        Puts the original seams back
+        """
+        for seam, original in reversed(zip(self.seams, self.originals)):
+            if original is None:
+                delattr(seam.owner, seam.name)
+            else:
+                setattr(seam.owner, seam.name, original)
+        return
+# end class Instruments
+
+# name: function that runs the operation on the access point
+ATHEROS_OPERATIONS = (('atheros.set_channel', lambda ap: ap.set_channel('6')),
+                      ('atheros.set_ssid', lambda ap: ap.set_ssid('benchmark', '2.4')),
+                      ('atheros.status', lambda ap: ap.status()))
+
+BROADCOM_OPERATIONS = (('broadcom.get_status', lambda ap: ap.get_status('both')),
+                       ('broadcom.set_channel', lambda ap: ap.set_channel('6')),
+                       ('broadcom.enable', lambda ap: ap.enable('5')),
+                       ('broadcom.disable', lambda ap: ap.disable('5')))
+
+OPERATION_NAMES = [name for name, operation in ATHEROS_OPERATIONS + BROADCOM_OPERATIONS]
+
+Timing = namedtuple('Timing', 'operation seconds connect command sleep parse')
+Regression = namedtuple('Regression', 'operation phase baseline current')
+
+
+class OperationsBenchmark(BaseClass):
+    """
+    Times the access points' operations against the fake servers
+    """
+    def __init__(self, repetitions=REPETITIONS, operations=None):
+        """
+        OperationsBenchmark constructor
+
+        :param:
+
+         - `repetitions`: number of times to time each operation (the fastest is kept)
+         - `operations`: collection of operation names to run (default: all of them)
+        """
+        super(OperationsBenchmark, self).__init__()
+        self.repetitions = repetitions
+        self.operations = operations
+        self._timer = None
+        return
+
+    @property
+    def timer(self):
+        """
+        The PhaseTimer
+        """
+        if self._timer is None:
+            self._timer = PhaseTimer()
+        return self._timer
+
+    def selected(self, operations):
+        """
+        Filters operations to the ones that were asked for
+
+        :param:
+
+         - `operations`: collection of (name, function) pairs
+
+        :return: list of the (name, function) pairs in self.operations
+        """
+        return [(name, operation) for name, operation in operations
+                if self.operations is None or name in self.operations]
+
+    def time_operation(self, name, build, operation, cleanup):
+        """
+        Times an operation
+
+        :param:
+
+         - `name`: name for the operation
+         - `build`: callable that returns a new access point
+         - `operation`: callable that takes the access point and runs the operation
+         - `cleanup`: callable that takes the access point after it's timed
+
+        :precondition: the seams are instrumented with self.timer
+        :return: Timing for the fastest repetition
+        """
+        timings = []
+        for repetition in xrange(self.repetitions):
+            ap = build()
+            self.timer.start()
+            try:
+                operation(ap)
+            finally:
+                phases = self.timer.stop()
+                cleanup(ap)
+            timings.append(Timing(operation=name, seconds=sum(phases.values()),
+                                  **phases))
+            self.logger.debug(str(timings[-1]))
+        return min(timings, key=lambda timing: timing.seconds)
+
+    def run_atheros(self):
+        """
+        Times the AtherosAR5KAP operations against a FakeAtherosServer
+
+        :return: list of Timings
+        """
+        operations = self.selected(ATHEROS_OPERATIONS)
+        if not operations:
+            return []
+        server = FakeAtherosServer(username=USERNAME, password=PASSWORD)
+        server.start()
+        build = lambda: AtherosAR5KAP(connection=TelnetConnection(hostname='127.0.0.1',
+                                                                  port=server.port,
+                                                                  username=USERNAME,
+                                                                  password=PASSWORD))
+        try:
+            return [self.time_operation(name, build, operation, lambda ap: ap.close())
+                    for name, operation in operations]
+        finally:
+            server.stop()
+
+    def run_broadcom(self):
+        """
+        Times the BroadcomBCM94718NR operations against a FakeBroadcomServer
+
+        :return: list of Timings
+        """
+        operations = self.selected(BROADCOM_OPERATIONS)
+        if not operations:
+            return []
+        server = FakeBroadcomServer()
+        server.start()
+        build = lambda: BroadcomBCM94718NR(hostname=server.hostname)
+        working_directory = os.getcwd()
+        scratch = tempfile.mkdtemp()
+        stdout = sys.stdout
+        os.chdir(scratch)
+        sys.stdout = StringIO()
+        try:
+            return [self.time_operation(name, build, operation, lambda ap: None)
+                    for name, operation in operations]
+        finally:
+            sys.stdout = stdout
+            os.chdir(working_directory)
+            shutil.rmtree(scratch)
+            server.stop()
+
+    def run(self):
+        """
+        Times all the (selected) operations
+
+        :return: list of Timings
+        """
+        with Instruments(self.timer):
+            return self.run_atheros() + self.run_broadcom()
+# end class OperationsBenchmark
+
+def to_json(timings):
+    """
+    Converts the timings to a JSON string
+
+    :param:
+
+     - `timings`: collection of Timings
+
+    :return: JSON dictionary of operation: {phase: seconds}
+    """
+    operations = {}
+    for timing in timings:
+        seconds = timing._asdict()
+        del seconds['operation']
+        operations[timing.operation] = seconds
+    return json.dumps(operations, indent=2, sort_keys=True)
+
+def from_json(text):
+    """
+    Converts the output of `to_json` back into Timings
+
+    :param:
+
+     - `text`: JSON string
+
+    :return: list of Timings
+    """
+    return [Timing(operation=name, **seconds)
+            for name, seconds in sorted(json.loads(text).iteritems())]
+
+def compare(timings, baseline, tolerance=TOLERANCE):
+    """
+    Finds the phases that got slower
+
+    :param:
+
+     - `timings`: collection of Timings for the current code
+     - `baseline`: collection of Timings to compare them to
+     - `tolerance`: fraction slower than the baseline allowed
+
+    :return: list of Regressions
+    """
+    baseline = dict((timing.operation, timing) for timing in baseline)
+    regressions = []
+    for timing in timings:
+        if timing.operation not in baseline:
+            continue
+        for phase in (TOTAL,) + PHASES:
+            old = getattr(baseline[timing.operation], phase)
+            new = getattr(timing, phase)
+            if new > old * (1 + tolerance) and new - old > MINIMUM_DIFFERENCE:
+                regressions.append(Regression(timing.operation, phase, old, new))
+    return regressions
+
+def main():
+    """
+    Runs the benchmark, writes the JSON and compares it to the baseline
+    """
+    parser = argparse.ArgumentParser(description="Times the access points' operations")
+    parser.add_argument('--operations', nargs='+', choices=OPERATION_NAMES,
+                        help='Operations to time (default: all of them)')
+    parser.add_argument('--repetitions', type=int, default=REPETITIONS,
+                        help='Times to run each operation, the fastest is kept (default=%(default)s)')
+    parser.add_argument('--output',
+                        help='File to write the JSON to (default: stdout)')
+    parser.add_argument('--baseline',
+                        help='JSON from an earlier run to compare to')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='Fraction slower than the baseline allowed (default=%(default)s)')
+    args = parser.parse_args()
+    benchmark = OperationsBenchmark(repetitions=args.repetitions,
+                                    operations=args.operations)
+    timings = benchmark.run()
+    if args.output is None:
+        print to_json(timings)
+    else:
+        with open(args.output, 'w') as output:
+            output.write(to_json(timings))
+    if args.baseline is not None:
+        with open(args.baseline) as baseline:
+            regressions = compare(timings, from_json(baseline.read()),
+                                  tolerance=args.tolerance)
+        for regression in regressions:
+            print REGRESSION.format(*regression)
+        if regressions:
+            sys.exit(1)
+    return
+
+# python standard library
+import unittest
+
+class TestPhaseTimer(unittest.TestCase):
+    def setUp(self):
+        self.timer = PhaseTimer()
+        return
+
+    def test_phases(self):
+        """
+        Does the time go to the phase on top of the stack?
+        """
+        self.timer.start()
+        sleep = self.timer.wrap(SLEEP, time.sleep)
+        login = self.timer.wrap(CONNECT, lambda: sleep(0.02) or read())
+        read = self.timer.wrap(COMMAND, lambda: time.sleep(0.01))
+        login()
+        phases = self.timer.stop()
+        self.assertGreaterEqual(phases[SLEEP], 0.02)
+        self.assertLess(phases[SLEEP], 0.03)
+        # reading while logging in is part of connecting
+        self.assertGreaterEqual(phases[CONNECT], 0.01)
+        self.assertLess(phases[COMMAND], 0.01)
+        self.assertEqual(0, phases[PARSE])
+        return
+
+    def test_other_thread(self):
+        """
+        Are calls from other threads ignored?
+        """
+        sleep = self.timer.wrap(SLEEP, time.sleep)
+        self.timer.start()
+        thread = threading.Thread(target=sleep, args=(0.02,))
+        thread.start()
+        thread.join()
+        phases = self.timer.stop()
+        self.assertEqual(0, phases[SLEEP])
+        self.assertGreaterEqual(phases[COMMAND], 0.02)
+        return
+
+    def test_instruments(self):
+        """
+        Are the seams replaced and put back?
+        """
+        sleep = time.sleep
+        find_all = vars(bs4.element.Tag)['find_all']
+        with Instruments(self.timer):
+            self.assertIsNot(sleep, time.sleep)
+            self.timer.start()
+            time.sleep(0.01)
+            bs4.BeautifulSoup('<p>a</p>', 'html.parser').find('p')
+            phases = self.timer.stop()
+        self.assertIs(sleep, time.sleep)
+        self.assertIs(find_all, vars(bs4.element.Tag)['find_all'])
+        self.assertNotIn('connect', vars(bs4.BeautifulSoup))
+        self.assertGreaterEqual(phases[SLEEP], 0.01)
+        self.assertGreater(phases[PARSE], 0)
+        return
+# end class TestPhaseTimer
+
+class TestOperationsBenchmark(unittest.TestCase):
+    def test_run(self):
+        """
+        Does each operation get a timing with phases that add up?
+        """
+        benchmark = OperationsBenchmark(repetitions=1)
+        timings = benchmark.run()
+        self.assertEqual(OPERATION_NAMES, [timing.operation for timing in timings])
+        for timing in timings:
+            self.assertAlmostEqual(timing.seconds,
+                                   sum(getattr(timing, phase) for phase in PHASES))
+            self.assertGreater(timing.connect, 0)
+            self.assertGreater(timing.command, 0)
+        broadcom = dict((timing.operation, timing) for timing in timings)
+        self.assertGreater(broadcom['broadcom.get_status'].parse, 0)
+        # the HTTPConnection rests between requests
+        self.assertGreater(broadcom['broadcom.set_channel'].sleep, 0)
+        self.assertEqual(sorted(timings), from_json(to_json(timings)))
+        return
+
+    def test_compare(self):
+        """
+        Are the phases that got slower found?
+        """
+        baseline = [Timing('a', 1.0, 0.1, 0.5, 0.3, 0.1),
+                    Timing('b', 1.0, 0.1, 0.5, 0.3, 0.1)]
+        timings = [Timing('a', 1.001, 0.1, 0.5, 0.3, 0.101),
+                   Timing('b', 2.0, 0.1, 0.5, 1.3, 0.1),
+                   Timing('c', 9.0, 9.0, 0, 0, 0)]
+        self.assertEqual([Regression('b', TOTAL, 1.0, 2.0),
+                          Regression('b', SLEEP, 0.3, 1.3)],
+                         compare(timings, baseline))
+        self.assertEqual([], compare(timings, baseline, tolerance=5))
+        return
+# end class TestOperationsBenchmark
+
+if __name__ == '__main__':
+    main()
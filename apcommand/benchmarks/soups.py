@@ -0,0 +1,184 @@
+# python standard library
+from collections import namedtuple
+import argparse
+import os
+import time
+
+# this package
+from apcommand.baseclass import BaseClass
+from apcommand.benchmarks.fakebroadcom import PAGE_DIRECTORY
+from apcommand.accesspoints.broadcom.parser import BroadcomRadioSoup, BroadcomLANSoup
+from apcommand.accesspoints.broadcom.parser import BroadcomSSIDSoup, ENGINES
+from apcommand.accesspoints.broadcom.parser import available_engines
+from apcommand.accesspoints.broadcom.firmware import BroadcomFirmwareSoup
+
+RADIO_PROPERTIES = ('mac_24_ghz', 'mac_5_ghz', 'country', 'interface_state',
+                    'channel', 'bandwidth', 'sideband')
+# saved html-file, soup, the properties to read
+PAGES = (('radio_asp.html', BroadcomRadioSoup, RADIO_PROPERTIES),
+         ('radio_5_asp.html', BroadcomRadioSoup, RADIO_PROPERTIES),
+         ('radio_disabled.html', BroadcomRadioSoup, RADIO_PROPERTIES),
+         ('ssid_asp.html', BroadcomSSIDSoup, ('ssid',)),
+         ('lan_asp.html', BroadcomLANSoup, ('dhcp_state',)),
+         ('lan_asp_2.html', BroadcomLANSoup, ('dhcp_state',)),
+         ('dhcp_enabled.html', BroadcomLANSoup, ('dhcp_state',)),
+         ('firmware_asp.html', BroadcomFirmwareSoup, ('bootloader_version', 'os_version',
+                                                       'wl_driver_version')))
+REPETITIONS = 10
+HEADER = "{0:<20} {1:<10} {2:>14}".format('Page', 'Engine', 'Pages/Second')
+ROW = "{0:<20} {1:<10} {2:>14.0f}"
+FASTEST = "\nFastest: {0}"
+
+Result = namedtuple('Result', 'page engine pages_per_second')
+
+
+class SoupBenchmark(BaseClass):
+    """
+    Times reading the saved Broadcom pages with each soup engine
+    """
+    def __init__(self, pages=PAGES, engines=None, repetitions=REPETITIONS):
+        """
+        SoupBenchmark constructor
+
+        :param:
+
+         - `pages`: collection of (html-file, soup-class, property-names)
+         - `engines`: collection of soup engines to time (default: the available ones)
+         - `repetitions`: number of times to read each page (the best is kept)
+        """
+        super(SoupBenchmark, self).__init__()
+        self.pages = pages
+        if engines is None:
+            engines = available_engines()
+        self.engines = engines
+        self.repetitions = repetitions
+        return
+
+    def read(self, html, soup, properties, engine):
+        """
+        Reads all the properties from a new soup
+
+        :param:
+
+         - `html`: text of the page
+         - `soup`: the soup class for the page
+         - `properties`: names of the soup's properties to read
+         - `engine`: the soup engine to use
+
+        :return: tuple of the values
+        """
+        page = soup(html, engine=engine)
+        return tuple(getattr(page, name) for name in properties)
+
+    def time_engine(self, html, soup, properties, engine):
+        """
+        Times reading the page with one engine
+
+        :param:
+
+         - `html`: text of the page
+         - `soup`: the soup class for the page
+         - `properties`: names of the soup's properties to read
+         - `engine`: the soup engine to use
+
+        :return: (seconds for the fastest read, the values read)
+        """
+        best = None
+        for repetition in xrange(self.repetitions):
+            start = time.time()
+            values = self.read(html, soup, properties, engine)
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        return best, values
+
+    def run(self):
+        """
+        Times the engines for each page
+
+        :return: list of Results
+        :raise: AssertionError if an engine read different values than the first one
+        """
+        results = []
+        for filename, soup, properties in self.pages:
+            with open(os.path.join(PAGE_DIRECTORY, filename)) as page:
+                html = page.read()
+            expected = None
+            for engine in self.engines:
+                elapsed, values = self.time_engine(html, soup, properties, engine)
+                if expected is None:
+                    expected = values
+                assert values == expected, "{0} read {1} from {2}, expected {3}".format(engine,
+                                                                                       values,
+                                                                                       filename,
+                                                                                       expected)
+                self.logger.debug("{0} read {1} in {2} seconds".format(engine, filename,
+                                                                        elapsed))
+                results.append(Result(filename, engine, 1/elapsed))
+        return results
+# end class SoupBenchmark
+
+
+def fastest(results):
+    """
+    Picks the engine that read the whole corpus fastest
+
+    :param:
+
+     - `results`: collection of Results from SoupBenchmark.run
+
+    :return: name of the engine with the most pages per second over all the pages
+    """
+    totals = {}
+    for result in results:
+        totals[result.engine] = totals.get(result.engine, 0) + 1/result.pages_per_second
+    return min(totals, key=totals.get)
+
+def main():
+    """
+    Runs the benchmark and prints a table of the results
+    """
+    parser = argparse.ArgumentParser(description="Times the Broadcom soup engines")
+    parser.add_argument('--engines', nargs='+', choices=ENGINES, default=available_engines(),
+                        help='Soup engines to time (default=%(default)s)')
+    parser.add_argument('--repetitions', type=int, default=REPETITIONS,
+                        help='Times to read each page, the best is kept (default=%(default)s)')
+    args = parser.parse_args()
+    benchmark = SoupBenchmark(engines=args.engines, repetitions=args.repetitions)
+    print HEADER
+    results = benchmark.run()
+    for result in results:
+        print ROW.format(*result)
+    print FASTEST.format(fastest(results))
+    return
+
+# python standard library
+import unittest
+
+class TestSoupBenchmark(unittest.TestCase):
+    def test_run(self):
+        """
+        Does each engine get a result for each page?
+        """
+        benchmark = SoupBenchmark(repetitions=1)
+        results = benchmark.run()
+        self.assertEqual([(filename, engine) for filename, soup, properties in PAGES
+                          for engine in available_engines()],
+                         [(result.page, result.engine) for result in results])
+        for result in results:
+            self.assertGreater(result.pages_per_second, 0)
+        self.assertIn(fastest(results), available_engines())
+        return
+
+    def test_fastest(self):
+        """
+        Is the fastest engine the one with the least total time, not the best single page?
+        """
+        results = [Result('a.html', 'bs4', 1000), Result('b.html', 'bs4', 1),
+                   Result('a.html', 'stream', 10), Result('b.html', 'stream', 10)]
+        self.assertEqual('stream', fastest(results))
+        return
+# end class TestSoupBenchmark
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,7 @@ import argparse
 # this package
 import subcommands
 from apcommand.accesspoints.broadcom.commons import BandEnumeration
+from apcommand.accesspoints.broadcom.parser import available_engines
 
 
 class Arguments(object):
@@ -105,6 +106,23 @@ class Arguments(object):
                                  help='Seconds to sleep after web server call (default=%(default)s)',
                                  type=float,
                                  default=0.5)
+        self.parser.add_argument('--adaptive',
+                                 action='store_true',
+                                 help="Learn the AP's pacing (starting from --sleep) instead of always sleeping --sleep seconds",
+                                 default=None)
+        self.parser.add_argument('--keep-pacing',
+                                 action='store_true',
+                                 help="Learn the AP's pacing and keep it in ~/.apcommand_pacing.shelve for the next run (implies --adaptive)",
+                                 default=None)
+        self.parser.add_argument('--skip-unchanged',
+                                 action='store_true',
+                                 help="Don't send the changes the AP already has (only read the pages)",
+                                 default=None)
+        self.parser.add_argument('--parser',
+                                 dest='engine',
+                                 choices=available_engines(),
+                                 help='Engine to parse the pages with (leave unset for default)',
+                                 default=None)
         return
 
     def add_subparsers(self):
@@ -23,6 +23,7 @@ from apcommand.baseclass import BaseClass
 import apcommand.accesspoints.broadcom.broadcom
 from apcommand.commons.errors import ArgumentError
 from apcommand.accesspoints.broadcom.commons import BandEnumeration
+from apcommand.connections.pacing import host_pacers, SHELF_NAME
 
 
 class SubCommand(BaseClass):
@@ -44,10 +45,15 @@ class SubCommand(BaseClass):
         '''
         # assume that the accesspoint class has valuable defaults
         # only pass in parameters that have been set by the arguments
-        apargs = ('hostname', 'username', 'password', 'sleep')
+        apargs = ('hostname', 'username', 'password', 'sleep', 'adaptive', 'engine',
+                  'skip_unchanged')
         apvalues = (getattr(args, arg) for arg in apargs if getattr(args, arg) is not None)
         apkeys = (arg for arg in apargs if getattr(args, arg) is not None)
         apkwargs = dict(zip(apkeys, apvalues))
+        if args.keep_pacing:
+            # the learned gaps are only saved in the home directory if the user asks
+            host_pacers.shelf_name = SHELF_NAME
+            apkwargs['adaptive'] = True
         self.logger.debug("Creating BroadcomBCM94718NR with: {0}".format(apkwargs))
         ap = apcommand.accesspoints.broadcom.broadcom.BroadcomBCM94718NR(**apkwargs)
         return ap
@@ -85,12 +91,12 @@ class SubCommand(BaseClass):
             out_string = "{0} GHz Channel: {1} {3} ({2})"
             for band in '2.4 5'.split():
                 print "{0} GHz:".format(band)
-                key = band[0]
-                channel = ap.query[key].channel
+                radio = ap.query[band[0]].snapshot
+                channel = radio.channel
                 print "   Channel: {0}".format(channel)
-                state = ap.query[key].state
+                state = radio.interface_state
                 print "  {0}".format(state)
-                sideband = ap.query[key].sideband
+                sideband = radio.sideband
                 if sideband is None:
                     sideband = ''
                 print '   {0}'.format(sideband)
@@ -0,0 +1,781 @@
+# python standard library
+from collections import namedtuple
+import asyncore
+import socket
+import sys
+import urllib
+import urlparse
+
+# this package
+from apcommand.baseclass import BaseClass
+from apcommand.commons.errors import ConnectionError, TimeoutError
+
+# connections
+from asyncloop import event_loop, Pending, Return
+from httpconnection import BasicAuth, HTTPConnectionError, PROTOCOL, GET, EMPTY_STRING
+from ratelimiter import host_limiters, monotonic
+from pacing import host_pacers, SERVER_ERROR
+from retry import RetryPolicy
+
+HTTP_PORT = 80
+CHUNK_SIZE = 4096
+# seconds to wait for a response
+TIMEOUT = 10
+CRLF = '\r\n'
+END_OF_HEAD = CRLF * 2
+HEADER_SEPARATOR = ':'
+HTTP_VERSION = 'HTTP/1.1'
+FORM_TYPE = 'application/x-www-form-urlencoded'
+CHUNKED = 'chunked'
+CLOSE = 'close'
+# the errors a retry might get past
+RETRY_ERRORS = (ConnectionError, TimeoutError, socket.error)
+# responses that never have a body
+NO_BODY = (204, 304)
+HEAD = 'HEAD'
+
+class AsyncResponse(namedtuple('AsyncResponse', 'status_code reason headers content')):
+    """
+    The response to a request
+    """
+    __slots__ = ()
+
+    @property
+    def text(self):
+        """
+        The body of the response
+        """
+        return self.content
+
+    @property
+    def ok(self):
+        """
+        True if the status code isn't an error
+        """
+        return self.status_code < 400
+# end class AsyncResponse
+
+class HTTPStream(BaseClass, asyncore.dispatcher):
+    """
+    A non-blocking HTTP client socket
+    """
+    def __init__(self, loop, sock=None):
+        """
+        HTTPStream constructor
+
+        :param:
+
+         - `loop`: the EventLoop to run the socket on
+         - `sock`: an already connected socket (if not given use `connect_to`)
+        """
+        BaseClass.__init__(self)
+        asyncore.dispatcher.__init__(self, sock=sock, map=loop.map)
+        self.loop = loop
+        self.outgoing = EMPTY_STRING
+        self.buffer = EMPTY_STRING
+        self.opened = None
+        self.waiter = None
+        self.method = None
+        self.head = None
+        self.keep_alive = True
+        return
+
+    def connect_to(self, host, port, timeout):
+        """
+        Starts connecting to the web-server
+
+        :param:
+
+         - `host`: address of the server
+         - `port`: the server's port
+         - `timeout`: seconds to wait for the connection
+
+        :return: Pending that finishes once connected
+        """
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.opened = Pending()
+        self.loop.with_timeout(self.opened, timeout,
+                               "Timed out connecting to {0}:{1}".format(host, port))
+        self.connect((host, port))
+        return self.opened
+
+    def exchange(self, request, method, timeout):
+        """
+        Sends the request and waits for the response
+
+        :param:
+
+         - `request`: the whole request as a string
+         - `method`: the request's HTTP method (HEAD responses have no body)
+         - `timeout`: seconds to wait for the response
+
+        :return: Pending for the AsyncResponse
+        """
+        self.waiter = self.loop.with_timeout(Pending(), timeout,
+                                             "Timed out waiting for the response")
+        self.method = method
+        self.head = None
+        self.buffer = EMPTY_STRING
+        self.outgoing += request
+        if self.socket is None:
+            self.fail(ConnectionError("The HTTP connection is closed"))
+        return self.waiter
+
+    def read_head(self):
+        """
+        Splits the status-line and headers off the front of the buffer
+
+        :return: (status_code, reason, headers) or None if the head isn't all here
+        """
+        end = self.buffer.find(END_OF_HEAD)
+        if end == -1:
+            return None
+        lines = self.buffer[:end].split(CRLF)
+        self.buffer = self.buffer[end + len(END_OF_HEAD):]
+        version, status_code, reason = (lines[0].split(None, 2) + [EMPTY_STRING])[:3]
+        headers = {}
+        for line in lines[1:]:
+            name, separator, value = line.partition(HEADER_SEPARATOR)
+            headers[name.strip().lower()] = value.strip()
+        return int(status_code), reason, headers
+
+    def dechunk(self):
+        """
+        Pulls the chunks out of the buffer
+
+        :return: the body or None if the last chunk isn't here yet
+        """
+        chunks = []
+        index = 0
+        while True:
+            end = self.buffer.find(CRLF, index)
+            if end == -1:
+                return None
+            size = int(self.buffer[index:end].split(';')[0], 16)
+            start = end + len(CRLF)
+            if not size:
+                # the last chunk (no trailers are expected from the access points)
+                if self.buffer.find(CRLF, start) == -1:
+                    return None
+                return EMPTY_STRING.join(chunks)
+            if len(self.buffer) < start + size + len(CRLF):
+                return None
+            chunks.append(self.buffer[start:start + size])
+            index = start + size + len(CRLF)
+
+    def parse(self, closed=False):
+        """
+        Finishes the waiting Pending if the whole response has arrived
+
+        :param:
+
+         - `closed`: True if the server closed the connection
+        """
+        if self.waiter is None or self.waiter.done:
+            return
+        if self.head is None:
+            self.head = self.read_head()
+            if self.head is None:
+                return
+        status_code, reason, headers = self.head
+        if headers.get('connection', EMPTY_STRING).lower() == CLOSE:
+            self.keep_alive = False
+        if self.method == HEAD or status_code in NO_BODY:
+            body = EMPTY_STRING
+        elif headers.get('transfer-encoding', EMPTY_STRING).lower() == CHUNKED:
+            body = self.dechunk()
+        elif 'content-length' in headers:
+            length = int(headers['content-length'])
+            body = self.buffer[:length] if len(self.buffer) >= length else None
+        else:
+            self.keep_alive = False
+            body = self.buffer if closed else None
+        if body is None:
+            return
+        waiter, self.waiter = self.waiter, None
+        self.buffer = EMPTY_STRING
+        waiter.set_result(AsyncResponse(status_code, reason, headers, body))
+        return
+
+    def fail(self, error):
+        """
+        Fails whatever is waiting on the stream
+
+        :param:
+
+         - `error`: the exception to give them
+        """
+        if self.opened is not None:
+            self.opened.set_exception(error)
+        if self.waiter is not None:
+            waiter, self.waiter = self.waiter, None
+            waiter.set_exception(error)
+        return
+
+    def writable(self):
+        """
+        :return: True if connecting or there's something to send
+        """
+        return self.connecting or bool(self.outgoing)
+
+    def handle_connect(self):
+        """
+        Finishes the `opened` Pending
+        """
+        self.opened.set_result(self)
+        return
+
+    def handle_write(self):
+        """
+        Sends as much of the request as the socket will take
+        """
+        sent = self.send(self.outgoing)
+        self.outgoing = self.outgoing[sent:]
+        return
+
+    def handle_read(self):
+        """
+        Reads into the buffer and checks for the end of the response
+        """
+        data = self.recv(CHUNK_SIZE)
+        if data:
+            self.buffer += data
+            self.parse()
+        return
+
+    def handle_close(self):
+        """
+        Closes the socket, finishes a read-until-closed response and fails anything else waiting
+        """
+        self.close()
+        self.keep_alive = False
+        self.parse(closed=True)
+        self.fail(ConnectionError("The HTTP connection was closed"))
+        return
+
+    def handle_error(self):
+        """
+        Closes the socket and fails whatever is waiting with the error
+        """
+        error = sys.exc_info()[1]
+        self.logger.debug(error)
+        self.close()
+        self.keep_alive = False
+        self.fail(ConnectionError(str(error)))
+        return
+# end class HTTPStream
+
+class AsyncHTTPConnection(BaseClass):
+    """
+    A non-blocking connection to an HTTP server
+    """
+    def __init__(self, hostname, username=EMPTY_STRING, password=EMPTY_STRING,
+                 path=EMPTY_STRING, data=None, protocol=PROTOCOL,
+                 rest=0.5, rate=None, burst=1, limiter=None, adaptive=False,
+                 retry=None, timeout=TIMEOUT, loop=None):
+        """
+        AsyncHTTPConnection constructor
+
+        :param:
+
+         - `hostname`: Address or resolvable host-name (with an optional `:port`)
+         - `username`: Username for sites that need authentication
+         - `password`: password for sites needing authentication
+         - `path`: optional path to add to URL
+         - `data`: dictionary of data for the page
+         - `protocol`: transport protocol (only 'http' is supported)
+         - `rest`: seconds to wait between calls to the server
+         - `rate`: most requests a second to the server (None means no limit)
+         - `burst`: requests that can go at once before `rate` applies
+         - `limiter`: TokenBucket to pace the requests (default is the host's shared one)
+         - `adaptive`: if True learn the gap after each page instead of always using `rest`
+         - `retry`: RetryPolicy for refused requests (default retries the reads)
+         - `timeout`: seconds each attempt waits for the server to connect and respond
+         - `loop`: The EventLoop to use (default is the shared event_loop)
+        """
+        super(AsyncHTTPConnection, self).__init__()
+        self._hostname = None
+        self.hostname = hostname
+        self.username = username
+        self.password = password
+        self.path = path
+        self.data = data
+        self.protocol = protocol
+        self.rest = rest
+        self.rate = rate
+        self.burst = burst
+        self._limiter = limiter
+        self.adaptive = adaptive
+        self._pacer = None
+        self._retry = retry
+        self.timeout = timeout
+        self._loop = loop
+        self._auth = None
+        self.stream = None
+        self.last = None
+        return
+
+    @property
+    def hostname(self):
+        """
+        The address for the HTTP server
+        """
+        return self._hostname
+
+    @hostname.setter
+    def hostname(self, new_hostname):
+        """
+        Sets the hostname and resets the address, the limiter and the pacer (closes the stream)
+        """
+        if self._hostname is not None:
+            self.close()
+        self._hostname = new_hostname
+        self._address = None
+        self._limiter = None
+        self._pacer = None
+        return
+
+    @property
+    def address(self):
+        """
+        The (host, port) for the socket
+        """
+        if self._address is None:
+            split = urlparse.urlsplit('//' + self.hostname)
+            self._address = (split.hostname, split.port or HTTP_PORT)
+        return self._address
+
+    @property
+    def loop(self):
+        """
+        The EventLoop for the connection
+        """
+        if self._loop is None:
+            self._loop = event_loop
+        return self._loop
+
+    @property
+    def auth(self):
+        """
+        A BasicAuth for the username and password (rebuilt if they change)
+        """
+        if self._auth is None or self._auth.credentials != (self.username, self.password):
+            self._auth = BasicAuth(self.username, self.password)
+        return self._auth
+
+    @property
+    def limiter(self):
+        """
+        A TokenBucket to prevent calling the server too soon (shared with the host's other connections)
+        """
+        if self._limiter is None:
+            self._limiter = host_limiters.limiter(self.hostname, rate=self.rate,
+                                                  burst=self.burst,
+                                                  minimum_gap=self.rest)
+        return self._limiter
+
+    @property
+    def pacer(self):
+        """
+        The host's AdaptivePacer (None if the connection isn't adaptive)
+        """
+        if self._pacer is None and self.adaptive:
+            self._pacer = host_pacers.pacer(self.hostname, initial=self.rest)
+        return self._pacer
+
+    @property
+    def retry(self):
+        """
+        The RetryPolicy for refused or timed-out requests (only its counts and backoff are used)
+        """
+        if self._retry is None:
+            self._retry = RetryPolicy()
+        return self._retry
+
+    def build(self, method, path, data=None):
+        """
+        Builds the request
+
+        :param:
+
+         - `method`: the HTTP method
+         - `path`: the path for the URL
+         - `data`: dictionary of form-data to send in the body
+
+        :return: the request as a string
+        """
+        body = urllib.urlencode(data) if data else EMPTY_STRING
+        lines = ['{0} /{1} {2}'.format(method, path.lstrip('/'), HTTP_VERSION),
+                 'Host: {0}'.format(self.hostname),
+                 'Authorization: {0}'.format(self.auth.header),
+                 'Accept-Encoding: identity']
+        if body:
+            lines.append('Content-Type: {0}'.format(FORM_TYPE))
+        if body or method not in (GET, HEAD):
+            lines.append('Content-Length: {0}'.format(len(body)))
+        return CRLF.join(lines) + END_OF_HEAD + body
+
+    def exchange(self, method, path, data, timeout):
+        """
+        Coroutine to send one request on the stream (opening the stream if it isn't open)
+
+        :param:
+
+         - `method`: the HTTP method
+         - `path`: the path for the URL
+         - `data`: dictionary of form-data
+         - `timeout`: seconds to wait
+
+        :raise: Return with the AsyncResponse
+        """
+        try:
+            if self.stream is None or not self.stream.keep_alive:
+                self.close()
+                self.stream = HTTPStream(self.loop)
+                yield self.stream.connect_to(self.address[0], self.address[1], timeout)
+            response = yield self.stream.exchange(self.build(method, path, data),
+                                                  method, timeout)
+        except Exception:
+            # a late response would be taken for the next request's
+            self.close()
+            raise
+        if not self.stream.keep_alive:
+            self.close()
+        raise Return(response)
+
+    def request(self, method, data=None, path=None, timeout=None, idempotent=False):
+        """
+        Starts a paced request (it runs after the requests called before it)
+
+        :param:
+
+         - `method`: the HTTP method
+         - `data`: dictionary of form-data (default is `self.data`)
+         - `path`: the path for the URL (default is `self.path`)
+         - `timeout`: seconds each attempt waits for the server (default is `self.timeout`)
+         - `idempotent`: if True the request can be retried even if it's a write
+
+        :return: Task for the AsyncResponse (fails with an HTTPConnectionError if the server couldn't be reached)
+        """
+        method = method.upper()
+        data = self.data if data is None else data
+        path = self.path if path is None else path
+        timeout = self.timeout if timeout is None else timeout
+        finished = Pending()
+        previous, self.last = self.last, finished
+        return self.loop.spawn(self.paced(method, data, path, timeout, idempotent,
+                                          previous, finished))
+
+    def retried(self, method, path, data, timeout, idempotent):
+        """
+        Coroutine to run the exchange, running it again after the retry policy's backoff if it fails
+
+        :raise: Return with the AsyncResponse
+        :raise: HTTPConnectionError if the last attempt failed
+        """
+        retry = self.retry
+        retryable = retry.retryable(method, data, idempotent)
+        attempts = 0
+        start = monotonic()
+        while True:
+            attempts += 1
+            try:
+                response = yield self.loop.spawn(self.exchange(method, path, data, timeout))
+                break
+            except RETRY_ERRORS as error:
+                if not retryable or attempts >= retry.attempts:
+                    retry.record(attempts, monotonic() - start, True)
+                    self.logger.error(error)
+                    self.logger.error("Check the server and the sleep times between requests")
+                    raise HTTPConnectionError("Unable to connect to the server")
+                delay = retry.delay(attempts)
+                self.logger.warning("Attempt {0} of {1} failed ({2}), retrying in {3:.2f} seconds".format(attempts,
+                                                                                                         retry.attempts,
+                                                                                                         error,
+                                                                                                         delay))
+                yield self.loop.sleep(delay)
+        retry.record(attempts, monotonic() - start, False)
+        raise Return(response)
+
+    def paced(self, method, data, path, timeout, idempotent, previous, finished):
+        """
+        Coroutine that waits its turn, then for the limiter, then runs the exchange
+
+        :param:
+
+         - `previous`: Pending for the request called before this one (or None)
+         - `finished`: Pending to finish when this request is done
+
+        :raise: Return with the AsyncResponse
+        """
+        try:
+            if previous is not None:
+                yield previous
+            pacer = self.pacer
+            key = pacer.key(path, method, data) if pacer is not None else None
+            gap = None
+            delay = self.limiter.reserve()
+            try:
+                if delay > 0:
+                    self.logger.debug("Waiting {0:.3f} seconds".format(delay))
+                    yield self.loop.sleep(delay)
+                start = monotonic()
+                try:
+                    response = yield self.loop.spawn(self.retried(method, path, data,
+                                                                  timeout, idempotent))
+                except HTTPConnectionError:
+                    if pacer is not None:
+                        gap = pacer.failed(key)
+                    raise
+                if pacer is not None:
+                    if response.status_code >= SERVER_ERROR:
+                        gap = pacer.failed(key)
+                    else:
+                        gap = pacer.succeeded(key, monotonic() - start)
+            finally:
+                self.limiter.release(gap)
+        finally:
+            finished.set_result()
+        raise Return(response)
+
+    def __call__(self, *args, **kwargs):
+        """
+        A shortcut for GET requests
+
+        :return: Task for the AsyncResponse
+        """
+        return self.request(GET, *args, **kwargs)
+
+    def __getattr__(self, method):
+        """
+        The parameters are the same as `request` (method is converted to uppercase)
+
+        :param:
+
+         - `method`: The HTTP Method (GET, POST, HEAD)
+
+        :return: function that starts the request
+        """
+        if method.startswith('_'):
+            raise AttributeError(method)
+
+        def request_call(*args, **kwargs):
+            return self.request(method.upper(), *args, **kwargs)
+
+        return request_call
+
+    def close(self):
+        """
+        Closes the stream
+        """
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        return
+# end class AsyncHTTPConnection
+
+# python standard library
+import BaseHTTPServer
+import SocketServer
+import threading
+import time
+import unittest
+
+# third-party
+from mock import MagicMock, call
+
+# this package
+from asyncloop import EventLoop
+from pacing import AdaptivePacer, PageKey, READ
+from ratelimiter import TokenBucket
+
+class TestHTTPStream(unittest.TestCase):
+    def setUp(self):
+        self.stream = HTTPStream(EventLoop())
+        self.stream.waiter = Pending()
+        return
+
+    def test_parse(self):
+        """
+        Does it wait for the whole body?
+        """
+        self.stream.buffer = 'HTTP/1.1 200 OK\r\nContent-Length: 5\r\n'
+        self.stream.parse()
+        self.assertIsNone(self.stream.head)
+        self.stream.buffer += '\r\nabc'
+        self.stream.parse()
+        self.assertFalse(self.stream.waiter.done)
+        waiter = self.stream.waiter
+        self.stream.buffer += 'de'
+        self.stream.parse()
+        self.assertEqual(AsyncResponse(200, 'OK', {'content-length': '5'}, 'abcde'),
+                         waiter.result)
+        self.assertTrue(self.stream.keep_alive)
+        return
+
+    def test_chunked(self):
+        """
+        Does it de-chunk the body?
+        """
+        waiter = self.stream.waiter
+        self.stream.buffer = 'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n3\r\nabc\r\n'
+        self.stream.parse()
+        self.assertFalse(waiter.done)
+        self.stream.buffer += '2\r\nde\r\n0\r\n\r\n'
+        self.stream.parse()
+        self.assertEqual('abcde', waiter.result.text)
+        return
+# end class TestHTTPStream
+
+class EchoHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def answer(self):
+        length = int(self.headers.getheader('content-length', 0))
+        body = self.rfile.read(length) if length else ''
+        if self.path.endswith('sleep'):
+            time.sleep(0.2)
+        self.server.connections.add(self.client_address)
+        text = ' '.join((self.command, self.path, body))
+        self.send_response(500 if self.path.endswith('error') else 200)
+        self.send_header('Content-Length', str(len(text)))
+        self.end_headers()
+        self.wfile.write(text)
+        return
+
+    do_GET = answer
+    do_POST = answer
+
+    def log_message(self, format, *args):
+        return
+
+
+class EchoServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class TestAsyncHTTPConnection(unittest.TestCase):
+    def setUp(self):
+        self.server = EchoServer(('127.0.0.1', 0), EchoHandler)
+        self.server.connections = set()
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.hostname = '127.0.0.1:{0}'.format(self.server.server_address[1])
+        self.loop = EventLoop()
+        return
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        return
+
+    def connection(self, **kwargs):
+        kwargs.setdefault('limiter', TokenBucket())
+        kwargs.setdefault('path', 'radio.asp')
+        return AsyncHTTPConnection(hostname=self.hostname, password='admin',
+                                   loop=self.loop, **kwargs)
+
+    def test_request(self):
+        """
+        Does it send the method, path and form and return the response?
+        """
+        connection = self.connection(data={'wl_unit': '1'})
+        self.assertEqual(('127.0.0.1', self.server.server_address[1]), connection.address)
+        response = self.loop.run_until_complete(connection())
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('GET /radio.asp wl_unit=1', response.text)
+        response = self.loop.run_until_complete(connection.post(data={'action': 'Apply'},
+                                                                path='ssid.asp'))
+        self.assertEqual('POST /ssid.asp action=Apply', response.text)
+        self.assertIn('Authorization: Basic', connection.build(GET, 'lan.asp'))
+        connection.close()
+        return
+
+    def test_keep_alive(self):
+        """
+        Do the requests re-use the connection?
+        """
+        connection = self.connection()
+        for request in range(3):
+            self.loop.run_until_complete(connection())
+        self.assertEqual(1, len(self.server.connections))
+        connection.close()
+        return
+
+    def test_concurrent(self):
+        """
+        Do the connections to different servers wait at the same time?
+        """
+        connections = [self.connection(path='sleep') for index in range(5)]
+        start = time.time()
+        responses = self.loop.run(*(connection() for connection in connections))
+        self.assertLess(time.time() - start, 0.2 * 4)
+        self.assertEqual(['GET /sleep '] * 5, [response.text for response in responses])
+        for connection in connections:
+            connection.close()
+        return
+
+    def test_pacing(self):
+        """
+        Does it wait for the limiter and release it with the pacer's gaps?
+        """
+        limiter = MagicMock()
+        limiter.reserve.return_value = 0
+        connection = self.connection(limiter=limiter, adaptive=True)
+        connection._pacer = AdaptivePacer(self.hostname, initial=0.5, shelf_name=None)
+        self.loop.run(connection(), connection(path='error'))
+        self.assertEqual([call.reserve(), call.release(0.25),
+                          call.reserve(), call.release(0.5)], limiter.mock_calls)
+        self.assertEqual(1, connection.pacer.pace(PageKey('error', READ)).failures)
+        # the server error backed off the page before it
+        self.assertEqual(0.5, connection.pacer.gap(PageKey('radio.asp', READ)))
+
+        # the limiter's delay is slept on the loop
+        connection = self.connection(limiter=TokenBucket(minimum_gap=0.1))
+        start = time.time()
+        self.loop.run(connection(), connection(), connection())
+        self.assertGreaterEqual(time.time() - start, 0.2)
+        connection.close()
+        return
+
+    def test_unreachable(self):
+        """
+        Does a server that isn't there raise an HTTPConnectionError (and not stop the next request)?
+        """
+        closed = socket.socket()
+        closed.bind(('127.0.0.1', 0))
+        port = closed.getsockname()[1]
+        closed.close()
+        connection = AsyncHTTPConnection(hostname='127.0.0.1:{0}'.format(port), timeout=1,
+                                         limiter=TokenBucket(), loop=self.loop)
+        connection.retry.backoff = 0.01
+        first, second = connection(), connection(data={'action': 'Apply'})
+        self.assertRaises(HTTPConnectionError, self.loop.run_until_complete, first)
+        self.assertRaises(HTTPConnectionError, self.loop.run_until_complete, second)
+        # the read was tried three times, the write once
+        self.assertEqual((2, 4, 2, 2), connection.retry.stats[:4])
+        return
+
+    def test_retry(self):
+        """
+        Does a request that's refused get sent again?
+        """
+        connection = self.connection(retry=RetryPolicy(backoff=0.01))
+        refused = [True]
+        exchange = connection.exchange
+
+        def refuse_once(*args):
+            if refused:
+                refused.pop()
+                raise ConnectionError("refused")
+            result = yield self.loop.spawn(exchange(*args))
+            raise Return(result)
+        connection.exchange = refuse_once
+        response = self.loop.run_until_complete(connection(data={'action': 'Apply'},
+                                                           idempotent=True))
+        self.assertEqual('GET /radio.asp action=Apply', response.text)
+        self.assertEqual((1, 2, 1, 0), connection.retry.stats[:4])
+        connection.close()
+        return
+# end class TestAsyncHTTPConnection
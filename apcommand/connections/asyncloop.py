@@ -0,0 +1,480 @@
+# python standard library
+from collections import deque
+import asyncore
+import heapq
+import itertools
+import time
+import types
+
+# this package
+from apcommand.baseclass import BaseClass
+from apcommand.commons.errors import TimeoutError
+
+# the longest to block in the poll (so the loop notices when it has nothing left to do)
+MAX_POLL = 1
+
+class Return(Exception):
+    """
+    Raised by a coroutine to give its result
+    """
+    def __init__(self, value=None):
+        """
+        Return constructor
+
+        :param:
+
+         - `value`: the coroutine's result
+        """
+        super(Return, self).__init__(value)
+        self.value = value
+        return
+# end class Return
+
+class Pending(BaseClass):
+    """
+    A result that isn't available yet
+    """
+    def __init__(self):
+        """
+        Pending constructor
+        """
+        super(Pending, self).__init__()
+        self.done = False
+        self.exception = None
+        self.callbacks = []
+        self._result = None
+        return
+
+    @property
+    def result(self):
+        """
+        The result
+
+        :raise: the exception if it failed, RuntimeError if it isn't done
+        """
+        if not self.done:
+            raise RuntimeError("The result isn't available yet")
+        if self.exception is not None:
+            raise self.exception
+        return self._result
+
+    def set_result(self, result=None):
+        """
+        Sets the result and calls the callbacks (ignored if already done)
+
+        :param:
+
+         - `result`: the value to give to whatever is waiting
+        """
+        if not self.done:
+            self._result = result
+            self.finish()
+        return
+
+    def set_exception(self, exception):
+        """
+        Fails the pending result and calls the callbacks (ignored if already done)
+
+        :param:
+
+         - `exception`: Exception instance to raise in whatever is waiting
+        """
+        if not self.done:
+            self.exception = exception
+            self.finish()
+        return
+
+    def add_callback(self, callback):
+        """
+        Adds a function to call once this is done (it's called right away if it's done)
+
+        :param:
+
+         - `callback`: function that takes this Pending as its argument
+        """
+        if self.done:
+            callback(self)
+        else:
+            self.callbacks.append(callback)
+        return
+
+    def finish(self):
+        """
+        Marks this done and calls the callbacks
+        """
+        self.done = True
+        callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback(self)
+        return
+# end class Pending
+
+class Task(Pending):
+    """
+    Runs a coroutine on the event loop
+    """
+    def __init__(self, coroutine, loop):
+        """
+        Task constructor
+
+        :param:
+
+         - `coroutine`: generator that yields Pending objects
+         - `loop`: the EventLoop to run it on
+        """
+        super(Task, self).__init__()
+        self.coroutine = coroutine
+        self.loop = loop
+        loop.call_soon(self.step)
+        return
+
+    def step(self, pending=None):
+        """
+        Runs the coroutine up to its next yield
+
+        :param:
+
+         - `pending`: the finished Pending the coroutine was waiting on
+        """
+        try:
+            if pending is None:
+                waiting_on = self.coroutine.next()
+            elif pending.exception is not None:
+                waiting_on = self.coroutine.throw(pending.exception)
+            else:
+                waiting_on = self.coroutine.send(pending.result)
+        except Return as returned:
+            self.set_result(returned.value)
+            return
+        except StopIteration:
+            self.set_result(None)
+            return
+        except Exception as error:
+            self.logger.debug("{0} raised {1}".format(self.coroutine, error))
+            self.set_exception(error)
+            return
+        if not isinstance(waiting_on, Pending):
+            self.coroutine.close()
+            self.set_exception(TypeError("Coroutines have to yield Pending objects, not {0}".format(waiting_on)))
+            return
+        waiting_on.add_callback(lambda finished: self.loop.call_soon(self.step, finished))
+        return
+# end class Task
+
+class Timer(object):
+    """
+    A callback scheduled for later
+    """
+    def __init__(self, callback, args):
+        """
+        Timer constructor
+
+        :param:
+
+         - `callback`: function to call
+         - `args`: tuple of arguments for the callback
+        """
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        return
+
+    def cancel(self):
+        """
+        Stops the callback from being called
+        """
+        self.cancelled = True
+        return
+# end class Timer
+
+class EventLoop(BaseClass):
+    """
+    Runs coroutines and asyncore sockets in one thread
+    """
+    def __init__(self, clock=time.time):
+        """
+        EventLoop constructor
+
+        :param:
+
+         - `clock`: function that returns the time in seconds (for the timers)
+        """
+        super(EventLoop, self).__init__()
+        self.clock = clock
+        self.map = {}
+        self.ready = deque()
+        self.timers = []
+        self.running = False
+        self.counter = itertools.count()
+        return
+
+    def call_soon(self, callback, *args):
+        """
+        Schedules the callback to be called on the next pass through the loop
+
+        :param:
+
+         - `callback`: function to call
+         - `args`: arguments for the callback
+        """
+        self.ready.append((callback, args))
+        return
+
+    def call_later(self, delay, callback, *args):
+        """
+        Schedules the callback to be called after a delay
+
+        :param:
+
+         - `delay`: seconds to wait
+         - `callback`: function to call
+         - `args`: arguments for the callback
+
+        :return: Timer (call its `cancel` to stop it)
+        """
+        timer = Timer(callback, args)
+        # the counter breaks ties so the timers themselves never get compared
+        heapq.heappush(self.timers, (self.clock() + delay, next(self.counter), timer))
+        return timer
+
+    def spawn(self, coroutine):
+        """
+        Starts running a coroutine
+
+        :param:
+
+         - `coroutine`: generator that yields Pending objects
+
+        :return: Task for the coroutine
+        """
+        return Task(coroutine, self)
+
+    def sleep(self, seconds):
+        """
+        :param:
+
+         - `seconds`: time to wait
+
+        :return: Pending that finishes after `seconds`
+        """
+        pending = Pending()
+        self.call_later(seconds, pending.set_result)
+        return pending
+
+    def with_timeout(self, pending, timeout, message="Timed out"):
+        """
+        Fails the pending with a TimeoutError if it takes too long
+
+        :param:
+
+         - `pending`: the Pending to time
+         - `timeout`: seconds it's allowed to take
+         - `message`: message for the TimeoutError
+
+        :return: the pending
+        """
+        timer = self.call_later(timeout, pending.set_exception, TimeoutError(message))
+        pending.add_callback(lambda finished: timer.cancel())
+        return pending
+
+    def gather(self, *pendings):
+        """
+        Waits for all the pendings
+
+        :param:
+
+         - `pendings`: Pending objects (generators get spawned)
+
+        :return: Pending with a list of results (in the same order), fails if any of them fail
+        """
+        pendings = [self.spawn(pending) if isinstance(pending, types.GeneratorType) else pending
+                    for pending in pendings]
+        gathered = Pending()
+        if not pendings:
+            gathered.set_result([])
+            return gathered
+        remaining = [len(pendings)]
+
+        def finished(pending):
+            if pending.exception is not None:
+                gathered.set_exception(pending.exception)
+                return
+            remaining[0] -= 1
+            if not remaining[0]:
+                gathered.set_result([pending.result for pending in pendings])
+            return
+
+        for pending in pendings:
+            pending.add_callback(finished)
+        return gathered
+
+    def run_once(self):
+        """
+        Runs the timers that are due, polls the sockets then runs the ready callbacks
+        """
+        now = self.clock()
+        while self.timers and self.timers[0][0] <= now:
+            deadline, count, timer = heapq.heappop(self.timers)
+            if not timer.cancelled:
+                self.ready.append((timer.callback, timer.args))
+
+        if self.ready:
+            timeout = 0
+        elif self.timers:
+            timeout = min(MAX_POLL, max(0, self.timers[0][0] - now))
+        else:
+            timeout = MAX_POLL
+        if self.map:
+            asyncore.poll(timeout, self.map)
+        elif timeout:
+            time.sleep(timeout)
+
+        # callbacks added while these run wait for the next pass
+        for index in xrange(len(self.ready)):
+            callback, args = self.ready.popleft()
+            callback(*args)
+        return
+
+    def run_until_complete(self, pending):
+        """
+        Runs the loop until the pending is done
+
+        :param:
+
+         - `pending`: Pending (or a coroutine to spawn)
+
+        :return: the pending's result
+        :raise: RuntimeError if called while the loop is running or there's nothing left to wait on
+        """
+        if self.running:
+            raise RuntimeError("The loop is already running (yield the Pending instead)")
+        if isinstance(pending, types.GeneratorType):
+            pending = self.spawn(pending)
+        self.running = True
+        try:
+            while not pending.done:
+                if not (self.ready or self.timers or self.map):
+                    raise RuntimeError("Nothing left to run but the Pending isn't done")
+                self.run_once()
+        finally:
+            self.running = False
+        return pending.result
+
+    def run(self, *coroutines):
+        """
+        Runs the coroutines (or pendings) until they're all done
+
+        :return: list of results
+        """
+        return self.run_until_complete(self.gather(*coroutines))
+# end class EventLoop
+
+event_loop = EventLoop()
+
+# python standard library
+import unittest
+
+# third-party
+from mock import patch
+
+class FakeClock(object):
+    """
+    A clock that only moves forward when something sleeps
+    """
+    def __init__(self):
+        self.now = 0
+        return
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+        return
+# end class FakeClock
+
+class TestEventLoop(unittest.TestCase):
+    def setUp(self):
+        self.loop = EventLoop()
+        return
+
+    def add(self, a, b, delay=0):
+        yield self.loop.sleep(delay)
+        raise Return(a + b)
+
+    def test_spawn(self):
+        """
+        Does a coroutine's Return become the Task's result?
+        """
+        task = self.loop.spawn(self.add(1, 2))
+        self.assertFalse(task.done)
+        self.assertRaises(RuntimeError, getattr, task, 'result')
+        self.assertEqual(3, self.loop.run_until_complete(task))
+
+        # coroutines that wait on coroutines
+        def outer():
+            total = yield self.loop.spawn(self.add(3, 4))
+            raise Return(total * 2)
+        self.assertEqual(14, self.loop.run_until_complete(outer()))
+        return
+
+    def test_exception(self):
+        """
+        Do exceptions get thrown into the coroutines that are waiting?
+        """
+        def fail():
+            yield self.loop.sleep(0)
+            raise ValueError("bad value")
+
+        def catch():
+            try:
+                yield self.loop.spawn(fail())
+            except ValueError as error:
+                raise Return(str(error))
+        self.assertEqual('bad value', self.loop.run_until_complete(catch()))
+        self.assertRaises(ValueError, self.loop.run_until_complete, fail())
+
+        def wrong_yield():
+            yield 5
+        self.assertRaises(TypeError, self.loop.run_until_complete, wrong_yield())
+        return
+
+    def test_gather(self):
+        """
+        Do gathered coroutines run at the same time and keep their order?
+        """
+        clock = FakeClock()
+        self.loop.clock = clock
+        with patch('time.sleep', clock.sleep):
+            results = self.loop.run(self.add(1, 2, delay=0.1), self.add(3, 4, delay=0.05))
+        self.assertEqual([3, 7], results)
+        # the waits overlapped so it took as long as the longest one (not their sum)
+        self.assertAlmostEqual(0.1, clock.now)
+        self.assertEqual([], self.loop.run())
+        return
+
+    def test_with_timeout(self):
+        """
+        Does it raise a TimeoutError if the pending takes too long?
+        """
+        pending = self.loop.with_timeout(self.loop.sleep(10), 0.01, 'too slow')
+        self.assertRaises(TimeoutError, self.loop.run_until_complete, pending)
+        # the timer is cancelled if it finishes in time
+        loop = EventLoop()
+        pending = loop.with_timeout(loop.sleep(0), 10)
+        loop.run_until_complete(pending)
+        self.assertTrue(all(timer.cancelled for deadline, count, timer in loop.timers))
+        return
+
+
+    def test_running(self):
+        """
+        Does it refuse to block inside the loop or wait on something that can't finish?
+        """
+        def blocker():
+            yield self.loop.sleep(0)
+            self.loop.run_until_complete(self.loop.sleep(0))
+        self.assertRaises(RuntimeError, self.loop.run_until_complete, blocker())
+        self.assertRaises(RuntimeError, self.loop.run_until_complete, Pending())
+        return
+# end class TestEventLoop
@@ -0,0 +1,653 @@
+# python standard library
+from collections import deque
+from StringIO import StringIO
+from telnetlib import IAC, DO, DONT, WILL, WONT, SB, SE, theNULL
+import asyncore
+import re
+import socket
+import sys
+
+# this package
+from apcommand.baseclass import BaseClass
+from apcommand.commands.changeprompt import ChangePrompt
+from apcommand.commons.errors import ConnectionError
+
+# connections
+from asyncloop import event_loop, Pending, Return
+from localconnection import OutputError
+from nonlocalconnection import NonLocalConnection
+
+NEWLINE = '\n'
+SPACER = '{0} {1}'
+EMPTY_STRING = EOF = ''
+CHUNK_SIZE = 4096
+COMMAND_TIMEOUT = 10
+NEGOTIATION = (DO, DONT, WILL, WONT)
+REFUSALS = {DO: WONT, WILL: DONT}
+
+class TelnetStream(BaseClass, asyncore.dispatcher):
+    """
+    A non-blocking telnet client socket
+    """
+    def __init__(self, loop, end_of_line='\r\n', sock=None):
+        """
+        TelnetStream constructor
+
+        :param:
+
+         - `loop`: the EventLoop to run the socket on
+         - `end_of_line`: the end of line string used by the device
+         - `sock`: an already connected socket (if not given use `connect_to`)
+        """
+        BaseClass.__init__(self)
+        asyncore.dispatcher.__init__(self, sock=sock, map=loop.map)
+        self.loop = loop
+        self.end_of_line = end_of_line
+        self.raw = EMPTY_STRING
+        self.subnegotiating = False
+        self.outgoing = EMPTY_STRING
+        self.buffer = EMPTY_STRING
+        self.lines = deque()
+        self.opened = None
+        self.waiter = None
+        return
+
+    def connect_to(self, host, port, timeout):
+        """
+        Starts connecting to the telnet server
+
+        :param:
+
+         - `host`: address of the server
+         - `port`: the server's port
+         - `timeout`: seconds to wait for the connection
+
+        :return: Pending that finishes once connected
+        """
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.opened = Pending()
+        self.loop.with_timeout(self.opened, timeout,
+                               "Timed out connecting to {0}:{1}".format(host, port))
+        self.connect((host, port))
+        return self.opened
+
+    def write(self, data):
+        """
+        Queues the data to send
+
+        :param:
+
+         - `data`: string to send to the device
+        """
+        self.outgoing += data
+        return
+
+    def cook(self, data):
+        """
+        Strips the telnet commands out of the data and queues refusals for option requests
+
+        :param:
+
+         - `data`: string read from the socket
+
+        :return: the data without the telnet commands
+        """
+        data = self.raw + data
+        self.raw = EMPTY_STRING
+        if IAC not in data and not self.subnegotiating:
+            return data.replace(theNULL, EMPTY_STRING)
+        cooked = []
+        index = 0
+        while index < len(data):
+            if self.subnegotiating:
+                end = data.find(IAC + SE, index)
+                if end == -1:
+                    # the IAC might be the start of the SE
+                    if data.endswith(IAC):
+                        self.raw = IAC
+                    break
+                self.subnegotiating = False
+                index = end + 2
+                continue
+            start = data.find(IAC, index)
+            if start == -1:
+                cooked.append(data[index:])
+                break
+            cooked.append(data[index:start])
+            command = data[start + 1:start + 2]
+            if not command or (command in NEGOTIATION and start + 2 == len(data)):
+                # the rest of the command is in the next chunk
+                self.raw = data[start:]
+                break
+            if command == IAC:
+                cooked.append(IAC)
+                index = start + 2
+            elif command in NEGOTIATION:
+                if command in REFUSALS:
+                    self.write(IAC + REFUSALS[command] + data[start + 2])
+                index = start + 3
+            elif command == SB:
+                self.subnegotiating = True
+                index = start + 2
+            else:
+                index = start + 2
+        return EMPTY_STRING.join(cooked).replace(theNULL, EMPTY_STRING)
+
+    def split(self, text):
+        """
+        Moves the complete lines in the text to `lines` (the unfinished line stays in the buffer)
+
+        :param:
+
+         - `text`: cooked output
+        """
+        lines = (self.buffer + text).split(self.end_of_line)
+        self.buffer = lines.pop()
+        self.lines.extend(line + self.end_of_line for line in lines)
+        return
+
+    def discard(self):
+        """
+        Throws away any output that hasn't been read
+        """
+        if self.lines or self.buffer:
+            self.logger.debug("Discarding: {0}".format(EMPTY_STRING.join(self.lines) + self.buffer))
+        self.lines.clear()
+        self.buffer = EMPTY_STRING
+        return
+
+    def wait(self, check, timeout, message):
+        """
+        Waits for the check to find what it's looking for
+
+        :param:
+
+         - `check`: function that returns None until it finds its output, then the result
+         - `timeout`: seconds to wait
+         - `message`: message for the TimeoutError
+
+        :return: Pending for the check's result
+        """
+        pending = self.loop.with_timeout(Pending(), timeout, message)
+        self.waiter = (pending, check)
+        if self.socket is None:
+            self.fail(ConnectionError("The telnet connection is closed"))
+        self.check()
+        return pending
+
+    def expect(self, expressions, timeout):
+        """
+        Waits for one of the expressions to show up (everything up to then is discarded)
+
+        :param:
+
+         - `expressions`: list of compiled regular expressions
+         - `timeout`: seconds to wait
+
+        :return: Pending for the index of the expression that matched
+        """
+        def check():
+            text = EMPTY_STRING.join(self.lines) + self.buffer
+            for index, expression in enumerate(expressions):
+                if expression.search(text):
+                    self.lines.clear()
+                    self.buffer = EMPTY_STRING
+                    return index
+            return None
+        patterns = [expression.pattern for expression in expressions]
+        return self.wait(check, timeout, "Timed out waiting for {0}".format(patterns))
+
+    def read_until_prompt(self, prompt, timeout):
+        """
+        Waits for the prompt to show up at the start of a line
+
+        :param:
+
+         - `prompt`: compiled regular expression for the prompt
+         - `timeout`: seconds to wait
+
+        :return: Pending for the list of lines before the prompt
+        """
+        def check():
+            if prompt.search(self.buffer) is None:
+                return None
+            lines = list(self.lines)
+            self.lines.clear()
+            self.buffer = EMPTY_STRING
+            return lines
+        return self.wait(check, timeout, "Timed out waiting for the prompt ({0})".format(prompt.pattern))
+
+    def check(self):
+        """
+        Finishes the waiting Pending if its check finds what it's looking for
+        """
+        if self.waiter is None:
+            return
+        pending, check = self.waiter
+        if pending.done:
+            # it timed out
+            self.waiter = None
+            return
+        result = check()
+        if result is not None:
+            self.waiter = None
+            pending.set_result(result)
+        return
+
+    def fail(self, error):
+        """
+        Fails whatever is waiting on the stream
+
+        :param:
+
+         - `error`: the exception to give them
+        """
+        if self.opened is not None:
+            self.opened.set_exception(error)
+        if self.waiter is not None:
+            pending, check = self.waiter
+            self.waiter = None
+            pending.set_exception(error)
+        return
+
+    def writable(self):
+        """
+        :return: True if connecting or there's something to send
+        """
+        return self.connecting or bool(self.outgoing)
+
+    def handle_connect(self):
+        """
+        Finishes the `opened` Pending
+        """
+        self.opened.set_result(self)
+        return
+
+    def handle_write(self):
+        """
+        Sends as much of the outgoing data as the socket will take
+        """
+        sent = self.send(self.outgoing)
+        self.outgoing = self.outgoing[sent:]
+        return
+
+    def handle_read(self):
+        """
+        Reads, cooks and splits the output
+        """
+        data = self.recv(CHUNK_SIZE)
+        if data:
+            self.split(self.cook(data))
+            self.check()
+        return
+
+    def handle_close(self):
+        """
+        Closes the socket and fails whatever is waiting
+        """
+        self.close()
+        self.fail(ConnectionError("The telnet connection was closed"))
+        return
+
+    def handle_error(self):
+        """
+        Closes the socket and fails whatever is waiting with the error
+        """
+        error = sys.exc_info()[1]
+        self.logger.debug(error)
+        self.close()
+        self.fail(ConnectionError(str(error)))
+        return
+# end class TelnetStream
+
+class AsyncOutput(Pending):
+    """
+    The output of a command that might not have finished
+    """
+    def __init__(self, loop):
+        """
+        AsyncOutput constructor
+
+        :param:
+
+         - `loop`: the EventLoop running the command
+        """
+        super(AsyncOutput, self).__init__()
+        self.loop = loop
+        self._lines = None
+        return
+
+    @property
+    def lines(self):
+        """
+        The lines that haven't been read (runs the loop if the command hasn't finished)
+
+        :raise: the command's exception if it failed
+        """
+        if self._lines is None:
+            if not self.done:
+                self.loop.run_until_complete(self)
+            self._lines = deque(self.result)
+        return self._lines
+
+    def readline(self, timeout=None):
+        """
+        :return: the next line (EOF if there aren't any more)
+        """
+        if self.lines:
+            return self.lines.popleft()
+        return EOF
+
+    def readlines(self):
+        """
+        :return: list of the lines that haven't been read
+        """
+        lines = list(self.lines)
+        self.lines.clear()
+        return lines
+
+    def read(self):
+        """
+        :return: the lines that haven't been read as a string
+        """
+        return EMPTY_STRING.join(self.readlines())
+
+    def __iter__(self):
+        """
+        Iterates over the lines that haven't been read
+        """
+        while self.lines:
+            yield self.lines.popleft()
+        return
+# end class AsyncOutput
+
+class AsyncTelnetConnection(NonLocalConnection):
+    """
+    A non-blocking telnet connection
+    """
+    def __init__(self, port=None, prompt="#", end_of_line='\r\n',
+                 mangle_prompt=True, login_prompt='login:',
+                 password_prompt='Password:', loop=None, *args, **kwargs):
+        """
+        AsyncTelnetConnection constructor
+
+        :param:
+
+         - `hostname`: The IP Address or hostname
+         - `port`: The telnet port
+         - `username`: The login name
+         - `password`: The password (if needed)
+         - `timeout`: The login timeout
+         - `prompt`: The prompt to expect (a regular expression)
+         - `end_of_line`: The string indicating the end of a line.
+         - `mangle_prompt`: If True, change the prompt
+         - `login_prompt`: The prompt for the login name
+         - `password_prompt`: The prompt for the password
+         - `loop`: The EventLoop to use (default is the shared event_loop)
+        """
+        super(AsyncTelnetConnection, self).__init__(*args, **kwargs)
+        self._port = port
+        self.prompt = prompt
+        self.end_of_line = end_of_line
+        self.mangle_prompt = mangle_prompt
+        self.login_prompt = login_prompt
+        self.password_prompt = password_prompt
+        self._loop = loop
+        self._prompt_expression = None
+        self.stream = None
+        self.last = None
+        return
+
+    @property
+    def port(self):
+        """
+        The port for the telnet server (default 23)
+        """
+        if self._port is None:
+            self._port = 23
+        return self._port
+
+    @property
+    def loop(self):
+        """
+        The EventLoop for the connection
+        """
+        if self._loop is None:
+            self._loop = event_loop
+        return self._loop
+
+    @property
+    def prompt_expression(self):
+        """
+        The compiled prompt
+        """
+        if self._prompt_expression is None:
+            self._prompt_expression = re.compile(self.prompt)
+        return self._prompt_expression
+
+    @property
+    def client(self):
+        """
+        The Task logging in (starts it the first time)
+
+        :return: Task whose result is the logged-in TelnetStream
+        """
+        if self._client is None:
+            self._client = self.loop.spawn(self.login())
+        return self._client
+
+    def login(self):
+        """
+        Coroutine to connect, login and change the prompt
+
+        :raise: Return with the TelnetStream
+        """
+        self.stream = TelnetStream(self.loop, end_of_line=self.end_of_line)
+        yield self.stream.connect_to(self.hostname, self.port, self.timeout)
+        prompts = [self.prompt_expression, re.compile(self.login_prompt)]
+        index = yield self.stream.expect(prompts, self.timeout)
+        if index == 1:
+            self.stream.write(self.username + NEWLINE)
+            if self.password is not None:
+                yield self.stream.expect([re.compile(self.password_prompt)], self.timeout)
+                self.stream.write(self.password + NEWLINE)
+            yield self.stream.expect([self.prompt_expression], self.timeout)
+        if self.mangle_prompt:
+            changer = ChangePrompt(adapter=None)
+            self.stream.write("{0}={1}".format(changer.variable, changer.prompt) + NEWLINE)
+            self.prompt = changer.prompt
+            self._prompt_expression = None
+            yield self.stream.read_until_prompt(self.prompt_expression, self.timeout)
+        raise Return(self.stream)
+
+    def run_command(self, command, timeout, previous):
+        """
+        Coroutine to run one command (after the login and the previous command)
+
+        :param:
+
+         - `command`: the command-line to send
+         - `timeout`: seconds to wait for the prompt
+         - `previous`: Pending for the command called before this one (or None)
+
+        :raise: Return with the list of lines of output
+        """
+        if previous is not None:
+            try:
+                yield previous
+            except Exception as error:
+                self.logger.debug("The previous command failed: {0}".format(error))
+        stream = yield self.client
+        stream.discard()
+        self.logger.debug("Sending the command: " + command)
+        stream.write(command + NEWLINE)
+        lines = yield stream.read_until_prompt(self.prompt_expression, timeout)
+        raise Return(lines)
+
+    def _main(self, command, arguments='', timeout=None):
+        """
+        Queues the command (the dot-notation is the expected interface)
+
+        :param:
+
+         - `command`: The shell command.
+         - `arguments`: A string of command arguments.
+         - `timeout`: seconds to wait for the output (default 10)
+
+        :return: OutputError with an AsyncOutput as the output
+        """
+        if timeout is None:
+            timeout = COMMAND_TIMEOUT
+        output = AsyncOutput(self.loop)
+        previous, self.last = self.last, output
+        task = self.loop.spawn(self.run_command(SPACER.format(command, arguments),
+                                                timeout, previous))
+
+        def finished(task):
+            if task.exception is not None:
+                output.set_exception(task.exception)
+            else:
+                output.set_result(task.result)
+            return
+        task.add_callback(finished)
+        return OutputError(output, StringIO(EMPTY_STRING))
+
+    def close(self):
+        """
+        Closes the socket
+        """
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        self._client = None
+        self.last = None
+        return
+# end class AsyncTelnetConnection
+
+# python standard library
+import SocketServer
+import threading
+import time
+import unittest
+
+# this package
+from asyncloop import EventLoop
+from apcommand.commons.errors import TimeoutError
+
+class TestTelnetStream(unittest.TestCase):
+    def setUp(self):
+        self.stream = TelnetStream(EventLoop())
+        return
+
+    def test_cook(self):
+        """
+        Does it strip the telnet commands and refuse the options?
+        """
+        self.assertEqual('login:', self.stream.cook(IAC + DO + '\x01login:'))
+        self.assertEqual(IAC + WONT + '\x01', self.stream.outgoing)
+        # commands split across reads
+        self.assertEqual('ab', self.stream.cook('ab' + IAC))
+        self.assertEqual('c' + IAC, self.stream.cook(WILL + '\x03c' + IAC + IAC))
+        self.assertEqual(IAC + WONT + '\x01' + IAC + DONT + '\x03', self.stream.outgoing)
+        self.assertEqual('d', self.stream.cook('d' + IAC + SB + '\x18\x01'))
+        self.assertEqual('f', self.stream.cook(IAC + SE + 'f' + theNULL))
+        return
+
+    def test_split(self):
+        """
+        Does it keep the unfinished line in the buffer?
+        """
+        self.stream.split('iwconfig\r\nath0 IEEE')
+        self.stream.split(' 802.11ng\r\nxyz')
+        self.assertEqual(['iwconfig\r\n', 'ath0 IEEE 802.11ng\r\n'], list(self.stream.lines))
+        self.assertEqual('xyz', self.stream.buffer)
+        return
+# end class TestTelnetStream
+
+class FakeTelnetHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        self.wfile.write(IAC + DO + '\x01' + 'ap login: ')
+        self.rfile.readline()
+        self.wfile.write('Password: ')
+        self.rfile.readline()
+        prompt = 'root@ap #'
+        self.wfile.write(prompt)
+        while True:
+            line = self.rfile.readline().strip()
+            if not line:
+                break
+            if line.startswith('PS1='):
+                prompt = line[4:]
+                self.wfile.write(line + '\r\n' + prompt)
+                continue
+            if line.startswith('sleep'):
+                time.sleep(float(line.split()[1]))
+            self.wfile.write(line + '\r\noutput of ' + line + '\r\n' + prompt)
+        return
+
+
+class TestAsyncTelnetConnection(unittest.TestCase):
+    def setUp(self):
+        self.server = SocketServer.ThreadingTCPServer(('127.0.0.1', 0), FakeTelnetHandler)
+        self.server.daemon_threads = True
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.loop = EventLoop()
+        return
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        return
+
+    def connection(self):
+        return AsyncTelnetConnection(hostname='127.0.0.1', port=self.server.server_address[1],
+                                     username='root', password='5up', loop=self.loop)
+
+    def test_command(self):
+        """
+        Does it login and return the output?
+        """
+        connection = self.connection()
+        output, error = connection.iwconfig('ath0')
+        second, error = connection.cfg('-s')
+        self.assertIsInstance(output, AsyncOutput)
+        self.assertFalse(output.done)
+        # reading it runs the loop
+        self.assertEqual(['iwconfig ath0\r\n', 'output of iwconfig ath0\r\n'], output.readlines())
+        self.assertEqual(EOF, output.readline())
+        self.assertEqual('cfg -s\r\noutput of cfg -s\r\n', second.read())
+        self.assertNotEqual('#', connection.prompt)
+        connection.close()
+        return
+
+    def test_concurrent(self):
+        """
+        Do the connections wait at the same time?
+        """
+        def check(connection):
+            output, error = connection.sleep('0.2')
+            lines = yield output
+            raise Return(lines[-1])
+        connections = [self.connection() for index in range(5)]
+        # log them all in first
+        self.loop.run(*(connection.client for connection in connections))
+        start = time.time()
+        results = self.loop.run(*(check(connection) for connection in connections))
+        self.assertLess(time.time() - start, 0.2 * 4)
+        self.assertEqual(['output of sleep 0.2\r\n'] * 5, results)
+        for connection in connections:
+            connection.close()
+        return
+
+    def test_timeout(self):
+        """
+        Does a command that takes too long raise a TimeoutError?
+        """
+        connection = self.connection()
+        output, error = connection('sleep', '0.3', timeout=0.1)
+        self.assertRaises(TimeoutError, output.read)
+        connection.close()
+        return
+# end class TestAsyncTelnetConnection
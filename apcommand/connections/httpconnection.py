@@ -1,100 +1,75 @@
-
 # python standard library
 import urlparse
 import threading
 
 # this package
 from apcommand.baseclass import BaseClass
+from httppool import HTTPPoolKey, POOL_CONNECTIONS, POOL_MAXSIZE
+from httppool import new_session, session_stats
+from ratelimiter import host_limiters, monotonic
+from pacing import host_pacers, SERVER_ERROR
+from retry import RetryPolicy
 
 # third-party
 import requests
 
-class EventTimer(BaseClass):
+def paced(method):
     """
-    A timer object to set an event
+    Decorator to wait for the limiter before the call and release it after (with the pacer's gap)
     """
-    def __init__(self, event=None, seconds=0.5):
-        """
-        EventTimer constructor
-
-        :param:
-
-         - `event`: a threading.Event to set
-         - `seconds`: number of seconds to run the timer
-        """
-        self._event = event
-        self.seconds = seconds
-        self._timer = None
-        return
+    def _method(self, http_method, *args, **kwargs):
+        pacer = self.pacer
+        if pacer is None:
+            with self.limiter:
+                return method(self, http_method, *args, **kwargs)
+        key = pacer.key(self.path, http_method, kwargs.get('data', self.data))
+        gap = None
+        self.limiter.acquire()
+        start = monotonic()
+        try:
+            response = method(self, http_method, *args, **kwargs)
+            if response.status_code >= SERVER_ERROR:
+                gap = pacer.failed(key)
+            else:
+                gap = pacer.succeeded(key, monotonic() - start)
+            return response
+        except HTTPConnectionError:
+            gap = pacer.failed(key)
+            raise
+        finally:
+            self.limiter.release(gap)
+    return _method
 
-    @property
-    def event(self):
-        """
-        Threading event for the timer to set
-        """
-        if self._event is None:
-            self._event = threading.Event()
-            # I don't know about this, but I think
-            # I want it to always rely on the timer to clear it
-            self._event.set()
-        return self._event
+PROTOCOL = 'http'
+GET = 'GET'
+EMPTY_STRING = ''
 
-    @property
-    def timer(self):
-        """
-        A threading.Timer object
+class BasicAuth(requests.auth.AuthBase):
+    """
+    HTTP basic-authentication with the header built once
+    """
+    def __init__(self, username, password):
         """
-        # Timers can only be started once, so this can't be persistent
-        return threading.Timer(self.seconds, self.set_event)
+        BasicAuth constructor
 
-    def set_event(self):
-        """
-        Sets the event
-        """
-        self.event.set()
-        return
+        :param:
 
-    def start(self):
+         - `username`: the login name
+         - `password`: the password
         """
-        The main interface - clears the event then starts the timer
-        """
-        self.event.clear()
-        self.timer.start()
+        self.credentials = (username, password)
+        self.header = requests.auth._basic_auth_str(username, password)
         return
 
-    def clear(self):
-        """
-        A convenience method for users to call the event.clear method.        
+    def __call__(self, request):
         """
-        self.event.clear()
-        return
+        Adds the Authorization header to the request
 
-    def wait(self, timeout=None):
-        """
-        Calls event.wait if timeout not given use self.seconds
+        :return: the request
         """
-        if timeout is None:
-            timeout = self.seconds
-        self.event.wait(timeout)
-        return            
-# end class EventTimer
-
-def wait(method):
-    """
-    Decorator to wait for previous timers and to start a new one on exit
-    """
-    def _method(self, *args, **kwargs):
-        # wait if timer is running but only up until the time-limit
-        self.timer.wait(self.timer.seconds)
-        self.timer.clear()
-        outcome = method(self, *args, **kwargs)
-        self.timer.start()
-        return outcome
-    return _method
-
-PROTOCOL = 'http'
-GET = 'GET'
-EMPTY_STRING = ''
+        request.headers['Authorization'] = self.header
+        return request
+# end class BasicAuth
 
 class HTTPConnectionError(RuntimeError):
    """An exception to raise if the server wasn't reachable."""
@@ -105,8 +80,9 @@ class HTTPConnection(BaseClass):
     """
     def __init__(self, hostname, username=EMPTY_STRING, password=EMPTY_STRING,
                  path=EMPTY_STRING, data=None, protocol=PROTOCOL,
-                 rest=0.5,
-                 lock=None):
+                 rest=0.5, rate=None, burst=1, limiter=None, adaptive=False,
+                 retry=None, lock=None, pool=None, pool_connections=POOL_CONNECTIONS,
+                 pool_maxsize=POOL_MAXSIZE):
         """
         HTTPConnection constructor
 
@@ -120,6 +96,14 @@ class HTTPConnection(BaseClass):
          - `data`: dictionary of data for the page
          - `lock`: A re-entrant lock for users of the connection to share
          - `rest`: seconds to wait between calls to the server
+         - `rate`: most requests a second to the server (None means no limit)
+         - `burst`: requests that can go at once before `rate` applies
+         - `limiter`: TokenBucket to pace the requests (default is the host's shared one)
+         - `adaptive`: if True learn the gap after each page instead of always using `rest`
+         - `retry`: RetryPolicy for refused requests (default retries the reads)
+         - `pool`: HTTPSessionPool to share a session with other connections (None means don't share)
+         - `pool_connections`: servers the connection's own session keeps connections to
+         - `pool_maxsize`: most connections the connection's own session keeps to one server
         """
         super(HTTPConnection, self).__init__()
         self._hostname = None
@@ -127,6 +111,8 @@ class HTTPConnection(BaseClass):
         self.username = username
         self.password = password
         self.rest = rest
+        self.rate = rate
+        self.burst = burst
         self._protocol = None
         self.protocol = protocol
         self._path = None
@@ -134,17 +120,93 @@ class HTTPConnection(BaseClass):
         self.data = data
         self._url = None
         self._lock = lock
-        self._timer = None
+        self._limiter = limiter
+        self.adaptive = adaptive
+        self._pacer = None
+        self._retry = retry
+        self.pool = pool
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self._session = None
+        self._auth = None
         return
 
     @property
-    def timer(self):
+    def pool_key(self):
+        """
+        The key for this connection's session in the pool
+
+        :rtype: HTTPPoolKey
+        """
+        return HTTPPoolKey(self.protocol, self.hostname)
+
+    @property
+    def session(self):
+        """
+        A keep-alive requests.Session (from the pool if there is one)
+        """
+        if self._session is None:
+            if self.pool is not None:
+                self._session = self.pool.session(self.pool_key)
+            else:
+                self._session = new_session(pool_connections=self.pool_connections,
+                                            pool_maxsize=self.pool_maxsize)
+        return self._session
+
+    @property
+    def stats(self):
+        """
+        The session's request and connection counts
+
+        :rtype: SessionStats
+        """
+        return session_stats(self.session)
+
+    @property
+    def auth(self):
         """
-        An Event Timer to prevent calling the server too soon
+        A BasicAuth for the username and password (rebuilt if they change)
         """
-        if self._timer is None:
-            self._timer = EventTimer(seconds=self.rest)
-        return self._timer        
+        if self._auth is None or self._auth.credentials != (self.username, self.password):
+            self._auth = BasicAuth(self.username, self.password)
+        return self._auth
+
+    @property
+    def limiter(self):
+        """
+        A TokenBucket to prevent calling the server too soon (shared with the host's other connections)
+        """
+        if self._limiter is None:
+            self._limiter = host_limiters.limiter(self.hostname, rate=self.rate,
+                                                  burst=self.burst,
+                                                  minimum_gap=self.rest)
+        return self._limiter
+
+    @property
+    def pacer(self):
+        """
+        The host's AdaptivePacer (None if the connection isn't adaptive)
+        """
+        if self._pacer is None and self.adaptive:
+            self._pacer = host_pacers.pacer(self.hostname, initial=self.rest)
+        return self._pacer
+
+    @property
+    def retry(self):
+        """
+        The RetryPolicy for refused or timed-out requests
+        """
+        if self._retry is None:
+            self._retry = RetryPolicy()
+        return self._retry
+
+    @retry.setter
+    def retry(self, policy):
+        """
+        Sets the RetryPolicy
+        """
+        self._retry = policy
+        return
 
     @property
     def lock(self):
@@ -183,10 +245,13 @@ class HTTPConnection(BaseClass):
     @hostname.setter
     def hostname(self, new_hostname):
         """
-        Sets the hostname and resets the URL
+        Sets the hostname and resets the URL, the session, the limiter and the pacer
         """
         self._hostname = new_hostname
         self._url = None
+        self._session = None
+        self._limiter = None
+        self._pacer = None
         return
 
     @property
@@ -217,20 +282,31 @@ class HTTPConnection(BaseClass):
                                              
         return self._url
 
-    @wait
+    @paced
     def request(self, method, *args, **kwargs):
         """
-        Calls requests.request(method, *args, **kwargs)
+        Calls session.request(method, *args, **kwargs) (retrying it if the retry policy allows it)
+
+        :param:
+
+         - `method`: the HTTP method
+         - `idempotent`: if True the request can be retried even if it's a write
 
         :return: requests.Response object
+        :raise: HTTPConnectionError if the server couldn't be reached
         """
+        idempotent = kwargs.pop('idempotent', False)
+        if 'data' not in kwargs and self.data is not None:
+            kwargs['data'] = self.data
+        if self.retry.timeout is not None:
+            kwargs.setdefault('timeout', self.retry.timeout)
+
+        def send():
+            return self.session.request(method, self.url,
+                                        auth=self.auth, *args, **kwargs)
         try:
-            if 'data' not in kwargs and self.data is not None:
-                return requests.request(method, self.url, data=self.data,
-                                        auth=(self.username, self.password), *args, **kwargs)
-            return requests.request(method, self.url,
-                                    auth=(self.username, self.password), *args, **kwargs)
-        except requests.ConnectionError as error:
+            return self.retry.call(send, method, kwargs.get('data'), idempotent)
+        except self.retry.errors as error:
             self.logger.error(error)
             self.logger.error("Check the server and the sleep times between requests")
         raise HTTPConnectionError("Unable to connect to the server")
@@ -258,6 +334,35 @@ class HTTPConnection(BaseClass):
 
         return request_call
 
+    def copy(self):
+        """
+        Makes a new connection with this one's settings (for a thread to use on its own)
+
+        The copy shares this connection's limiter, pacer, retry policy and pool but has its
+        own lock and session (and its own path once it's changed).
+
+        :return: HTTPConnection to the same server
+        """
+        copy = HTTPConnection(hostname=self.hostname, username=self.username,
+                              password=self.password, path=self.path, data=self.data,
+                              protocol=self.protocol, rest=self.rest, rate=self.rate,
+                              burst=self.burst, limiter=self.limiter, adaptive=self.adaptive,
+                              retry=self.retry, pool=self.pool,
+                              pool_connections=self.pool_connections,
+                              pool_maxsize=self.pool_maxsize)
+        copy._pacer = self._pacer
+        return copy
+
+    def close(self):
+        """
+        Closes the connection's own session (a session from the pool is left open)
+        """
+        if self._session is not None and self.pool is None:
+            self._session.close()
+        self._session = None
+        return
+# end class HTTPConnection
+
 # python standard library
 import unittest
 from random import randrange
@@ -268,6 +373,12 @@ import string
 # third-party
 from mock import MagicMock, patch, call
 
+# this package
+from httppool import HTTPSessionPool
+from ratelimiter import HostLimiters, TokenBucket
+from pacing import AdaptivePacer, PageKey, READ, WRITE
+from retry import RetryStats
+
 random_letters = lambda : ''.join([choose(string.letters) for choice in xrange(randrange(100))])
 class TestHTTPConnection(unittest.TestCase):
     def setUp(self):
@@ -278,16 +389,43 @@ class TestHTTPConnection(unittest.TestCase):
         self.data = {"wl_unit":'0'}
         self.path = 'radio.asp'
         self.url = 'http://' + self.hostname + '/' + self.path
+        self.sleep = MagicMock()
         self.connection = HTTPConnection(hostname=self.hostname,
                                          username=self.username,
                                          password=self.password,
                                          data=self.data,
-                                         path=self.path)
+                                         path=self.path,
+                                         retry=RetryPolicy(sleep=self.sleep))
+        self.timeout = self.connection.retry.timeout
 
         # mocks
         self.requests = MagicMock()
         self.response = MagicMock()
         self.requests.return_value = self.response
+        self.connection._session = MagicMock(name='session')
+        self.connection._session.request = self.requests
+        return
+
+    def test_copy(self):
+        """
+        Does a copy keep all the settings and share the limiter?
+        """
+        limiter = TokenBucket(minimum_gap=2)
+        pool = HTTPSessionPool()
+        connection = HTTPConnection(hostname='192.168.1.1:8080', username='admin',
+                                    password='secret', protocol='https', rest=0.25, rate=4,
+                                    burst=2, limiter=limiter, adaptive=True,
+                                    retry=self.connection.retry, pool=pool,
+                                    pool_connections=3, pool_maxsize=5)
+        copy = connection.copy()
+        for setting in ('hostname', 'username', 'password', 'protocol', 'rest', 'rate',
+                        'burst', 'adaptive', 'retry', 'pool', 'pool_connections',
+                        'pool_maxsize', 'path', 'data', 'url'):
+            self.assertEqual(getattr(connection, setting), getattr(copy, setting))
+        self.assertIs(limiter, copy.limiter)
+        self.assertIsNot(connection.lock, copy.lock)
+        copy.path = 'ssid.asp'
+        self.assertEqual('', connection.path)
         return
 
     def test_constructor(self):
@@ -307,35 +445,134 @@ class TestHTTPConnection(unittest.TestCase):
 
     def test_request(self):
         """
-        Does it call requests.request with the right signature?
-        """
-        with patch('requests.request', self.requests):
-            # get
-            outcome = self.connection.get()
-            self.assertIsNotNone(self.connection.data)
-            self.requests.assert_called_with('GET', self.connection.url,
-                                                  auth=self.auth,
-                                                  data=self.data)
-            self.assertEqual(outcome, self.response)
-            # post
-            params = {'xor':'1', 'aor':'0'}
-            self.connection.data = None
-            outcome = self.connection.post(params=params)
-            self.requests.assert_called_with('POST', self.connection.url,
-                                             auth=self.auth,
-                                             params=params)
-            self.assertEqual(outcome, self.response)
+        Does it call session.request with the right signature?
+        """
+        # get
+        outcome = self.connection.get()
+        self.assertIsNotNone(self.connection.data)
+        self.requests.assert_called_with('GET', self.connection.url,
+                                         auth=self.connection.auth,
+                                         data=self.data, timeout=self.timeout)
+        self.assertEqual(outcome, self.response)
+        # post
+        params = {'xor':'1', 'aor':'0'}
+        self.connection.data = None
+        outcome = self.connection.post(params=params)
+        self.requests.assert_called_with('POST', self.connection.url,
+                                         auth=self.connection.auth,
+                                         params=params, timeout=self.timeout)
+        self.assertEqual(outcome, self.response)
         return
 
     def test_call(self):
         """
         Does calling the HTTPConnection do the same thing as GET?
         """
-        with patch('requests.request', self.requests):
-            data = {'wl_radio':'1'}
-            outcome = self.connection(data=data)
-            self.requests.assert_called_with(GET, self.url, auth=self.auth,
-                                             data=data)
+        data = {'wl_radio':'1'}
+        outcome = self.connection(data=data)
+        self.requests.assert_called_with(GET, self.url, auth=self.connection.auth,
+                                         data=data, timeout=self.timeout)
+        return
+
+    def test_auth(self):
+        """
+        Is the basic-auth header built once and rebuilt when the password changes?
+        """
+        auth = self.connection.auth
+        self.assertEqual(self.auth, auth.credentials)
+        self.assertIs(auth, self.connection.auth)
+        request = auth(MagicMock(headers={}))
+        self.assertEqual(requests.auth.HTTPBasicAuth(*self.auth)(MagicMock(headers={})).headers,
+                         request.headers)
+        self.connection.password = 'new' + self.password
+        self.assertEqual('new' + self.password, self.connection.auth.credentials[1])
+        return
+
+    def test_session(self):
+        """
+        Does it share the pool's session and keep its own otherwise?
+        """
+        pool = HTTPSessionPool()
+        connection = HTTPConnection(hostname=self.hostname, pool=pool)
+        other = HTTPConnection(hostname=self.hostname, pool=pool)
+        self.assertIs(connection.session, other.session)
+        connection.close()
+        self.assertEqual(1, len(pool))
+        self.assertIs(other.session, pool.session(connection.pool_key))
+
+        own = HTTPConnection(hostname=self.hostname, pool_maxsize=2)
+        self.assertIsNot(own.session, other.session)
+        self.assertEqual(2, own.session.get_adapter(own.url)._pool_maxsize)
+        self.assertEqual((0, 0, 0), own.stats)
+        pool.clear()
+        return
+
+    def test_limiter(self):
+        """
+        Do connections to the same host share a limiter that paces their requests?
+        """
+        limiters = HostLimiters()
+        with patch('apcommand.connections.httpconnection.host_limiters', limiters):
+            connection = HTTPConnection(hostname=self.hostname, rest=0.25)
+            other = HTTPConnection(hostname=self.hostname, rest=1)
+            self.assertIs(connection.limiter, other.limiter)
+            self.assertEqual(0.25, other.limiter.minimum_gap)
+            elsewhere = HTTPConnection(hostname=self.hostname + '0')
+            self.assertIsNot(connection.limiter, elsewhere.limiter)
+        limiter = MagicMock()
+        self.connection._limiter = limiter
+        self.connection.get()
+        self.assertEqual([call.__enter__(), call.__exit__(None, None, None)],
+                         limiter.mock_calls)
+        return
+
+    def test_adaptive(self):
+        """
+        Does an adaptive connection release the limiter with the pacer's gaps?
+        """
+        limiter = MagicMock()
+        self.connection._limiter = limiter
+        self.assertIsNone(self.connection.pacer)
+        self.connection.adaptive = True
+        self.connection._pacer = AdaptivePacer(self.hostname, initial=0.5,
+                                               shelf_name=None)
+        self.response.status_code = 200
+        self.connection.get()
+        self.connection.get(data={'action': 'Apply'})
+        self.response.status_code = 503
+        self.connection.get()
+        self.requests.side_effect = requests.ConnectionError
+        self.assertRaises(HTTPConnectionError, self.connection.get)
+        self.assertEqual([call(0.25), call(0.5), call(0.25), call(0.5)],
+                         limiter.release.mock_calls)
+        # the server error after the write backed off the write's gap
+        self.assertEqual(1, self.connection.pacer.gap(PageKey(self.path, WRITE)))
+        self.assertEqual(2, self.connection.pacer.pace(PageKey(self.path, READ)).failures)
+        return
+
+    def test_retry(self):
+        """
+        Are refused reads (and idempotent writes) sent again?
+        """
+        self.requests.side_effect = [requests.ConnectionError, self.response]
+        self.assertEqual(self.response, self.connection.get(timeout=2))
+        self.assertEqual(2, self.requests.call_count)
+        self.requests.assert_called_with(GET, self.url, auth=self.connection.auth,
+                                         data=self.data, timeout=2)
+        self.assertEqual(1, self.sleep.call_count)
+
+        # a write is only sent once unless it's idempotent
+        apply_data = {'action': 'Apply'}
+        self.requests.side_effect = requests.ConnectionError
+        self.assertRaises(HTTPConnectionError, self.connection, data=apply_data)
+        self.assertEqual(3, self.requests.call_count)
+        self.requests.side_effect = [requests.Timeout, self.response]
+        self.connection(data=apply_data, idempotent=True)
+        self.requests.assert_called_with(GET, self.url, auth=self.connection.auth,
+                                         data=apply_data, timeout=self.timeout)
+        stats = self.connection.retry.stats
+        self.assertEqual((3, 5, 2, 1), stats[:4])
+        self.assertIsInstance(stats, RetryStats)
         return
 
     def test_set_parameter(self):
@@ -360,99 +597,3 @@ class TestHTTPConnection(unittest.TestCase):
         self.assertEqual(new_url,
                          self.connection.url)
         return
-
-class TestEventTimer(unittest.TestCase):
-    def setUp(self):
-        self.event_patch = patch('threading.Event')        
-        self.mock_event = self.event_patch.start()
-
-        self.timer_patch = patch('threading.Timer')
-        self.mock_timer = self.timer_patch.start()
-        self.timer = EventTimer()
-        return
-
-    def tearDown(self):
-        self.event_patch.stop()
-        self.timer_patch.stop()
-        return
-
-    def test_event(self):
-        """
-        Does it create then set the event so it won't block by default?
-        """
-        event = MagicMock()
-        e = EventTimer().event
-        e.set.assert_called_with()
-        return
-
-    def test_set_event(self):
-        """
-        Does it set the  event?
-        """
-        self.timer.set_event()
-        self.timer.event.set.assert_called_with()
-        return
-
-    def test_timer(self):
-        """
-        Does it pass the timer the seconds and set_event method?
-        """
-        t = self.timer.timer
-        self.mock_timer.assert_called_with(self.timer.seconds, self.timer.set_event)
-        return
-
-    def test_start(self):
-        """
-        Does it clear the event then start the timer?
-        """
-        self.timer.start()
-        # first call - create the event and set
-        # second call - clear the call so users will block
-        # third call - start the timer
-        calls = [call.set(), call.clear(), call.start()]
-        self.assertEqual(calls, self.timer.event.mock_calls + self.timer.timer.mock_calls)
-        return
-
-    def test_clear(self):
-        """
-        Does the Timer pass on the clear call to the event?
-        """
-        self.timer.clear()
-        self.timer.event.clear.assert_called_with()
-        return
-
-    def test_wait(self):
-        """
-        Does the Timer pass on the wait call to the event?
-        """
-        self.timer.wait()        
-        self.timer.event.wait.assert_called_with(self.timer.seconds)
-        timeout = random.randrange(10)
-        self.timer.wait(timeout)
-        self.timer.event.wait.assert_called_with(timeout)
-        return
-
-class TestWait(unittest.TestCase):
-    def setUp(self):
-        self.event = MagicMock()
-        self.timer = MagicMock()
-        self.sleep = random.random()
-        self.timer.seconds = self.sleep
-        self.cow = MagicMock()
-        return
-    
-    @wait
-    def dummy(self, apple):
-        return self.cow(apple)
-
-    def test_wait(self):
-        """
-        Does the decorator call the right methods?
-        """
-        self.cow.return_value = 'boy'
-        output = self.dummy('pie')
-        self.cow.assert_called_with('pie')
-        self.assertEqual('boy', output)
-        calls = [call.wait(self.sleep), call.clear(), call.start()]
-        self.assertEqual(calls, self.timer.mock_calls)
-        return
\ No newline at end of file
@@ -0,0 +1,224 @@
+# python standard library
+from collections import namedtuple
+import threading
+
+# this package
+from apcommand.baseclass import BaseClass
+
+# third-party
+import requests
+
+# the number of servers (per scheme) each session keeps connections to
+POOL_CONNECTIONS = 1
+# the most connections to keep open to one server
+POOL_MAXSIZE = 4
+SCHEMES = ('http://', 'https://')
+
+SessionStats = namedtuple('SessionStats', 'requests connections reused')
+
+
+def new_session(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE):
+    """
+    Builds a keep-alive requests.Session
+
+    :param:
+
+     - `pool_connections`: number of servers to keep connections to
+     - `pool_maxsize`: most connections to keep open to one server
+
+    :return: requests.Session with the pool sizes set
+    """
+    session = requests.Session()
+    for scheme in SCHEMES:
+        session.mount(scheme, requests.adapters.HTTPAdapter(pool_connections=pool_connections,
+                                                            pool_maxsize=pool_maxsize))
+    return session
+
+def session_stats(session):
+    """
+    Counts the session's requests and connections
+
+    :param:
+
+     - `session`: requests.Session
+
+    :return: SessionStats (requests, new connections made, requests that re-used a connection)
+    """
+    requests_made = connections = 0
+    for adapter in session.adapters.itervalues():
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            requests_made += pool.num_requests
+            connections += pool.num_connections
+    return SessionStats(requests_made, connections, requests_made - connections)
+
+HTTPPoolKey = namedtuple('HTTPPoolKey', 'protocol hostname')
+
+class HTTPSessionPool(BaseClass):
+    """
+    A holder of keep-alive sessions shared by the HTTPConnections to the same server
+    """
+    def __init__(self, pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE):
+        """
+        HTTPSessionPool constructor
+
+        :param:
+
+         - `pool_connections`: number of servers each session keeps connections to
+         - `pool_maxsize`: most connections each session keeps open to one server
+        """
+        super(HTTPSessionPool, self).__init__()
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self._lock = None
+        self._sessions = None
+        return
+
+    @property
+    def lock(self):
+        """
+        A re-entrant lock to protect the sessions
+
+        :rtype: RLock
+        """
+        if self._lock is None:
+            self._lock = threading.RLock()
+        return self._lock
+
+    @property
+    def sessions(self):
+        """
+        Dictionary of key: requests.Session
+        """
+        if self._sessions is None:
+            self._sessions = {}
+        return self._sessions
+
+    def session(self, key):
+        """
+        Gets the session for the key (creating it if it doesn't exist yet)
+
+        :param:
+
+         - `key`: HTTPPoolKey for the server
+
+        :return: requests.Session
+        """
+        with self.lock:
+            if key not in self.sessions:
+                self.logger.debug("Creating a session for {0}".format(key))
+                self.sessions[key] = new_session(pool_connections=self.pool_connections,
+                                                 pool_maxsize=self.pool_maxsize)
+            return self.sessions[key]
+
+    def stats(self, key=None):
+        """
+        Counts the requests and connections
+
+        :param:
+
+         - `key`: HTTPPoolKey for one server's session (default is all of them)
+
+        :return: SessionStats
+        """
+        with self.lock:
+            if key is not None:
+                sessions = [self.sessions[key]] if key in self.sessions else []
+            else:
+                sessions = self.sessions.values()
+            counts = [session_stats(session) for session in sessions]
+        return SessionStats(*[sum(column) for column in zip(*counts)] or (0, 0, 0))
+
+    def clear(self):
+        """
+        Closes all the sessions
+        """
+        with self.lock:
+            for session in self.sessions.itervalues():
+                session.close()
+            self.sessions.clear()
+        return
+
+    def __len__(self):
+        """
+        The number of sessions
+        """
+        with self.lock:
+            return len(self.sessions)
+# end class HTTPSessionPool
+
+http_pool = HTTPSessionPool()
+
+# python standard library
+import BaseHTTPServer
+import unittest
+
+class KeepAliveHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write('ok')
+        return
+
+    def log_message(self, format, *args):
+        return
+
+
+class TestHTTPSessionPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = HTTPSessionPool(pool_maxsize=2)
+        self.key = HTTPPoolKey('http', '192.168.1.1')
+        return
+
+    def tearDown(self):
+        self.pool.clear()
+        return
+
+    def test_session(self):
+        """
+        Does each key get one session that's shared?
+        """
+        session = self.pool.session(self.key)
+        self.assertIs(session, self.pool.session(self.key))
+        other = self.pool.session(HTTPPoolKey('http', '192.168.1.2'))
+        self.assertIsNot(session, other)
+        self.assertEqual(2, len(self.pool))
+        self.pool.clear()
+        self.assertEqual(0, len(self.pool))
+        self.assertEqual(SessionStats(0, 0, 0), self.pool.stats())
+        return
+
+    def test_pool_sizes(self):
+        """
+        Are the pool sizes given to the session's adapters?
+        """
+        adapter = self.pool.session(self.key).get_adapter('http://192.168.1.1/')
+        self.assertEqual(2, adapter._pool_maxsize)
+        self.assertEqual(POOL_CONNECTIONS, adapter._pool_connections)
+        return
+
+    def test_reuse(self):
+        """
+        Do the requests after the first one re-use its connection?
+        """
+        server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            key = HTTPPoolKey('http', '127.0.0.1:{0}'.format(server.server_address[1]))
+            url = 'http://{0}/'.format(key.hostname)
+            for request in range(3):
+                self.assertEqual('ok', self.pool.session(key).get(url).text)
+            self.assertEqual(SessionStats(3, 1, 2), self.pool.stats(key))
+            self.assertEqual(SessionStats(0, 0, 0), self.pool.stats(self.key))
+        finally:
+            self.pool.clear()
+            server.shutdown()
+            server.server_close()
+        return
+# end class TestHTTPSessionPool
@@ -0,0 +1,361 @@
+# python standard library
+from collections import namedtuple
+from contextlib import closing
+import anydbm
+import atexit
+import os
+import shelve
+import threading
+
+# this package
+from apcommand.baseclass import BaseClass
+
+READ = 'read'
+WRITE = 'write'
+READ_METHODS = ('GET', 'HEAD')
+# the Broadcom sends its changes as form-data with an 'action' (e.g. action=Apply)
+WRITE_FIELD = 'action'
+
+# the gap is multiplied by SHRINK after a good read and by GROW after a failure
+SHRINK = 0.5
+GROW = 2
+# the smallest and largest gaps the pacer will learn
+FLOOR = 0.05
+CEILING = 8
+# the smallest gap after a failure (so a gap of 0 can still back off)
+STEP = 0.1
+# seconds an answer can take before it counts as slow
+SLOW = 2
+SERVER_ERROR = 500
+
+SHELF_NAME = os.path.join(os.path.expanduser('~'), '.apcommand_pacing.shelve')
+SHELF_KEY = 'pacing {0}'
+
+PageKey = namedtuple('PageKey', 'page kind')
+PagePace = namedtuple('PagePace', 'gap successes failures slow')
+
+
+def is_read(method, data=None):
+    """
+    Checks if a request only reads the page
+
+    :param:
+
+     - `method`: the HTTP method
+     - `data`: the form-data for the request
+
+    :return: True if the request doesn't change anything
+    """
+    return method.upper() in READ_METHODS and not (data and WRITE_FIELD in data)
+
+class AdaptivePacer(BaseClass):
+    """
+    Learns the gap to leave after each page's requests for one server
+    """
+    def __init__(self, hostname, initial=0.5, floor=FLOOR, ceiling=CEILING,
+                 shrink=SHRINK, grow=GROW, slow=SLOW, shelf_name=None):
+        """
+        AdaptivePacer constructor
+
+        :param:
+
+         - `hostname`: the server's address (the shelf-key for its gaps)
+         - `initial`: gap for pages that haven't been learned (and the least for writes)
+         - `floor`: smallest gap to shrink to
+         - `ceiling`: largest gap to back off to
+         - `shrink`: multiplier for the gap after a good read
+         - `grow`: multiplier for the gap after a failure
+         - `slow`: seconds an answer can take before it counts as a failure
+         - `shelf_name`: path to the shelf to keep the gaps in (None means don't keep them)
+        """
+        super(AdaptivePacer, self).__init__()
+        self.hostname = hostname
+        self.initial = initial
+        self.floor = min(floor, initial)
+        self.ceiling = ceiling
+        self.shrink = shrink
+        self.grow = grow
+        self.slow = slow
+        self.shelf_name = shelf_name
+        self.lock = threading.RLock()
+        self.previous = None
+        self.dirty = False
+        self._paces = None
+        return
+
+    @property
+    def paces(self):
+        """
+        Dictionary of PageKey: PagePace (loaded from the shelf the first time)
+        """
+        if self._paces is None:
+            self._paces = self.load()
+        return self._paces
+
+    def key(self, page, method, data=None):
+        """
+        Builds the key for a request
+
+        :param:
+
+         - `page`: the path for the request
+         - `method`: the HTTP method
+         - `data`: the form-data for the request
+
+        :return: PageKey
+        """
+        if is_read(method, data):
+            return PageKey(page, READ)
+        return PageKey(page, WRITE)
+
+    def pace(self, key):
+        """
+        Gets the PagePace for the key (a new one if the page hasn't been seen)
+        """
+        return self.paces.get(key, PagePace(self.initial, 0, 0, 0))
+
+    def gap(self, key):
+        """
+        The seconds to wait after a request for the key
+        """
+        with self.lock:
+            return self.pace(key).gap
+
+    def update(self, key, **changes):
+        """
+        Changes the key's PagePace
+        """
+        self.paces[key] = self.pace(key)._replace(**changes)
+        self.dirty = True
+        return
+
+    def back_off(self, key):
+        """
+        Grows the gap before the request that failed (the previous request's gap)
+        """
+        before = self.previous if self.previous is not None else key
+        gap = min(self.ceiling, max(self.pace(before).gap * self.grow, STEP))
+        self.logger.debug("Backing off {0} to {1} seconds".format(before, gap))
+        self.update(before, gap=gap)
+        return
+
+    def succeeded(self, key, seconds):
+        """
+        Learns from a request that got an answer
+
+        :param:
+
+         - `key`: PageKey for the request
+         - `seconds`: how long the answer took
+
+        :return: seconds to wait before the next request
+        """
+        with self.lock:
+            pace = self.pace(key)
+            if seconds > self.slow:
+                self.update(key, slow=pace.slow + 1)
+                self.back_off(key)
+            elif key.kind == READ:
+                self.update(key, successes=pace.successes + 1,
+                            gap=max(self.floor, pace.gap * self.shrink))
+            else:
+                self.update(key, successes=pace.successes + 1,
+                            gap=max(self.initial, pace.gap))
+            self.previous = key
+            return self.pace(key).gap
+
+    def failed(self, key):
+        """
+        Learns from a request that didn't get an answer (or got an error)
+
+        :param:
+
+         - `key`: PageKey for the request
+
+        :return: seconds to wait before the next request
+        """
+        with self.lock:
+            self.update(key, failures=self.pace(key).failures + 1)
+            self.back_off(key)
+            self.previous = key
+            return self.pace(key).gap
+
+    def load(self):
+        """
+        Reads the learned gaps from the shelf
+
+        :return: dictionary of PageKey: PagePace (empty if there aren't any)
+        """
+        if self.shelf_name is None:
+            return {}
+        try:
+            with closing(shelve.open(self.shelf_name, flag='r')) as shelf:
+                stored = shelf[SHELF_KEY.format(self.hostname)]
+        except (anydbm.error, KeyError):
+            return {}
+        return dict((PageKey(*key), PagePace(*pace)) for key, pace in stored.iteritems())
+
+    def save(self):
+        """
+        Writes the learned gaps to the shelf (if they changed)
+        """
+        with self.lock:
+            if self.shelf_name is None or not self.dirty:
+                return
+            stored = dict((tuple(key), tuple(pace)) for key, pace in self.paces.iteritems())
+            try:
+                with closing(shelve.open(self.shelf_name)) as shelf:
+                    shelf[SHELF_KEY.format(self.hostname)] = stored
+            except (anydbm.error, IOError, OSError) as error:
+                self.logger.warning("Unable to save the pacing: {0}".format(error))
+                return
+            self.dirty = False
+        return
+# end class AdaptivePacer
+
+class HostPacers(BaseClass):
+    """
+    A holder of one AdaptivePacer per host
+    """
+    def __init__(self):
+        """
+        HostPacers constructor
+        """
+        super(HostPacers, self).__init__()
+        self.lock = threading.Lock()
+        self.pacers = {}
+        self.shelf_name = None
+        return
+
+    def pacer(self, hostname, **settings):
+        """
+        Gets the host's AdaptivePacer (creating it if it doesn't exist yet)
+
+        :param:
+
+         - `hostname`: the server's address
+         - `settings`: AdaptivePacer parameters for a new pacer
+
+        :return: AdaptivePacer
+        """
+        settings.setdefault('shelf_name', self.shelf_name)
+        with self.lock:
+            if hostname not in self.pacers:
+                self.pacers[hostname] = AdaptivePacer(hostname, **settings)
+            return self.pacers[hostname]
+
+    def save(self):
+        """
+        Saves all the pacers' gaps
+        """
+        with self.lock:
+            pacers = self.pacers.values()
+        for pacer in pacers:
+            pacer.save()
+        return
+
+    def clear(self):
+        """
+        Forgets all the pacers
+        """
+        with self.lock:
+            self.pacers.clear()
+        return
+# end class HostPacers
+
+host_pacers = HostPacers()
+atexit.register(host_pacers.save)
+
+# python standard library
+import shutil
+import tempfile
+import unittest
+
+class TestAdaptivePacer(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.shelf_name = os.path.join(self.directory, 'pacing.shelve')
+        self.pacer = AdaptivePacer('192.168.1.1', initial=0.5,
+                                   shelf_name=self.shelf_name)
+        self.read = self.pacer.key('radio.asp', 'GET', {'wl_unit': '0'})
+        self.write = self.pacer.key('radio.asp', 'GET', {'action': 'Apply'})
+        return
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        return
+
+    def test_key(self):
+        """
+        Are writes told apart from reads?
+        """
+        self.assertEqual(PageKey('radio.asp', READ), self.read)
+        self.assertEqual(PageKey('radio.asp', WRITE), self.write)
+        self.assertEqual(WRITE, self.pacer.key('ssid.asp', 'post').kind)
+        return
+
+    def test_reads(self):
+        """
+        Does the gap after good reads shrink down to the floor?
+        """
+        self.assertEqual(0.5, self.pacer.gap(self.read))
+        self.assertEqual([0.25, 0.125, 0.0625, FLOOR, FLOOR],
+                         [self.pacer.succeeded(self.read, 0.01) for read in range(5)])
+        self.assertEqual(5, self.pacer.pace(self.read).successes)
+        return
+
+    def test_writes(self):
+        """
+        Do writes keep the initial gap?
+        """
+        self.pacer.succeeded(self.read, 0.01)
+        self.assertEqual(0.5, self.pacer.succeeded(self.write, 0.01))
+        self.assertEqual(0.5, self.pacer.gap(self.write))
+        return
+
+    def test_failures(self):
+        """
+        Does a failure (or a slow answer) back off the gap before it?
+        """
+        for read in range(4):
+            self.pacer.succeeded(self.read, 0.01)
+        self.pacer.failed(PageKey('ssid.asp', READ))
+        self.assertEqual(FLOOR * GROW, self.pacer.gap(self.read))
+        self.assertEqual(1, self.pacer.pace(PageKey('ssid.asp', READ)).failures)
+        self.pacer.succeeded(self.read, SLOW + 1)
+        self.assertEqual(1, self.pacer.pace(self.read).slow)
+        self.assertEqual(0.5 * GROW, self.pacer.gap(PageKey('ssid.asp', READ)))
+        for failure in range(10):
+            self.pacer.failed(self.read)
+        self.assertEqual(CEILING, self.pacer.gap(self.read))
+        return
+
+    def test_persistence(self):
+        """
+        Are the learned gaps saved and loaded again?
+        """
+        self.pacer.succeeded(self.read, 0.01)
+        self.pacer.save()
+        self.assertFalse(self.pacer.dirty)
+        pacer = AdaptivePacer('192.168.1.1', shelf_name=self.shelf_name)
+        self.assertEqual(0.25, pacer.gap(self.read))
+        other = AdaptivePacer('192.168.1.2', initial=0.5, shelf_name=self.shelf_name)
+        self.assertEqual(0.5, other.gap(self.read))
+        self.assertEqual({}, AdaptivePacer('192.168.1.1', shelf_name=None).paces)
+        return
+# end class TestAdaptivePacer
+
+
+class TestHostPacers(unittest.TestCase):
+    def test_shelf_name(self):
+        """
+        Are the gaps only kept if the HostPacers is given a shelf?
+        """
+        pacers = HostPacers()
+        self.assertIsNone(pacers.pacer('192.168.1.1').shelf_name)
+        self.assertIsNone(AdaptivePacer('192.168.1.1').shelf_name)
+        pacers.shelf_name = SHELF_NAME
+        self.assertEqual(SHELF_NAME, pacers.pacer('192.168.1.2').shelf_name)
+        self.assertIsNone(pacers.pacer('192.168.1.3', shelf_name=None).shelf_name)
+        return
+# end class TestHostPacers
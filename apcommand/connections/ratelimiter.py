@@ -0,0 +1,396 @@
+# python standard library
+import ctypes
+import ctypes.util
+import sys
+import threading
+import time
+
+# this package
+from apcommand.baseclass import BaseClass
+
+# the clock-id for clock_gettime (from linux/time.h)
+CLOCK_MONOTONIC = 1
+
+class TimeSpec(ctypes.Structure):
+    """
+    The struct timespec that clock_gettime fills in
+    """
+    _fields_ = [('seconds', ctypes.c_long),
+                ('nanoseconds', ctypes.c_long)]
+# end class TimeSpec
+
+
+def load_clock_gettime():
+    """
+    Loads clock_gettime from the C library
+
+    :return: clock_gettime function or None if it isn't available
+    """
+    # the clock-ids aren't the same on other systems (CLOCK_MONOTONIC is 6 on a mac)
+    if not sys.platform.startswith('linux'):
+        return None
+    name = ctypes.util.find_library('rt') or ctypes.util.find_library('c')
+    if name is None:
+        return None
+    try:
+        clock_gettime = ctypes.CDLL(name, use_errno=True).clock_gettime
+    except (OSError, AttributeError):
+        return None
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(TimeSpec)]
+    if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(TimeSpec())) != 0:
+        return None
+    return clock_gettime
+
+_clock_gettime = load_clock_gettime()
+
+
+def monotonic():
+    """
+    Seconds from a clock that never goes backwards (the start is arbitrary)
+
+    :return: float seconds
+    :raise: OSError if clock_gettime fails
+    """
+    if _clock_gettime is None:
+        return time.time()
+    spec = TimeSpec()
+    if _clock_gettime(CLOCK_MONOTONIC, ctypes.byref(spec)) != 0:
+        error = ctypes.get_errno()
+        raise OSError(error, "clock_gettime failed")
+    return spec.seconds + spec.nanoseconds * 1e-9
+
+monotonic = getattr(time, 'monotonic', monotonic)
+
+class TokenBucket(BaseClass):
+    """
+    A thread-free rate limiter with a minimum gap between requests
+    """
+    def __init__(self, rate=None, burst=1, minimum_gap=0, clock=monotonic):
+        """
+        TokenBucket constructor
+
+        :param:
+
+         - `rate`: tokens added per second (None means no limit)
+         - `burst`: most tokens the bucket holds (requests that can go at once)
+         - `minimum_gap`: seconds from the end of one request to the start of the next
+         - `clock`: function that returns the time in seconds
+        """
+        super(TokenBucket, self).__init__()
+        self.rate = rate
+        self.burst = burst
+        self.minimum_gap = minimum_gap
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.tokens = burst
+        self.updated = None
+        self.next_start = None
+        self.outstanding = 0
+        self.waits = 0
+        self.waited = 0
+        return
+
+    def refill(self, now):
+        """
+        Adds the tokens for the time since the last refill
+
+        :param:
+
+         - `now`: the clock's time
+        """
+        if self.updated is not None and self.rate is not None:
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return
+
+    def reserve(self):
+        """
+        Takes a token and the next start time
+
+        :return: seconds the caller has to wait before it starts
+        """
+        with self.lock:
+            now = self.clock()
+            self.refill(now)
+            start = now
+            if self.rate is not None and self.tokens < 1:
+                start = now + (1 - self.tokens) / float(self.rate)
+            if self.next_start is not None:
+                start = max(start, self.next_start)
+            if self.rate is not None:
+                self.tokens -= 1
+            self.next_start = start + self.minimum_gap
+            self.outstanding += 1
+            delay = start - now
+            if delay > 0:
+                self.waits += 1
+                self.waited += delay
+        return delay
+
+    def acquire(self):
+        """
+        Waits until the next request can start
+
+        :return: seconds waited
+        """
+        delay = self.reserve()
+        if delay > 0:
+            self.logger.debug("Waiting {0:.3f} seconds".format(delay))
+            time.sleep(delay)
+            return delay
+        return 0
+
+    def release(self, gap=None):
+        """
+        Marks the end of a request (the gap is counted from here)
+
+        :param:
+
+         - `gap`: seconds before the next request (default is the minimum_gap)
+        """
+        if gap is None:
+            gap = self.minimum_gap
+        with self.lock:
+            self.outstanding = max(0, self.outstanding - 1)
+            finished = self.clock() + gap
+            if (self.next_start is None or not self.outstanding
+                or finished > self.next_start):
+                self.next_start = finished
+        return
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        self.release()
+        return False
+# end class TokenBucket
+
+class HostLimiters(BaseClass):
+    """
+    A holder of one TokenBucket per host
+    """
+    def __init__(self):
+        """
+        HostLimiters constructor
+        """
+        super(HostLimiters, self).__init__()
+        self.lock = threading.Lock()
+        self.limiters = {}
+        return
+
+    def limiter(self, hostname, rate=None, burst=1, minimum_gap=0):
+        """
+        Gets the host's TokenBucket (creating it if it doesn't exist yet)
+
+        :param:
+
+         - `hostname`: the server's address (with the port if it isn't the default)
+         - `rate`, `burst`, `minimum_gap`: settings for a new TokenBucket
+
+        :return: TokenBucket
+        """
+        with self.lock:
+            if hostname not in self.limiters:
+                self.logger.debug("Creating a limiter for {0}".format(hostname))
+                self.limiters[hostname] = TokenBucket(rate=rate, burst=burst,
+                                                      minimum_gap=minimum_gap)
+            limiter = self.limiters[hostname]
+            if (rate, burst, minimum_gap) != (limiter.rate, limiter.burst, limiter.minimum_gap):
+                message = ("The limiter for {0} has rate={1}, burst={2}, minimum_gap={3}"
+                           " (ignoring rate={4}, burst={5}, minimum_gap={6})")
+                self.logger.warning(message.format(hostname, limiter.rate, limiter.burst,
+                                                   limiter.minimum_gap, rate, burst,
+                                                   minimum_gap))
+            return limiter
+
+    def clear(self):
+        """
+        Forgets all the limiters
+        """
+        with self.lock:
+            self.limiters.clear()
+        return
+
+    def __len__(self):
+        """
+        The number of limiters
+        """
+        with self.lock:
+            return len(self.limiters)
+# end class HostLimiters
+
+host_limiters = HostLimiters()
+
+# python standard library
+import unittest
+
+# third-party
+from mock import MagicMock, patch
+
+class FakeClock(object):
+    """
+    A clock that only moves when it sleeps
+    """
+    def __init__(self):
+        self.now = 0
+        self.sleeps = []
+        return
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+        return
+# end class FakeClock
+
+
+class TestTokenBucket(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.sleep_patch = patch('time.sleep', self.clock.sleep)
+        self.sleep_patch.start()
+        return
+
+    def tearDown(self):
+        self.sleep_patch.stop()
+        return
+
+    def test_idle(self):
+        """
+        Does a limiter that's been idle longer than the gap let requests straight through?
+        """
+        limiter = TokenBucket(minimum_gap=0.5, clock=self.clock)
+        self.assertEqual(0, limiter.acquire())
+        limiter.release()
+        self.clock.now += 0.5
+        with limiter:
+            pass
+        self.assertEqual([], self.clock.sleeps)
+        self.assertEqual(0, limiter.waits)
+        return
+
+    def test_minimum_gap(self):
+        """
+        Is the gap counted from the end of the previous request?
+        """
+        limiter = TokenBucket(minimum_gap=0.5, clock=self.clock)
+        limiter.acquire()
+        self.clock.now += 2
+        limiter.release()
+        self.clock.now += 0.125
+        self.assertEqual(0.375, limiter.acquire())
+        self.assertEqual([0.375], self.clock.sleeps)
+        self.assertEqual((1, 0.375), (limiter.waits, limiter.waited))
+        return
+
+    def test_burst(self):
+        """
+        Can `burst` requests go at once, with the rest at `rate`?
+        """
+        limiter = TokenBucket(rate=2, burst=3, clock=self.clock)
+        for request in range(3):
+            with limiter:
+                pass
+        self.assertEqual([], self.clock.sleeps)
+        with limiter:
+            pass
+        self.assertEqual([0.5], self.clock.sleeps)
+        self.clock.now += 10
+        for request in range(3):
+            with limiter:
+                pass
+        self.assertEqual([0.5], self.clock.sleeps)
+        return
+
+    def test_reservations(self):
+        """
+        Are callers that acquire before the others release lined up by the gap?
+        """
+        limiter = TokenBucket(minimum_gap=0.5, clock=self.clock)
+        self.assertEqual([0, 0.5, 1],
+                         [limiter.reserve() for caller in range(3)])
+        return
+
+    def test_release_gap(self):
+        """
+        Does a gap given to release replace the minimum gap?
+        """
+        limiter = TokenBucket(minimum_gap=0.5, clock=self.clock)
+        limiter.acquire()
+        limiter.release(gap=0.125)
+        self.assertEqual(0.125, limiter.acquire())
+        limiter.release(gap=2)
+        self.assertEqual(2, limiter.acquire())
+        limiter.release(gap=0)
+        # with another caller waiting it can only move the start later
+        self.assertEqual([0, 0.5], [limiter.reserve(), limiter.reserve()])
+        limiter.release(gap=0)
+        self.assertEqual(1, limiter.reserve())
+        return
+
+    def test_no_threads(self):
+        """
+        Does it pace the requests without starting any threads?
+        """
+        limiter = TokenBucket(rate=10, minimum_gap=0.1, clock=self.clock)
+        threads = threading.active_count()
+        for request in range(5):
+            with limiter:
+                self.assertEqual(threads, threading.active_count())
+        self.assertEqual(threads, threading.active_count())
+        self.assertEqual(4, limiter.waits)
+        return
+# end class TestTokenBucket
+
+
+class TestHostLimiters(unittest.TestCase):
+    def test_limiter(self):
+        """
+        Do the connections to one host share a limiter?
+        """
+        limiters = HostLimiters()
+        limiter = limiters.limiter('192.168.1.1', minimum_gap=0.5)
+        self.assertIs(limiter, limiters.limiter('192.168.1.1', minimum_gap=2))
+        self.assertEqual(0.5, limiter.minimum_gap)
+        self.assertIsNot(limiter, limiters.limiter('192.168.1.2'))
+        self.assertEqual(2, len(limiters))
+        limiters.clear()
+        self.assertEqual(0, len(limiters))
+        return
+
+    def test_settings(self):
+        """
+        Does asking for different settings for a host log a warning?
+        """
+        limiters = HostLimiters()
+        limiters._logger = MagicMock()
+        limiters.limiter('192.168.1.1', minimum_gap=0.5)
+        limiters.limiter('192.168.1.1', minimum_gap=0.5)
+        self.assertEqual([], limiters.logger.warning.mock_calls)
+        limiter = limiters.limiter('192.168.1.1', rate=2, minimum_gap=0.5)
+        self.assertEqual(1, len(limiters.logger.warning.mock_calls))
+        self.assertIsNone(limiter.rate)
+        return
+
+    def test_monotonic(self):
+        """
+        Does the clock move forward?
+        """
+        start = monotonic()
+        time.sleep(0.01)
+        self.assertGreater(monotonic(), start)
+        return
+
+    def test_other_systems(self):
+        """
+        Is clock_gettime only used on linux?
+        """
+        with patch('sys.platform', 'darwin'):
+            self.assertIsNone(load_clock_gettime())
+        return
+# end class TestHostLimiters
@@ -0,0 +1,281 @@
+# python standard library
+from collections import namedtuple
+import random
+import threading
+import time
+
+# this package
+from apcommand.baseclass import BaseClass
+
+# connections
+from pacing import is_read
+from ratelimiter import monotonic
+
+# third-party
+import requests
+
+# the most times to send a request (including the first)
+ATTEMPTS = 3
+# seconds to wait before the first retry (multiplied by FACTOR for each one after it)
+BACKOFF = 0.5
+FACTOR = 2
+# the longest to wait between attempts
+CEILING = 8
+# seconds each attempt has to connect and answer
+TIMEOUT = 10
+# the errors that mean the server might answer if asked again
+RETRY_ERRORS = (requests.ConnectionError, requests.Timeout)
+
+class RetryStats(namedtuple('RetryStats', 'requests attempts retries failures latency')):
+    """
+    The counts for a RetryPolicy
+    """
+    __slots__ = ()
+
+    @property
+    def mean_latency(self):
+        """
+        The average seconds a request took (0 if there weren't any)
+        """
+        if not self.requests:
+            return 0
+        return self.latency / float(self.requests)
+# end class RetryStats
+
+class RetryPolicy(BaseClass):
+    """
+    Decides when to send a failed request again and how long to wait first
+    """
+    def __init__(self, attempts=ATTEMPTS, backoff=BACKOFF, factor=FACTOR,
+                 ceiling=CEILING, jitter=True, timeout=TIMEOUT, retry_writes=False,
+                 errors=RETRY_ERRORS, sleep=time.sleep, clock=monotonic,
+                 random=random.random):
+        """
+        RetryPolicy constructor
+
+        :param:
+
+         - `attempts`: the most times to send a request (1 means don't retry)
+         - `backoff`: seconds to wait before the first retry
+         - `factor`: what the backoff is multiplied by for each retry after the first
+         - `ceiling`: the longest to wait between attempts
+         - `jitter`: if True wait a random time between half the backoff and the backoff
+         - `timeout`: seconds each attempt has (None means wait forever)
+         - `retry_writes`: if True retry the writes too (not just the reads)
+         - `errors`: tuple of the exceptions to retry
+         - `sleep`: function to wait between attempts
+         - `clock`: function that returns the time in seconds
+         - `random`: function that returns a random number from 0 to 1
+        """
+        super(RetryPolicy, self).__init__()
+        self.attempts = attempts
+        self.backoff = backoff
+        self.factor = factor
+        self.ceiling = ceiling
+        self.jitter = jitter
+        self.timeout = timeout
+        self.retry_writes = retry_writes
+        self.errors = errors
+        self.sleep = sleep
+        self.clock = clock
+        self.random = random
+        self.lock = threading.Lock()
+        self.reset()
+        return
+
+    def retryable(self, method, data=None, idempotent=False):
+        """
+        Checks if a request can be sent again
+
+        :param:
+
+         - `method`: the HTTP method
+         - `data`: the form-data for the request
+         - `idempotent`: True if the caller says the request is safe to repeat
+
+        :return: True if the request can be retried
+        """
+        return idempotent or self.retry_writes or is_read(method, data)
+
+    def delay(self, attempt):
+        """
+        The seconds to wait after a failed attempt
+
+        :param:
+
+         - `attempt`: the number of the attempt that failed (starting at 1)
+
+        :return: the (jittered) backoff
+        """
+        backoff = min(self.ceiling, self.backoff * self.factor ** (attempt - 1))
+        if self.jitter:
+            backoff = backoff / 2.0 + self.random() * backoff / 2.0
+        return backoff
+
+    def record(self, attempts, latency, failed):
+        """
+        Adds a request to the counts
+
+        :param:
+
+         - `attempts`: the times the request was sent
+         - `latency`: seconds the request took (including the waits)
+         - `failed`: True if the last attempt failed
+        """
+        with self.lock:
+            self.requests += 1
+            self.attempts_made += attempts
+            self.failures += int(failed)
+            self.latency += latency
+        return
+
+    def call(self, function, method, data=None, idempotent=False):
+        """
+        Calls the function, calling it again if it raises one of the errors
+
+        :param:
+
+         - `function`: the request (with no arguments)
+         - `method`: the HTTP method
+         - `data`: the form-data for the request
+         - `idempotent`: True if the caller says the request is safe to repeat
+
+        :return: what the function returns
+        :raise: the function's last error if every attempt failed (or it can't be retried)
+        """
+        retryable = self.retryable(method, data, idempotent)
+        attempts = 0
+        failed = True
+        start = self.clock()
+        try:
+            while True:
+                attempts += 1
+                try:
+                    outcome = function()
+                    failed = False
+                    return outcome
+                except self.errors as error:
+                    if not retryable or attempts >= self.attempts:
+                        raise
+                    delay = self.delay(attempts)
+                    self.logger.warning("Attempt {0} of {1} failed ({2}), retrying in {3:.2f} seconds".format(attempts,
+                                                                                                             self.attempts,
+                                                                                                             error,
+                                                                                                             delay))
+                    self.sleep(delay)
+        finally:
+            self.record(attempts, self.clock() - start, failed)
+
+    @property
+    def stats(self):
+        """
+        The counts so far
+
+        :rtype: RetryStats
+        """
+        with self.lock:
+            return RetryStats(self.requests, self.attempts_made,
+                              self.attempts_made - self.requests,
+                              self.failures, self.latency)
+
+    def reset(self):
+        """
+        Sets the counts back to 0
+        """
+        with self.lock:
+            self.requests = 0
+            self.attempts_made = 0
+            self.failures = 0
+            self.latency = 0
+        return
+# end class RetryPolicy
+
+# python standard library
+import unittest
+
+# third-party
+from mock import MagicMock, call
+
+class TestRetryPolicy(unittest.TestCase):
+    def setUp(self):
+        self.now = 0
+        self.sleep = MagicMock()
+        self.policy = RetryPolicy(attempts=3, backoff=0.5, factor=2, ceiling=1.5,
+                                  sleep=self.sleep, clock=lambda: self.now,
+                                  random=lambda: 0.5)
+        self.function = MagicMock(return_value='page')
+        return
+
+    def test_retryable(self):
+        """
+        Are only the reads retried unless the caller says so?
+        """
+        self.assertTrue(self.policy.retryable('get', {'wl_unit': '1'}))
+        self.assertTrue(self.policy.retryable('HEAD'))
+        self.assertFalse(self.policy.retryable('GET', {'action': 'Apply'}))
+        self.assertFalse(self.policy.retryable('POST'))
+        self.assertTrue(self.policy.retryable('GET', {'action': 'Apply'}, idempotent=True))
+        self.policy.retry_writes = True
+        self.assertTrue(self.policy.retryable('POST'))
+        return
+
+    def test_delay(self):
+        """
+        Does the backoff grow up to the ceiling with the jitter between half and all of it?
+        """
+        self.assertEqual([0.375, 0.75, 1.125, 1.125],
+                         [self.policy.delay(attempt) for attempt in range(1, 5)])
+        self.policy.random = lambda: 0
+        self.assertEqual(0.25, self.policy.delay(1))
+        self.policy.jitter = False
+        self.assertEqual([0.5, 1, 1.5], [self.policy.delay(attempt) for attempt in range(1, 4)])
+        return
+
+    def test_call(self):
+        """
+        Does a read that's refused get sent again after the backoff?
+        """
+        def refuse_once():
+            if self.function.call_count == 1:
+                self.now += 1
+                raise requests.ConnectionError("refused")
+            return 'page'
+        self.function.side_effect = refuse_once
+        self.assertEqual('page', self.policy.call(self.function, 'GET'))
+        self.assertEqual([call(0.375)], self.sleep.mock_calls)
+        self.assertEqual(RetryStats(1, 2, 1, 0, 1), self.policy.stats)
+        self.function.side_effect = None
+        self.policy.call(self.function, 'GET')
+        self.assertEqual(0.5, self.policy.stats.mean_latency)
+        self.policy.reset()
+        self.assertEqual(RetryStats(0, 0, 0, 0, 0), self.policy.stats)
+        return
+
+    def test_give_up(self):
+        """
+        Does it raise the last error after the last attempt (and not retry other errors)?
+        """
+        self.function.side_effect = requests.Timeout("too slow")
+        self.assertRaises(requests.Timeout, self.policy.call, self.function, 'GET')
+        self.assertEqual(3, self.function.call_count)
+        self.assertEqual([call(0.375), call(0.75)], self.sleep.mock_calls)
+        self.assertEqual(RetryStats(1, 3, 2, 1, 0), self.policy.stats)
+        self.function.side_effect = ValueError
+        self.assertRaises(ValueError, self.policy.call, self.function, 'GET')
+        self.assertEqual(4, self.function.call_count)
+        return
+
+    def test_writes(self):
+        """
+        Is an Apply only retried when it's marked idempotent?
+        """
+        self.function.side_effect = requests.ConnectionError
+        apply_data = {'action': 'Apply'}
+        self.assertRaises(requests.ConnectionError, self.policy.call, self.function,
+                          'GET', apply_data)
+        self.assertEqual(1, self.function.call_count)
+        self.assertRaises(requests.ConnectionError, self.policy.call, self.function,
+                          'GET', apply_data, idempotent=True)
+        self.assertEqual(4, self.function.call_count)
+        return
+# end class TestRetryPolicy
@@ -1,18 +1,28 @@
 
 #python Libraries
 from StringIO import StringIO
+from collections import deque
+import itertools
 import os.path
+import random
+import re
+import select
+import socket
 import telnetlib
 import time
 
+
 # this package
 from apcommand.baseclass import BaseClass
 from apcommand.commands import changeprompt
 
 # connections
 from apcommand.commons.readoutput import ValidatingOutput
+from apcommand.commons.errors import ConnectionError, TimeoutError
 from nonlocalconnection import NonLocalConnection, NonLocalConnectionBuilder
 from localconnection import OutputError
+from telnetpool import PoolKey
+
 
 
 NEWLINE = '\n'
@@ -20,6 +30,18 @@ SPACER = '{0} {1}'
 UNKNOWN = "Unknown command: "
 EMPTY_STRING = EOF = ''
 PLUGIN_NAME = 'telnet'
+# nothing (but spaces) comes after a prompt that's waiting for input
+PROMPT_END = r'[ \t]*$'
+# the marker echoed after each command in a batch (and the command to echo it)
+MARKER = 'APCOMMAND_{0}_{1}'
+MARKER_COMMAND = "echo APCOMMAND''_{0}_{1}"
+# the markers echoed before and after each framed command
+FRAME_START = MARKER.format('{0}', '{1}_start')
+FRAME_END = MARKER.format('{0}', '{1}_end')
+# the command goes in with its separator (';' or the '&' it already ends with)
+FRAMED_COMMAND = "echo APCOMMAND''_{0}_{1}_start; {2} echo APCOMMAND''_{0}_{1}_end"
+SEPARATOR = ';'
+BACKGROUND = '&'
 
 
 class OutputFile(ValidatingOutput):
@@ -59,7 +81,7 @@ class TelnetAdapter(BaseClass):
     A TelnetAdapter Adapts the telnetlib.Telnet to this libraries interfaces.
     """
     def __init__(self, host, prompt="#", login='root', password=None, port=23, timeout=2, end_of_line='\r\n',
-                 login_prompt="login:"):
+                 login_prompt="login:", buffered=False, framed=False):
         """
         :param:
 
@@ -71,6 +93,8 @@ class TelnetAdapter(BaseClass):
          - `end_of_line`: The end of line string used by the device.
          - `login_prompt`: The prompt to look for when starting a connection.
          - `password`: if given tries to login
+         - `buffered`: if True, use the BufferedTelnetOutput to read the output
+         - `framed`: if True, echo markers around each command and read with the FramedTelnetOutput
         """
         super(TelnetAdapter, self).__init__()
         self.host = host
@@ -82,6 +106,11 @@ class TelnetAdapter(BaseClass):
         self.end_of_line = end_of_line
         self._client = None
         self.login_prompt = login_prompt
+        self.buffered = buffered
+        self.framed = framed
+        self.login_time = None
+        self.token = '{0:08x}'.format(random.getrandbits(32))
+        self.sequence = itertools.count()
         return
 
     @property
@@ -93,36 +122,120 @@ class TelnetAdapter(BaseClass):
         :return: The telnet client
         """
         if self._client is None:
+            start = time.time()
             self._client = telnetlib.Telnet(host=self.host, port=self.port,timeout=self.timeout)
             possibilities = [self.prompt, self.login_prompt]
             output = self._client.expect(possibilities, timeout=self.timeout)
-            if output[0] == 1:
+            if output[MATCH_INDEX] == 1:
                 self._client.write(self.login + NEWLINE)
                 if self.password is not None:
                     output = self._client.read_until("Password: ", timeout=self.timeout)
                     self._client.write(self.password + NEWLINE)
+                self.wait_for(self.prompt)
+            elif output[MATCH_INDEX] == 0:
+                self.logger.debug("Already at the prompt, skipping the login")
+            else:
+                self.close()
+                raise TimeoutError("Timed out waiting for '{0}' or '{1}' from {2}".format(self.prompt,
+                                                                                      self.login_prompt,
+                                                                                      self.host))
+            self.login_time = time.time() - start
+            self.logger.debug("Logged in to {0} in {1:.3f} seconds".format(self.host,
+                                                                            self.login_time))
         return self._client
 
+    def wait_for(self, expression, timeout=None):
+        """
+        Reads (and throws away) the output until the expression matches
+
+        :param:
+
+         - `expression`: regular expression to wait for
+         - `timeout`: seconds to wait (default is the adapter's timeout)
+
+        :return: the output up to the end of the match
+        :raise: TimeoutError if the expression doesn't match in time
+        """
+        if timeout is None:
+            timeout = self.timeout
+        output = self._client.expect([expression], timeout=timeout)
+        if output[MATCH_INDEX] == -1:
+            raise TimeoutError("Timed out waiting for '{0}' (got '{1}')".format(expression,
+                                                                                output[MATCHING_STRING]))
+        return output[MATCHING_STRING]
+
     def exec_command(self, command, timeout=10):
         """
         The main interface.
 
-        Since I'm hiding the client from users, this will do a read_very_eager before continuing.
-        The read is intended to try and flush the output
+        If `framed` the command is sent between two numbered markers, so the output
+        skips whatever an earlier command left unread. Otherwise this will do a
+        read_very_eager before continuing to try and flush the output.
 
         :param:
 
          - `command`: The command to execute on the device
          - `timeout`: The readline timeout
 
-        :return: TelnetOutput with the this object's as client
+        :return: TelnetOutput (Buffered or Framed) with the this object's as client
         """
         self.client.timeout = timeout
+        if self.framed:
+            sequence = next(self.sequence)
+            self.logger.debug("Sending the command: " + command)
+            command = command.rstrip()
+            if not command.endswith(BACKGROUND):
+                # 'command &;' is a syntax error so a background command keeps its '&'
+                command += SEPARATOR
+            self.writeline(FRAMED_COMMAND.format(self.token, sequence, command))
+            return FramedTelnetOutput(start=FRAME_START.format(self.token, sequence),
+                                      end=FRAME_END.format(self.token, sequence),
+                                      client=self.client, prompt=self.prompt,
+                                      timeout=self.timeout, end_of_line=self.end_of_line)
         self.logger.debug("In queue: " + self.client.read_very_eager())
         self.logger.debug("Sending the command: " + command)
         self.writeline(command)
-        return TelnetOutput(client=self.client, prompt=self.prompt,
-                            timeout=self.timeout, end_of_line=self.end_of_line)
+        output = BufferedTelnetOutput if self.buffered else TelnetOutput
+        return output(client=self.client, prompt=self.prompt,
+                      timeout=self.timeout, end_of_line=self.end_of_line)
+
+    def exec_batch(self, commands, timeout=10):
+        """
+        Sends all the commands in one write, with a marker echoed after each one
+
+        :param:
+
+         - `commands`: list of commands to execute on the device
+         - `timeout`: The readline timeout
+
+        :return: list with a list of lines of output for each command
+        """
+        return self.send_batch(commands, timeout=timeout).outputs()
+
+    def send_batch(self, commands, timeout=10):
+        """
+        Writes all the commands in one write without reading the output
+
+        :param:
+
+         - `commands`: list of commands to execute on the device
+         - `timeout`: The readline timeout
+
+        :return: BatchTelnetOutput to read the batch's output
+        """
+        self.client.timeout = timeout
+        self.logger.debug("In queue: " + self.client.read_very_eager())
+        token = '{0:08x}'.format(random.getrandbits(32))
+        markers = [MARKER.format(token, index) for index in range(len(commands))]
+        sent = []
+        for index, command in enumerate(commands):
+            sent.append(command.rstrip(NEWLINE))
+            sent.append(MARKER_COMMAND.format(token, index))
+        self.logger.debug("Sending the batch: " + str(commands))
+        self.client.write(NEWLINE.join(sent) + NEWLINE)
+        return BatchTelnetOutput(client=self.client, sent=sent, markers=markers,
+                                 prompt=self.prompt, timeout=self.timeout,
+                                 end_of_line=self.end_of_line)
                            
     
     def writeline(self, message=""):
@@ -133,16 +246,79 @@ class TelnetAdapter(BaseClass):
         """
         self.client.write(message.rstrip(NEWLINE) + NEWLINE)
         return
+
+    def is_alive(self):
+        """
+        Checks if the session is still usable without sending anything to the device
+
+        As a side-effect, any output left in the queue is flushed.
+
+        :return: False if the client was never created or the device hung up
+        """
+        if self._client is None or self._client.get_socket() is None:
+            return False
+        try:
+            self.logger.debug("In queue: " + self._client.read_very_eager())
+        except (EOFError, socket.error) as error:
+            self.logger.debug(error)
+            return False
+        return True
+
+    @property
+    def closed(self):
+        """
+        True if the client was closed or has read the end of file (checks without reading)
+        """
+        return (self._client is None or self._client.get_socket() is None
+                or self._client.eof)
+
+    def probe(self, timeout=1):
+        """
+        Checks that the device still answers by having it echo a marker
+
+        As a side-effect, any output left in the queue is flushed.
+
+        :param:
+
+         - `timeout`: seconds to wait for the marker
+
+        :return: True if the marker came back in time
+        """
+        if not self.is_alive():
+            return False
+        probe = 'probe_{0}'.format(next(self.sequence))
+        try:
+            self.writeline(MARKER_COMMAND.format(self.token, probe))
+            self.wait_for(re.escape(MARKER.format(self.token, probe)), timeout=timeout)
+        except (TimeoutError, EOFError, socket.error) as error:
+            self.logger.debug(error)
+            return False
+        return True
+
+    def close(self):
+        """
+        Closes the telnet client (if it was created)
+        """
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+        return
     
     def __del__(self):
-        self.client.close()
+        self.close()
         return
 # end class TelnetAdapter
 
 
+
 MATCH_INDEX = 0
 MATCHING_STRING = 2
 
+# the BufferedTelnetOutput's socket reads
+CHUNK_SIZE = 4096
+# characters that telnetlib has to strip out of the output
+TELNET_SPECIAL = (telnetlib.IAC, telnetlib.theNULL, '\021')
+
 
 class TelnetOutput(BaseClass):
     """
@@ -232,13 +408,303 @@ class TelnetOutput(BaseClass):
 # end TelnetOutput
 
 
+class BufferedTelnetOutput(TelnetOutput):
+    """
+    A TelnetOutput that splits the lines itself instead of using expect
+    """
+    def __init__(self, *args, **kwargs):
+        """
+        BufferedTelnetOutput constructor
+
+        :param:
+
+         - `client` : a connected telnet client
+         - `prompt`: The current prompt on the client
+         - `end_of_line`: Then end of line character
+         - `timeout`: The readline timeout
+        """
+        super(BufferedTelnetOutput, self).__init__(*args, **kwargs)
+        self.buffer = EMPTY_STRING
+        self._lines = None
+        self._prompt_expression = None
+        self._prompt_end_expression = None
+        return
+
+    @property
+    def lines(self):
+        """
+        The complete lines that haven't been read yet
+
+        :rtype: deque
+        """
+        if self._lines is None:
+            self._lines = deque()
+        return self._lines
+
+    @property
+    def prompt_expression(self):
+        """
+        The compiled prompt (the prompt is a regular expression, as it is for expect)
+        """
+        if self._prompt_expression is None:
+            self._prompt_expression = re.compile(self.prompt)
+        return self._prompt_expression
+
+    @property
+    def prompt_end_expression(self):
+        """
+        The compiled prompt anchored at the end of the text (only trailing spaces after it)
+        """
+        if self._prompt_end_expression is None:
+            self._prompt_end_expression = re.compile('(?:{0}){1}'.format(self.prompt,
+                                                                         PROMPT_END))
+        return self._prompt_end_expression
+
+    def split(self, chunk):
+        """
+        Adds the chunk to the buffer and moves the complete lines to `lines`
+
+        :param:
+
+         - `chunk`: string of output read from the client
+
+        :postcondition: buffer holds only the text after the last end_of_line
+        """
+        lines = (self.buffer + chunk).split(self.end_of_line)
+        self.buffer = lines.pop()
+        self.lines.extend(line + self.end_of_line for line in lines)
+        return
+
+    def read_chunk(self):
+        """
+        Reads the next chunk of output straight from the client's socket
+
+        telnetlib only reads 50 bytes at a time and cooks them one character at a time,
+        so the chunk is only given to the client to cook if it has telnet commands in it.
+
+        :return: string of output
+        :raise: EOFError if the device hung up
+        """
+        chunk = self.client.get_socket().recv(CHUNK_SIZE)
+        if not chunk:
+            self.client.eof = True
+            raise EOFError("telnet connection closed")
+        if (self.client.iacseq or self.client.sb or
+            any(character in chunk for character in TELNET_SPECIAL)):
+            self.client.rawq += chunk
+            self.client.process_rawq()
+            chunk, self.client.cookedq = self.client.cookedq, EMPTY_STRING
+        return chunk
+
+    def fill(self, timeout):
+        """
+        Reads whatever output is waiting (waiting up to `timeout` seconds for some to arrive)
+
+        :param:
+
+         - `timeout`: seconds to wait for the client to have output
+
+        :return: False if nothing arrived or the device hung up
+        """
+        try:
+            # anything the client already read (e.g. while logging in) comes first
+            chunk = self.client.read_lazy()
+            if not chunk:
+                readable, writeable, exceptional = select.select([self.client], [], [], timeout)
+                if not readable:
+                    return False
+                chunk = self.read_chunk()
+        except EOFError as error:
+            self.logger.debug(error)
+            return False
+        self.split(chunk)
+        return True
+
+    def at_prompt(self):
+        """
+        Checks if the unfinished line ends with the prompt (only the unfinished line can)
+
+        :return: True if the text after the buffer's last newline ends with the prompt
+        """
+        fragment = self.buffer.rsplit(NEWLINE, 1)[-1]
+        return self.prompt_end_expression.search(fragment) is not None
+
+    def readline(self, timeout=None):
+        """
+        Gets a single line of output from the output
+        
+        :param:
+
+         - `timeout`: The readline timeout
+         
+        :return: The next line of text
+        """
+        if timeout is None:
+            timeout = self.timeout
+        if self.finished:
+            return EOF
+
+        end_time = time.time() + timeout
+        while not self.lines:
+            if self.at_prompt():
+                self.logger.debug("Stopping on : " + self.buffer)
+                self.finished = True
+                return EOF
+            remaining = end_time - time.time()
+            if remaining <= 0 or not self.fill(remaining):
+                self.logger.debug("Timed out waiting for the prompt, stopping on : " + self.buffer)
+                self.finished = True
+                return EOF
+        return self.lines.popleft()
+# end BufferedTelnetOutput
+
+
+class BatchTelnetOutput(BufferedTelnetOutput):
+    """
+    Reads the output of a batch of commands and splits it up by command
+    """
+    def __init__(self, sent, markers, *args, **kwargs):
+        """
+        BatchTelnetOutput constructor
+
+        :param:
+
+         - `sent`: list of the lines that were sent (the device might echo them)
+         - `markers`: list of the strings echoed after each command
+         - `client` : a connected telnet client
+         - `prompt`: The current prompt on the client
+         - `end_of_line`: Then end of line character
+         - `timeout`: The readline timeout
+        """
+        super(BatchTelnetOutput, self).__init__(*args, **kwargs)
+        self.sent = sent
+        self.markers = markers
+        self.marker_index = 0
+        self.echo_index = 0
+        return
+
+    def at_prompt(self):
+        """
+        Checks for the prompt, but only after the last marker (there's a prompt after every command)
+
+        :return: True if all the markers were read and the prompt is in the buffer
+        """
+        return (self.marker_index == len(self.markers) and
+                super(BatchTelnetOutput, self).at_prompt())
+
+    def outputs(self):
+        """
+        Reads all the output and splits it up at the markers
+
+        :return: list with a list of lines of output for each command
+        """
+        outputs = [[]]
+        after_prompt = True
+        for line in self:
+            if line == EOF:
+                break
+            text = line
+            # the prompt ends up in front of the line that follows it
+            prompt = self.prompt_expression.match(line)
+            if prompt is not None:
+                text = line[prompt.end():]
+            stripped = text.rstrip(self.end_of_line)
+            if (self.echo_index < len(self.sent) and
+                stripped == self.sent[self.echo_index]):
+                self.echo_index += 1
+                after_prompt = True
+                continue
+            if (self.marker_index < len(self.markers) and
+                stripped == self.markers[self.marker_index]):
+                self.marker_index += 1
+                outputs.append([])
+                after_prompt = True
+                continue
+            outputs[-1].append(text if after_prompt else line)
+            after_prompt = False
+        # the last list is whatever came after the last marker
+        outputs.pop()
+        if len(outputs) < len(self.markers):
+            self.logger.warning("Only got {0} of {1} outputs".format(len(outputs),
+                                                                     len(self.markers)))
+            outputs.extend([] for marker in self.markers[len(outputs):])
+        return outputs
+# end BatchTelnetOutput
+
+
+class FramedTelnetOutput(BufferedTelnetOutput):
+    """
+    Reads the output of a command sent between a start and an end marker
+    """
+    def __init__(self, start, end, *args, **kwargs):
+        """
+        FramedTelnetOutput constructor
+
+        :param:
+
+         - `start`: the string echoed before the command
+         - `end`: the string echoed after the command
+         - `client` : a connected telnet client
+         - `prompt`: The current prompt on the client
+         - `end_of_line`: Then end of line character
+         - `timeout`: The readline timeout
+        """
+        super(FramedTelnetOutput, self).__init__(*args, **kwargs)
+        self.start = start
+        self.end = end
+        self.started = False
+        return
+
+    def at_prompt(self):
+        """
+        The end marker finishes the output, not the prompt (there might be prompts left over from earlier commands)
+
+        :return: False
+        """
+        return False
+
+    def is_marker(self, line, marker):
+        """
+        Checks if the line is the marker (the prompt might be in front of it)
+
+        :return: True if the line ends with the marker
+        """
+        return line.rstrip(self.end_of_line).endswith(marker)
+
+    def readline(self, timeout=None):
+        """
+        Gets the next line of the command's output (skipping anything before the start marker)
+
+        :param:
+
+         - `timeout`: The readline timeout
+
+        :return: The next line of text
+        """
+        while not self.started:
+            line = super(FramedTelnetOutput, self).readline(timeout)
+            if line == EOF:
+                return EOF
+            if self.is_marker(line, self.start):
+                self.started = True
+            else:
+                self.logger.debug("Skipping: " + line)
+        line = super(FramedTelnetOutput, self).readline(timeout)
+        if line != EOF and self.is_marker(line, self.end):
+            self.finished = True
+            return EOF
+        return line
+# end FramedTelnetOutput
+
+
 class TelnetConnection(NonLocalConnection):
     """
     A TelnetConnection executes commands over a Telnet Connection
 
     """
     def __init__(self, port=None, prompt="#", end_of_line='\r\n',
-                 mangle_prompt=True, login_wait=1,
+                 mangle_prompt=True, login_wait=0, pool=None, buffered=False, framed=False,
+                 keepalive=None, reconnect_attempts=3, backoff=0.5, max_backoff=8,
                  *args, **kwargs):
         """
         TelnetConnection constructor
@@ -252,7 +718,14 @@ class TelnetConnection(NonLocalConnection):
          - `timeout`: The readline timeout
          - `end_of_line`: The string indicating the end of a line.
          - `mangle_prompt`: If True, change the prompt
-         - `login_wait`: time to wait after logging in
+         - `login_wait`: extra time to wait after logging in (for devices that need it)
+         - `pool`: A TelnetSessionPool to share logged-in sessions (None means don't share)
+         - `buffered`: If True, read the output with the BufferedTelnetOutput
+         - `framed`: If True, send each command between markers (see FramedTelnetOutput)
+         - `keepalive`: seconds a session can sit unused before it's probed (None means never)
+         - `reconnect_attempts`: times to try logging in again when the session dies (0 to raise a ConnectionError instead)
+         - `backoff`: seconds to wait after the first failed reconnect (doubled each time)
+         - `max_backoff`: the longest to wait between reconnect attempts
         """
         super(TelnetConnection, self).__init__(*args, **kwargs)
         self._port = port
@@ -261,8 +734,20 @@ class TelnetConnection(NonLocalConnection):
         self.end_of_line = end_of_line
         self.mangle_prompt = mangle_prompt
         self.login_wait = login_wait
+        self.pool = pool
+        self.buffered = buffered
+        self.framed = framed
+        self.login_time = None
+        self.keepalive = keepalive
+        self.reconnect_attempts = reconnect_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.reconnects = 0
+        self.reconnect_time = 0
+        self.last_used = None
         return
 
+
     @property
     def port(self):
         """
@@ -287,25 +772,130 @@ class TelnetConnection(NonLocalConnection):
         self._port = port
         return
     
+    @property
+    def pool_key(self):
+        """
+        The key for this connection's sessions in the pool
+
+        :rtype: PoolKey
+        """
+        return PoolKey(self.hostname, self.port, self.username, self.prompt,
+                       self.mangle_prompt, self.end_of_line, self.buffered, self.framed)
+
     @property
     def client(self):
         """
+        Gets the session (logging in again if the old one died)
+
         :return: TelnetAdapter for the telnet connection
         """
         if self._client is None:
-            self._client = TelnetAdapter(host=self.hostname, 
-                                         login=self.username, port=self.port,
-                                         timeout=self.timeout,
-                                         end_of_line=self.end_of_line,
-                                         password=self.password,
-                                         prompt=self.prompt)
-            if self.mangle_prompt:
-                changer = changeprompt.ChangePrompt(adapter=self._client)
-                self.logger.debug(changer.run())
+            if self.pool is not None:
+                self._client = self.pool.checkout(self.pool_key, self.login)
+            else:
+                self._client = self.login()
+        elif self._client.closed:
+            self.logger.warning("The session to {0} was closed".format(self.hostname))
+            self.reconnect()
+        elif (self.keepalive is not None and
+              time.time() - self.last_used > self.keepalive and
+              not self._client.probe(timeout=self.timeout)):
+            self.logger.warning("The session to {0} stopped answering".format(self.hostname))
+            self.reconnect()
+        self.last_used = time.time()
+        return self._client
+
+    def reconnect(self):
+        """
+        Throws away the current session and logs in again
+
+        Waits `backoff` seconds after the first failed attempt, doubling the wait
+        (up to `max_backoff`) after each one after that.
+
+        :postcondition: reconnects and reconnect_time updated
+        :return: the new TelnetAdapter
+        :raise: the last attempt's error if none of the attempts worked (ConnectionError if reconnect_attempts is 0)
+        """
+        start = time.time()
+        if self._client is not None:
+            # a dead session shouldn't go back to the pool
+            self._client.close()
+            self._client = None
+        if self.reconnect_attempts < 1:
+            raise ConnectionError("The session to {0} died and reconnect_attempts is {1}".format(self.hostname,
+                                                                                                self.reconnect_attempts))
+        wait = self.backoff
+        try:
+            for attempt in xrange(1, self.reconnect_attempts + 1):
+                try:
+                    client = self.client
+                    break
+                except (TimeoutError, EOFError, socket.error) as error:
+                    self.logger.warning("Reconnect {0} of {1} to {2} failed: {3}".format(attempt,
+                                                                                       self.reconnect_attempts,
+                                                                                       self.hostname,
+                                                                                       error))
+                    if attempt == self.reconnect_attempts:
+                        raise
+                    time.sleep(wait)
+                    wait = min(wait * 2, self.max_backoff)
+        finally:
+            self.reconnect_time += time.time() - start
+        self.reconnects += 1
+        self.logger.info("Reconnected to {0} in {1:.3f} seconds".format(self.hostname,
+                                                                        time.time() - start))
+        return client
+
+    def login(self):
+        """
+        Creates a new TelnetAdapter and logs in to the device
+
+        :return: logged-in TelnetAdapter (with the prompt changed if mangle_prompt)
+        :raise: TimeoutError if the device doesn't give a prompt in time
+        """
+        start = time.time()
+        client = TelnetAdapter(host=self.hostname, 
+                               login=self.username, port=self.port,
+                               timeout=self.timeout,
+                               end_of_line=self.end_of_line,
+                               password=self.password,
+                               prompt=self.prompt,
+                               buffered=self.buffered,
+                               framed=self.framed)
+        # log in before the ChangePrompt changes the prompt the adapter waits for
+        client.client
+        if self.mangle_prompt:
+            changer = changeprompt.ChangePrompt(adapter=client)
+            self.logger.debug(changer.run())
+            # the echoed command has the new prompt in it so it has to start a line
+            client.wait_for(re.escape(self.end_of_line) + changer.prompt + PROMPT_END)
+        if self.login_wait:
             self.logger.debug('Sleeping for {0} seconds to let the login complete'.format(self.login_wait))
             time.sleep(self.login_wait)
-        return self._client
+        self.login_time = time.time() - start
+        self.logger.debug("Login to {0} took {1:.3f} seconds".format(self.hostname,
+                                                                    self.login_time))
+        return client
+
+    def close(self):
+        """
+        Gives the session back to the pool (or closes it if there's no pool)
+        """
+        if self._client is not None:
+            if self.pool is not None:
+                self.pool.checkin(self.pool_key, self._client)
+            else:
+                self._client.close()
+            self._client = None
+        return
+
+    def __del__(self):
+        # __getattr__ turns missing attributes into commands, so check the __dict__
+        if self.__dict__.get('_client') is not None:
+            self.close()
+        return
     
+
     def _main(self, command, arguments="",
                         timeout=10):
         """
@@ -323,8 +913,16 @@ class TelnetConnection(NonLocalConnection):
         :postcondition: OutputError with output and error file-like objects
         """
         self.logger.debug("calling 'client.exec_command({0})'".format(command))
-        stdout = self.client.exec_command(SPACER.format(command, arguments),
-                                          timeout=timeout)
+        command = SPACER.format(command, arguments)
+        try:
+            stdout = self.client.exec_command(command, timeout=timeout)
+        except (EOFError, socket.error) as error:
+            if not self.reconnect_attempts:
+                raise
+            # the command couldn't be sent so it's safe to send it again
+            self.logger.warning("Lost the session to {0} ({1})".format(self.hostname, error))
+            self.reconnect()
+            stdout = self.client.exec_command(command, timeout=timeout)
         self.logger.debug("Completed 'client.exec_command({0})'".format(command))       
 
         stderr = StringIO("")
@@ -333,11 +931,184 @@ class TelnetConnection(NonLocalConnection):
 
     exec_command = _main
 
+    def exec_batch(self, commands, timeout=10):
+        """
+        Executes the commands as one batch (see TelnetAdapter.exec_batch)
+
+        :param:
+
+         - `commands`: list of command strings (command and arguments)
+         - `timeout`: readline timeout
+
+        :return: list of OutputErrors (one for each command)
+        """
+        commands = [self.prefix + command for command in commands]
+        try:
+            output = self.client.send_batch(commands, timeout=timeout)
+        except (EOFError, socket.error) as error:
+            if not self.reconnect_attempts:
+                raise
+            # the batch couldn't be sent so it's safe to send it again
+            self.logger.warning("Lost the session to {0} ({1})".format(self.hostname, error))
+            self.reconnect()
+            output = self.client.send_batch(commands, timeout=timeout)
+        outputs = output.outputs()
+        return [OutputError(OutputFile(StringIO(EMPTY_STRING.join(lines)), self.validate),
+                            StringIO(""))
+                for lines in outputs]
+
     def validate(self, line):
         return
 # end TelnetConnection
 
 
+class PendingOutput(BaseClass):
+    """
+    A file-like stand-in for the output of a command in a batch that hasn't been sent yet
+    """
+    def __init__(self, batch, index):
+        """
+        PendingOutput constructor
+
+        :param:
+
+         - `batch`: the TelnetBatch that has the command
+         - `index`: the command's index in the batch
+        """
+        super(PendingOutput, self).__init__()
+        self.batch = batch
+        self.index = index
+        self.callbacks = []
+        return
+
+    @property
+    def sent(self):
+        """
+        True if the batch has sent this output's command
+        """
+        return self.index < len(self.batch.outputs)
+
+    @property
+    def output(self):
+        """
+        The command's output (sends the batch if it hasn't been sent)
+        """
+        if not self.sent:
+            self.batch.flush()
+        return self.batch.outputs[self.index]
+
+    def when_sent(self, callback):
+        """
+        Calls the callback once the command has been sent (right away if it has been)
+
+        :param:
+
+         - `callback`: function that takes no arguments
+        """
+        if self.sent:
+            callback()
+        else:
+            self.callbacks.append(callback)
+        return
+
+    def readline(self, timeout=None):
+        """
+        :return: next line of the output
+        """
+        return self.output.readline()
+
+    def readlines(self):
+        """
+        :return: list of lines of output
+        """
+        return self.output.readlines()
+
+    def read(self):
+        """
+        :return: the output as a string
+        """
+        return self.output.read()
+
+    def __iter__(self):
+        """
+        Iterates over the output
+        """
+        return iter(self.output)
+# end class PendingOutput
+
+
+class TelnetBatch(BaseClass):
+    """
+    Records commands so that they can be sent as a batch
+    """
+    def __init__(self, connection, timeout=10):
+        """
+        TelnetBatch constructor
+
+        :param:
+
+         - `connection`: a TelnetConnection (anything with exec_batch)
+         - `timeout`: readline timeout for the batch
+        """
+        super(TelnetBatch, self).__init__()
+        self.connection = connection
+        self.timeout = timeout
+        self.commands = []
+        self.pending = []
+        self.outputs = []
+        return
+
+    def record(self, command, arguments=''):
+        """
+        Adds the command to the batch
+
+        :param:
+
+         - `command`: The shell command
+         - `arguments`: A string of command arguments
+
+        :return: OutputError with a PendingOutput
+        """
+        self.commands.append(SPACER.format(command, arguments))
+        pending = PendingOutput(batch=self, index=len(self.pending))
+        self.pending.append(pending)
+        return OutputError(pending, StringIO(""))
+
+    def flush(self):
+        """
+        Sends the commands that haven't been sent yet
+
+        :postcondition: outputs holds an output for every recorded command
+        """
+        unsent = self.commands[len(self.outputs):]
+        if not unsent:
+            return
+        first = len(self.outputs)
+        results = self.connection.exec_batch(unsent, timeout=self.timeout)
+        self.outputs.extend(output for output, error in results)
+        for pending in self.pending[first:]:
+            for callback in pending.callbacks:
+                callback()
+        return
+
+    def __call__(self, command, arguments='', timeout=None):
+        """
+        Records the command (the same as the dot-notation)
+        """
+        return self.record(command, arguments)
+
+    def __getattr__(self, command):
+        """
+        Turns the dot-notation into recorded commands
+
+        :return: function that records the command
+        """
+        def record(arguments=''):
+            return self.record(command, arguments)
+        return record
+# end class TelnetBatch
+
+
 class TelnetConnectionBuilder(NonLocalConnectionBuilder):
     """
     Implements a builder for the TelnetConnection
@@ -476,17 +1247,626 @@ class TelnetConnectionBuilder(NonLocalConnectionBuilder):
 
 
 # python standard library
+import threading
 import unittest
 from types import StringType
 
+# third party
+from mock import MagicMock, patch, call
 
 from nonlocalconnection import ConnectionParameters
 
 
+
 class TestTelnetConnectionBuilder(unittest.TestCase):
     pass
 
 
+class TestTelnetConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = MagicMock(name='pool')
+        self.adapter = MagicMock(name='adapter')
+        self.pool.checkout.return_value = self.adapter
+        self.connection = TelnetConnection(hostname='10.10.10.21',
+                                           username='root',
+                                           pool=self.pool)
+        return
+
+    def test_client(self):
+        """
+        Does it check the client out of the pool instead of logging in?
+        """
+        self.assertEqual(self.adapter, self.connection.client)
+        key = PoolKey('10.10.10.21', 23, 'root', '#', True, '\r\n', False, False)
+        self.pool.checkout.assert_called_with(key, self.connection.login)
+        return
+
+    def test_pool_key(self):
+        """
+        Do connections that read their output differently get different sessions?
+        """
+        key = self.connection.pool_key
+        for setting, value in (('framed', True), ('buffered', True), ('mangle_prompt', False),
+                               ('prompt', '$'), ('end_of_line', '\n')):
+            other = TelnetConnection(hostname='10.10.10.21', username='root', pool=self.pool,
+                                     **{setting: value})
+            self.assertNotEqual(key, other.pool_key)
+            self.assertEqual(value, getattr(other.pool_key, setting))
+        return
+
+    def test_close(self):
+        """
+        Does closing the connection check the client back in?
+        """
+        self.connection.client
+        self.connection.close()
+        self.pool.checkin.assert_called_with(self.connection.pool_key, self.adapter)
+        self.assertFalse(self.adapter.close.called)
+        self.assertIsNone(self.connection._client)
+
+        # without a pool the client gets closed
+        self.connection.pool = None
+        self.connection._client = self.adapter
+        self.connection.close()
+        self.adapter.close.assert_called_with()
+        return
+
+class TestTelnetLogin(unittest.TestCase):
+    def setUp(self):
+        self.telnet_patch = patch('telnetlib.Telnet')
+        self.telnet = self.telnet_patch.start()
+        self.client = self.telnet.return_value
+        self.client.read_very_eager.return_value = EMPTY_STRING
+        self.adapter = TelnetAdapter(host='10.10.10.21', password='5up')
+        return
+
+    def tearDown(self):
+        self.adapter._client = None
+        self.telnet_patch.stop()
+        return
+
+    def test_login(self):
+        """
+        Does it wait for the prompt after sending the password?
+        """
+        self.client.expect.side_effect = [(1, None, 'ap login:'), (0, None, 'root@ap #')]
+        self.assertEqual(self.client, self.adapter.client)
+        self.client.write.assert_called_with('5up' + NEWLINE)
+        self.client.expect.assert_called_with(['#'], timeout=2)
+        self.assertIsNotNone(self.adapter.login_time)
+        return
+
+    def test_banner_prompt(self):
+        """
+        Does it skip the login if the banner ends with the prompt?
+        """
+        self.client.expect.return_value = (0, None, 'root@ap #')
+        self.adapter.client
+        self.assertFalse(self.client.write.called)
+        self.assertEqual(1, self.client.expect.call_count)
+        return
+
+    def test_timeout(self):
+        """
+        Does it raise a TimeoutError (and hang up) if there's no prompt?
+        """
+        self.client.expect.return_value = (-1, None, 'garbage')
+        self.assertRaises(TimeoutError, getattr, self.adapter, 'client')
+        self.client.close.assert_called_with()
+        self.adapter._client = self.client
+        self.assertRaises(TimeoutError, self.adapter.wait_for, 'xyz')
+        return
+
+    def test_connection_login(self):
+        """
+        Does the connection wait for the new prompt instead of sleeping?
+        """
+        connection = TelnetConnection(hostname='10.10.10.21', username='root')
+        self.client.expect.side_effect = [(0, None, 'root@ap #'), (0, None, 'abc')]
+        with patch('time.sleep') as sleep:
+            adapter = connection.login()
+        self.assertFalse(sleep.called)
+        expression = self.client.expect.call_args[0][0][0]
+        self.assertTrue(re.search(expression, 'PS1={0}\r\n{0}'.format(adapter.prompt)))
+        self.assertIsNone(re.search(expression, 'PS1={0}'.format(adapter.prompt)))
+        self.assertIsNotNone(connection.login_time)
+        adapter._client = None
+        return
+# end class TestTelnetLogin
+
+
+class TestPromptSequence(unittest.TestCase):
+    def setUp(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(1)
+        self.received = []
+        self.device_thread = threading.Thread(target=self.device)
+        self.device_thread.daemon = True
+        self.device_thread.start()
+        return
+
+    def tearDown(self):
+        self.server.close()
+        return
+
+    def device(self):
+        """
+        Plays a device that only shows its prompt once the login is done
+        """
+        session, address = self.server.accept()
+        lines = session.makefile('rb')
+        session.sendall('ap login: ')
+        self.received.append(lines.readline().strip())
+        session.sendall('Password: ')
+        self.received.append(lines.readline().strip())
+        prompt = 'root@ap # '
+        session.sendall('\r\n' + prompt)
+        for line in iter(lines.readline, EMPTY_STRING):
+            line = line.strip()
+            self.received.append(line)
+            output = [line]
+            for command in line.split(';'):
+                command = command.strip()
+                if command.startswith('PS1='):
+                    prompt = command[len('PS1='):]
+                elif command.startswith('echo '):
+                    output.append(command[len('echo '):].replace("''", EMPTY_STRING))
+            session.sendall('\r\n'.join(output) + '\r\n' + prompt)
+        session.close()
+        return
+
+    def test_prompt_sequence(self):
+        """
+        Does the connection log in to a device that only shows its prompt after the login?
+        """
+        connection = TelnetConnection(hostname='127.0.0.1', port=self.server.getsockname()[1],
+                                      username='root', password='5up')
+        adapter = connection.login()
+        self.assertEqual(['root', '5up'], self.received[:2])
+        self.assertIn('PS1=' + adapter.prompt, self.received[2])
+        self.assertNotEqual('#', adapter.prompt)
+        adapter.close()
+        return
+# end class TestPromptSequence
+
+
+class TestTelnetReconnect(unittest.TestCase):
+    def setUp(self):
+        self.connection = TelnetConnection(hostname='10.10.10.21', username='root',
+                                           backoff=0.5, path='/opt/bin')
+        self.adapters = [MagicMock(name='adapter_{0}'.format(index)) for index in range(2)]
+        for adapter in self.adapters:
+            adapter.closed = False
+        self.connection.login = MagicMock(name='login')
+        self.connection.login.side_effect = self.adapters
+        return
+
+    def tearDown(self):
+        self.connection._client = None
+        return
+
+    def test_closed(self):
+        """
+        Does it log in again when the session has been closed?
+        """
+        first, second = self.adapters
+        self.assertEqual(first, self.connection.client)
+        self.assertEqual(first, self.connection.client)
+        first.closed = True
+        self.assertEqual(second, self.connection.client)
+        first.close.assert_called_with()
+        self.assertEqual(1, self.connection.reconnects)
+        self.assertGreaterEqual(self.connection.reconnect_time, 0)
+        return
+
+    def test_no_reconnect(self):
+        """
+        Does a closed session raise a ConnectionError when reconnect_attempts is 0?
+        """
+        first, second = self.adapters
+        self.connection.reconnect_attempts = 0
+        self.assertEqual(first, self.connection.client)
+        first.closed = True
+        self.assertRaises(ConnectionError, getattr, self.connection, 'client')
+        first.close.assert_called_with()
+        self.assertEqual(1, self.connection.login.call_count)
+        self.assertEqual(0, self.connection.reconnects)
+        return
+
+    def test_keepalive(self):
+        """
+        Does it probe a session that has been sitting and reconnect if it doesn't answer?
+        """
+        first, second = self.adapters
+        self.connection.keepalive = 60
+        self.connection.client
+        self.connection.client
+        self.assertFalse(first.probe.called)
+        self.connection.last_used -= 61
+        first.probe.return_value = True
+        self.assertEqual(first, self.connection.client)
+        self.connection.last_used -= 61
+        first.probe.return_value = False
+        self.assertEqual(second, self.connection.client)
+        self.assertEqual(1, self.connection.reconnects)
+        return
+
+    def test_backoff(self):
+        """
+        Does it wait longer after each failed attempt?
+        """
+        first, second = self.adapters
+        self.connection.login.side_effect = [first, TimeoutError('no prompt'),
+                                             socket.error('refused'), second]
+        self.connection.client
+        with patch('time.sleep') as sleep:
+            self.assertEqual(second, self.connection.reconnect())
+        self.assertEqual([call(0.5), call(1)], sleep.mock_calls)
+
+        # it gives up after reconnect_attempts
+        self.connection.login.side_effect = socket.error('refused')
+        with patch('time.sleep') as sleep:
+            self.assertRaises(socket.error, self.connection.reconnect)
+        self.assertEqual([call(0.5), call(1)], sleep.mock_calls)
+        self.assertEqual(1, self.connection.reconnects)
+        return
+
+    def test_resend(self):
+        """
+        Is a command whose write failed sent again (with the path) on the new session?
+        """
+        first, second = self.adapters
+        first.exec_command.side_effect = socket.error('broken pipe')
+        output, error = self.connection.iwconfig('ath0')
+        command = 'PATH=/opt/bin:$PATH;iwconfig ath0'
+        first.exec_command.assert_called_with(command, timeout=None)
+        second.exec_command.assert_called_with(command, timeout=None)
+        self.assertEqual(1, self.connection.reconnects)
+
+        # without reconnects the error goes to the caller
+        self.connection.reconnect_attempts = 0
+        second.exec_command.side_effect = EOFError
+        self.assertRaises(EOFError, self.connection.iwconfig, 'ath0')
+        return
+
+    def test_resend_batch(self):
+        """
+        Is a batch whose write failed sent again, but not one whose output was being read?
+        """
+        first, second = self.adapters
+        first.send_batch.side_effect = socket.error('broken pipe')
+        second.send_batch.return_value.outputs.return_value = [['ath0 down\r\n'], []]
+        outputs = self.connection.exec_batch(['apdown', 'cfg -c'])
+        commands = ['PATH=/opt/bin:$PATH;apdown', 'PATH=/opt/bin:$PATH;cfg -c']
+        first.send_batch.assert_called_with(commands, timeout=10)
+        second.send_batch.assert_called_with(commands, timeout=10)
+        self.assertEqual('ath0 down\r\n', outputs[0][0].read())
+        self.assertEqual(1, self.connection.reconnects)
+
+        # the device may have run some of the commands so they aren't sent again
+        second.send_batch.return_value.outputs.side_effect = EOFError
+        self.assertRaises(EOFError, self.connection.exec_batch, ['apdown', 'cfg -c'])
+        self.assertEqual(2, second.send_batch.call_count)
+        self.assertEqual(1, self.connection.reconnects)
+        return
+
+    def test_probe(self):
+        """
+        Does the adapter's probe wait for the echoed marker?
+        """
+        with patch('telnetlib.Telnet') as telnet:
+            client = telnet.return_value
+            client.read_very_eager.return_value = EMPTY_STRING
+            adapter = TelnetAdapter(host='10.10.10.21')
+            adapter.token = 'a'
+            adapter._client = client
+            client.expect.return_value = (0, None, 'APCOMMAND_a_probe_0')
+            self.assertTrue(adapter.probe())
+            client.write.assert_called_with("echo APCOMMAND''_a_probe_0\n")
+            self.assertEqual([re.escape('APCOMMAND_a_probe_0')], client.expect.call_args[0][0])
+            client.expect.return_value = (-1, None, '')
+            self.assertFalse(adapter.probe())
+            client.read_very_eager.side_effect = EOFError
+            self.assertFalse(adapter.probe())
+            adapter._client = None
+        return
+# end class TestTelnetReconnect
+
+
+class TestBufferedTelnetOutput(unittest.TestCase):
+    def setUp(self):
+        self.client = telnetlib.Telnet()
+        self.client.sock = MagicMock(name='socket')
+        self.output = BufferedTelnetOutput(client=self.client, prompt='#',
+                                           timeout=1)
+        self.select_patch = patch('select.select')
+        self.select = self.select_patch.start()
+        self.select.return_value = ([self.client], [], [])
+        return
+
+    def tearDown(self):
+        self.select_patch.stop()
+        return
+
+    def test_readlines(self):
+        """
+        Does it split lines that arrive in pieces?
+        """
+        self.client.cookedq = 'cfg -s\r\nAP_SSID'
+        self.client.sock.recv.side_effect = ['=atheros\r',
+                                             '\nAP_CHMODE=11NGHT20\r\n',
+                                             'root@ap #']
+        self.assertEqual(['cfg -s\r\n', 'AP_SSID=atheros\r\n',
+                          'AP_CHMODE=11NGHT20\r\n', EOF],
+                         self.output.readlines())
+        self.assertTrue(self.output.finished)
+        self.assertEqual(EOF, self.output.readline())
+        return
+
+    def test_prompt_in_line(self):
+        """
+        Does it ignore the prompt if it's part of a complete line?
+        """
+        self.client.sock.recv.side_effect = ['ls #*\r\n#']
+        self.assertEqual('ls #*\r\n', self.output.readline())
+        self.assertEqual(EOF, self.output.readline())
+        return
+
+    def test_partial_line(self):
+        """
+        Does a prompt in the middle of an unfinished line not end the output?
+        """
+        self.client.sock.recv.side_effect = ['cfg -s\r\nAP_SSID=#1', ' ap\r\n',
+                                             'stray\n#2', '\r\nroot@ap # ']
+        self.assertEqual(['cfg -s\r\n', 'AP_SSID=#1 ap\r\n', 'stray\n#2\r\n', EOF],
+                         self.output.readlines())
+        return
+
+    def test_telnet_commands(self):
+        """
+        Does it let telnetlib strip out the telnet commands?
+        """
+        will_echo = telnetlib.IAC + telnetlib.WILL + telnetlib.ECHO
+        self.client.sock.recv.side_effect = ['iwconfig' + will_echo + '\r\n',
+                                             'ath0' + telnetlib.IAC, telnetlib.WILL,
+                                             telnetlib.ECHO + '\r\n#']
+        self.assertEqual(['iwconfig\r\n', 'ath0\r\n', EOF], self.output.readlines())
+        # telnetlib answered the option negotiations
+        self.assertEqual(2, self.client.sock.sendall.call_count)
+        return
+
+    def test_timeout(self):
+        """
+        Does it stop if the client doesn't have any more output?
+        """
+        self.select.return_value = ([], [], [])
+        self.assertEqual(EOF, self.output.readline())
+        self.assertTrue(self.output.finished)
+
+        # the device hanging up also ends the output
+        self.select.return_value = ([self.client], [], [])
+        output = BufferedTelnetOutput(client=self.client)
+        self.client.sock.recv.return_value = ''
+        self.assertEqual(EOF, output.readline())
+        self.assertTrue(self.client.eof)
+        return
+
+    def test_adapter(self):
+        """
+        Does the adapter use it when `buffered` is set?
+        """
+        adapter = TelnetAdapter(host='10.10.10.21', buffered=True, framed=False)
+        adapter._client = self.client
+        self.select.return_value = ([], [], [])
+
+        self.assertIsInstance(adapter.exec_command('cfg -s'), BufferedTelnetOutput)
+        adapter.buffered = False
+        output = adapter.exec_command('cfg -s')
+        self.assertNotIsInstance(output, BufferedTelnetOutput)
+        adapter._client = None
+        return
+# end class TestBufferedTelnetOutput
+
+
+class TestBatchTelnetOutput(unittest.TestCase):
+    def setUp(self):
+        self.client = telnetlib.Telnet()
+        self.client.sock = MagicMock(name='socket')
+        self.sent = ['apdown', "echo APCOMMAND''_a_0", 'cfg -c', "echo APCOMMAND''_a_1"]
+        self.markers = ['APCOMMAND_a_0', 'APCOMMAND_a_1']
+        self.output = BatchTelnetOutput(client=self.client, sent=self.sent,
+                                        markers=self.markers, prompt='xyz#',
+                                        timeout=1)
+        self.select_patch = patch('select.select')
+        self.select = self.select_patch.start()
+        self.select.return_value = ([self.client], [], [])
+        return
+
+    def tearDown(self):
+        self.select_patch.stop()
+        return
+
+    def test_typeahead(self):
+        """
+        Does it split the output if the terminal echoes everything first?
+        """
+        self.client.sock.recv.side_effect = ["apdown\r\necho APCOMMAND''_a_0\r\ncfg -c\r\n",
+                                             "echo APCOMMAND''_a_1\r\nath0 down\r\nxyz#",
+                                             "APCOMMAND_a_0\r\nxyz#committed\r\n",
+                                             "xyz#APCOMMAND_a_1\r\nxyz#"]
+        self.assertEqual([['ath0 down\r\n'], ['committed\r\n']], self.output.outputs())
+        return
+
+    def test_shell_echo(self):
+        """
+        Does it split the output if the shell echoes each command as it reads it?
+        """
+        self.client.sock.recv.side_effect = ["apdown\r\nath0 down\r\n",
+                                             "xyz#echo APCOMMAND''_a_0\r\nAPCOMMAND_a_0\r\n",
+                                             "xyz#cfg -c\r\n",
+                                             "xyz#echo APCOMMAND''_a_1\r\nAPCOMMAND_a_1\r\nxyz#"]
+        self.assertEqual([['ath0 down\r\n'], []], self.output.outputs())
+        return
+
+    def test_timeout(self):
+        """
+        Does it still return an output for each command if the device stops answering?
+        """
+        self.client.sock.recv.side_effect = ["ath0 down\r\nxyz#APCOMMAND_a_0\r\n"]
+        with patch('select.select') as mock_select:
+            mock_select.side_effect = [([self.client], [], []), ([], [], [])]
+            self.assertEqual([['ath0 down\r\n'], []], self.output.outputs())
+        return
+
+    def test_exec_batch(self):
+        """
+        Does the adapter send the whole batch in one write?
+        """
+        adapter = TelnetAdapter(host='10.10.10.21', prompt='xyz#')
+        adapter._client = MagicMock(name='client')
+        outputs = [['ath0 down\r\n'], []]
+        with patch('random.getrandbits') as getrandbits:
+            getrandbits.return_value = 10
+            with patch.object(BatchTelnetOutput, 'outputs') as mock_outputs:
+                mock_outputs.return_value = outputs
+                self.assertEqual(outputs, adapter.exec_batch(['apdown', 'cfg -c']))
+        adapter._client.write.assert_called_with("apdown\necho APCOMMAND''_0000000a_0\n"
+                                                 "cfg -c\necho APCOMMAND''_0000000a_1\n")
+        adapter._client = None
+        return
+# end class TestBatchTelnetOutput
+
+
+class TestTelnetBatch(unittest.TestCase):
+    def setUp(self):
+        self.connection = MagicMock(name='connection')
+        self.connection.exec_batch.return_value = [OutputError(StringIO('down'), StringIO('')),
+                                                   OutputError(StringIO('set'), StringIO(''))]
+        self.batch = TelnetBatch(self.connection)
+        return
+
+    def test_record(self):
+        """
+        Does it wait to send the commands until an output is read?
+        """
+        down, error = self.batch.apdown()
+        setting, error = self.batch('cfg', '-a AP_SSID=test')
+        self.assertFalse(self.connection.exec_batch.called)
+        self.assertEqual('set', setting.read())
+        self.connection.exec_batch.assert_called_with(['apdown ', 'cfg -a AP_SSID=test'],
+                                                      timeout=10)
+        self.assertEqual('down', down.read())
+
+        # only the new commands are sent the next time
+        self.connection.exec_batch.return_value = [OutputError(StringIO('up'), StringIO(''))]
+        up, error = self.batch.apup()
+        self.batch.flush()
+        self.connection.exec_batch.assert_called_with(['apup '], timeout=10)
+        self.assertEqual('up', up.read())
+        return
+
+    def test_when_sent(self):
+        """
+        Does it call the callbacks when the batch is sent?
+        """
+        callback = MagicMock(name='callback')
+        down, error = self.batch.apdown()
+        down.when_sent(callback)
+        self.assertFalse(callback.called)
+        self.batch.cfg('-c')
+        self.batch.flush()
+        callback.assert_called_with()
+        down.when_sent(callback)
+        self.assertEqual(2, callback.call_count)
+        return
+# end class TestTelnetBatch
+
+
+class TestFramedTelnetOutput(unittest.TestCase):
+    def setUp(self):
+        self.client = telnetlib.Telnet()
+        self.client.sock = MagicMock(name='socket')
+        self.output = FramedTelnetOutput(client=self.client, prompt='xyz#', timeout=1,
+                                         start='APCOMMAND_a_1_start',
+                                         end='APCOMMAND_a_1_end')
+        self.select_patch = patch('select.select')
+        self.select = self.select_patch.start()
+        self.select.return_value = ([self.client], [], [])
+        return
+
+    def tearDown(self):
+        self.select_patch.stop()
+        return
+
+    def test_stale_output(self):
+        """
+        Does it skip the output left over from the last command?
+        """
+        self.client.sock.recv.side_effect = ["ath1 down\r\nxyz#",
+                                             "echo APCOMMAND''_a_1_start; iwconfig; echo APCOMMAND''_a_1_end\r\n",
+                                             "APCOMMAND_a_1_start\r\nath0 IEEE 802.11ng\r\n",
+                                             "APCOMMAND_a_1_end\r\nxyz#"]
+        self.assertEqual(['ath0 IEEE 802.11ng\r\n', EOF], self.output.readlines())
+        self.assertEqual(EOF, self.output.readline())
+        return
+
+    def test_timeout(self):
+        """
+        Does it stop if the end marker doesn't show up?
+        """
+        self.client.sock.recv.side_effect = ["APCOMMAND_a_1_start\r\nath0\r\nxyz#"]
+        self.assertEqual('ath0\r\n', self.output.readline())
+        self.select.return_value = ([], [], [])
+        self.assertEqual(EOF, self.output.readline())
+        return
+
+    def test_adapter(self):
+        """
+        Does the adapter frame the commands with numbered markers?
+        """
+        adapter = TelnetAdapter(host='10.10.10.21', framed=True)
+        adapter._client = MagicMock(name='client')
+        adapter.token = 'a'
+        first = adapter.exec_command('iwconfig')
+        adapter._client.write.assert_called_with("echo APCOMMAND''_a_0_start; iwconfig; "
+                                                 "echo APCOMMAND''_a_0_end\n")
+        second = adapter.exec_command('cfg -s')
+        self.assertEqual(('APCOMMAND_a_1_start', 'APCOMMAND_a_1_end'), (second.start, second.end))
+        self.assertIsInstance(first, FramedTelnetOutput)
+        self.assertFalse(adapter._client.read_very_eager.called)
+        adapter._client = None
+        return
+
+    def test_background(self):
+        """
+        Does a command that ends with '&' keep the framing valid?
+        """
+        adapter = TelnetAdapter(host='10.10.10.21', framed=True)
+        adapter._client = MagicMock(name='client')
+        adapter.token = 'a'
+        adapter.exec_command('iperf -s & ')
+        adapter._client.write.assert_called_with("echo APCOMMAND''_a_0_start; iperf -s & "
+                                                 "echo APCOMMAND''_a_0_end\n")
+        adapter._client = None
+        return
+
+    def test_unframed(self):
+        """
+        Does an adapter send the command as it is unless it's asked to frame it?
+        """
+        adapter = TelnetAdapter(host='10.10.10.21')
+        adapter._client = MagicMock(name='client')
+        adapter._client.read_very_eager.return_value = EMPTY_STRING
+        self.assertNotIsInstance(adapter.exec_command('iperf -s &'), FramedTelnetOutput)
+        adapter._client.write.assert_called_with('iperf -s &\n')
+        self.assertFalse(TelnetConnection(hostname='10.10.10.21', username='root').framed)
+        adapter._client = None
+        return
+# end class TestFramedTelnetOutput
+
+
+
 if __name__ == "__main__":
     import time
     import sys
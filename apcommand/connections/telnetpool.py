@@ -0,0 +1,250 @@
+# python standard library
+from collections import namedtuple
+import threading
+import time
+
+# this package
+from apcommand.baseclass import BaseClass
+
+# sessions that haven't been used in this many seconds get closed
+IDLE_TIMEOUT = 300
+# the most sessions to keep (per key) once they've been checked in
+MAX_IDLE = 4
+
+PoolKey = namedtuple('PoolKey', 'hostname port username prompt mangle_prompt end_of_line '
+                                'buffered framed')
+
+class TelnetSessionPool(BaseClass):
+    """
+    A pool of logged-in TelnetAdapters
+    """
+    def __init__(self, idle_timeout=IDLE_TIMEOUT, max_idle=MAX_IDLE):
+        """
+        TelnetSessionPool constructor
+
+        :param:
+
+         - `idle_timeout`: seconds a session can sit in the pool before it's closed
+         - `max_idle`: maximum number of checked-in sessions to keep per key
+        """
+        super(TelnetSessionPool, self).__init__()
+        self.idle_timeout = idle_timeout
+        self.max_idle = max_idle
+        self._lock = None
+        self._sessions = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        return
+
+    @property
+    def lock(self):
+        """
+        A re-entrant lock to protect the sessions
+
+        :rtype: RLock
+        """
+        if self._lock is None:
+            self._lock = threading.RLock()
+        return self._lock
+
+    @property
+    def sessions(self):
+        """
+        Dictionary of key: list of (adapter, time checked in)
+        """
+        if self._sessions is None:
+            self._sessions = {}
+        return self._sessions
+
+    def checkout(self, key, factory):
+        """
+        Gets a live session for the key (or creates a new one)
+
+        :param:
+
+         - `key`: PoolKey for the session
+         - `factory`: callable that returns a new logged-in adapter
+
+        :return: TelnetAdapter
+        """
+        while True:
+            with self.lock:
+                self.evict()
+                idle = self.sessions.get(key, [])
+                if not idle:
+                    break
+                # most recently used first, it's the least likely to have timed out
+                adapter, checked_in = idle.pop()
+            if adapter.is_alive():
+                self.hits += 1
+                self.logger.debug("Re-using session for {0}".format(key))
+                return adapter
+            self.logger.debug("Discarding dead session for {0}".format(key))
+            adapter.close()
+        self.misses += 1
+        self.logger.debug("Creating new session for {0}".format(key))
+        return factory()
+
+    def checkin(self, key, adapter):
+        """
+        Returns a session to the pool
+
+        :param:
+
+         - `key`: PoolKey the session was checked out with
+         - `adapter`: the TelnetAdapter to return
+
+        :postcondition: adapter added to the sessions if still alive
+        """
+        if not adapter.is_alive():
+            self.logger.debug("Not keeping dead session for {0}".format(key))
+            adapter.close()
+            return
+        with self.lock:
+            idle = self.sessions.setdefault(key, [])
+            idle.append((adapter, time.time()))
+            while len(idle) > self.max_idle:
+                oldest, checked_in = idle.pop(0)
+                oldest.close()
+            self.evict()
+        return
+
+    def evict(self, now=None):
+        """
+        Closes sessions that have been idle longer than the idle_timeout
+
+        :param:
+
+         - `now`: time to measure the idle-time from (default is time.time())
+        """
+        if now is None:
+            now = time.time()
+        with self.lock:
+            for key, idle in self.sessions.items():
+                keep = []
+                for adapter, checked_in in idle:
+                    if now - checked_in > self.idle_timeout:
+                        self.logger.debug("Evicting idle session for {0}".format(key))
+                        self.evictions += 1
+                        adapter.close()
+                    else:
+                        keep.append((adapter, checked_in))
+                if keep:
+                    self.sessions[key] = keep
+                else:
+                    del self.sessions[key]
+        return
+
+    def clear(self):
+        """
+        Closes all the checked-in sessions
+        """
+        with self.lock:
+            for idle in self.sessions.itervalues():
+                for adapter, checked_in in idle:
+                    adapter.close()
+            self.sessions.clear()
+        return
+
+    def __len__(self):
+        """
+        The number of checked-in sessions
+        """
+        with self.lock:
+            return sum(len(idle) for idle in self.sessions.itervalues())
+# end class TelnetSessionPool
+
+session_pool = TelnetSessionPool()
+
+# python standard library
+import unittest
+
+# third party
+from mock import MagicMock, patch
+
+class TestTelnetSessionPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = TelnetSessionPool(idle_timeout=10, max_idle=2)
+        self.key = PoolKey('10.10.10.21', 23, 'root', '#', True, '\r\n', False, False)
+        self.adapter = MagicMock(name='adapter')
+        self.adapter.is_alive.return_value = True
+        self.factory = MagicMock(name='factory')
+        self.factory.return_value = self.adapter
+        return
+
+    def test_miss(self):
+        """
+        Does it call the factory if there's no session in the pool?
+        """
+        adapter = self.pool.checkout(self.key, self.factory)
+        self.assertEqual(self.adapter, adapter)
+        self.factory.assert_called_with()
+        self.assertEqual(1, self.pool.misses)
+        return
+
+    def test_hit(self):
+        """
+        Does a checked-in session get re-used instead of logging in again?
+        """
+        self.pool.checkin(self.key, self.adapter)
+        self.assertEqual(1, len(self.pool))
+        adapter = self.pool.checkout(self.key, self.factory)
+        self.assertEqual(self.adapter, adapter)
+        self.assertFalse(self.factory.called)
+        self.assertEqual(1, self.pool.hits)
+        self.assertEqual(0, len(self.pool))
+
+        # other keys don't get it
+        self.pool.checkin(self.key, self.adapter)
+        other = self.key._replace(hostname='10.10.10.22')
+        self.pool.checkout(other, self.factory)
+        self.factory.assert_called_with()
+        return
+
+    def test_dead_session(self):
+        """
+        Does it close dead sessions instead of handing them out?
+        """
+        self.pool.checkin(self.key, self.adapter)
+        self.adapter.is_alive.return_value = False
+        new_adapter = MagicMock(name='new_adapter')
+        self.factory.return_value = new_adapter
+        adapter = self.pool.checkout(self.key, self.factory)
+        self.assertEqual(new_adapter, adapter)
+        self.adapter.close.assert_called_with()
+
+        # dead sessions aren't accepted back either
+        self.pool.checkin(self.key, self.adapter)
+        self.assertEqual(0, len(self.pool))
+        return
+
+    def test_evict(self):
+        """
+        Does it close sessions that have been idle too long?
+        """
+        with patch('time.time') as mock_time:
+            mock_time.return_value = 100
+            self.pool.checkin(self.key, self.adapter)
+            mock_time.return_value = 111
+            self.pool.checkout(self.key, self.factory)
+        self.adapter.close.assert_called_with()
+        self.assertEqual(1, self.pool.evictions)
+        self.assertEqual(1, self.pool.misses)
+        return
+
+    def test_max_idle(self):
+        """
+        Does it only keep `max_idle` sessions for a key?
+        """
+        adapters = [MagicMock(name='adapter_{0}'.format(index)) for index in range(3)]
+        for adapter in adapters:
+            adapter.is_alive.return_value = True
+            self.pool.checkin(self.key, adapter)
+        self.assertEqual(2, len(self.pool))
+        adapters[0].close.assert_called_with()
+        self.pool.clear()
+        self.assertEqual(0, len(self.pool))
+        adapters[2].close.assert_called_with()
+        return
+# end class TestTelnetSessionPool
@@ -21,7 +21,7 @@ setup(name='apcommand',
                           'beautifulsoup4'],
       packages = find_packages(exclude=["__main__"]),
       include_package_data = True,
-      package_data = {"":["*.txt", "*.rst", "*.ini"]},
+      package_data = {"":["*.txt", "*.rst", "*.ini", "*.html"]},
       entry_points = """
 	  [console_scripts]
           atheros=apcommand.atheros_main:main